@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+תור הפקת ספרים - הוספה, סטטוס, ביטול, ו-worker שמפיק ספרים מהתור
+במקום לולאות shell של run_full_book_10pages.py: עדיפויות, ניסיונות חוזרים
+עם backoff, מכסות ספקים משותפות לכל הספרים, ועצירה מסודרת (Ctrl+C / SIGTERM)
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import signal
+from typing import Callable, Dict
+
+from job_queue import JobQueue, PRIORITIES
+from book_worker import BookWorker
+
+
+def produce_book_job(payload: Dict, checkpoint: Callable[[str], None]) -> Dict:
+    """עבודת תור אחת = ספר אחד (Stages 1-5)"""
+    from run_full_book_10pages import produce_book
+
+    return produce_book(payload['child_name'], payload['age'], payload['topic'],
+                        num_pages=payload.get('num_pages', 10), checkpoint=checkpoint)
+
+
+def parse_priority(value: str) -> int:
+    """שם עדיפות (backfill / normal / customer / urgent) או מספר"""
+    if value in PRIORITIES:
+        return PRIORITIES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"priority must be one of {list(PRIORITIES)} or an integer")
+
+
+def print_job(job: Dict):
+    payload = job['payload']
+    line = (f"#{job['id']:<5} {job['status']:<10} p={job['priority']:<4} "
+            f"{job['attempts']}/{job['max_attempts']}  "
+            f"{payload.get('child_name')} ({payload.get('age')}) - {payload.get('topic')}")
+    if job['status'] == "RUNNING":
+        line += f"  ▶️  {job['stage'] or 'starting'} @ {job['worker']}"
+        if job['cancel_requested']:
+            line += " (מבוטלת)"
+    if job['last_error'] and job['status'] in ("QUEUED", "FAILED"):
+        line += f"  ⚠️  {job['last_error'][:80]}"
+    if job['result']:
+        line += f"  📁 {job['result'].get('run_dir')}"
+    print(line)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='תור הפקת ספרים')
+    parser.add_argument('--db', type=Path, default=Path("data/queue/jobs.db"), help='קובץ התור')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='הוספת ספר לתור')
+    enqueue_parser.add_argument('child_name', help='שם הילד/ה')
+    enqueue_parser.add_argument('age', type=int, help='גיל')
+    enqueue_parser.add_argument('topic', help='נושא הסיפור')
+    enqueue_parser.add_argument('--priority', type=parse_priority, default=0,
+                                help=f"{' / '.join(PRIORITIES)} או מספר (גבוה = קודם)")
+    enqueue_parser.add_argument('--max-attempts', type=int, default=3)
+    enqueue_parser.add_argument('--pages', type=int, default=10)
+
+    status_parser = commands.add_parser('status', help='מצב התור')
+    status_parser.add_argument('--status', choices=['QUEUED', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED'])
+    status_parser.add_argument('--limit', type=int, default=30)
+
+    cancel_parser = commands.add_parser('cancel', help='ביטול עבודה')
+    cancel_parser.add_argument('job_id', type=int)
+
+    retry_parser = commands.add_parser('retry', help='החזרת עבודה שנכשלה / בוטלה לתור')
+    retry_parser.add_argument('job_id', type=int)
+
+    worker_parser = commands.add_parser('worker', help='הפעלת worker')
+    worker_parser.add_argument('--jobs', type=int, default=int(os.getenv("BOOK_WORKER_JOBS", "2")),
+                               help='ספרים במקביל')
+    worker_parser.add_argument('--exit-when-empty', action='store_true',
+                               help='לצאת כשאין עבודה מוכנה (במקום להמתין לעבודות חדשות)')
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+
+    if args.command == 'enqueue':
+        job_id = queue.enqueue(
+            {"child_name": args.child_name, "age": args.age, "topic": args.topic,
+             "num_pages": args.pages},
+            priority=args.priority, max_attempts=args.max_attempts
+        )
+        print(f"📥 עבודה #{job_id} נוספה לתור (עדיפות {args.priority})")
+
+    elif args.command == 'status':
+        counts = queue.counts()
+        print("📋 " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        for job in queue.list(status=args.status, limit=args.limit):
+            print_job(job)
+
+    elif args.command == 'cancel':
+        status = queue.cancel(args.job_id)
+        if status is None:
+            print(f"❌ עבודה #{args.job_id} לא נמצאה")
+            return 1
+        if status == "RUNNING":
+            print(f"🚫 עבודה #{args.job_id} תיעצר לפני השלב הבא")
+        elif status == "CANCELLED":
+            print(f"🚫 עבודה #{args.job_id} בוטלה")
+        else:
+            print(f"ℹ️  עבודה #{args.job_id} כבר {status}")
+
+    elif args.command == 'retry':
+        if not queue.retry(args.job_id):
+            print(f"❌ עבודה #{args.job_id} לא במצב FAILED / CANCELLED")
+            return 1
+        print(f"🔁 עבודה #{args.job_id} חזרה לתור")
+
+    elif args.command == 'worker':
+        worker = BookWorker(queue, produce_book_job, max_jobs=args.jobs)
+
+        def handle_signal(signum, frame):
+            # פעם ראשונה: drain; פעם שנייה: העבודות חוזרות לתור ויוצאים מיד
+            if worker.draining:
+                worker.abandon()
+                os._exit(130)
+            worker.drain()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+        stats = worker.run(exit_when_empty=args.exit_when_empty)
+        return 0 if stats["failed"] == 0 else 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+הפקה מרובה מתבנית - סיפור מאושר אחד לרשימת ילדים
+טקסט מותאם לכל ילד, תמונות וניקוד של התבנית משמשים שוב, PDFs במקביל
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import json
+
+from bulk_personalizer import BulkPersonalizer, TemplateRun, VariantRun, load_children
+from cost_ledger import CostLedger, set_active_ledger
+
+
+def make_variant_images(gender: str, story_data: dict, images_dir: Path):
+    """מאייר עמודים למגדר אחר עם אותו Stage 3 (כולל QA) של הריצה המלאה"""
+    from run_full_book_10pages import step3_generate_images
+
+    run = VariantRun(images_dir.parent, gender)
+    try:
+        step3_generate_images(run, story_data)
+    except Exception as e:
+        run.close(error=e)
+        raise
+    run.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='הפקת ספרים מותאמים לרשימת ילדים מריצה מאושרת')
+    parser.add_argument('template_run', type=Path, help='תיקיית הריצה המאושרת (data/runs/.../<run_id>)')
+    parser.add_argument('children', type=Path, help='CSV / JSONL עם name, gender, mother_name, father_name')
+    parser.add_argument('--output', type=Path, default=None, help='תיקיית פלט')
+    parser.add_argument('--template-name', default=None, help='שם הדמות בתבנית (ברירת מחדל: מהריצה)')
+    parser.add_argument('--smart', action='store_true', help='התאמת טקסט עם Claude במקום המילון')
+    parser.add_argument('--reuse-template-images', action='store_true',
+                        help='לא לאייר עמודים למגדר השני - תמונות התבנית לכל הילדים')
+    parser.add_argument('--workers', type=int, default=None, help='תהליכים ליצירת PDF')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("📚 הפקה מרובה מתבנית")
+    print("=" * 80)
+
+    template = TemplateRun(args.template_run, character_name=args.template_name)
+    children = load_children(args.children)
+    print(f"\n📂 תבנית: {template.run_dir} ({template.character_name}, {len(template.pages)} עמודים)")
+    print(f"👧👦 ילדים: {len(children)}")
+
+    bulk = BulkPersonalizer(
+        template, output_dir=args.output, smart=args.smart, max_workers=args.workers,
+        variant_images=None if args.reuse_template_images else make_variant_images
+    )
+    bulk.output_dir.mkdir(parents=True, exist_ok=True)
+    ledger = CostLedger(bulk.output_dir / "cost_ledger.jsonl")
+    set_active_ledger(ledger)
+
+    try:
+        manifest = bulk.run(children)
+    except Exception as e:
+        print(f"\n❌ שגיאה: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+    ledger.print_report()
+    costs = ledger.summarize()
+    with open(bulk.output_dir / "cost_report.json", 'w', encoding='utf-8') as f:
+        json.dump(costs, f, ensure_ascii=False, indent=2)
+
+    completed = sum(1 for child in manifest['children'] if child['status'] == "COMPLETED")
+    print(f"\n✅ {completed}/{len(children)} ספרים הופקו")
+    print(f"   🔤 ניקוד: {manifest['nikud']}")
+    if children:
+        print(f"   💰 עלות לילד: ${costs['total']['cost_usd'] / len(children):.4f} "
+              f"({costs['total']['calls'] / len(children):.2f} קריאות API)")
+    print(f"📁 {bulk.output_dir}")
+
+    return 0 if completed == len(children) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+ניהול מאגר הקבצים לפי תוכן (data/cas)
+dedupe מכניס תמונות ו-PDFs של ריצות קיימות למאגר (עותקים זהים הופכים ל-hard links),
+gc מוחק אובייקטים שאף ריצה לא מפנה אליהם
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from artifact_store import ArtifactStore
+
+# רק קבצים שנכתבים פעם אחת (או מוחלפים ב-rename) - לא יומנים שמתווספים אליהם
+DEDUPE_KINDS = ("images", "pdf")
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='מאגר הקבצים לפי תוכן')
+    parser.add_argument('--cas-dir', type=Path, default=Path("data/cas"), help='תיקיית המאגר')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help='גודל המאגר והחיסכון')
+
+    gc_parser = commands.add_parser('gc', help='מחיקת אובייקטים ללא הפניות')
+    gc_parser.add_argument('--dry-run', action='store_true')
+
+    dedupe_parser = commands.add_parser('dedupe', help='הכנסת ריצות קיימות למאגר')
+    dedupe_parser.add_argument('--runs-dir', type=Path, default=Path("data/runs"))
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.cas_dir)
+
+    if args.command == 'dedupe':
+        files = [path for kind in DEDUPE_KINDS
+                 for path in args.runs_dir.glob(f"*/*/{kind}/*") if path.is_file()]
+        print(f"🔍 {len(files)} קבצים ב-{args.runs_dir}")
+        for i, path in enumerate(files, 1):
+            store.ingest(path)
+            if i % 500 == 0:
+                print(f"   {i}/{len(files)}")
+
+    if args.command == 'gc':
+        result = store.gc(dry_run=args.dry_run)
+        action = "יימחקו" if args.dry_run else "נמחקו"
+        print(f"🧹 {action} {result['removed']} אובייקטים ({format_bytes(result['freed_bytes'])})")
+
+    stats = store.stats()
+    print(f"📦 {stats['objects']} אובייקטים, {format_bytes(stats['bytes'])} בדיסק")
+    print(f"🔗 {stats['references']} הפניות, נחסכו {format_bytes(stats['saved_bytes'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+שאילתות על אינדקס הריצות - בלי לסרוק את data/runs
+rebuild בונה את האינדקס מחדש מהדיסק (אחרי מחיקות ידניות / ריצות ישנות)
+similarity מכניס סיפורים קיימים לאינדקס הדמיון (זיהוי כפילויות ב-Stage 1)
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from run_index import RunIndex
+from story_similarity import SimilarityIndex
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='אינדקס הריצות')
+    parser.add_argument('--runs-dir', type=Path, default=Path("data/runs"), help='תיקיית הריצות')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('rebuild', help='בנייה מחדש מהדיסק')
+    commands.add_parser('stats', help='מספר ריצות לפי סטטוס')
+
+    similarity_parser = commands.add_parser('similarity', help='הכנסת סיפורים קיימים לאינדקס הדמיון')
+    similarity_parser.add_argument('--stories-dir', type=Path, default=Path("data/stories"),
+                                   help='סיפורי ה-Orchestrator')
+
+    list_parser = commands.add_parser('list', help='ריצות לפי סינון')
+    list_parser.add_argument('--status', choices=['RUNNING', 'FAILED', 'COMPLETED', 'UNKNOWN'])
+    list_parser.add_argument('--failed-stage', default=None)
+    list_parser.add_argument('--child', default=None, help='שם הדמות')
+    list_parser.add_argument('--topic', default=None)
+    list_parser.add_argument('--since', default=None, help='YYYY-MM-DD')
+    list_parser.add_argument('--until', default=None, help='YYYY-MM-DD (כולל)')
+    list_parser.add_argument('--limit', type=int, default=50)
+
+    artifacts_parser = commands.add_parser('artifacts', help='קבצי ריצה')
+    artifacts_parser.add_argument('run_id')
+    artifacts_parser.add_argument('--kind', choices=['story', 'images', 'pdf', 'qa', 'logs'])
+    args = parser.parse_args()
+
+    index = RunIndex(args.runs_dir / "run_index.db")
+
+    if args.command == 'rebuild':
+        count = index.rebuild(args.runs_dir)
+        print(f"♻️  אונדקסו {count} ריצות מ-{args.runs_dir}")
+        print(f"   {index.status_counts()}")
+
+    elif args.command == 'similarity':
+        similarity_index = SimilarityIndex()
+        added = similarity_index.backfill(args.runs_dir, args.stories_dir)
+        print(f"🔍 נוספו {added} סיפורים - {similarity_index.count()} באינדקס הדמיון")
+
+    elif args.command == 'stats':
+        for status, count in sorted(index.status_counts().items(), key=lambda item: str(item[0])):
+            print(f"   {status}: {count}")
+
+    elif args.command == 'list':
+        runs = index.runs(status=args.status, failed_stage=args.failed_stage, child=args.child,
+                          topic=args.topic, since=args.since, until=args.until, limit=args.limit)
+        for run in runs:
+            line = f"{run['created_at'] or '-':<26} {run['status'] or '-':<10} {run['run_id']}  {run['book_slug']}"
+            if run['status'] == "FAILED":
+                line += f"  ❌ {run['failed_stage'] or '?'}: {run['failure_reason'] or ''}"
+            print(line)
+        print(f"\n📋 {len(runs)} ריצות")
+
+    elif args.command == 'artifacts':
+        if index.get_run(args.run_id) is None:
+            print(f"❌ ריצה לא נמצאה באינדקס: {args.run_id}")
+            return 1
+        for path in index.artifacts(args.run_id, kind=args.kind):
+            print(path)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,15 +10,21 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 from dotenv import load_dotenv
 load_dotenv()
 
-import json
+import os
+import uuid
 import hashlib
 from datetime import datetime
 from PIL import Image
 from pathlib import Path
+from typing import Callable, Optional
 
 from claude_agent import ClaudeAgent
+from cost_ledger import ledger_context
 from image_generator import ImageGenerator
 from production_pdf_with_nikud import ProductionPDFWithNikud
+from run_journal import atomic_write_json
+from run_manager import RunManager as BaseRunManager
+from story_similarity import SimilarityIndex, generate_distinct_story
 from validate_single_page import (
     check_image_fills_page,
     check_nikud_coverage,
@@ -48,33 +54,24 @@ def get_text_area_bounds(image_width: int, image_height: int) -> tuple:
     return (text_x_start, text_y_start, text_area_width, text_height)
 
 
-class RunManager:
-    """מנהל ריצה עם metadata ולוגים"""
+class RunManager(BaseRunManager):
+    """
+    ריצה של הפקת ספר מלא - תיקייה data/runs/<ילד>_age<גיל>_<נושא>/<run_id>
+    metadata ביומן האירועים, שלבים וקבצים באינדקס הריצות, תמונות ו-PDFs במאגר הקבצים
+    """
 
     def __init__(self, child_name: str, age: int, topic: str):
         self.child_name = child_name
         self.age = age
         self.topic = topic
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        random_id = hashlib.sha256(f"{timestamp}{child_name}".encode()).hexdigest()[:8]
-        self.run_id = f"{timestamp}_{random_id}"
-
-        # תיקיות
-        self.base_dir = Path(f"data/runs/{child_name}_age{age}_{topic}/{self.run_id}")
-        self.story_dir = self.base_dir / "story"
-        self.images_dir = self.base_dir / "images"
-        self.pdf_dir = self.base_dir / "pdf"
-        self.qa_dir = self.base_dir / "qa"
-        self.logs_dir = self.base_dir / "logs"
-
-        for d in [self.story_dir, self.images_dir, self.pdf_dir, self.qa_dir, self.logs_dir]:
-            d.mkdir(parents=True, exist_ok=True)
+        # uuid - כמה ספרים לאותו ילד באותה שנייה (worker התור) לא חולקים תיקייה
+        random_id = hashlib.sha256(f"{timestamp}{child_name}{uuid.uuid4()}".encode()).hexdigest()[:8]
+        super().__init__(topic, age, child_name, run_id=f"{timestamp}_{random_id}",
+                         book_slug=f"{child_name}_age{age}_{topic}")
 
     def save_story(self, story_data: dict):
-        story_path = self.story_dir / "story.json"
-        with open(story_path, 'w', encoding='utf-8') as f:
-            json.dump(story_data, f, ensure_ascii=False, indent=2)
-        return story_path
+        return super().save_story(story_data, version=None)
 
 
 def step1_generate_story(run: RunManager, num_pages: int = 10):
@@ -94,43 +91,22 @@ def step1_generate_story(run: RunManager, num_pages: int = 10):
 - מותאם לגיל {run.age}
 - סיפור טוב עם התחלה, אמצע וסוף
 
-פורמט JSON:
-{{
-  "story": {{
-    "title": "כותרת הסיפור",
-    "target_age": {run.age},
-    "pages": [
-      {{
-        "page_number": 1,
-        "text": "טקסט העמוד...",
-        "visual_description": "תיאור מפורט של הסצנה..."
-      }},
-      ...
-    ]
-  }}
-}}"""
-
-    response = agent.client.messages.create(
-        model=agent.model,
-        max_tokens=8000,
-        messages=[{"role": "user", "content": prompt}]
+שלח את הסיפור דרך הכלי submit_story (target_age: {run.age})."""
+
+    # טיוטה כמעט-זהה לסיפור קיים נדחית כאן - לפני שמשלמים על תמונות
+    similarity_index = SimilarityIndex()
+    story_data, signature = generate_distinct_story(
+        # tool use עם סכמה של בדיוק num_pages עמודים - עמודים פגומים מבוקשים מחדש לבד
+        lambda attempt_prompt: agent.generate_story_structured(
+            attempt_prompt, num_pages=num_pages, target_age=run.age,
+            max_tokens=8000, cache_site="story_generation"
+        ),
+        prompt, similarity_index, exclude=run.run_id,
+        threshold=float(os.getenv("STORY_DUPLICATE_THRESHOLD", "0.6")),
+        max_attempts=int(os.getenv("STORY_DUPLICATE_ATTEMPTS", "3"))
     )
 
-    content = response.content[0].text
-
-    # חלץ JSON
-    json_start = content.find('{')
-    json_end = content.rfind('}') + 1
-    story_json = content[json_start:json_end]
-    story_data = json.loads(story_json)
-
-    # וודא שיש בדיוק num_pages עמודים
-    actual_pages = len(story_data['story']['pages'])
-    if actual_pages != num_pages:
-        print(f"   ⚠️  נוצרו {actual_pages} עמודים במקום {num_pages}, קוצץ/משלים")
-        if actual_pages > num_pages:
-            story_data['story']['pages'] = story_data['story']['pages'][:num_pages]
-        # אם פחות - נשאר כך (לא משלים)
+    similarity_index.add(run.run_id, story_data, signature=signature)
 
     story_path = run.save_story(story_data)
 
@@ -227,10 +203,11 @@ CRITICAL: Full-bleed illustration extending to all edges. NO borders, NO frames,
                     print(f"      🔧 Delta: מונע פלישה לאזור טקסט")
 
             # Generate
-            result = image_gen.generate_image(
-                prompt=current_prompt,
-                aspect_ratio="4:3"
-            )
+            with ledger_context(page=page_num):
+                result = image_gen.generate_image(
+                    prompt=current_prompt,
+                    aspect_ratio="4:3"
+                )
 
             if not result or 'image_data' not in result:
                 print(f"      ❌ API נכשל")
@@ -377,11 +354,22 @@ CRITICAL: Full-bleed illustration extending to all edges. NO borders, NO frames,
 
             # Pass/Fail
             qa_passed = resolution_ok and white_ok and edge_ok and text_area_ok
+            run.log_step("image_qa", {
+                "page": page_num,
+                "attempt": attempt,
+                "passed": qa_passed,
+                "width": width,
+                "height": height,
+                "white_pct": round(white_pct, 2),
+                "uniform_edges": uniform_edges,
+                "intrusion_pct": round(intrusion_pct, 2)
+            })
 
             if qa_passed:
                 # SUCCESS
                 image_path = run.images_dir / f"page_{page_num:02d}.png"
                 temp_path.rename(image_path)
+                run.record_artifact(image_path)
                 print(f"      ✅ QA עבר - תמונה נשמרה")
                 break
             else:
@@ -434,9 +422,12 @@ def step4_generate_pdfs(run: RunManager, story_data: dict):
 
         # צור PDF בודד
         pdf_path = run.pdf_dir / f"page_{page_num:02d}.pdf"
+        run.store.release(pdf_path)
         pdf = ProductionPDFWithNikud(str(pdf_path), target_age=age)
-        pdf.add_story_page(page_num, text, image_path)
+        with ledger_context(page=page_num):
+            pdf.add_story_page(page_num, text, image_path)
         pdf.save()
+        run.record_artifact(pdf_path)
 
         print(f"   ✅ PDF נוצר: {pdf_path.name}")
 
@@ -518,8 +509,8 @@ def step5_validate_all(run: RunManager, story_data: dict, image_results: list):
 
     # שמור תוצאות
     report_path = run.qa_dir / "validation_report.json"
-    with open(report_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    atomic_write_json(report_path, results)
+    run.record_artifact(report_path)
 
     print(f"\n💾 דוח validation נשמר: {report_path}")
 
@@ -583,6 +574,97 @@ def print_final_summary(results: list):
         print(f"   ✅ לא זוהה drift משמעותי")
 
 
+def produce_book(child_name: str, age: int, topic: str, num_pages: int = 10,
+                 checkpoint: Optional[Callable[[str], None]] = None) -> dict:
+    """
+    מפיק ספר אחד - Stages 1-5 - ומחזיר סיכום (משמש את ה-CLI ואת worker התור)
+
+    Args:
+        checkpoint: נקרא עם שם השלב לפני כל שלב (worker התור: עדכון סטטוס ובדיקת ביטול)
+
+    הריצה נרשמת ביומן האירועים ובאינדקס הריצות: שלב שנכשל (או בוטל) מסמן את
+    הריצה FAILED עם השלב; עמודים שנכשלו ב-validation מסמנים FAILED בשלב validation
+
+    Returns:
+        {"run_id", "run_dir", "status", "pages_passed", "pages", "cost_usd", "api_calls"}
+    """
+    run = RunManager(child_name, age, topic)
+    print(f"\n📂 Run ID: {run.run_id}")
+    print(f"📁 תיקייה: {run.base_dir}")
+
+    stage = None
+
+    def enter(next_stage: str):
+        nonlocal stage
+        stage = next_stage
+        if checkpoint is not None:
+            checkpoint(stage)
+
+    # close: snapshot סופי, שחרור היומן והאינדקס (worker התור מריץ ספרים רבים בתהליך אחד)
+    try:
+        try:
+            # Stage 1: Story
+            enter("story")
+            with ledger_context(stage="story"):
+                story_data = step1_generate_story(run, num_pages=num_pages)
+            run.mark_step_complete("story", True, {"title": story_data['story']['title']})
+
+            # Stage 3: Images
+            enter("images")
+            with ledger_context(stage="images"):
+                image_results = step3_generate_images(run, story_data, max_retries=3)
+            run.mark_step_complete("images", True, {
+                "pages": len(image_results),
+                "attempts": sum(r['attempts'] for r in image_results)
+            })
+
+            # Stage 4: PDFs
+            enter("pdf")
+            with ledger_context(stage="pdf"):
+                step4_generate_pdfs(run, story_data)
+            run.mark_step_complete("pdf", True)
+
+            # Stage 5: Validation
+            enter("validation")
+            with ledger_context(stage="validation"):
+                validation_results = step5_validate_all(run, story_data, image_results)
+        except BaseException as e:
+            run.mark_failed(f"{type(e).__name__}: {e}", stage=stage)
+            raise
+
+        failed_pages = [r['page'] for r in validation_results if not r['passed']]
+        run.mark_step_complete("validation", not failed_pages, {
+            "pages_passed": len(validation_results) - len(failed_pages),
+            "pages": len(validation_results),
+            "failed_pages": failed_pages
+        })
+        if failed_pages:
+            run.mark_failed(f"validation failed on pages {failed_pages}", stage="validation")
+        else:
+            run.mark_complete()
+
+        # סיכום
+        print_final_summary(validation_results)
+        run.ledger.print_report()
+        costs = run.ledger.summarize()
+        cost_report_path = run.qa_dir / "cost_report.json"
+        atomic_write_json(cost_report_path, costs)
+        run.record_artifact(cost_report_path)
+        report = run.generate_report()
+
+        return {
+            "run_id": run.run_id,
+            "run_dir": str(run.base_dir),
+            "status": report['status'],
+            "pages_passed": len(validation_results) - len(failed_pages),
+            "pages": len(validation_results),
+            "cost_usd": report['summary']['total_cost_usd'],
+            "api_calls": report['summary']['api_calls']
+        }
+    finally:
+        run.close()
+
+
 def main():
     import argparse
 
@@ -597,29 +679,11 @@ def main():
     print("   Stages 1-5 עם edge validation")
     print("="*80)
 
-    # יצירת run
-    run = RunManager(args.child_name, args.age, args.topic)
-    print(f"\n📂 Run ID: {run.run_id}")
-    print(f"📁 תיקייה: {run.base_dir}")
-
     try:
-        # Stage 1: Story
-        story_data = step1_generate_story(run, num_pages=10)
-
-        # Stage 3: Images
-        image_results = step3_generate_images(run, story_data, max_retries=3)
-
-        # Stage 4: PDFs
-        step4_generate_pdfs(run, story_data)
-
-        # Stage 5: Validation
-        validation_results = step5_validate_all(run, story_data, image_results)
-
-        # סיכום
-        print_final_summary(validation_results)
+        result = produce_book(args.child_name, args.age, args.topic)
 
         print(f"\n✅ הפקה הושלמה!")
-        print(f"📁 כל הקבצים ב: {run.base_dir}")
+        print(f"📁 כל הקבצים ב: {result['run_dir']}")
 
     except Exception as e:
         print(f"\n❌ שגיאה: {e}")
@@ -4,6 +4,7 @@ Advanced Prompt Enhancer - משפר פרומפטים עם הבנה סיפורי
 from typing import Dict
 from claude_agent import ClaudeAgent
 from story_arc_analyzer import StoryArcAnalyzer
+from json_extraction import extract_json
 
 
 class AdvancedPromptEnhancer:
@@ -113,28 +114,20 @@ Response format (JSON):
             max_tokens=1500,
             temperature=0.8,
             system="You are an expert at creating commercially successful children's book illustrations that tell stories visually and connect emotionally with readers.",
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}],
+            cache_site="advanced_prompt_enhancer"
         )
 
-        content = response.content[0].text
-
         # Parse JSON
-        import json
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-
-        if json_start != -1 and json_end > json_start:
-            result = json.loads(content[json_start:json_end])
-
-            # Add metadata
-            result["story_analysis"] = self.analyzer.analyze_page_position(
-                page_number, page_text, None
-            )
-            result["page_number"] = page_number
-
-            return result
-        else:
-            raise ValueError("Could not parse JSON from response")
+        result = extract_json(response.content[0].text)
+
+        # Add metadata
+        result["story_analysis"] = self.analyzer.analyze_page_position(
+            page_number, page_text, None
+        )
+        result["page_number"] = page_number
+
+        return result
 
     def _extract_focus_areas(self, story_direction: str) -> str:
         """
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Artifact Store - מאגר קבצים לפי תוכן (SHA-256) תחת data/cas
+
+ריצות חוזרות, הפקה מרובה וכריכה שמשמשת גם כעמוד 1 שומרות את אותן תמונות
+ואותם PDFs שוב ושוב. כאן כל תוכן נשמר פעם אחת:
+- objects/<2 תווים>/<שאר ה-hash> - עותק יחיד לכל תוכן
+- הקובץ בתיקיית הריצה הופך ל-hard link לאובייקט (אותו inode - בלי העתקה ובלי מקום נוסף)
+- ספירת ההפניות היא st_nlink של האובייקט (פחות הקישור של המאגר עצמו) - אין טבלה
+  שיכולה לצאת מסונכרנת; מחיקת תיקיית ריצה משחררת את ההפניות שלה אוטומטית
+- gc מוחק אובייקטים שאף ריצה לא מפנה אליהם (st_nlink == 1)
+
+קבצים במאגר הם בלתי ניתנים לשינוי (הרשאות קריאה בלבד): מחליפים קובץ ע"י כתיבה
+לקובץ חדש ו-os.replace, לא בכתיבה במקום (שהייתה משנה את כל ההפניות).
+המאגר חייב להיות באותה מערכת קבצים כמו data/runs: קובץ ממערכת קבצים אחרת
+(EXDEV) נשאר כמו שהוא ולא נכנס למאגר - אין אובייקטים שהם עותקים, שספירת
+ההפניות שלהם (st_nlink) הייתה שגויה ו-gc היה מוחק אותם.
+
+ingest / materialize מחזיקים נעילה משותפת (flock על root/.lock) בזמן הקישור,
+ו-gc נעילה בלעדית: gc לא מוחק אובייקט בין הבדיקה שהוא קיים לבין הקישור אליו.
+"""
+import os
+import stat
+import errno
+import hashlib
+import threading
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - נעילה בתוך התהליך בלבד
+    fcntl = None
+
+
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+
+class ArtifactStore:
+    """
+    מאגר content-addressed עם hard links
+    """
+
+    def __init__(self, root: Path = None):
+        if root is None:
+            root = Path("data/cas")
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.root / ".lock"
+        self._process_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive: bool = False):
+        """נעילה בין תהליכים: משותפת לקישורים, בלעדית ל-gc"""
+        if fcntl is None:
+            with self._process_lock:
+                yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    @staticmethod
+    def digest_file(path: Path) -> str:
+        with open(path, 'rb') as f:
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return hashlib.file_digest(f, "sha256").hexdigest()
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def has(self, digest: str) -> bool:
+        return self.object_path(digest).exists()
+
+    def refcount(self, digest: str) -> int:
+        """מספר הקבצים מחוץ למאגר שמפנים לאובייקט"""
+        try:
+            return self.object_path(digest).stat().st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _cross_device(error: OSError) -> bool:
+        # EXDEV: מערכת קבצים אחרת; EPERM / ENOTSUP: מערכת קבצים בלי hard links
+        return error.errno in (errno.EXDEV, errno.EPERM, errno.ENOTSUP)
+
+    @classmethod
+    def _link_replace(cls, source: Path, dest: Path) -> bool:
+        """
+        dest הופך ל-hard link ל-source באופן אטומי (link לשם זמני ואז rename)
+
+        Returns:
+            False אם אי אפשר לקשר (מערכת קבצים אחרת) - dest נשאר כמו שהוא
+        """
+        temp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.link")
+        if temp_path.exists():
+            temp_path.unlink()
+        try:
+            os.link(source, temp_path)
+        except OSError as e:
+            if cls._cross_device(e):
+                return False
+            raise
+        os.replace(temp_path, dest)
+        return True
+
+    def ingest(self, path: Path, digest: str = None) -> str:
+        """
+        מכניס קובץ למאגר ומחליף אותו ב-hard link לאובייקט
+
+        אם התוכן כבר קיים - הקובץ מוחלף בקישור לאובייקט הקיים (המקום מתפנה).
+        אחרת הקובץ עצמו הופך לאובייקט (link, בלי העתקה).
+        קובץ ממערכת קבצים אחרת נשאר כמו שהוא ולא נכנס למאגר.
+
+        Returns:
+            SHA-256 של התוכן
+        """
+        path = Path(path)
+        digest = digest or self.digest_file(path)
+        object_path = self.object_path(digest)
+
+        with self._locked():
+            if object_path.exists():
+                if not os.path.samefile(object_path, path):
+                    self._link_replace(object_path, path)
+                return digest
+
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, object_path)
+            except FileExistsError:
+                # תהליך אחר הכניס את אותו תוכן בינתיים
+                self._link_replace(object_path, path)
+                return digest
+            except OSError as e:
+                if not self._cross_device(e):
+                    raise
+                return digest
+            os.chmod(object_path, READ_ONLY)
+        return digest
+
+    @staticmethod
+    def release(path: Path):
+        """
+        לפני כתיבה מחדש של קובץ במקום (למשל PDF בהמשך ריצה): מנתק את הנתיב
+        מהאובייקט, כך שהכתיבה יוצרת קובץ חדש ולא משנה את כל ההפניות
+        """
+        try:
+            Path(path).unlink()
+        except FileNotFoundError:
+            pass
+
+    def materialize(self, digest: str, dest: Path) -> Optional[Path]:
+        """
+        יוצר את dest כקישור לאובייקט קיים (פגיעה במטמון = link אחד, בלי I/O של תוכן)
+
+        Returns:
+            dest, או None אם התוכן לא במאגר (או ש-dest במערכת קבצים אחרת)
+        """
+        object_path = self.object_path(digest)
+        if not object_path.exists():
+            return None
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            if not object_path.exists():
+                return None
+            return dest if self._link_replace(object_path, dest) else None
+
+    def _objects(self) -> Iterator[Path]:
+        for shard in self.objects_dir.iterdir():
+            if shard.is_dir():
+                yield from (path for path in shard.iterdir() if path.is_file())
+
+    def gc(self, dry_run: bool = False) -> Dict:
+        """
+        מוחק אובייקטים שאף קובץ לא מפנה אליהם
+
+        Returns:
+            {"removed": מספר אובייקטים, "freed_bytes": בתים}
+        """
+        removed = 0
+        freed = 0
+        with self._locked(exclusive=True):
+            for path in self._objects():
+                info = path.stat()
+                if info.st_nlink <= 1:
+                    removed += 1
+                    freed += info.st_size
+                    if not dry_run:
+                        path.unlink()
+        return {"removed": removed, "freed_bytes": freed}
+
+    def stats(self) -> Dict:
+        """
+        objects: אובייקטים, bytes: מקום בפועל,
+        references: קבצים שמפנים למאגר, saved_bytes: מה שהעותקים היו תופסים
+        """
+        objects = 0
+        size = 0
+        references = 0
+        saved = 0
+        for path in self._objects():
+            info = path.stat()
+            refs = info.st_nlink - 1
+            objects += 1
+            size += info.st_size
+            references += refs
+            saved += info.st_size * max(0, refs - 1)
+        return {"objects": objects, "bytes": size, "references": references, "saved_bytes": saved}
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    root = Path(tempfile.mkdtemp())
+    store = ArtifactStore(root / "cas")
+    for run_id in ("run_a", "run_b", "run_c"):
+        page = root / "runs" / run_id / "images" / "page_01.png"
+        page.parent.mkdir(parents=True)
+        page.write_bytes(b"same illustration" * 1000)
+        digest = store.ingest(page)
+
+    print(f"🔗 {digest[:12]}: {store.refcount(digest)} הפניות, {store.stats()}")
+    shutil.rmtree(root / "runs")
+    print(f"🧹 gc: {store.gc()}")
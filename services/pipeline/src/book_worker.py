@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Book Worker - daemon שמפיק ספרים מתור העבודות (job_queue)
+
+- עד max_jobs ספרים במקביל, thread לכל ספר באותו תהליך: בקרי הקצב והמקביליות
+  של הספקים (rate_limiter - <PROVIDER>_MAX_CONCURRENCY, RPM, TPM) משותפים לכל
+  הספרים, כך ששלב התמונות של כמה ספרים לא חורג יחד מהמכסה של ספק התמונות
+- יומן העלויות של כל ספר נפרד (set_active_ledger לפי thread)
+- הספר הבא נלקח לפי עדיפות; כישלון חוזר לתור עם backoff (job_queue)
+- drain: מפסיקים לקחת עבודות חדשות, מסיימים את אלה שרצות ויוצאים
+"""
+import os
+import time
+import socket
+import threading
+from typing import Callable, Dict
+
+from job_queue import JobQueue, JobCancelled
+
+
+# handler(payload, checkpoint) -> result; checkpoint(stage) לפני כל שלב
+JobHandler = Callable[[Dict, Callable[[str], None]], Dict]
+
+
+class BookWorker:
+    """
+    לולאת ה-worker: לוקח עבודות, מריץ אותן ב-threads, מעדכן heartbeat
+    """
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, max_jobs: int = 2,
+                 poll_seconds: float = 5.0, heartbeat_seconds: float = 30.0,
+                 stale_seconds: float = 600.0, name: str = None):
+        """
+        Args:
+            queue: תור העבודות
+            handler: מפיק עבודה אחת (למשל produce_book)
+            max_jobs: ספרים במקביל
+            poll_seconds: בדיקת עבודות חדשות כשאין מה לקחת
+            heartbeat_seconds: תדירות עדכון heartbeat לעבודות שרצות
+            stale_seconds: עבודה של worker אחר בלי heartbeat זמן כזה חוזרת לתור
+        """
+        self.queue = queue
+        self.handler = handler
+        self.max_jobs = max_jobs
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.draining = False
+        self.stats = {"completed": 0, "failed": 0, "retried": 0, "cancelled": 0, "lost": 0}
+        self._running: Dict[int, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def drain(self):
+        """עצירה מסודרת: לא לוקחים עבודות חדשות, העבודות שרצות מסתיימות"""
+        if not self.draining:
+            self.draining = True
+            print(f"\n🛑 drain: ממתין ל-{len(self._running)} עבודות שרצות (שוב = יציאה מיידית)")
+        self._wakeup.set()
+
+    def abandon(self):
+        """יציאה מיידית: העבודות שרצות חוזרות לתור בלי לספור ניסיון"""
+        with self._lock:
+            job_ids = list(self._running)
+        for job_id in job_ids:
+            self.queue.release(job_id, self.name)
+        print(f"⏹️  {len(job_ids)} עבודות הוחזרו לתור")
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _finished(self, job_id: int, owned, outcome: str, message: str):
+        """סופר ומדפיס תוצאה - אלא אם העבודה כבר לא שלנו (requeue_stale העביר אותה)"""
+        if not owned:
+            self._count("lost")
+            print(f"⚠️  עבודה #{job_id} כבר לא שייכת ל-{self.name} - התוצאה לא נרשמה")
+            return
+        self._count(outcome)
+        print(message)
+
+    def _run_job(self, job: Dict):
+        job_id = job["id"]
+
+        def checkpoint(stage: str):
+            if self.queue.set_stage(job_id, stage):
+                raise JobCancelled(f"job {job_id} cancelled before stage {stage}")
+
+        payload = job["payload"]
+        print(f"\n▶️  עבודה #{job_id} (עדיפות {job['priority']}, ניסיון {job['attempts']}/"
+              f"{job['max_attempts']}): {payload}")
+        try:
+            result = self.handler(payload, checkpoint)
+            if (result or {}).get("status") == "FAILED":
+                # הריצה הסתיימה אבל נכשלה (למשל בוולידציה) - ניסיון נוסף לא יתקן אותה
+                status = self.queue.fail(job_id, self.name, f"run {result.get('run_id')} FAILED",
+                                         retryable=False, result=result)
+                self._finished(job_id, status, "failed", f"❌ עבודה #{job_id} נכשלה: {result}")
+            else:
+                owned = self.queue.complete(job_id, self.name, result)
+                self._finished(job_id, owned, "completed", f"✅ עבודה #{job_id} הושלמה: {result}")
+        except JobCancelled:
+            owned = self.queue.mark_cancelled(job_id, self.name)
+            self._finished(job_id, owned, "cancelled", f"🚫 עבודה #{job_id} בוטלה")
+        except Exception as e:
+            status = self.queue.fail(job_id, self.name, f"{type(e).__name__}: {e}")
+            self._finished(job_id, status, "retried" if status == "QUEUED" else "failed",
+                           f"❌ עבודה #{job_id} נכשלה ({status}): {e}")
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+            self._wakeup.set()
+
+    def _fill_slots(self) -> bool:
+        """לוקח עבודות עד max_jobs; מחזיר True אם נלקחה לפחות אחת"""
+        claimed = False
+        while not self.draining and len(self._running) < self.max_jobs:
+            job = self.queue.claim(self.name)
+            if job is None:
+                break
+            thread = threading.Thread(target=self._run_job, args=(job,),
+                                      name=f"job-{job['id']}", daemon=True)
+            with self._lock:
+                self._running[job["id"]] = thread
+            thread.start()
+            claimed = True
+        return claimed
+
+    def run(self, exit_when_empty: bool = False) -> Dict:
+        """
+        לולאה ראשית עד drain (או, עם exit_when_empty, עד שאין עבודה מוכנה ואין עבודה שרצה -
+        עבודות שממתינות ל-backoff נשארות בתור)
+
+        Returns:
+            מונים: completed / failed / retried / cancelled / lost
+        """
+        print(f"👷 worker {self.name}: עד {self.max_jobs} ספרים במקביל")
+        last_heartbeat = 0.0
+        last_stale_check = 0.0
+
+        while True:
+            now = time.monotonic()
+            if now - last_stale_check >= self.stale_seconds / 2:
+                requeued = self.queue.requeue_stale(self.stale_seconds)
+                if requeued:
+                    print(f"♻️  {requeued} עבודות של workers שקרסו הוחזרו לתור")
+                last_stale_check = now
+
+            self._wakeup.clear()
+            self._fill_slots()
+
+            if now - last_heartbeat >= self.heartbeat_seconds:
+                with self._lock:
+                    job_ids = list(self._running)
+                self.queue.heartbeat(self.name, job_ids)
+                last_heartbeat = now
+
+            if not self._running and (self.draining or exit_when_empty):
+                break
+
+            self._wakeup.wait(min(self.poll_seconds, self.heartbeat_seconds))
+
+        print(f"👋 worker {self.name} יצא: {self.stats}")
+        return self.stats
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    queue = JobQueue(Path(tempfile.mkdtemp()) / "jobs.db")
+    for name, priority in (("backfill", -10), ("לקוח", 10), ("רגיל", 0)):
+        queue.enqueue({"name": name}, priority=priority)
+
+    def fake_book(payload: Dict, checkpoint: Callable[[str], None]) -> Dict:
+        for stage in ("story", "images", "pdf"):
+            checkpoint(stage)
+            time.sleep(0.05)
+        return {"book": payload["name"]}
+
+    BookWorker(queue, fake_book, max_jobs=1, poll_seconds=0.1).run(exit_when_empty=True)
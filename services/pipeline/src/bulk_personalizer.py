@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Bulk Personalizer - סיפור מאושר אחד לילדים רבים
+
+במקום ריצה מלאה לכל ילד (סיפור, תמונות וניקוד חדשים):
+- הטקסט מותאם לכל ילד מתבנית אחת (StoryPersonalizer - בלי API, או Smart)
+- תמונות התבנית משמשות שוב: שם הילד לא מופיע בתמונה, ועמוד שמתאר את הדמות
+  במגדר אחר מאויר פעם אחת לכל מגדר (variants/<gender>) ומשותף לכל הילדים
+- ניקוד: הטקסט המנוקד של התבנית נשמר פעם אחת, ולכל ילד מנוקדות מחדש רק
+  המילים שהשתנו (שם, צורות זכר) - עם מטמון משותף לכל הילדים
+- כל ה-PDFs נוצרים במקביל ב-process pool (ללא קריאות API בתהליכי העבודה)
+"""
+import re
+import csv
+import json
+from pathlib import Path
+from difflib import SequenceMatcher
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from cost_ledger import ledger_context
+from run_journal import RunJournal, load_run_metadata
+from story_personalizer import StoryPersonalizer, REWRITERS
+
+
+GENDERS = ("boy", "girl")
+
+# StoryPersonalizer ממיר רק מלשון נקבה (REWRITERS["boy"]) - תבנית חייבת להיות של ילדה
+TEMPLATE_GENDER = "girl"
+
+# תווים שאסור שיגיעו משם ילד לשם תיקייה (מפרידי נתיב, תווים אסורים ב-Windows, תווי בקרה)
+_UNSAFE_PATH_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f\s]+')
+
+# ניקוד וטעמים (בלי מקף עברי U+05BE)
+_NIKUD_RE = re.compile("[\u0591-\u05BD\u05BF-\u05C7]")
+
+
+def strip_nikud(text: str) -> str:
+    return _NIKUD_RE.sub("", text)
+
+
+def safe_path_component(name: str, max_length: int = 50) -> str:
+    """שם (למשל של ילד מה-CSV) כרכיב נתיב אחד: בלי '/', '..', רווחים ותווים אסורים"""
+    cleaned = _UNSAFE_PATH_RE.sub("_", name).strip("._")[:max_length]
+    return cleaned or "child"
+
+
+def load_children(path: Path) -> List[Dict]:
+    """
+    טוען רשימת ילדים מ-CSV (עם שורת כותרת) או מ-JSONL
+
+    שדות: name (חובה), gender ("boy" / "girl", חובה), mother_name, father_name
+
+    Raises:
+        ValueError: שורה בלי שם או עם מגדר לא תקין (כולל מספר השורה)
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            rows = [(i, json.loads(line)) for i, line in enumerate(f, 1) if line.strip()]
+        else:
+            rows = list(enumerate(csv.DictReader(f), 2))
+
+    children = []
+    for line_no, row in rows:
+        child = {key: (str(value).strip() if value is not None else "") for key, value in row.items() if key}
+        if not child.get("name"):
+            raise ValueError(f"{path}:{line_no}: missing name")
+        if child.get("gender") not in GENDERS:
+            raise ValueError(f"{path}:{line_no}: gender must be boy/girl, got {child.get('gender')!r}")
+        children.append({
+            "name": child["name"],
+            "gender": child["gender"],
+            "mother_name": child.get("mother_name") or None,
+            "father_name": child.get("father_name") or None
+        })
+    return children
+
+
+class TemplateRun:
+    """
+    ריצה מאושרת שמשמשת תבנית: story/story.json (או story_best / story_v1) ו-images/page_XX.png
+    הסיפור בלשון נקבה (TEMPLATE_GENDER) - זה הכיוון היחיד ש-StoryPersonalizer ממיר ממנו
+    """
+
+    STORY_FILES = ("story.json", "story_best.json", "story_v1.json")
+
+    def __init__(self, run_dir: Path, character_name: str = None):
+        self.run_dir = Path(run_dir)
+        self.story_dir = self.run_dir / "story"
+        self.images_dir = self.run_dir / "images"
+        self.gender = TEMPLATE_GENDER
+
+        story_path = next((self.story_dir / name for name in self.STORY_FILES
+                           if (self.story_dir / name).exists()), None)
+        if story_path is None:
+            raise FileNotFoundError(f"Template story not found in {self.story_dir}")
+        with open(story_path, 'r', encoding='utf-8') as f:
+            self.story_data = json.load(f)
+
+        self.character_name = character_name or self._character_name()
+        self.age = self.story_data['story'].get('target_age', 4)
+        self.pages = {page['page_number']: page for page in self.story_data['story']['pages']}
+
+    def _character_name(self) -> str:
+        """שם הדמות: מהסיפור, מ-run_metadata.json או משם התיקייה (<name>_age<N>_<topic>)"""
+        name = self.story_data.get('character', {}).get('name')
+        if name:
+            return name
+        name = (load_run_metadata(self.run_dir) or {}).get('character_name')
+        if name:
+            return name
+        slug = self.run_dir.parent.name
+        if "_age" in slug:
+            return slug.split("_age")[0].replace("_", " ")
+        raise ValueError(f"Cannot determine the template character name for {self.run_dir}")
+
+    def image_path(self, page_num: int, images_dir: Path = None) -> Optional[Path]:
+        path = (images_dir or self.images_dir) / f"page_{page_num:02d}.png"
+        return path if path.exists() else None
+
+    def vocalized_pages(self, processor) -> Dict[int, str]:
+        """
+        הטקסט המנוקד של התבנית - מחושב פעם אחת ונשמר ב-story/story_nikud.json
+        """
+        nikud_path = self.story_dir / "story_nikud.json"
+        cached = {}
+        if nikud_path.exists():
+            with open(nikud_path, 'r', encoding='utf-8') as f:
+                cached = {int(k): v for k, v in json.load(f).get("pages", {}).items()}
+
+        missing = [n for n in self.pages if cached.get(n) is None]
+        if missing:
+            print(f"🔤 מנקד את התבנית ({len(missing)} עמודים)...")
+            with ledger_context(stage="template_nikud"):
+                for page_num in missing:
+                    with ledger_context(page=page_num):
+                        cached[page_num] = processor.add_nikud(self.pages[page_num]['text'], use_api=True)
+            with open(nikud_path, 'w', encoding='utf-8') as f:
+                json.dump({"pages": {str(k): v for k, v in sorted(cached.items())}},
+                          f, ensure_ascii=False, indent=2)
+        return cached
+
+
+class VariantRun:
+    """
+    הריצה ש-Stage 3 של הריצה המלאה (step3_generate_images) מקבל כשמאיירים עמודי variant:
+    תיקיות images / logs תחת variants/<gender>, ויומן אירועים משלה (QA של כל ניסיון)
+
+    התמונות לא נרשמות באינדקס הריצות - הן שייכות לתיקיית התבנית, לא לריצה חדשה
+    """
+
+    def __init__(self, variant_dir: Path, gender: str):
+        self.base_dir = Path(variant_dir)
+        self.images_dir = self.base_dir / "images"
+        self.logs_dir = self.base_dir / "logs"
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self.journal = RunJournal(self.base_dir)
+        self.journal.record("created", flush=True, metadata={
+            "gender": gender,
+            "created_at": datetime.now().isoformat(),
+            "status": "RUNNING"
+        })
+
+    def log_step(self, step_name: str, data: dict):
+        self.journal.record("log", step=step_name, data=data)
+
+    def record_artifact(self, path: Path, kind: str = None, dedupe: bool = True) -> Path:
+        return Path(path)
+
+    def close(self, error: Optional[Exception] = None):
+        """סוף האיור: סטטוס סופי ביומן ושחרור היומן"""
+        if error is None:
+            self.journal.record("completed", flush=True)
+        else:
+            self.journal.record("failed", flush=True, reason=str(error), stage="images")
+        self.journal.close()
+
+
+class Revocalizer:
+    """
+    מנקד טקסט מותאם לפי התבנית: מילים שלא השתנו לוקחות את הניקוד של התבנית,
+    ורק רצפים שהשתנו נשלחים לניקוד (פעם אחת לכל רצף, לכל הילדים)
+    """
+
+    def __init__(self, processor, template_pages: Dict[int, str], template_nikud: Dict[int, str]):
+        self.processor = processor
+        self.memo: Dict[str, str] = {}
+        self.stats = {"words_reused": 0, "spans_vocalized": 0, "pages_fully_vocalized": 0}
+        # מילים מנוקדות מיושרות למילות התבנית (רק כשהניקוד לא שינה את מספר המילים / אותיות)
+        self._aligned: Dict[int, tuple] = {}
+        for page_num, text in template_pages.items():
+            plain, vocalized = text.split(), (template_nikud.get(page_num) or "").split()
+            if len(plain) == len(vocalized) and all(
+                strip_nikud(v) == p for p, v in zip(plain, vocalized)
+            ):
+                self._aligned[page_num] = (plain, vocalized)
+
+    def _vocalize_span(self, span: str) -> str:
+        if span not in self.memo:
+            self.memo[span] = self.processor.add_nikud(span, use_api=True)
+            self.stats["spans_vocalized"] += 1
+        return self.memo[span]
+
+    def vocalize(self, page_num: int, text: str) -> str:
+        aligned = self._aligned.get(page_num)
+        if aligned is None:
+            # לא ניתן ליישר לתבנית - ניקוד מלא (עדיין משותף לילדים עם אותו טקסט)
+            self.stats["pages_fully_vocalized"] += 1
+            return self._vocalize_span(text)
+
+        plain, vocalized = aligned
+        words = text.split()
+        out: List[str] = []
+        matcher = SequenceMatcher(None, plain, words, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                out.extend(vocalized[i1:i2])
+                self.stats["words_reused"] += i2 - i1
+            elif j2 > j1:
+                out.append(self._vocalize_span(" ".join(words[j1:j2])))
+        return " ".join(out)
+
+
+def _render_book(job: Dict) -> Dict:
+    """תהליך עבודה: PDF של ספר אחד מטקסט מנוקד מוכן (ללא קריאות API)"""
+    from production_pdf_with_nikud import ProductionPDFWithNikud
+
+    pdf = ProductionPDFWithNikud(job["pdf_path"], target_age=job["age"])
+    for page in job["pages"]:
+        image_path = Path(page["image_path"]) if page["image_path"] else None
+        pdf.add_story_page(page["page_number"], page["text"], image_path,
+                           text_with_nikud=page["text_with_nikud"])
+    pdf.save()
+    return {"child": job["child"], "pdf_path": job["pdf_path"]}
+
+
+class BulkPersonalizer:
+    """
+    הפקת ספרים מותאמים לרשימת ילדים מתבנית אחת
+    """
+
+    def __init__(self, template: TemplateRun, output_dir: Path = None, smart: bool = False,
+                 max_workers: int = None,
+                 variant_images: Optional[Callable[[str, Dict, Path], None]] = None):
+        """
+        Args:
+            template: ריצת התבנית
+            output_dir: תיקיית הפלט (ברירת מחדל: data/runs/bulk/<template>_<timestamp>)
+            smart: התאמת טקסט עם Claude (StoryPersonalizerSmart) במקום המילון
+            max_workers: תהליכים ליצירת PDF (ברירת מחדל: מספר המעבדים)
+            variant_images: fn(gender, story_data, images_dir) שמאייר את העמודים הנתונים
+                            למגדר אחר; None = תמונות התבנית לכל העמודים
+        """
+        self.template = template
+        if output_dir is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_dir = Path("data/runs/bulk") / f"{template.run_dir.name}_{timestamp}"
+        self.output_dir = Path(output_dir)
+        self.max_workers = max_workers
+        self.variant_images = variant_images
+
+        if smart:
+            from story_personalizer_smart import StoryPersonalizerSmart
+            self.personalizer = StoryPersonalizerSmart()
+        else:
+            self.personalizer = StoryPersonalizer()
+
+        from hebrew_text_processor import HebrewTextProcessor
+        self.processor = HebrewTextProcessor()
+        self._images: Dict[str, Dict[int, Optional[Path]]] = {}
+
+    def _template_story(self) -> Dict:
+        """התבנית במבנה ש-StoryPersonalizer מצפה לו (character + summary)"""
+        story_data = dict(self.template.story_data)
+        story_data['character'] = {**story_data.get('character', {}), 'name': self.template.character_name}
+        story_data['story'] = {'summary': '', **story_data['story']}
+        return story_data
+
+    def gendered_pages(self, gender: str) -> List[int]:
+        """עמודים שהתיאור הוויזואלי שלהם משתנה עם המגדר - התמונה שלהם לא מתאימה"""
+        rewriter = REWRITERS[gender]
+        if gender == self.template.gender or not rewriter.mapping:
+            return []
+        return [number for number, page in sorted(self.template.pages.items())
+                if rewriter.rewrite(page['visual_description']) != page['visual_description']]
+
+    def images_for(self, gender: str) -> Dict[int, Optional[Path]]:
+        """
+        תמונה לכל עמוד עבור מגדר: של התבנית, או variant משותף לכל הילדים מאותו מגדר
+        (נוצר פעם אחת ונשמר תחת תיקיית התבנית)
+        """
+        if gender in self._images:
+            return self._images[gender]
+
+        images = {number: self.template.image_path(number) for number in self.template.pages}
+        pages = self.gendered_pages(gender) if self.variant_images else []
+        if pages:
+            variant_dir = self.template.run_dir / "variants" / gender / "images"
+            variant_dir.mkdir(parents=True, exist_ok=True)
+            missing = [n for n in pages if self.template.image_path(n, variant_dir) is None]
+            if missing:
+                print(f"🎨 מאייר {len(missing)} עמודים למגדר {gender} (פעם אחת לכל הילדים)")
+                rewriter = REWRITERS[gender]
+                variant_story = {'story': {**self.template.story_data['story'], 'pages': [
+                    {**self.template.pages[n],
+                     'visual_description': rewriter.rewrite(self.template.pages[n]['visual_description'])}
+                    for n in missing
+                ]}}
+                with ledger_context(stage="variant_images"):
+                    self.variant_images(gender, variant_story, variant_dir)
+            for number in pages:
+                images[number] = self.template.image_path(number, variant_dir) or images[number]
+
+        self._images[gender] = images
+        return images
+
+    def run(self, children: List[Dict]) -> Dict:
+        """
+        מפיק ספר לכל ילד
+
+        Returns:
+            manifest (נשמר גם ל-<output_dir>/manifest.json)
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        template_story = self._template_story()
+        template_texts = {n: page['text'] for n, page in self.template.pages.items()}
+        revocalizer = Revocalizer(self.processor, template_texts,
+                                  self.template.vocalized_pages(self.processor))
+
+        print(f"\n✨ מתאים טקסט ל-{len(children)} ילדים...")
+        jobs, entries = [], []
+        for index, child in enumerate(children, 1):
+            child_dir = self.output_dir / f"{index:03d}_{safe_path_component(child['name'])}"
+            (child_dir / "story").mkdir(parents=True, exist_ok=True)
+
+            with ledger_context(stage="personalize"):
+                story_data = self.personalizer.personalize_story(
+                    template_story, child_name=child['name'], child_gender=child['gender'],
+                    mother_name=child['mother_name'], father_name=child['father_name']
+                )
+                with open(child_dir / "story" / "story.json", 'w', encoding='utf-8') as f:
+                    json.dump(story_data, f, ensure_ascii=False, indent=2)
+
+                images = self.images_for(child['gender'])
+                pages = []
+                for page in story_data['story']['pages']:
+                    with ledger_context(page=page['page_number']):
+                        vocalized = revocalizer.vocalize(page['page_number'], page['text'])
+                    image = images.get(page['page_number'])
+                    pages.append({"page_number": page['page_number'], "text": page['text'],
+                                  "text_with_nikud": vocalized,
+                                  "image_path": str(image) if image else None})
+
+            jobs.append({"child": child['name'], "age": self.template.age, "pages": pages,
+                         "pdf_path": str(child_dir / "book.pdf")})
+            entries.append({**child, "dir": str(child_dir), "title": story_data['story']['title'],
+                            "variant_pages": self.gendered_pages(child['gender']) if self.variant_images else []})
+
+        print(f"\n📄 יוצר {len(jobs)} ספרים במקביל...")
+        failures = {}
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(_render_book, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    print(f"   ✅ {job['child']}: {job['pdf_path']}")
+                except Exception as e:
+                    failures[job['pdf_path']] = str(e)
+                    print(f"   ❌ {job['child']}: {e}")
+
+        for entry, job in zip(entries, jobs):
+            entry["pdf_path"] = job["pdf_path"]
+            entry["status"] = "FAILED" if job["pdf_path"] in failures else "COMPLETED"
+            if job["pdf_path"] in failures:
+                entry["error"] = failures[job["pdf_path"]]
+
+        manifest = {
+            "template_run": str(self.template.run_dir),
+            "template_character": self.template.character_name,
+            "created_at": datetime.now().isoformat(),
+            "children": entries,
+            "nikud": revocalizer.stats
+        }
+        with open(self.output_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+
+if __name__ == "__main__":
+    template_pages = {1: "נועה הלכה לגן והיא שמחה"}
+    template_nikud = {1: "נוֹעָה הָלְכָה לַגַּן וְהִיא שְׂמֵחָה"}
+
+    class _DemoProcessor:
+        def add_nikud(self, text, use_api=True):
+            return f"[{text}]"
+
+    revocalizer = Revocalizer(_DemoProcessor(), template_pages, template_nikud)
+    print(revocalizer.vocalize(1, "אדם הלך לגן והוא שמח"))
+    print(revocalizer.stats)
@@ -7,6 +7,8 @@ from pathlib import Path
 from typing import List, Dict
 import anthropic
 import os
+from llm_clients import wrap_anthropic
+from json_extraction import extract_json
 
 
 class CharacterAnalyzer:
@@ -18,7 +20,7 @@ class CharacterAnalyzer:
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY not found")
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = wrap_anthropic(anthropic.Anthropic(api_key=api_key), "character_analysis")
         self.model = "claude-3-5-sonnet-20241022"
     
     def analyze_character_from_images(self, image_paths: List[Path], 
@@ -110,22 +112,14 @@ class CharacterAnalyzer:
         )
         
         # Parse JSON
-        import json
-        response_text = response.content[0].text
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        
-        if json_start != -1 and json_end > json_start:
-            character_data = json.loads(response_text[json_start:json_end])
-            
-            # הוסף מטא-דאטה
-            character_data["name"] = child_name
-            character_data["age"] = age
-            character_data["gender"] = gender
-            
-            return character_data
-        else:
-            raise ValueError("Could not parse character analysis")
+        character_data = extract_json(response.content[0].text)
+
+        # הוסף מטא-דאטה
+        character_data["name"] = child_name
+        character_data["age"] = age
+        character_data["gender"] = gender
+
+        return character_data
 
 
 # Test
@@ -6,13 +6,19 @@ import json
 from anthropic import Anthropic
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
+from llm_clients import wrap_anthropic, cached_system
+from json_extraction import extract_json
+from story_schema import (
+    STORY_TOOL_NAME, PAGES_TOOL_NAME, StoryValidationError,
+    story_tool, pages_tool, validate_pages, validate_header, build_story
+)
 
 load_dotenv()
 
 
 class ClaudeAgent:
     def __init__(self, model: str = None):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = wrap_anthropic(Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY")), "claude_agent")
         self.model = model or os.getenv("CLAUDE_MODEL", "claude-sonnet-4-5-20250929")
 
     def generate_topics(self, num_topics: int = 100, existing_feedback: str = None) -> Dict:
@@ -42,7 +48,8 @@ class ClaudeAgent:
         if existing_feedback:
             user_prompt += f"התחשב במשוב הבא מהמעריך:\n{existing_feedback}\n\n"
 
-        user_prompt += """
+        # הוראות פורמט סטטיות - חלק מה-system הקבוע (cached_system מסמן ל-prompt cache רק מעל המינימום)
+        output_format = """
 נושאים לדוגמה שכדאי להתייחס אליהם:
 - שגרות יומיומיות: שינה, התארגנות בבוקר, צחצוח שיניים
 - חברה וחברות: שיתוף, פתרון קונפליקטים, אמפתיה
@@ -72,20 +79,12 @@ class ClaudeAgent:
             model=self.model,
             max_tokens=16000,
             temperature=1.0,
-            system=system_prompt,
+            system=cached_system(system_prompt + "\n" + output_format, self.model),
             messages=[{"role": "user", "content": user_prompt}]
         )
 
-        # Extract JSON from response
-        content = response.content[0].text
-        # Try to find JSON in the response
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-        if json_start != -1 and json_end > json_start:
-            json_str = content[json_start:json_end]
-            return json.loads(json_str)
-        else:
-            raise ValueError("Could not parse JSON from Claude response")
+        # Extract JSON from response (בלי תיקון - תשובה קטועה היא כשל, לא רשימה חלקית)
+        return extract_json(response.content[0].text, repair=False)
 
     def create_story(self, topic: Dict, character: Dict, style_guide: Dict,
                     existing_feedback: str = None) -> Dict:
@@ -127,7 +126,7 @@ class ClaudeAgent:
         if existing_feedback:
             user_prompt += f"\nמשוב מהאיטרציה הקודמת:\n{existing_feedback}\n\n"
 
-        user_prompt += """
+        output_format = """
 השב בפורמט JSON:
 {
     "title": "שם הספר",
@@ -147,18 +146,109 @@ class ClaudeAgent:
             model=self.model,
             max_tokens=16000,
             temperature=0.9,
-            system=system_prompt,
+            system=cached_system(system_prompt + "\n" + output_format, self.model),
             messages=[{"role": "user", "content": user_prompt}]
         )
 
-        content = response.content[0].text
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-        if json_start != -1 and json_end > json_start:
-            json_str = content[json_start:json_end]
-            return json.loads(json_str)
-        else:
-            raise ValueError("Could not parse JSON from Claude response")
+        # בלי תיקון - סיפור שנקטע באמצע לא חוזר כסיפור תקין עם חלק מהעמודים
+        return extract_json(response.content[0].text, repair=False)
+
+    STORY_REPAIR_SYSTEM = """אתה סופר ספרי ילדים בעברית שמשלים עמודים חסרים בסיפור קיים.
+שמור על רצף העלילה, על הדמויות ועל הסגנון של העמודים הקיימים.
+לכל עמוד: טקסט (לא ריק) ותיאור ויזואלי מפורט לאיור."""
+
+    def generate_story_structured(self, prompt: str, num_pages: int, target_age: int,
+                                  max_tokens: int = 8000, max_repair_rounds: int = 2,
+                                  cache_site: str = None) -> Dict:
+        """
+        יוצר סיפור דרך tool use - התשובה מגיעה כ-JSON לפי הסכמה של story_schema
+
+        עמודים חסרים / פגומים (או כותרת חסרה) מבוקשים מחדש לבד,
+        עד max_repair_rounds סבבים - בלי לייצר שוב את כל הסיפור.
+
+        Returns:
+            {"story": {"title", "target_age", "pages": [...]}} עם בדיוק num_pages עמודים
+
+        Raises:
+            StoryValidationError: אם נשארו עמודים פגומים אחרי כל סבבי התיקון
+        """
+        site = {"cache_site": cache_site} if cache_site else {}
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            tools=[story_tool(num_pages)],
+            tool_choice={"type": "tool", "name": STORY_TOOL_NAME},
+            messages=[{"role": "user", "content": prompt}],
+            **site
+        )
+        data = self.tool_input(response, STORY_TOOL_NAME)
+
+        title = validate_header(data, target_age)
+        pages, invalid = validate_pages(data.get("pages"), num_pages)
+
+        for repair_round in range(1, max_repair_rounds + 1):
+            if not invalid and title:
+                break
+            print(f"   🔧 סבב תיקון {repair_round}: מבקש מחדש עמודים {invalid}"
+                  + ("" if title else " + כותרת"))
+            repaired = self._request_pages(prompt, title, pages, invalid, needs_title=not title)
+            if not title:
+                title = validate_header(repaired, target_age)
+            new_pages, _ = validate_pages(repaired.get("pages"), num_pages)
+            for number in invalid:
+                if number in new_pages:
+                    pages[number] = new_pages[number]
+            invalid = [number for number in range(1, num_pages + 1) if number not in pages]
+
+        if invalid or not title:
+            raise StoryValidationError(
+                f"Story failed schema validation (pages {invalid}, title={'ok' if title else 'missing'})",
+                invalid
+            )
+        return build_story(title, target_age, pages)
+
+    def _request_pages(self, prompt: str, title: Optional[str], pages: Dict,
+                       page_numbers: List[int], needs_title: bool) -> Dict:
+        """בקשה ממוקדת: רק העמודים page_numbers, עם העמודים התקינים כהקשר"""
+        existing = "\n\n".join(
+            f"--- עמוד {number} ---\n{page.text}\n[איור: {page.visual_description}]"
+            for number, page in sorted(pages.items())
+        ) or "(אין)"
+        user_prompt = f"""הבקשה המקורית:
+{prompt}
+
+כותרת: {title or '(חסרה - הצע כותרת)'}
+
+העמודים הקיימים:
+{existing}
+
+כתוב את העמודים {', '.join(map(str, page_numbers))} בלבד, עם page_number תואם."""
+
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=min(8000, 600 * len(page_numbers) + 500),
+            system=self.STORY_REPAIR_SYSTEM,
+            tools=[pages_tool(page_numbers, include_title=needs_title)],
+            tool_choice={"type": "tool", "name": PAGES_TOOL_NAME},
+            messages=[{"role": "user", "content": user_prompt}],
+            cache_site="story_repair"
+        )
+        return self.tool_input(response, PAGES_TOOL_NAME)
+
+    @staticmethod
+    def tool_input(response, tool_name: str) -> Dict:
+        """הקלט של בלוק ה-tool_use (או JSON מהטקסט אם המודל לא קרא לכלי)"""
+        for block in response.content:
+            if block.type == "tool_use" and block.name == tool_name:
+                return block.input if isinstance(block.input, dict) else {}
+        text = "".join(block.text for block in response.content if block.type == "text")
+        try:
+            # תיקון מותר כאן: validate_pages מזהה עמודים חסרים ומבקש אותם מחדש
+            data = extract_json(text)
+        except ValueError:
+            return {}
+        # תשובה בפורמט הישן {"story": {...}}
+        return data.get("story", data) if isinstance(data, dict) else {}
 
     def propose_characters(self, num_characters: int = 10,
                           existing_feedback: str = None) -> Dict:
@@ -174,7 +264,7 @@ class ClaudeAgent:
         if existing_feedback:
             user_prompt += f"משוב:\n{existing_feedback}\n\n"
 
-        user_prompt += """
+        output_format = """
 כל דמות תכלול:
 - שם
 - תיאור פיזי
@@ -200,18 +290,11 @@ class ClaudeAgent:
             model=self.model,
             max_tokens=8000,
             temperature=1.0,
-            system=system_prompt,
+            system=cached_system(system_prompt + "\n" + output_format, self.model),
             messages=[{"role": "user", "content": user_prompt}]
         )
 
-        content = response.content[0].text
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-        if json_start != -1 and json_end > json_start:
-            json_str = content[json_start:json_end]
-            return json.loads(json_str)
-        else:
-            raise ValueError("Could not parse JSON from Claude response")
+        return extract_json(response.content[0].text, repair=False)
 
 
 # Test
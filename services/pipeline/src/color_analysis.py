@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Color Analysis - ניתוח צבע ובהירות של אזור בתמונה לבחירת צבע טקסט
+
+במקום Counter על כל פיקסל (איטי, זולל זיכרון ורועש בגרדיאנטים - הצבע
+המדויק הנפוץ ביותר חסר משמעות):
+- האזור מוקטן קודם (reduce - ממוצע בלוקים) לכמה אלפי פיקסלים לכל היותר
+- צבע דומיננטי = התא הגדול ביותר בהיסטוגרמה גסה (3 ביטים לערוץ) - עמיד לגרדיאנטים
+- בהירות וניגודיות = ImageStat על ערוץ הבהירות (ממוצע וסטיית תקן)
+כל הסריקות רצות ב-C של Pillow - בלי לולאות Python על פיקסלים
+"""
+import math
+import contextlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps, ImageStat
+
+from production_pdf_with_nikud import PAGE_SIZE, TEXT_AREA_RATIO, TEXT_RIGHT_MARGIN, TEXT_VERTICAL_MARGIN
+
+# סף בהירות (0-255) שמעליו טקסט כהה קריא יותר מטקסט בהיר
+LIGHT_BACKGROUND_LUMINANCE = 140
+
+
+def text_column_bounds(width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    גבולות עמודת הטקסט (x, y, רוחב, גובה) בפיקסלים של התמונה
+
+    הפריסה של production_pdf_with_nikud מוגדרת בנקודות על עמוד PAGE_SIZE,
+    והתמונה נמתחת לכל העמוד - אז השוליים מוקטנים לפי גודל התמונה
+    """
+    page_width, page_height = PAGE_SIZE
+    column_width = int(width * TEXT_AREA_RATIO)
+    right_margin = round(TEXT_RIGHT_MARGIN * width / page_width)
+    vertical_margin = round(TEXT_VERTICAL_MARGIN * height / page_height)
+    x_start = width - right_margin - column_width
+    return (x_start, vertical_margin, column_width, height - 2 * vertical_margin)
+
+
+def _open(image: Union[Path, str, Image.Image]):
+    """context manager: קובץ נפתח ונסגר ביציאה; תמונת PIL קיימת מוחזרת כמו שהיא ולא נסגרת"""
+    if isinstance(image, Image.Image):
+        return contextlib.nullcontext(image)
+    return Image.open(image)
+
+
+def _sample(img: Image.Image, box: Optional[Tuple[int, int, int, int]], max_side: int) -> Image.Image:
+    """
+    האזור מוקטן כך שהצלע הארוכה לכל היותר max_side
+    reduce עם box = חיתוך + ממוצע בלוקים בפעולה אחת, בלי להעתיק את האזור המלא
+    """
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if box is None:
+        box = (0, 0, img.width, img.height)
+    factor = max(1, -(-max(box[2] - box[0], box[3] - box[1]) // max_side))
+    return img.reduce(factor, box=box).convert("RGB")
+
+
+def _draft_jpeg(img: Image.Image, box: Optional[Tuple[int, int, int, int]],
+                max_side: int) -> Tuple[Image.Image, Optional[Tuple[int, int, int, int]]]:
+    """
+    פענוח JPEG מוקטן ישירות (DCT scaling, עד 1/8) - לא מפענחים רזולוציה מלאה
+    קנה המידה נבחר לפי האזור: הצלע הארוכה שלו נשארת לפחות max_side
+    והקצרה לפחות פיקסל אחד, כך שאזור קטן לא מתעגל לתיבה ריקה
+    """
+    full_width, full_height = img.size
+    left, top, right, bottom = box if box is not None else (0, 0, full_width, full_height)
+    box_long = max(right - left, bottom - top, 1)
+    box_short = max(min(right - left, bottom - top), 1)
+    scale = min(1.0, max(max_side / box_long, 1 / box_short))
+    img.draft("RGB", (math.ceil(full_width * scale), math.ceil(full_height * scale)))
+    if box is None or img.size == (full_width, full_height):
+        return img, box
+
+    # קצוות האזור מעוגלים החוצה - האזור המוקטן מכסה את כל המקורי
+    scale_x = img.width / full_width
+    scale_y = img.height / full_height
+    return img, (math.floor(left * scale_x), math.floor(top * scale_y),
+                 min(img.width, math.ceil(right * scale_x)),
+                 min(img.height, math.ceil(bottom * scale_y)))
+
+
+def analyze_region(image: Union[Path, str, Image.Image],
+                   box: Optional[Tuple[int, int, int, int]] = None,
+                   max_side: int = 64, bits: int = 3) -> Dict:
+    """
+    צבע דומיננטי, בהירות ממוצעת וניגודיות של אזור בתמונה
+
+    Args:
+        image: נתיב או תמונת PIL
+        box: (left, top, right, bottom) - None = כל התמונה
+        max_side: גודל הדגימה (הצלע הארוכה) לפני הניתוח
+        bits: ביטים לערוץ בהיסטוגרמה (3 = 512 תאי צבע)
+
+    Returns:
+        {"dominant": (r, g, b), "dominant_share": 0-1, "mean": (r, g, b),
+         "luminance": 0-255, "contrast": סטיית תקן של הבהירות}
+    """
+    with _open(image) as img:
+        if img is not image and img.format == "JPEG":
+            img, box = _draft_jpeg(img, box, max_side)
+        sample = _sample(img, box, max_side)
+
+    # היסטוגרמה גסה: כל ערוץ מעוגל ל-bits ביטים, התא הגדול ביותר = הצבע הדומיננטי (מרכז התא)
+    binned = ImageOps.posterize(sample, bits)
+    count, color = max(binned.getcolors(sample.width * sample.height))
+    half_bin = (1 << (8 - bits)) // 2
+    dominant = tuple(min(255, channel + half_bin) for channel in color)
+
+    rgb_stat = ImageStat.Stat(sample)
+    luma_stat = ImageStat.Stat(sample.convert("L"))
+    return {
+        "dominant": dominant,
+        "dominant_share": round(count / (sample.width * sample.height), 3),
+        "mean": tuple(int(round(v)) for v in rgb_stat.mean),
+        "luminance": round(luma_stat.mean[0], 1),
+        "contrast": round(luma_stat.stddev[0], 1)
+    }
+
+
+def analyze_text_column(image: Union[Path, str, Image.Image], **kwargs) -> Dict:
+    """analyze_region על עמודת הטקסט הנעולה (35% מימין)"""
+    if isinstance(image, Image.Image):
+        size = image.size
+    else:
+        with Image.open(image) as img:
+            size = img.size
+    x, y, width, height = text_column_bounds(*size)
+    return analyze_region(image, (x, y, x + width, y + height), **kwargs)
+
+
+def choose_text_colors(stats: Dict) -> Tuple[Tuple[int, int, int], Tuple[int, int, int, int]]:
+    """
+    צבע טקסט והצללה לפי הרקע:
+    רקע בהיר -> טקסט כהה עם הצללה בהירה, רקע כהה -> טקסט לבן עם הצללה כהה
+    רקע "עמוס" (ניגודיות גבוהה) מקבל הצללה חזקה יותר
+
+    Returns:
+        (text_rgb, shadow_rgba)
+    """
+    opacity = int(min(200, 90 + stats["contrast"] * 2))
+    if stats["luminance"] >= LIGHT_BACKGROUND_LUMINANCE:
+        return (0, 0, 0), (255, 255, 255, opacity)
+    return (255, 255, 255), (0, 0, 0, opacity)
+
+
+if __name__ == "__main__":
+    import time
+
+    demo = Image.linear_gradient("L").resize((1024, 768)).convert("RGB")
+    start = time.perf_counter()
+    stats = analyze_text_column(demo)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    print(f"🎨 עמודת טקסט: {stats} ({elapsed_us:.0f}µs)")
+    print(f"   צבעים: {choose_text_colors(stats)}")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Cost Ledger - יומן עלויות וזמנים לכל קריאת API בריצה
+נרשם מתוך שדות ה-usage האמיתיים של התשובה (לא אומדן לפי אורך טקסט)
+
+כל שורה ב-JSONL היא קריאה אחת: מודל, נקודת קריאה, שלב, עמוד,
+טוקנים (כולל קריאה/כתיבה של prompt cache), זמן, ועלות בדולרים.
+"""
+import json
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+# מחירון (דולר למיליון טוקנים) לפי prefix של משפחת מודל
+# ההתאמה היא לפי ה-prefix הארוך ביותר, כך ש-"gpt-4o-mini" לא מתומחר כ-"gpt-4o"
+# cache_write / cache_read = מחיר טוקני prompt cache (Anthropic: כתיבה 1.25x, קריאה 0.1x)
+MODEL_PRICING = {
+    "claude-opus-4-5": {"input": 5.0, "output": 25.0, "cache_write": 6.25, "cache_read": 0.50},
+    "claude-opus-4": {"input": 15.0, "output": 75.0, "cache_write": 18.75, "cache_read": 1.50},
+    "claude-sonnet-4": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-7-sonnet": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-5-sonnet": {"input": 3.0, "output": 15.0, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-haiku-4-5": {"input": 1.0, "output": 5.0, "cache_write": 1.25, "cache_read": 0.10},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.0, "cache_write": 1.0, "cache_read": 0.08},
+    "claude-3-haiku": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "cache_read": 0.075},
+    "gpt-4o": {"input": 2.50, "output": 10.0, "cache_read": 1.25},
+    "gemini-2.0-flash-exp": {"input": 0.0, "output": 0.0},  # ניסיוני - חינם!
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40, "cache_read": 0.025},
+    "gemini-2.5-flash-image": {"input": 0.30, "output": 30.0},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cache_read": 0.075},
+    "gemini-3-pro-image": {"input": 2.0, "output": 120.0},
+}
+
+
+def get_model_pricing(model: str) -> Optional[Dict]:
+    """
+    מחזיר מחירון למודל לפי ה-prefix הארוך ביותר שמתאים
+    None = מודל לא מוכר (לא מנחשים - עדיף עלות 0 מסומנת מאשר מחיר שגוי)
+    """
+    if not model:
+        return None
+    name = model.split("/")[-1]  # "models/gemini-..." -> "gemini-..."
+    matches = [prefix for prefix in MODEL_PRICING if name.startswith(prefix)]
+    if not matches:
+        return None
+    return MODEL_PRICING[max(matches, key=len)]
+
+
+def calculate_cost(model: str, input_tokens: int, output_tokens: int,
+                   cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> float:
+    """
+    עלות בדולרים של קריאה אחת
+
+    Args:
+        input_tokens: טוקני קלט שלא מהמטמון
+        cache_read_tokens / cache_write_tokens: טוקני prompt cache
+    """
+    pricing = get_model_pricing(model)
+    if pricing is None:
+        return 0.0
+
+    input_price = pricing["input"]
+    return (
+        input_tokens * input_price
+        + output_tokens * pricing["output"]
+        + cache_read_tokens * pricing.get("cache_read", input_price)
+        + cache_write_tokens * pricing.get("cache_write", input_price)
+    ) / 1_000_000
+
+
+# שלב ועמוד נוכחיים - עוברים אוטומטית ל-asyncio tasks
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("ledger_stage", default=None)
+_current_page: contextvars.ContextVar = contextvars.ContextVar("ledger_page", default=None)
+
+
+@contextmanager
+def ledger_context(stage: str = None, page: int = None):
+    """
+    מסמן את כל הקריאות בתוך הבלוק בשלב / עמוד
+
+    Example:
+        with ledger_context(stage="images", page=3):
+            image_gen.generate_image(...)
+    """
+    tokens = []
+    if stage is not None:
+        tokens.append((_current_stage, _current_stage.set(stage)))
+    if page is not None:
+        tokens.append((_current_page, _current_page.set(page)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CostLedger:
+    """
+    יומן עלויות של ריצה אחת - נשמר כ-JSONL (שורה לכל קריאה, נכתב מיד)
+    """
+
+    TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "CostLedger":
+        """טוען יומן קיים (למשל לדוח על ריצה שהסתיימה)"""
+        ledger = cls(path)
+        if ledger.path.exists():
+            with open(ledger.path, 'r', encoding='utf-8') as f:
+                ledger.entries = [json.loads(line) for line in f if line.strip()]
+        return ledger
+
+    def record(self, provider: str, model: str, call_site: str, usage: Dict,
+               latency_s: float, cache_hit: bool = False,
+               stage: str = None, page: int = None) -> Dict:
+        """
+        רושם קריאה אחת
+
+        Args:
+            usage: input_tokens / output_tokens / cache_read_tokens / cache_write_tokens
+            cache_hit: התשובה הגיעה ממטמון ה-LLM המקומי (לא חויבה)
+        """
+        tokens = {field: int(usage.get(field) or 0) for field in self.TOKEN_FIELDS}
+        cost = calculate_cost(model, **tokens)
+
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "provider": provider,
+            "model": model,
+            "call_site": call_site,
+            "stage": stage if stage is not None else _current_stage.get(),
+            "page": page if page is not None else _current_page.get(),
+            **tokens,
+            "latency_s": round(latency_s, 3),
+            "cache_hit": cache_hit,
+            "cost_usd": 0.0 if cache_hit else cost,
+            "saved_usd": cost if cache_hit else 0.0,
+            "priced": get_model_pricing(model) is not None
+        }
+
+        with self._lock:
+            self.entries.append(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        return entry
+
+    @classmethod
+    def _aggregate(cls, entries: List[Dict]) -> Dict:
+        totals = {
+            "calls": len(entries),
+            "cache_hits": sum(1 for e in entries if e.get("cache_hit")),
+            **{field: sum(e.get(field, 0) for e in entries) for field in cls.TOKEN_FIELDS},
+            "cost_usd": round(sum(e.get("cost_usd", 0) for e in entries), 6),
+            "saved_usd": round(sum(e.get("saved_usd", 0) for e in entries), 6),
+            "latency_s": round(sum(e.get("latency_s", 0) for e in entries), 3)
+        }
+        cacheable = totals["input_tokens"] + totals["cache_read_tokens"] + totals["cache_write_tokens"]
+        totals["prompt_cache_hit_rate"] = (
+            round(totals["cache_read_tokens"] / cacheable, 3) if cacheable else 0.0
+        )
+        return totals
+
+    def _group_by(self, field: str) -> Dict:
+        groups: Dict[str, List[Dict]] = {}
+        for entry in self.entries:
+            key = entry.get(field)
+            groups.setdefault("-" if key is None else str(key), []).append(entry)
+        return {key: self._aggregate(items) for key, items in groups.items()}
+
+    def summarize(self) -> Dict:
+        """סיכום כולל + לפי שלב, עמוד, נקודת קריאה ומודל"""
+        with self._lock:
+            return {
+                "total": self._aggregate(self.entries),
+                "by_stage": self._group_by("stage"),
+                "by_page": self._group_by("page"),
+                "by_call_site": self._group_by("call_site"),
+                "by_model": self._group_by("model"),
+                "unpriced_models": sorted({e["model"] for e in self.entries
+                                           if not e.get("priced") and e.get("model")})
+            }
+
+    def get_total_cost(self) -> float:
+        """עלות כוללת בדולרים"""
+        return sum(e.get("cost_usd", 0) for e in self.entries)
+
+    def print_report(self):
+        """מדפיס דוח עלויות לפי שלב"""
+        summary = self.summarize()
+        total = summary["total"]
+
+        print("\n" + "="*60)
+        print("💰 דוח עלויות (usage אמיתי)")
+        print("="*60)
+
+        for stage, data in summary["by_stage"].items():
+            print(f"  {stage}: ${data['cost_usd']:.4f} "
+                  f"({data['calls']} קריאות, {data['latency_s']:.1f}s)")
+
+        print(f"\n  📊 סה\"כ: ${total['cost_usd']:.4f} | {total['calls']} קריאות | "
+              f"{total['input_tokens']}→{total['output_tokens']} tokens")
+        if total["cache_hits"]:
+            print(f"  📦 מטמון LLM: {total['cache_hits']} קריאות, נחסכו ${total['saved_usd']:.4f}")
+        if total["cache_read_tokens"] or total["cache_write_tokens"]:
+            print(f"  ⚡ prompt cache: {total['prompt_cache_hit_rate']:.0%} מטוקני הקלט נקראו מהמטמון")
+            for call_site, data in summary["by_call_site"].items():
+                if data["cache_read_tokens"] or data["cache_write_tokens"]:
+                    print(f"     {call_site}: {data['prompt_cache_hit_rate']:.0%}")
+        if summary["unpriced_models"]:
+            print(f"  ⚠️  מודלים ללא מחירון: {', '.join(summary['unpriced_models'])}")
+        print("="*60)
+
+
+_active_ledger: Optional[CostLedger] = None
+# היומן של ה-thread / task הנוכחי - worker שמריץ כמה ספרים במקביל (thread לכל ספר)
+# רושם כל קריאה ליומן של הספר שלה ולא לזה שנקבע אחרון בתהליך
+_context_ledger: contextvars.ContextVar = contextvars.ContextVar("active_ledger", default=None)
+
+
+def set_active_ledger(ledger: Optional[CostLedger]):
+    """קובע את היומן שאליו נרשמות כל הקריאות בתהליך (וב-thread הנוכחי)"""
+    global _active_ledger
+    _active_ledger = ledger
+    _context_ledger.set(ledger)
+
+
+def get_active_ledger() -> Optional[CostLedger]:
+    return _context_ledger.get() or _active_ledger
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    fn שרץ ב-thread אחר (ThreadPoolExecutor) עם היומן, השלב והעמוד של הקורא
+    contextvars לא עוברים ל-threads חדשים לבד; כל קריאה מקבלת עותק משלה של ה-context
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def record_usage(provider: str, model: str, call_site: str, usage: Dict,
+                 latency_s: float, cache_hit: bool = False) -> Optional[Dict]:
+    """רושם ביומן הפעיל (אם אין יומן פעיל - לא עושה כלום)"""
+    ledger = get_active_ledger()
+    if ledger is None:
+        return None
+    return ledger.record(provider, model, call_site, usage, latency_s, cache_hit)
+
+
+if __name__ == "__main__":
+    ledger = CostLedger(Path("/tmp/cost_ledger_demo.jsonl"))
+    with ledger_context(stage="story"):
+        ledger.record("anthropic", "claude-sonnet-4-5-20250929", "story_generation",
+                      {"input_tokens": 1200, "output_tokens": 3000}, 42.0)
+    with ledger_context(stage="pdf", page=1):
+        ledger.record("anthropic", "claude-sonnet-4-5-20250929", "nikud",
+                      {"input_tokens": 80, "output_tokens": 200, "cache_read_tokens": 1500}, 3.1)
+    ledger.print_report()
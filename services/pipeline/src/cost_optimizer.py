@@ -5,9 +5,11 @@ Cost Optimizer - מערכת לאופטימיזציה של עלויות
 import os
 from typing import Dict, List, Tuple
 from dotenv import load_dotenv
-from anthropic import Anthropic
-from openai import OpenAI
+from anthropic import Anthropic, AsyncAnthropic
+from openai import OpenAI, AsyncOpenAI
 import google.generativeai as genai
+from llm_clients import LoopLocalClient, wrap_anthropic, wrap_openai
+from cost_ledger import MODEL_PRICING, calculate_cost
 
 load_dotenv()
 
@@ -17,14 +19,8 @@ class CostOptimizer:
     מנהל את המודלים בצורה חסכונית
     """
 
-    # מחירון (למיליון טוקנים)
-    PRICING = {
-        "claude-sonnet-4-5": {"input": 3.0, "output": 15.0},
-        "claude-haiku-3-5": {"input": 0.25, "output": 1.25},
-        "gpt-4o": {"input": 2.5, "output": 10.0},
-        "gpt-4o-mini": {"input": 0.15, "output": 0.6},
-        "gemini-flash": {"input": 0.0, "output": 0.0}  # חינם!
-    }
+    # מחירון (למיליון טוקנים) - משותף עם יומן העלויות
+    PRICING = MODEL_PRICING
 
     def __init__(self):
         self.total_cost = 0.0
@@ -52,21 +48,24 @@ class CostOptimizer:
 
     def estimate_tokens(self, text: str) -> int:
         """
-        אומדן גס של מספר טוקנים
+        אומדן גס של מספר טוקנים - רק לתכנון לפני קריאה
+        (העלות בפועל נרשמת מה-usage של התשובה)
         בערך 1 טוקן = 4 תווים באנגלית, 2-3 תווים בעברית
         """
         # עברית = בערך 2.5 תווים לטוקן
         return int(len(text) / 2.5)
 
-    def log_request(self, model: str, input_tokens: int, output_tokens: int) -> float:
+    def log_request(self, model: str, input_tokens: int, output_tokens: int,
+                    cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> float:
         """
         רושם בקשה ומחשב עלות
-        """
-        pricing = self._get_pricing_for_model(model)
 
-        input_cost = (input_tokens / 1_000_000) * pricing["input"]
-        output_cost = (output_tokens / 1_000_000) * pricing["output"]
-        total_cost = input_cost + output_cost
+        Args:
+            input_tokens: טוקני קלט שלא מה-prompt cache
+            cache_read_tokens / cache_write_tokens: טוקני prompt cache
+        """
+        total_cost = calculate_cost(model, input_tokens, output_tokens,
+                                    cache_read_tokens, cache_write_tokens)
 
         self.total_cost += total_cost
 
@@ -74,26 +73,13 @@ class CostOptimizer:
             "model": model,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
             "cost": total_cost
         })
 
         return total_cost
 
-    def _get_pricing_for_model(self, model: str) -> Dict:
-        """מחזיר מחירון למודל"""
-        if "haiku" in model:
-            return self.PRICING["claude-haiku-3-5"]
-        elif "sonnet" in model or "claude" in model:
-            return self.PRICING["claude-sonnet-4-5"]
-        elif "mini" in model:
-            return self.PRICING["gpt-4o-mini"]
-        elif "gpt-4o" in model:
-            return self.PRICING["gpt-4o"]
-        elif "gemini" in model:
-            return self.PRICING["gemini-flash"]
-        else:
-            return {"input": 0, "output": 0}
-
     def get_total_cost(self) -> float:
         """מחזיר עלות כוללת"""
         return self.total_cost
@@ -155,30 +141,38 @@ class CostEfficientClaudeAgent:
     Claude Agent חסכוני
     משתמש בפונקציות של CostOptimizer
     """
+    SELF_EVALUATION_SYSTEM = "אתה מעריך תוכן לפי קריטריונים."
+
     def __init__(self, cost_optimizer: CostOptimizer):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = wrap_anthropic(Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY")),
+                                     "cost_efficient_claude")
+        # לקוח לכל event loop - כל סבב מקבילי רץ ב-asyncio.run משלו
+        self.async_client = LoopLocalClient(lambda: wrap_anthropic(
+            AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY")), "cost_efficient_claude"
+        ))
         self.optimizer = cost_optimizer
 
-    def generate_with_model(self, prompt: str, system: str,
-                           model: str = None, temperature: float = 1.0) -> Dict:
-        """
-        יוצר תוכן עם מודל ספציפי ורושם עלות
-        """
-        if model is None:
-            model = self.optimizer.get_cheap_claude()
-
-        response = self.client.messages.create(
-            model=model,
-            max_tokens=8000,
-            temperature=temperature,
-            system=system,
-            messages=[{"role": "user", "content": prompt}]
-        )
+    def _request_params(self, prompt: str, system: str, model: str,
+                        temperature: float, deterministic: bool, variant: str) -> Dict:
+        return {
+            "model": model,
+            "max_tokens": 8000,
+            "temperature": temperature,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}],
+            "cache_deterministic": deterministic,
+            "cache_variant": variant
+        }
 
+    def _log_response(self, model: str, response) -> Dict:
         # רישום עלות
         input_tokens = response.usage.input_tokens
         output_tokens = response.usage.output_tokens
-        cost = self.optimizer.log_request(model, input_tokens, output_tokens)
+        cost = self.optimizer.log_request(
+            model, input_tokens, output_tokens,
+            cache_read_tokens=response.usage.cache_read_input_tokens or 0,
+            cache_write_tokens=response.usage.cache_creation_input_tokens or 0
+        )
 
         print(f"  💰 {model}: ${cost:.4f} ({input_tokens}→{output_tokens} tokens)")
 
@@ -188,11 +182,35 @@ class CostEfficientClaudeAgent:
             "model": model
         }
 
-    def self_evaluate(self, content: str, criteria: str) -> float:
+    def generate_with_model(self, prompt: str, system: str,
+                           model: str = None, temperature: float = 1.0,
+                           deterministic: bool = None, variant: str = None) -> Dict:
         """
-        הערכה עצמית זולה של Claude לפני שליחה ל-OpenAI
+        יוצר תוכן עם מודל ספציפי ורושם עלות
+
+        Args:
+            deterministic: סימון למטמון LLM (None = לפי temperature)
+            variant: מזהה מועמד - מועמדים מקבילים לאותו פרומפט לא חולקים רשומת מטמון
         """
-        prompt = f"""דרג את התוכן הבא לפי הקריטריונים.
+        model = model or self.optimizer.get_cheap_claude()
+        response = self.client.messages.create(
+            **self._request_params(prompt, system, model, temperature, deterministic, variant)
+        )
+        return self._log_response(model, response)
+
+    async def generate_with_model_async(self, prompt: str, system: str,
+                                        model: str = None, temperature: float = 1.0,
+                                        deterministic: bool = None, variant: str = None) -> Dict:
+        """כמו generate_with_model - לריצה מקבילה של כמה מועמדים"""
+        model = model or self.optimizer.get_cheap_claude()
+        response = await self.async_client.messages.create(
+            **self._request_params(prompt, system, model, temperature, deterministic, variant)
+        )
+        return self._log_response(model, response)
+
+    @staticmethod
+    def _self_evaluation_prompt(content: str, criteria: str) -> str:
+        return f"""דרג את התוכן הבא לפי הקריטריונים.
 תן רק ציון מספרי בין 0-100.
 
 קריטריונים:
@@ -203,18 +221,36 @@ class CostEfficientClaudeAgent:
 
 השב רק במספר, ללא הסבר."""
 
+    @staticmethod
+    def _parse_score(response: Dict) -> float:
+        try:
+            return float(response["content"].strip())
+        except ValueError:
+            return 0
+
+    def self_evaluate(self, content: str, criteria: str) -> float:
+        """
+        הערכה עצמית זולה של Claude לפני שליחה ל-OpenAI
+        """
         response = self.generate_with_model(
-            prompt=prompt,
-            system="אתה מעריך תוכן לפי קריטריונים.",
+            prompt=self._self_evaluation_prompt(content, criteria),
+            system=self.SELF_EVALUATION_SYSTEM,
             model=self.optimizer.get_cheap_claude(),
-            temperature=0.3
+            temperature=0.3,
+            deterministic=True
         )
+        return self._parse_score(response)
 
-        try:
-            score = float(response["content"].strip())
-            return score
-        except:
-            return 0
+    async def self_evaluate_async(self, content: str, criteria: str) -> float:
+        """כמו self_evaluate - לסינון מקבילי של מועמדים"""
+        response = await self.generate_with_model_async(
+            prompt=self._self_evaluation_prompt(content, criteria),
+            system=self.SELF_EVALUATION_SYSTEM,
+            model=self.optimizer.get_cheap_claude(),
+            temperature=0.3,
+            deterministic=True
+        )
+        return self._parse_score(response)
 
 
 class CostEfficientOpenAIAgent:
@@ -222,31 +258,34 @@ class CostEfficientOpenAIAgent:
     OpenAI Agent חסכוני
     """
     def __init__(self, cost_optimizer: CostOptimizer):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = wrap_openai(OpenAI(api_key=os.getenv("OPENAI_API_KEY")),
+                                  "cost_efficient_evaluation", deterministic=True)
+        self.async_client = LoopLocalClient(lambda: wrap_openai(
+            AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")), "cost_efficient_evaluation",
+            deterministic=True
+        ))
         self.optimizer = cost_optimizer
 
-    def evaluate_with_model(self, content: str, criteria: str,
-                           model: str = None) -> Dict:
-        """
-        מעריך תוכן עם מודל ספציפי
-        """
-        if model is None:
-            model = self.optimizer.get_cheap_openai()
-
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=[
+    @staticmethod
+    def _request_params(content: str, criteria: str, model: str) -> Dict:
+        return {
+            "model": model,
+            "messages": [
                 {"role": "system", "content": "אתה מעריך תוכן לספרי ילדים."},
                 {"role": "user", "content": f"{criteria}\n\n{content}"}
             ],
-            temperature=0.3,
-            response_format={"type": "json_object"}
-        )
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"}
+        }
 
-        # רישום עלות
-        input_tokens = response.usage.prompt_tokens
+    def _log_response(self, model: str, response) -> Dict:
+        # רישום עלות (prompt_tokens כולל את הטוקנים מה-prompt cache)
+        details = response.usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+        input_tokens = response.usage.prompt_tokens - cached_tokens
         output_tokens = response.usage.completion_tokens
-        cost = self.optimizer.log_request(model, input_tokens, output_tokens)
+        cost = self.optimizer.log_request(model, input_tokens, output_tokens,
+                                          cache_read_tokens=cached_tokens)
 
         print(f"  💰 {model}: ${cost:.4f} ({input_tokens}→{output_tokens} tokens)")
 
@@ -256,6 +295,26 @@ class CostEfficientOpenAIAgent:
             "model": model
         }
 
+    def evaluate_with_model(self, content: str, criteria: str,
+                           model: str = None) -> Dict:
+        """
+        מעריך תוכן עם מודל ספציפי
+        """
+        model = model or self.optimizer.get_cheap_openai()
+        response = self.client.chat.completions.create(
+            **self._request_params(content, criteria, model)
+        )
+        return self._log_response(model, response)
+
+    async def evaluate_with_model_async(self, content: str, criteria: str,
+                                        model: str = None) -> Dict:
+        """כמו evaluate_with_model - להערכה מקבילה של המועמדים המובילים"""
+        model = model or self.optimizer.get_cheap_openai()
+        response = await self.async_client.chat.completions.create(
+            **self._request_params(content, criteria, model)
+        )
+        return self._log_response(model, response)
+
 
 # דוגמה לשימוש
 if __name__ == "__main__":
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Fingerprint Store - היסטוריית fingerprints ב-SQLite
+
+במקום קובץ JSON אחד שנקרא ונכתב מחדש בכל סיפור:
+- הוספה היא INSERT אחד (O(1), לא תלוי בגודל ההיסטוריה)
+- "N אחרונים בסדרה" היא שאילתה על אינדקס (series, id)
+- WAL + busy_timeout - כמה תהליכים יכולים לכתוב במקביל בלי לדרוס זה את זה
+- מיגרציה חד-פעמית מ-fingerprints_history.json (מסומנת בטבלת meta)
+- מוני דפוסים מצטברים (prefix counts) לכל scope (כל הסיפורים / סדרה):
+  "כמה מ-N האחרונים עם אותו דפוס" = הפרש של שני מונים - בלי לטעון את ה-N
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+# scope של כל הסיפורים (סדרות נשמרות בנוסף תחת שמן)
+ALL_SCOPE = "*"
+
+# הממדים שנספרים - כל אחד הוא שדה ב-patterns, ו-"structure" הוא הצירוף הרגשי
+PATTERN_DIMENSIONS = (
+    "conflict_type", "truth_moment_type", "solution_mechanism", "adult_role",
+    "pacing_profile", "ending_tone", "symbolic_object", "structure"
+)
+
+
+def pattern_values(patterns: Dict) -> Dict[str, str]:
+    """ערכי הממדים של fingerprint (ממדים ללא ערך - למשל אין חפץ סמלי - לא נספרים)"""
+    values = {dim: patterns.get(dim) for dim in PATTERN_DIMENSIONS if dim != "structure"}
+    if all(values.get(dim) for dim in ("conflict_type", "truth_moment_type", "ending_tone")):
+        values["structure"] = structure_key(patterns)
+    return {dim: value for dim, value in values.items() if value}
+
+
+def structure_key(patterns: Dict) -> str:
+    """המבנה הרגשי: conflict + truth_moment + ending"""
+    return f"{patterns['conflict_type']}→{patterns['truth_moment_type']}→{patterns['ending_tone']}"
+
+
+class PatternWindow:
+    """
+    חלון של N הסיפורים האחרונים ב-scope - מספר מופעים לכל ערך של כל ממד
+
+    נבנה מהמונים במאגר (שתי שאילתות אינדקס לכל ערך, לא תלוי בגודל ההיסטוריה)
+    או מרשימת fingerprints (from_fingerprints) - לאותן בדיקות בדיוק.
+    """
+
+    def __init__(self, size: int, counts=None, store: "FingerprintStore" = None,
+                 scope: str = None, start_seq: int = 0):
+        self.size = size
+        self._counts: Dict[tuple, int] = counts or {}
+        self._store = store
+        self._scope = scope
+        self._start_seq = start_seq
+
+    @classmethod
+    def from_fingerprints(cls, fingerprints: List[Dict]) -> "PatternWindow":
+        counts = Counter(
+            (dim, value)
+            for fp in fingerprints
+            for dim, value in pattern_values(fp["patterns"]).items()
+        )
+        return cls(len(fingerprints), dict(counts))
+
+    def count(self, dimension: str, value: str) -> int:
+        """כמה סיפורים בחלון עם value בממד dimension"""
+        key = (dimension, value)
+        if key not in self._counts:
+            self._counts[key] = (
+                self._store._window_count(self._scope, dimension, value, self._start_seq)
+                if self._store is not None and value else 0
+            )
+        return self._counts[key]
+
+    def counter(self, dimension: str) -> Dict[str, int]:
+        """התפלגות הערכים של ממד בחלון (ללא ערכים עם 0 מופעים)"""
+        values = (self._store._values(self._scope, dimension) if self._store is not None
+                  else [value for dim, value in self._counts if dim == dimension])
+        counts = {value: self.count(dimension, value) for value in values}
+        return {value: count for value, count in counts.items() if count}
+
+
+class FingerprintStore:
+    """
+    מאגר fingerprints מבוסס SQLite
+    הסדר הכרונולוגי נשמר לפי id (סדר ההוספה), כמו סדר הרשימה בקובץ ה-JSON
+    """
+
+    BUSY_TIMEOUT_MS = 30000
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        story_id TEXT,
+        series TEXT,
+        created_at TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_series ON fingerprints(series, id);
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_story ON fingerprints(story_id);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS scopes (
+        scope TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL
+    );
+    -- מונה מצטבר: כמה סיפורים ב-scope עד seq (כולל) עם value בממד dimension
+    CREATE TABLE IF NOT EXISTS pattern_counts (
+        scope TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        cumulative INTEGER NOT NULL,
+        PRIMARY KEY (scope, dimension, value, seq)
+    ) WITHOUT ROWID;
+    -- המונה העדכני ביותר לכל ערך (גם רשימת הערכים הקיימים לכל ממד)
+    CREATE TABLE IF NOT EXISTS pattern_totals (
+        scope TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (scope, dimension, value)
+    ) WITHOUT ROWID;
+    """
+
+    COUNTERS_VERSION = "pattern_counts_v1"
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # autocommit - טרנזקציות נפתחות במפורש עם BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_MS / 1000,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._ensure_counters()
+
+    @staticmethod
+    def _row(fingerprint: Dict) -> tuple:
+        return (
+            fingerprint.get("story_id"),
+            fingerprint.get("series"),
+            fingerprint.get("created_at"),
+            json.dumps(fingerprint, ensure_ascii=False)
+        )
+
+    def _insert(self, fingerprint: Dict) -> int:
+        """INSERT + עדכון המונים (בתוך טרנזקציה פתוחה)"""
+        cursor = self._conn.execute(
+            "INSERT INTO fingerprints (story_id, series, created_at, data) VALUES (?, ?, ?, ?)",
+            self._row(fingerprint)
+        )
+        self._index_patterns(fingerprint)
+        return cursor.lastrowid
+
+    def _index_patterns(self, fingerprint: Dict):
+        values = pattern_values(fingerprint.get("patterns", {}))
+        scopes = [ALL_SCOPE] + ([fingerprint["series"]] if fingerprint.get("series") else [])
+        for scope in scopes:
+            row = self._conn.execute("SELECT last_seq FROM scopes WHERE scope = ?", (scope,)).fetchone()
+            seq = (row[0] if row else 0) + 1
+            self._conn.execute("INSERT OR REPLACE INTO scopes (scope, last_seq) VALUES (?, ?)",
+                               (scope, seq))
+            for dimension, value in values.items():
+                row = self._conn.execute(
+                    "SELECT total FROM pattern_totals WHERE scope = ? AND dimension = ? AND value = ?",
+                    (scope, dimension, value)
+                ).fetchone()
+                total = (row[0] if row else 0) + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pattern_totals (scope, dimension, value, total) VALUES (?, ?, ?, ?)",
+                    (scope, dimension, value, total)
+                )
+                self._conn.execute(
+                    "INSERT INTO pattern_counts (scope, dimension, value, seq, cumulative) VALUES (?, ?, ?, ?, ?)",
+                    (scope, dimension, value, seq, total)
+                )
+
+    def _ensure_counters(self):
+        """בונה את המונים מחדש למאגר שנוצר לפניהם (פעם אחת)"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (self.COUNTERS_VERSION,)).fetchone():
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._conn.execute("SELECT 1 FROM meta WHERE key = ?",
+                                          (self.COUNTERS_VERSION,)).fetchone():
+                    for table in ("scopes", "pattern_counts", "pattern_totals"):
+                        self._conn.execute(f"DELETE FROM {table}")
+                    for (data,) in self._conn.execute("SELECT data FROM fingerprints ORDER BY id").fetchall():
+                        self._index_patterns(json.loads(data))
+                    self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                       (self.COUNTERS_VERSION, "1"))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append(self, fingerprint: Dict) -> int:
+        """מוסיף fingerprint (ומעדכן את מוני הדפוסים) ומחזיר את ה-id שלו"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                fingerprint_id = self._insert(fingerprint)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return fingerprint_id
+
+    def window(self, n: int = None, series: str = None) -> PatternWindow:
+        """
+        חלון של N הסיפורים האחרונים (None = הכל) ב-scope (סדרה או כל הסיפורים)
+        הספירות עצמן נשלפות לפי דרישה מהמונים
+        """
+        scope = series or ALL_SCOPE
+        with self._lock:
+            row = self._conn.execute("SELECT last_seq FROM scopes WHERE scope = ?", (scope,)).fetchone()
+        last_seq = row[0] if row else 0
+        start_seq = max(0, last_seq - n) if n else 0
+        return PatternWindow(last_seq - start_seq, store=self, scope=scope, start_seq=start_seq)
+
+    def _window_count(self, scope: str, dimension: str, value: str, start_seq: int) -> int:
+        """total(עכשיו) - cumulative(עד start_seq)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT total FROM pattern_totals WHERE scope = ? AND dimension = ? AND value = ?",
+                (scope, dimension, value)
+            ).fetchone()
+            if not row:
+                return 0
+            before = self._conn.execute(
+                "SELECT cumulative FROM pattern_counts WHERE scope = ? AND dimension = ? AND value = ? "
+                "AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                (scope, dimension, value, start_seq)
+            ).fetchone()
+        return row[0] - (before[0] if before else 0)
+
+    def _values(self, scope: str, dimension: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value FROM pattern_totals WHERE scope = ? AND dimension = ?", (scope, dimension)
+            ).fetchall()
+        return [value for (value,) in rows]
+
+    def last(self, n: int = None, series: str = None) -> List[Dict]:
+        """
+        N האחרונים (None = הכל), בסדר כרונולוגי (הישן ראשון)
+
+        Args:
+            series: סדרה ספציפית (None = כל הסיפורים)
+        """
+        query = "SELECT data FROM fingerprints"
+        params: list = []
+        if series:
+            query += " WHERE series = ?"
+            params.append(series)
+        query += " ORDER BY id DESC"
+        if n:
+            query += " LIMIT ?"
+            params.append(n)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    def count(self, series: str = None) -> int:
+        with self._lock:
+            if series:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM fingerprints WHERE series = ?", (series,)
+                ).fetchone()
+            else:
+                row = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()
+        return row[0]
+
+    def migrate_json(self, history_file: Path) -> int:
+        """
+        מייבא את fingerprints_history.json (פעם אחת בלבד)
+
+        הבדיקה והייבוא באותה טרנזקציה (BEGIN IMMEDIATE), כך ששני תהליכים
+        שעולים יחד לא מייבאים פעמיים.
+
+        Returns:
+            מספר הרשומות שיובאו (0 אם כבר יובא / אין קובץ)
+        """
+        history_file = Path(history_file)
+        if not history_file.exists():
+            return 0
+
+        marker = f"migrated:{history_file.resolve()}"
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+
+            with open(history_file, 'r', encoding='utf-8') as f:
+                stories = json.load(f).get("stories", [])
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return 0
+                for fp in stories:
+                    self._insert(fp)
+                self._conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                   (marker, str(len(stories))))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        print(f"📦 יובאו {len(stories)} fingerprints מ-{history_file.name} ל-{self.db_path.name}")
+        return len(stories)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_stores: Dict[Path, FingerprintStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path: Path, legacy_file: Optional[Path] = None) -> FingerprintStore:
+    """
+    מחזיר מאגר משותף לנתיב (נפתח פעם אחת לכל תהליך)
+    legacy_file - קובץ JSON ישן לייבוא בפתיחה הראשונה
+    """
+    key = Path(db_path).resolve()
+    with _stores_lock:
+        if key not in _stores:
+            store = FingerprintStore(key)
+            if legacy_file is not None:
+                store.migrate_json(legacy_file)
+            _stores[key] = store
+        return _stores[key]
+
+
+if __name__ == "__main__":
+    import sys
+    fingerprints_dir = Path(__file__).parent.parent / "data" / "fingerprints"
+    legacy = Path(sys.argv[1]) if len(sys.argv) > 1 else fingerprints_dir / "fingerprints_history.json"
+    store = get_store(legacy.with_suffix(".db"), legacy)
+    print(f"📊 {store.count()} fingerprints ב-{store.db_path}")
@@ -3,9 +3,13 @@ Gemini Agent - אחראי על יצירת ויזואלים
 """
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from dotenv import load_dotenv
 import google.generativeai as genai
+from cost_ledger import bind_context
+from llm_clients import wrap_gemini
+from rate_limiter import get_limiter
 
 load_dotenv()
 
@@ -14,41 +18,72 @@ class GeminiAgent:
     def __init__(self, model: str = None):
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
         self.model_name = model or os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        self.model = genai.GenerativeModel(self.model_name)
+        self.model = wrap_gemini(genai.GenerativeModel(self.model_name), "gemini_visuals")
 
-    def enhance_visual_descriptions(self, story: Dict, style_guide: Dict) -> Dict:
+    VISUAL_FIELDS = ("hebrew_description", "english_prompt", "style_tags", "technical_specs")
+
+    VISUAL_JSON_FORMAT = """{
+    "hebrew_description": "תיאור מפורט בעברית",
+    "english_prompt": "Detailed prompt in English for image generation",
+    "style_tags": ["tag1", "tag2"],
+    "technical_specs": {
+        "aspect_ratio": "recommended ratio",
+        "style": "art style",
+        "mood": "overall mood"
+    }
+}"""
+
+    def enhance_visual_descriptions(self, story: Dict, style_guide: Dict,
+                                    batch: bool = True, max_workers: int = None) -> Dict:
         """
         משפר תיאורים ויזואליים לשימוש ב-Imagen/Nanobana
 
+        ברירת המחדל היא בקשה אחת שמחזירה את כל העמודים (מערך JSON).
+        עמודים שחסרים בתשובה או לא עברו ולידציה משופרים בקריאה נפרדת לכל עמוד,
+        במקביל (עד max_workers - ברירת מחדל: מגבלת המקביליות של Gemini).
+
         Args:
             story: הסיפור עם תיאורים ראשוניים
             style_guide: מדריך סגנון עיצובי
+            batch: False = ישר לקריאות מקבילות לפי עמוד
 
         Returns:
             סיפור עם תיאורים ויזואליים משופרים
         """
-        system_instruction = """אתה מומחה לתיאור ויזואלי לצורך יצירת איורים ב-AI.
-תפקידך לקחת תיאור כללי ולהפוך אותו לפרומפט מפורט ומדויק ליצירת תמונה.
-
-עקרונות:
-- תאר בדיוק מה יופיע בתמונה
-- כלול פרטים על צבעים, תאורה, זווית צילום
-- ציין את סגנון האיור (קריקטורי, ריאליסטי, מינימליסטי)
-- וודא עקביות בין עמודים (דמויות, סגנון, סביבה)
-- התאם לגילאי 5-8 - צבעוני, ידידותי, לא מפחיד"""
+        pages = story['pages']
+        visuals = self._enhance_pages_batched(story, style_guide) if batch and len(pages) > 1 else {}
+
+        missing = [i for i in range(len(pages)) if i not in visuals]
+        if missing:
+            if visuals:
+                print(f"⚠️  {len(missing)} עמודים חסרים בתשובה המאוחדת, משפר בנפרד")
+            workers = min(len(missing), max_workers or get_limiter("gemini").max_concurrency)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    bind_context(lambda i: self._enhance_page(story['title'], pages[i], style_guide)),
+                    missing
+                )
+                visuals.update(zip(missing, results))
 
         enhanced_story = story.copy()
         enhanced_story['pages'] = []
 
-        for page in story['pages']:
-            prompt = f"""שפר את התיאור הויזואלי הבא לפרומפט ליצירת איור:
+        for i, page in enumerate(pages):
+            enhanced_visual = visuals[i]
 
-כותרת הספר: {story['title']}
-עמוד: {page['page_number']}
-טקסט: {page['text']}
-תיאור ויזואלי ראשוני: {page['visual_description']}
+            enhanced_page = page.copy()
+            enhanced_page['visual_description_enhanced'] = enhanced_visual['hebrew_description']
+            enhanced_page['image_prompt'] = enhanced_visual['english_prompt']
+            enhanced_page['style_tags'] = enhanced_visual['style_tags']
+            enhanced_page['technical_specs'] = enhanced_visual['technical_specs']
+
+            enhanced_story['pages'].append(enhanced_page)
+
+        return enhanced_story
 
-מדריך סגנון:
+    @staticmethod
+    def _style_block(style_guide: Dict) -> str:
+        return f"""מדריך סגנון:
 - סגנון: {style_guide.get('visual_style', 'קריקטורי צבעוני')}
 - מצב רוח: {style_guide.get('mood', 'חם ומזמין')}
 - קהל יעד: ילדים בגילאי 5-8
@@ -60,40 +95,88 @@ class GeminiAgent:
 3. סביבה ורקע
 4. צבעים ותאורה
 5. סגנון אמנותי
-6. מצב רוח ואווירה
+6. מצב רוח ואווירה"""
+
+    def _generate_json(self, prompt: str):
+        response = self.model.generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=0.7,
+                response_mime_type="application/json"
+            )
+        )
+        return json.loads(response.text)
+
+    def _is_valid_visual(self, visual) -> bool:
+        return isinstance(visual, dict) and all(field in visual for field in self.VISUAL_FIELDS)
+
+    def _enhance_page(self, title: str, page: Dict, style_guide: Dict) -> Dict:
+        """משפר עמוד בודד (קריאה אחת ל-Gemini)"""
+        prompt = f"""שפר את התיאור הויזואלי הבא לפרומפט ליצירת איור:
+
+כותרת הספר: {title}
+עמוד: {page['page_number']}
+טקסט: {page['text']}
+תיאור ויזואלי ראשוני: {page['visual_description']}
+
+{self._style_block(style_guide)}
 
 השב בפורמט JSON:
-{{
-    "hebrew_description": "תיאור מפורט בעברית",
-    "english_prompt": "Detailed prompt in English for image generation",
-    "style_tags": ["tag1", "tag2"],
-    "technical_specs": {{
-        "aspect_ratio": "recommended ratio",
-        "style": "art style",
-        "mood": "overall mood"
-    }}
-}}
+{self.VISUAL_JSON_FORMAT}
 """
+        return self._generate_json(prompt)
 
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.GenerationConfig(
-                    temperature=0.7,
-                    response_mime_type="application/json"
-                )
-            )
+    def _enhance_pages_batched(self, story: Dict, style_guide: Dict) -> Dict[int, Dict]:
+        """
+        משפר את כל העמודים בבקשה אחת
+        מחזיר {אינדקס עמוד: תיאור משופר} רק לעמודים שחזרו תקינים
+        """
+        pages_text = "\n\n".join(
+            f"""עמוד: {page['page_number']}
+טקסט: {page['text']}
+תיאור ויזואלי ראשוני: {page['visual_description']}"""
+            for page in story['pages']
+        )
+        prompt = f"""שפר את התיאורים הויזואליים של כל העמודים הבאים לפרומפטים ליצירת איורים.
+שמור על עקביות בין העמודים (דמויות, סגנון, סביבה).
 
-            enhanced_visual = json.loads(response.text)
+כותרת הספר: {story['title']}
 
-            enhanced_page = page.copy()
-            enhanced_page['visual_description_enhanced'] = enhanced_visual['hebrew_description']
-            enhanced_page['image_prompt'] = enhanced_visual['english_prompt']
-            enhanced_page['style_tags'] = enhanced_visual['style_tags']
-            enhanced_page['technical_specs'] = enhanced_visual['technical_specs']
+{pages_text}
 
-            enhanced_story['pages'].append(enhanced_page)
+{self._style_block(style_guide)}
 
-        return enhanced_story
+השב בפורמט JSON - אובייקט אחד לכל עמוד, לפי סדר העמודים:
+{{
+    "pages": [
+        {{
+            "page_number": 1,
+            "hebrew_description": "תיאור מפורט בעברית",
+            "english_prompt": "Detailed prompt in English for image generation",
+            "style_tags": ["tag1", "tag2"],
+            "technical_specs": {{
+                "aspect_ratio": "recommended ratio",
+                "style": "art style",
+                "mood": "overall mood"
+            }}
+        }}
+    ]
+}}
+"""
+        try:
+            data = self._generate_json(prompt)
+        except Exception as e:
+            print(f"⚠️  שיפור מאוחד נכשל ({e}), עובר לשיפור לפי עמוד")
+            return {}
+
+        by_number = {}
+        items = data.get("pages", []) if isinstance(data, dict) else data
+        for item in items if isinstance(items, list) else []:
+            if self._is_valid_visual(item):
+                by_number[item.get("page_number")] = item
+
+        return {i: by_number[page['page_number']]
+                for i, page in enumerate(story['pages']) if page['page_number'] in by_number}
 
     def generate_style_consistency_guide(self, story_title: str,
                                         initial_visual_concept: str) -> Dict:
@@ -11,6 +11,7 @@ import requests
 import time
 import os
 from anthropic import Anthropic
+from llm_clients import wrap_anthropic, cached_system
 
 
 class HebrewTextProcessor:
@@ -18,57 +19,9 @@ class HebrewTextProcessor:
     מעבד טקסט עברי לספרי ילדים
     """
 
-    def __init__(self):
-        self.nikud_enabled = True
-
-    def add_nikud(self, text: str, use_api: bool = True) -> str:
-        """
-        מוסיף ניקוד לטקסט עברי
-        משתמש ב-Claude API לניקוד מושלם
-
-        Args:
-            text: טקסט עברי
-            use_api: האם להשתמש ב-API (True) או רק במילון ידני (False)
-        """
-        if not self.nikud_enabled:
-            return text
-
-        # אם הטקסט קצר (עד 30 מילים), נסה Dicta API ואז Claude כגיבוי
-        if use_api and len(text.split()) <= 30:
-            # קודם כל - נקד את המילים שקיימות במילון הידני
-            # זה מונע מ-Claude לקבל מילים בעייתיות בכלל
-            partial_result = self._manual_nikud(text)
-
-            # בדוק אם יש מילים שעדיין צריכות ניקוד
-            nikud_chars = '\u05B0\u05B1\u05B2\u05B3\u05B4\u05B5\u05B6\u05B7\u05B8\u05B9\u05BB\u05BC\u05C1\u05C2'
-            words = partial_result.split()
-            words_without_nikud = [w for w in words if not any(c in nikud_chars for c in w.strip('.,;:!?"\''))]
-
-            # אם כל המילים כבר מנוקדות מהמילון הידני - סיימנו
-            if not words_without_nikud:
-                return partial_result
-
-            # תן ל-Claude את הטקסט החלקי עם בקשה להשלים רק את החסר
-            try:
-                result = self._add_nikud_claude(partial_result)
-                return result
-            except Exception as e:
-                print(f"⚠️  שגיאה ב-Claude API: {e}")
-                print(f"   משתמש במילון ידני")
-                return partial_result
-        else:
-            # טקסט ארוך או מצב ללא API - השתמש במילון ידני
-            return self._manual_nikud(text)
-
-    def _add_nikud_claude(self, text: str) -> str:
-        """
-        מוסיף ניקוד באמצעות Claude API
-        מדויק במיוחד לעברית מודרנית וספרי ילדים
-        """
-        try:
-            client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-            prompt = f"""⚠️ CRITICAL BLOCKER RULE ⚠️
+    # הוראות ניקוד סטטיות - נשלחות כ-system עם prompt caching,
+    # הטקסט לניקוד (המשתנה) נשלח אחריהן בהודעת ה-user
+    NIKUD_SYSTEM_PROMPT = """⚠️ CRITICAL BLOCKER RULE ⚠️
 You are ONLY adding nikud vowel marks to Hebrew text. You MUST NOT modify any Hebrew letters whatsoever.
 
 IMPORTANT: The spelling you see is the AUTHOR'S INTENTIONAL CHOICE for a children's book. DO NOT "correct", "normalize", or "standardize" the spelling. Both כתיב מלא and כתיב חסר are valid Hebrew, and the author has chosen כתיב מלא (full spelling with ו and י letters).
@@ -105,9 +58,6 @@ Output: גִּנָּה (kept י, only added marks)
 Input:  אופניים (with two י - keep both!)
 Output: אוֹפַנַּיִים (kept both י, only added marks)
 
-THE TEXT TO VOCALIZE (DO NOT CHANGE ANY LETTERS):
-{text}
-
 VERIFICATION CHECKLIST BEFORE RESPONDING:
 □ Did I change the number of Hebrew letters? (If YES → WRONG, start over)
 □ Did I remove any ו or י? (If YES → WRONG, start over)
@@ -129,12 +79,68 @@ VERIFICATION BEFORE YOU RESPOND:
 
 Return ONLY the vocalized text with nikud marks added, no explanations or comments."""
 
+    def __init__(self):
+        self.nikud_enabled = True
+
+    def add_nikud(self, text: str, use_api: bool = True) -> str:
+        """
+        מוסיף ניקוד לטקסט עברי
+        משתמש ב-Claude API לניקוד מושלם
+
+        Args:
+            text: טקסט עברי
+            use_api: האם להשתמש ב-API (True) או רק במילון ידני (False)
+        """
+        if not self.nikud_enabled:
+            return text
+
+        # אם הטקסט קצר (עד 30 מילים), נסה Dicta API ואז Claude כגיבוי
+        if use_api and len(text.split()) <= 30:
+            # קודם כל - נקד את המילים שקיימות במילון הידני
+            # זה מונע מ-Claude לקבל מילים בעייתיות בכלל
+            partial_result = self._manual_nikud(text)
+
+            # בדוק אם יש מילים שעדיין צריכות ניקוד
+            nikud_chars = '\u05B0\u05B1\u05B2\u05B3\u05B4\u05B5\u05B6\u05B7\u05B8\u05B9\u05BB\u05BC\u05C1\u05C2'
+            words = partial_result.split()
+            words_without_nikud = [w for w in words if not any(c in nikud_chars for c in w.strip('.,;:!?"\''))]
+
+            # אם כל המילים כבר מנוקדות מהמילון הידני - סיימנו
+            if not words_without_nikud:
+                return partial_result
+
+            # תן ל-Claude את הטקסט החלקי עם בקשה להשלים רק את החסר
+            try:
+                result = self._add_nikud_claude(partial_result)
+                return result
+            except Exception as e:
+                print(f"⚠️  שגיאה ב-Claude API: {e}")
+                print(f"   משתמש במילון ידני")
+                return partial_result
+        else:
+            # טקסט ארוך או מצב ללא API - השתמש במילון ידני
+            return self._manual_nikud(text)
+
+    def _add_nikud_claude(self, text: str) -> str:
+        """
+        מוסיף ניקוד באמצעות Claude API
+        מדויק במיוחד לעברית מודרנית וספרי ילדים
+        """
+        try:
+            # ניקוד הוא פונקציה של הטקסט בלבד - נשמר במטמון גם במצב deterministic
+            client = wrap_anthropic(Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY")),
+                                    "nikud", deterministic=True)
+
+            user_message = f"""THE TEXT TO VOCALIZE (DO NOT CHANGE ANY LETTERS):
+{text}"""
+
             response = client.messages.create(
                 model="claude-sonnet-4-5-20250929",
                 max_tokens=1000,
+                system=cached_system(self.NIKUD_SYSTEM_PROMPT),
                 messages=[{
                     "role": "user",
-                    "content": prompt
+                    "content": user_message
                 }]
             )
 
@@ -4,6 +4,7 @@
 """
 import anthropic
 import os
+from llm_clients import wrap_anthropic, cached_system
 
 
 class HebrewTextQualityChecker:
@@ -11,8 +12,49 @@ class HebrewTextQualityChecker:
     בודק ומשפר איכות טכסט עברי לסיפורי ילדים
     """
 
+    # הנחיות העורך - קבועות לכל העמודים, נשלחות כ-system (cached_system - קצרות מהמינימום של prompt cache)
+    # (הטקסט של העמוד נשלח אחריהן בהודעת ה-user)
+    EDITOR_RUBRIC = """אתה עורך מקצועי לסיפורי ילדים בעברית.
+
+בדוק את הטקסט לפי הקריטריונים הבאים:
+
+1. **דקדוק עברי תקין**:
+   - "היום משהו חדש" ← "היום יש משהו חדש" (חסר פועל)
+   - "אמא אור אומרת:" ← ודא שיש שם אמא בצורה נכונה
+   - בדוק שכל משפט הוא משפט שלם עם נושא ונשוא
+
+2. **התאמה לגיל היעד**:
+   - משפטים קצרים (עד 10 מילים למשפט)
+   - מילים פשוטות ומוכרות
+   - תחביר ישיר וברור
+
+3. **זרימה טבעית**:
+   - הטקסט צריך לזרום טבעית
+   - לא צריך להישמע מתורגם
+   - צריך להישמע כמו שהורה ישראלי מדבר
+
+4. **התאמה לתמונה**:
+   - הטקסט צריך להתאים למה שקורה בתמונה
+   - אם התיאור מדבר על דמות או פעולה, הטקסט חייב לכלול אותם
+
+החזר JSON בלבד:
+{
+    "original": "הטקסט המקורי",
+    "improved": "הטקסט המשופר (או המקורי אם הוא מושלם)",
+    "issues_found": ["בעיה 1", "בעיה 2"],
+    "changes_made": ["שינוי 1", "שינוי 2"],
+    "is_perfect": true/false
+}
+
+**חשוב**:
+- אם הטקסט מושלם, החזר אותו כמו שהוא ב-improved
+- שמור על המשמעות המקורית
+- אל תוסיף תוכן חדש, רק תקן ושפר ניסוח
+- השתמש בעברית פשוטה וטבעית"""
+
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+        self.client = wrap_anthropic(anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY')),
+                                     "hebrew_quality_check", deterministic=True)
 
     def check_and_improve_text(self, text: str, page_context: dict) -> dict:
         """
@@ -42,55 +84,18 @@ class HebrewTextQualityChecker:
             }
         target_age = page_context['target_age']
 
-        prompt = f"""אתה עורך מקצועי לסיפורי ילדים בעברית.
-
-טקסט נוכחי (עמוד {page_num}):
+        prompt = f"""טקסט נוכחי (עמוד {page_num}):
 "{text}"
 
 הקשר חזותי:
 {visual_desc[:300]}
 
-גיל יעד: {target_age}
-
-בדוק את הטקסט לפי הקריטריונים הבאים:
-
-1. **דקדוק עברי תקין**:
-   - "היום משהו חדש" ← "היום יש משהו חדש" (חסר פועל)
-   - "אמא אור אומרת:" ← ודא שיש שם אמא בצורה נכונה
-   - בדוק שכל משפט הוא משפט שלם עם נושא ונשוא
-
-2. **התאמה לגיל {target_age}**:
-   - משפטים קצרים (עד 10 מילים למשפט)
-   - מילים פשוטות ומוכרות
-   - תחביר ישיר וברור
-
-3. **זרימה טבעית**:
-   - הטקסט צריך לזרום טבעית
-   - לא צריך להישמע מתורגם
-   - צריך להישמע כמו שהורה ישראלי מדבר
-
-4. **התאמה לתמונה**:
-   - הטקסט צריך להתאים למה שקורה בתמונה
-   - אם התיאור מדבר על דמות או פעולה, הטקסט חייב לכלול אותם
-
-החזר JSON בלבד:
-{{
-    "original": "הטקסט המקורי",
-    "improved": "הטקסט המשופר (או המקורי אם הוא מושלם)",
-    "issues_found": ["בעיה 1", "בעיה 2"],
-    "changes_made": ["שינוי 1", "שינוי 2"],
-    "is_perfect": true/false
-}}
-
-**חשוב**:
-- אם הטקסט מושלם, החזר אותו כמו שהוא ב-improved
-- שמור על המשמעות המקורית
-- אל תוסיף תוכן חדש, רק תקן ושפר ניסוח
-- השתמש בעברית פשוטה וטבעית"""
+גיל יעד: {target_age}"""
 
         response = self.client.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=1000,
+            system=cached_system(self.EDITOR_RUBRIC),
             messages=[
                 {
                     "role": "user",
@@ -4,12 +4,16 @@ Image Generator - מערכת גנרית ליצירת תמונות
 """
 import os
 import json
+import time
 import base64
 from pathlib import Path
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from openai import OpenAI
 import requests
+from cost_ledger import record_usage
+from rate_limiter import get_limiter, RETRYABLE_STATUS
+from json_extraction import extract_json
 
 load_dotenv()
 
@@ -26,7 +30,8 @@ class ImageGenerator:
         self.provider = provider.lower()
 
         if self.provider == "dalle":
-            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            # ניסיונות חוזרים על 429 מנוהלים ב-rate_limiter
+            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
         elif self.provider == "stability":
             self.api_key = os.getenv("STABILITY_API_KEY")
         elif self.provider == "nanobana":
@@ -93,6 +98,9 @@ class ImageGenerator:
                 "image_data": response.content,
                 "provider": "stability"
             }
+        elif response.status_code in RETRYABLE_STATUS:
+            # HTTPError נושא את הסטטוס ואת retry-after ל-rate_limiter
+            response.raise_for_status()
         else:
             raise Exception(f"Stability API error: {response.status_code} - {response.text}")
 
@@ -129,6 +137,7 @@ class ImageGenerator:
         client = genai.Client(api_key=self.api_key)
 
         # יצירת התמונה
+        started = time.perf_counter()
         response = client.models.generate_content(
             model=model,
             contents=full_prompt,
@@ -140,6 +149,12 @@ class ImageGenerator:
             )
         )
 
+        usage = response.usage_metadata
+        record_usage("gemini", model, "image_generation", {
+            "input_tokens": getattr(usage, "prompt_token_count", 0),
+            "output_tokens": getattr(usage, "candidates_token_count", 0)
+        }, time.perf_counter() - started)
+
         # שמירת התמונה
         import tempfile
         import base64
@@ -163,16 +178,19 @@ class ImageGenerator:
     def generate_image(self, prompt: str, **kwargs) -> Dict:
         """
         יצירת תמונה - בוחר את הספק המתאים
+        עובר דרך בקר הקצב המשותף לתמונות (RPM, מקביליות, ניסיונות חוזרים על 429)
         """
         if self.provider == "dalle":
-            return self.generate_image_dalle(prompt, **kwargs)
+            generate = self.generate_image_dalle
         elif self.provider == "stability":
-            return self.generate_image_stability(prompt, **kwargs)
+            generate = self.generate_image_stability
         elif self.provider == "nanobana":
-            return self.generate_image_nanobana(prompt, **kwargs)
+            generate = self.generate_image_nanobana
         else:
             raise ValueError(f"Unknown provider: {self.provider}")
 
+        return get_limiter("image").call(lambda: generate(prompt, **kwargs))
+
     def save_image(self, image_data: bytes, file_path: str):
         """
         שומר תמונה לדיסק
@@ -239,17 +257,11 @@ Response format (JSON):
             max_tokens=1000,
             temperature=0.7,
             system="You are an expert at creating detailed prompts for AI art generation, specializing in children's book illustrations.",
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}],
+            cache_site="prompt_enhancer"
         )
 
-        content = response.content[0].text
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-
-        if json_start != -1 and json_end > json_start:
-            return json.loads(content[json_start:json_end])
-        else:
-            raise ValueError("Could not parse JSON from response")
+        return extract_json(response.content[0].text)
 
 
 # Demo / Test
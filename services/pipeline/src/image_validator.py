@@ -6,6 +6,8 @@ import base64
 from pathlib import Path
 from typing import Dict, Tuple
 from claude_agent import ClaudeAgent
+from llm_clients import cached_system
+from json_extraction import extract_json, JSONExtractionError
 
 
 class ImageValidator:
@@ -13,37 +15,15 @@ class ImageValidator:
     מערכת בדיקה אוטומטית לתמונות - משתמש ב-Claude Vision API
     """
 
-    def __init__(self):
-        self.claude = ClaudeAgent()
-        self.client = self.claude.client
-        self.model = self.claude.model
-
-    def validate_image(self, image_path: Path,
-                      page_context: Dict = None) -> Tuple[bool, str, Dict]:
-        """
-        בודק תמונה לפי קריטריונים ברורים
-
-        Args:
-            image_path: נתיב לתמונה
-            page_context: הקשר של העמוד (מספר, תיאור דמות, וכו')
-
-        Returns:
-            (passed, reason, details) - האם עבר, סיבה, פרטים נוספים
-        """
-        # קרא ואנקוד תמונה
-        with open(image_path, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
+    # קריטריונים בסיסיים - תמיד (בסדר עדיפות)
+    BASE_CRITERIA = [
+        "✓ CRITICAL: NO TEXT OR GIBBERISH anywhere in the image (mirrors, walls, any surface)",
+        "✓ IMPORTANT: RIGHT 1/3 (30-35%) is EMPTY PLAIN WALL with uniform color - no objects, no character parts",
+        "✓ IMPORTANT: Illustration stays in LEFT 2/3 (66%) - doesn't extend past 70% mark",
+        "✓ Wall color should be uniform and match the room's aesthetic"
+    ]
 
-        # בנה קריטריונים בהתאם להקשר
-        criteria = self._build_criteria(page_context)
-
-        # שלח לClaude Vision
-        prompt = f"""You are a quality control system for children's book illustrations.
-Analyze this image and check if it meets ALL the following criteria:
-
-{criteria}
-
-CRITICAL VALIDATION RULES (Priority Order):
+    VALIDATION_RULES = """CRITICAL VALIDATION RULES (Priority Order):
 
 1. TEXT/GIBBERISH CHECK (CRITICAL - MUST PASS):
    - Scan the ENTIRE image for any text, letters, symbols, or gibberish
@@ -75,30 +55,30 @@ CRITICAL VALIDATION RULES (Priority Order):
    - PASS: If right 30%+ is clearly empty and uniform
 
 Response format (JSON):
-{{
+{
     "passed": true/false,
-    "criteria_results": {{
-        "no_text_or_gibberish": {{
+    "criteria_results": {
+        "no_text_or_gibberish": {
             "passed": true/false,
             "details": "detailed explanation of what you see"
-        }},
-        "text_space_adequate": {{
+        },
+        "text_space_adequate": {
             "passed": true/false,
             "details": "description of right 1/3 area - is it empty and uniform? Does illustration stay in left 2/3?"
-        }},
-        "character_accurate": {{
+        },
+        "character_accurate": {
             "passed": true/false,
             "details": "how well character matches description"
-        }},
-        "parent_gender_correct": {{
+        },
+        "parent_gender_correct": {
             "passed": true/false,
             "details": "parent gender verification if applicable"
-        }}
-    }},
+        }
+    },
     "overall_verdict": "PASS or FAIL",
     "reason": "clear explanation of why it passed or failed",
     "suggestions": "what to fix if failed"
-}}
+}
 
 STRICTNESS LEVELS:
 - TEXT/GIBBERISH: Be VERY STRICT - any text = FAIL
@@ -113,10 +93,42 @@ Overall verdict should be PASS if:
 - Parent gender correct if applicable
 """
 
+    def __init__(self):
+        self.claude = ClaudeAgent()
+        self.client = self.claude.client.with_cache_site("image_validation", deterministic=True)
+        self.model = self.claude.model
+
+    def validate_image(self, image_path: Path,
+                      page_context: Dict = None) -> Tuple[bool, str, Dict]:
+        """
+        בודק תמונה לפי קריטריונים ברורים
+
+        Args:
+            image_path: נתיב לתמונה
+            page_context: הקשר של העמוד (מספר, תיאור דמות, וכו')
+
+        Returns:
+            (passed, reason, details) - האם עבר, סיבה, פרטים נוספים
+        """
+        # קרא ואנקוד תמונה
+        with open(image_path, 'rb') as f:
+            image_data = base64.b64encode(f.read()).decode('utf-8')
+
+        # בנה קריטריונים בהתאם להקשר
+        criteria = self._build_criteria(page_context)
+
+        # שלח לClaude Vision - הכללים והקריטריונים הבסיסיים ב-system (prompt cache),
+        # התמונה והקריטריונים של העמוד אחריהם
+        prompt = f"""PAGE-SPECIFIC CRITERIA (in addition to the base criteria):
+{criteria}
+
+Analyze this image and check if it meets ALL the criteria."""
+
         # קרא לClaude Vision
         response = self.client.messages.create(
             model=self.model,
             max_tokens=1500,
+            system=cached_system(self._system_prompt(), self.model),
             messages=[{
                 "role": "user",
                 "content": [
@@ -136,56 +148,38 @@ Overall verdict should be PASS if:
             }]
         )
 
-        # פרסר תשובה
-        content = response.content[0].text
-
-        # חלץ JSON - מצא את האובייקט הראשון המאוזן
-        import json
-        json_start = content.find('{')
+        # פרסר תשובה - האובייקט המאוזן הראשון
+        try:
+            result = extract_json(response.content[0].text, repair=False)
+        except JSONExtractionError as e:
+            # אם לא הצליח לפרסר - נכשל
+            return False, f"JSON parsing error: {str(e)}", {}
 
-        if json_start == -1:
-            return False, "Failed to find JSON in response", {}
+        passed = result.get('overall_verdict', 'FAIL') == 'PASS'
+        reason = result.get('reason', 'Unknown reason')
+        details = result.get('criteria_results', {})
 
-        # מצא את ה-} התואם
-        brace_count = 0
-        json_end = json_start
+        return passed, reason, details
 
-        for i in range(json_start, len(content)):
-            if content[i] == '{':
-                brace_count += 1
-            elif content[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    json_end = i + 1
-                    break
+    def _system_prompt(self) -> str:
+        """
+        החלק הקבוע של הבדיקה - זהה בכל הקריאות ולכן נשמר ב-prompt cache
+        """
+        base_criteria = '\n'.join(self.BASE_CRITERIA)
+        return f"""You are a quality control system for children's book illustrations.
+Analyze each image and check if it meets ALL the following criteria:
 
-        if json_end > json_start:
-            try:
-                result = json.loads(content[json_start:json_end])
+{base_criteria}
 
-                passed = result.get('overall_verdict', 'FAIL') == 'PASS'
-                reason = result.get('reason', 'Unknown reason')
-                details = result.get('criteria_results', {})
-
-                return passed, reason, details
-            except json.JSONDecodeError as e:
-                return False, f"JSON parsing error: {str(e)}", {}
-        else:
-            # אם לא הצליח לפרסר - נכשל
-            return False, "Failed to parse validation response", {}
+{self.VALIDATION_RULES}"""
 
     def _build_criteria(self, page_context: Dict = None) -> str:
         """
-        בונה קריטריונים בהתאם להקשר
+        בונה קריטריונים בהתאם להקשר של העמוד
+        (הקריטריונים הבסיסיים נמצאים ב-BASE_CRITERIA)
         """
         criteria = []
 
-        # קריטריונים בסיסיים תמיד (בסדר עדיפות)
-        criteria.append("✓ CRITICAL: NO TEXT OR GIBBERISH anywhere in the image (mirrors, walls, any surface)")
-        criteria.append("✓ IMPORTANT: RIGHT 1/3 (30-35%) is EMPTY PLAIN WALL with uniform color - no objects, no character parts")
-        criteria.append("✓ IMPORTANT: Illustration stays in LEFT 2/3 (66%) - doesn't extend past 70% mark")
-        criteria.append("✓ Wall color should be uniform and match the room's aesthetic")
-
         if page_context:
             # תיאור דמות
             if 'character_description' in page_context:
@@ -198,7 +192,7 @@ Overall verdict should be PASS if:
             if 'father_present' in page_context and page_context['father_present']:
                 criteria.append(f"✓ Father (named {page_context.get('father_name', 'עמרי')}) appears as MALE")
 
-        return '\n'.join(criteria)
+        return '\n'.join(criteria) if criteria else "(none)"
 
     def print_validation_report(self, passed: bool, reason: str, details: Dict):
         """
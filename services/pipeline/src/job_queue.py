@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Job Queue - תור עבודות מקומי ב-SQLite להפקת ספרים (בלי שירות חיצוני)
+
+- עדיפויות: עבודה עם priority גבוה יותר נלקחת קודם (לקוח משלם לפני backfill),
+  ובתוך אותה עדיפות - לפי סדר ההוספה
+- לקיחה אטומית (BEGIN IMMEDIATE): כמה workers / תהליכים לא לוקחים אותה עבודה
+- ניסיונות חוזרים עם backoff מעריכי + jitter (not_before), עד max_attempts
+- heartbeat: עבודה של worker שקרס (heartbeat ישן) חוזרת לתור
+- ביטול: עבודה בתור מבוטלת מיד; עבודה שרצה מסומנת ונעצרת בשלב הבא
+"""
+import json
+import time
+import random
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+CANCELLED = "CANCELLED"
+
+# עדיפויות מקובלות (כל מספר שלם תקין)
+PRIORITIES = {"backfill": -10, "normal": 0, "customer": 10, "urgent": 20}
+
+
+class JobCancelled(RuntimeError):
+    """העבודה בוטלה בזמן ריצה - לא נכשלה ולא מנסים שוב"""
+
+
+class JobQueue:
+    """
+    תור עבודות מבוסס SQLite (WAL + busy_timeout, כמו שאר המאגרים)
+    """
+
+    BUSY_TIMEOUT_MS = 30000
+    BASE_BACKOFF_SECONDS = 60.0
+    MAX_BACKOFF_SECONDS = 3600.0
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        not_before REAL NOT NULL DEFAULT 0,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        worker TEXT,
+        heartbeat REAL,
+        stage TEXT,
+        last_error TEXT,
+        result TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, priority DESC, id);
+    """
+
+    def __init__(self, db_path: Path = None):
+        if db_path is None:
+            db_path = Path("data/queue/jobs.db")
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_MS / 1000,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def _write(self, fn):
+        """מריץ fn(conn) בטרנזקציית כתיבה אחת ומחזיר את התוצאה"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def backoff_seconds(self, attempts: int) -> float:
+        """המתנה לפני ניסיון attempts+1: מעריכי עם jitter (50%-100%)"""
+        backoff = min(self.MAX_BACKOFF_SECONDS, self.BASE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+        return backoff * (0.5 + random.random() / 2)
+
+    # --- הוספה וניהול ---
+
+    def enqueue(self, payload: Dict, kind: str = "book", priority: int = 0,
+                max_attempts: int = 3) -> int:
+        """מוסיף עבודה לתור ומחזיר את ה-id שלה"""
+        return self._write(lambda conn: conn.execute(
+            "INSERT INTO jobs (kind, payload, priority, status, max_attempts, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), priority, QUEUED, max_attempts,
+             datetime.now().isoformat())
+        ).lastrowid)
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        """
+        מבטל עבודה: בתור - מבוטלת מיד; רצה - מסומנת והworker עוצר אותה בשלב הבא
+
+        Returns:
+            הסטטוס אחרי הביטול (None אם העבודה לא קיימת)
+        """
+        def cancel(conn):
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == QUEUED:
+                conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                             (CANCELLED, datetime.now().isoformat(), job_id))
+                return CANCELLED
+            if row["status"] == RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+        return self._write(cancel)
+
+    def retry(self, job_id: int) -> bool:
+        """מחזיר עבודה שנכשלה / בוטלה לתור (עם ניסיונות מחדש)"""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, not_before = 0, cancel_requested = 0, "
+            "last_error = NULL, finished_at = NULL WHERE id = ? AND status IN (?, ?)",
+            (QUEUED, job_id, FAILED, CANCELLED)
+        ).rowcount > 0)
+
+    # --- צד ה-worker ---
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """
+        לוקח את העבודה המוכנה בעלת העדיפות הגבוהה ביותר (אטומי בין תהליכים)
+
+        Returns:
+            העבודה (status=RUNNING, attempts כבר כולל את הניסיון הזה), או None
+        """
+        def claim(conn):
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND not_before <= ? "
+                "ORDER BY priority DESC, id LIMIT 1", (QUEUED, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, "
+                "worker = ?, heartbeat = ?, stage = NULL WHERE id = ?",
+                (RUNNING, datetime.now().isoformat(), worker, time.time(), row["id"])
+            )
+            return self._row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+        return self._write(claim)
+
+    def heartbeat(self, worker: str, job_ids: List[int]):
+        """מעדכן heartbeat לעבודות שרצות (קריאה אחת לכל העבודות של ה-worker)"""
+        if not job_ids:
+            return
+        now = time.time()
+        self._write(lambda conn: conn.executemany(
+            "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = ?",
+            [(now, job_id, worker, RUNNING) for job_id in job_ids]
+        ))
+
+    def set_stage(self, job_id: int, stage: str) -> bool:
+        """
+        מעדכן את השלב הנוכחי (לתצוגה)
+
+        Returns:
+            True אם התבקש ביטול של העבודה
+        """
+        def set_stage(conn):
+            conn.execute("UPDATE jobs SET stage = ?, heartbeat = ? WHERE id = ?",
+                         (stage, time.time(), job_id))
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return bool(row and row["cancel_requested"])
+        return self._write(set_stage)
+
+    # עדכוני הסיום תקפים רק ל-worker שמחזיק בעבודה: אחרי requeue_stale העבודה
+    # עברה ל-worker אחר, ו-worker "מת" שהתעורר לא דורס את התוצאה שלו
+    OWNED = "id = ? AND worker = ? AND status = 'RUNNING'"
+
+    def complete(self, job_id: int, worker: str, result: Dict = None) -> bool:
+        """
+        Returns:
+            False אם העבודה כבר לא שייכת ל-worker (הוחזרה לתור / נלקחה ע"י אחר)
+        """
+        return self._write(lambda conn: conn.execute(
+            f"UPDATE jobs SET status = ?, finished_at = ?, result = ?, stage = NULL WHERE {self.OWNED}",
+            (COMPLETED, datetime.now().isoformat(),
+             json.dumps(result or {}, ensure_ascii=False), job_id, worker)
+        ).rowcount > 0)
+
+    def mark_cancelled(self, job_id: int, worker: str) -> bool:
+        return self._write(lambda conn: conn.execute(
+            f"UPDATE jobs SET status = ?, finished_at = ? WHERE {self.OWNED}",
+            (CANCELLED, datetime.now().isoformat(), job_id, worker)
+        ).rowcount > 0)
+
+    def fail(self, job_id: int, worker: str, error: str, retryable: bool = True,
+             result: Dict = None) -> Optional[str]:
+        """
+        רושם כישלון: אם נשארו ניסיונות - חוזר לתור אחרי backoff, אחרת FAILED
+
+        Args:
+            result: נשמר עם העבודה (למשל run_dir של ריצה שנכשלה בוולידציה)
+
+        Returns:
+            הסטטוס החדש (QUEUED / FAILED), או None אם העבודה כבר לא שייכת ל-worker
+        """
+        def fail(conn):
+            row = conn.execute(f"SELECT attempts, max_attempts FROM jobs WHERE {self.OWNED}",
+                               (job_id, worker)).fetchone()
+            if row is None:
+                return None
+            stored = json.dumps(result, ensure_ascii=False) if result else None
+            if retryable and row["attempts"] < row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, not_before = ?, last_error = ?, result = ?, "
+                    "worker = NULL WHERE id = ?",
+                    (QUEUED, time.time() + self.backoff_seconds(row["attempts"]), error, stored, job_id)
+                )
+                return QUEUED
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, last_error = ?, result = ? WHERE id = ?",
+                (FAILED, datetime.now().isoformat(), error, stored, job_id)
+            )
+            return FAILED
+        return self._write(fail)
+
+    def release(self, job_id: int, worker: str) -> bool:
+        """מחזיר עבודה לתור בלי לספור ניסיון (worker שנעצר לפני שהעבודה הסתיימה)"""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), worker = NULL, stage = NULL "
+            f"WHERE {self.OWNED}", (QUEUED, job_id, worker)
+        ).rowcount > 0)
+
+    def requeue_stale(self, timeout_seconds: float) -> int:
+        """עבודות RUNNING שה-heartbeat שלהן ישן מ-timeout (worker קרס) - כישלון עם ניסיון חוזר"""
+        def requeue(conn):
+            rows = conn.execute(
+                "SELECT id, attempts, max_attempts FROM jobs WHERE status = ? AND heartbeat < ?",
+                (RUNNING, time.time() - timeout_seconds)
+            ).fetchall()
+            for row in rows:
+                if row["attempts"] < row["max_attempts"]:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, not_before = ?, worker = NULL, "
+                        "last_error = 'worker heartbeat lost' WHERE id = ?",
+                        (QUEUED, time.time() + self.backoff_seconds(row["attempts"]), row["id"])
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, finished_at = ?, "
+                        "last_error = 'worker heartbeat lost' WHERE id = ?",
+                        (FAILED, datetime.now().isoformat(), row["id"])
+                    )
+            return len(rows)
+        return self._write(requeue)
+
+    # --- שאילתות ---
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, status: str = None, limit: int = 50) -> List[Dict]:
+        """עבודות לפי סדר הביצוע: רצות, ואז התור לפי עדיפות, ואז שהסתיימו (החדשות קודם)"""
+        sql = "SELECT * FROM jobs"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += (" ORDER BY CASE status WHEN 'RUNNING' THEN 0 WHEN 'QUEUED' THEN 1 ELSE 2 END, "
+                "CASE WHEN status IN ('RUNNING', 'QUEUED') THEN -priority ELSE 0 END, "
+                "CASE WHEN status IN ('RUNNING', 'QUEUED') THEN id ELSE -id END LIMIT ?")
+        params.append(limit)
+        with self._lock:
+            return [self._row(row) for row in self._conn.execute(sql, params)]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {row["status"]: row["n"] for row in self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    queue = JobQueue(Path(tempfile.mkdtemp()) / "jobs.db")
+    queue.enqueue({"child_name": "נועה", "age": 4, "topic": "גן"}, priority=PRIORITIES["backfill"])
+    paying = queue.enqueue({"child_name": "יואב", "age": 6, "topic": "ים"}, priority=PRIORITIES["customer"])
+
+    job = queue.claim("demo")
+    print(f"▶️  ראשונה: #{job['id']} {job['payload']['child_name']} (עדיפות {job['priority']})")
+    print(f"🔁 כישלון: {queue.fail(job['id'], 'demo', 'timeout')}, ממתינה "
+          f"{queue.get(paying)['not_before'] - time.time():.0f}s")
+    print(f"📋 {queue.counts()}")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+JSON Extraction - חילוץ JSON סובלני מתשובות LLM
+
+במקום find('{') / rfind('}') + json.loads, שנכשל על טקסט אחרי ה-JSON,
+על סוגריים בתוך מחרוזות או על תשובה שנקטעה באמצע (max_tokens):
+- סריקה אחת לינארית שמוצאת את האובייקט המאוזן הראשון (מודעת למחרוזות ול-escape)
+- עדיפות לתוכן בתוך code fence (```json ... ```)
+- מתעלמת מטקסט לפני ואחרי ה-JSON
+- תיקונים קלים: פסיקים מיותרים לפני } / ], ותווי בקרה (שורה חדשה) בתוך מחרוזות
+- תיקון תשובה קטועה: סוגר מחרוזת פתוחה וסוגריים פתוחים, וחוזר לאיבר השלם האחרון
+  (find_json מחזיר repaired=True - מי שלא מקבל תוכן חלקי מעביר repair=False)
+- בכשל - JSONExtractionError עם המיקום בטקסט שבו הפרסור נעצר
+
+כל תו נסרק מספר קבוע של פעמים, ותיקון מנסה לכל היותר שני json.loads - זמן לינארי
+"""
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class JSONExtractionError(ValueError):
+    """לא נמצא JSON תקין בטקסט (position = מיקום הכשל בטקסט המקורי)"""
+
+    def __init__(self, message: str, position: Optional[int] = None):
+        if position is not None:
+            message = f"{message} (at char {position})"
+        super().__init__(message)
+        self.position = position
+
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?[ \t]*\r?\n?")
+_OPENER_RES = {False: re.compile(r"\{"), True: re.compile(r"[{\[]")}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """מסיר פסיקים לפני } או ] (מחוץ למחרוזות)"""
+    out: List[str] = []
+    in_string = escape = False
+    pending_comma = None
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if ch.isspace():
+                pending_comma.append(ch)
+                continue
+            if ch not in "}]":
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+        if ch == ",":
+            pending_comma = [ch]
+            continue
+        if ch == '"':
+            in_string = True
+        out.append(ch)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return "".join(out)
+
+
+def _loads(candidate: str) -> Tuple[Any, bool]:
+    """json.loads סובלני - מחזיר (ערך, האם נדרש תיקון)"""
+    try:
+        return json.loads(candidate), False
+    except json.JSONDecodeError:
+        pass
+    except RecursionError:
+        # קינון עמוק מדי למפענח של json - כשל פרסור רגיל, לא קריסה
+        raise json.JSONDecodeError("Nesting too deep", candidate, 0)
+    # strict=False מתיר שורות חדשות / טאבים בתוך מחרוזות
+    try:
+        return json.loads(candidate, strict=False), True
+    except json.JSONDecodeError:
+        return json.loads(_remove_trailing_commas(candidate), strict=False), True
+
+
+class _Scan:
+    """תוצאת סריקה של מבנה אחד החל מסוגר פותח"""
+
+    def __init__(self):
+        self.end: Optional[int] = None          # אינדקס אחרי הסוגר הסוגר (None = קטוע)
+        self.stack: List[str] = []              # סוגרים פתוחים בסוף הטקסט
+        self.in_string = False
+        # נקודת החיתוך הבטוחה האחרונה לתיקון: אחרי פותח / סוגר פנימי, או לפני פסיק.
+        # אחריה אין סוגריים, כך שהסוגרים הפתוחים בה הם stack שבסוף הטקסט
+        self.last_cut: Optional[int] = None
+
+
+def _scan(text: str, start: int) -> _Scan:
+    """סורק מ-start (סוגר פותח) עד שהמבנה נסגר או שהטקסט נגמר"""
+    scan = _Scan()
+    stack = scan.stack
+    in_string = escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            scan.last_cut = i + 1
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                # סוגר לא תואם - המבנה שבור, end שלילי (מיקום הסוגר) ו-stack ריק
+                stack.clear()
+                scan.end = -(i + 1)
+                return scan
+            stack.pop()
+            if not stack:
+                scan.end = i + 1
+                return scan
+            scan.last_cut = i + 1
+        elif ch == ",":
+            scan.last_cut = i
+    scan.in_string = in_string
+    return scan
+
+
+def _close(prefix: str, stack) -> str:
+    return prefix + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _repair_truncated(text: str, start: int, scan: _Scan) -> Optional[Tuple[Any, int]]:
+    """
+    משלים JSON קטוע: קודם סוגר את מה שפתוח כמו שהוא,
+    ואם זה לא תקין (ערך קטוע באמצע, מפתח בלי ערך) - חותך לנקודת החיתוך האחרונה
+    מחזיר (ערך, מיקום החיתוך) או None
+    """
+    tail = text[start:]
+    if scan.in_string:
+        tail += '"'
+    try:
+        return _loads(_close(tail, scan.stack))[0], len(text)
+    except json.JSONDecodeError:
+        pass
+
+    if scan.last_cut is None:
+        return None
+    try:
+        return _loads(_close(text[start:scan.last_cut], scan.stack))[0], scan.last_cut
+    except json.JSONDecodeError:
+        # שגיאה לפני נקודת החיתוך - לא חוזרים אחורה איבר אחרי איבר (ריבועי)
+        return None
+
+
+def find_json(text: str, repair: bool = True, allow_array: bool = False) -> Dict:
+    """
+    מוצא ומפרסר את ה-JSON המאוזן הראשון בטקסט
+
+    Args:
+        text: תשובת המודל (יכולה לכלול הסבר, code fence וטקסט אחרי ה-JSON)
+        repair: לנסות להשלים JSON קטוע
+        allow_array: לקבל גם מערך ברמה העליונה (ברירת מחדל: אובייקט בלבד)
+
+    Returns:
+        {"value": ..., "start": i, "end": j, "repaired": bool}
+        (start/end הם מיקומי ה-JSON בטקסט המקורי)
+
+    Raises:
+        JSONExtractionError: עם position של הכשל
+    """
+    if not text:
+        raise JSONExtractionError("Empty response", 0)
+
+    opener_re = _OPENER_RES[allow_array]
+    error_position = None
+    # מיקומי פתיחה - קודם בתוך code fence, אחר כך מתחילת הטקסט
+    fence = _FENCE_RE.search(text)
+    regions = ([fence.end()] if fence else []) + [0]
+    # פתיחה שנכשלה -> המקום להמשיך ממנו. פתיחות בתוך מבנה שבור שכבר נסרק
+    # מדולגות (חלקים של אותו מבנה) - כך כל תו נסרק מספר קבוע של פעמים
+    failed: Dict[int, int] = {}
+
+    for region in regions:
+        match = opener_re.search(text, region)
+        while match:
+            start = match.start()
+            if start in failed:
+                match = opener_re.search(text, failed[start])
+                continue
+            scan = _scan(text, start)
+
+            if scan.end is None:
+                # הטקסט נגמר לפני שהמבנה נסגר
+                if repair:
+                    repaired = _repair_truncated(text, start, scan)
+                    if repaired is not None:
+                        value, end = repaired
+                        return {"value": value, "start": start, "end": end, "repaired": True}
+                # מבנה קטוע שמתחיל כאן בולע את כל השאר - אין טעם לנסות פתיחות פנימיות
+                raise JSONExtractionError("Could not parse JSON from response", len(text))
+
+            if scan.end > 0:
+                try:
+                    value, repaired = _loads(text[start:scan.end])
+                    return {"value": value, "start": start, "end": scan.end, "repaired": repaired}
+                except json.JSONDecodeError as e:
+                    error_position = start + e.pos
+                failed[start] = scan.end
+            else:
+                # סוגר לא תואם - ממשיכים אחריו
+                error_position = -scan.end - 1
+                failed[start] = -scan.end
+            match = opener_re.search(text, failed[start])
+
+    if error_position is None:
+        raise JSONExtractionError("No JSON object found in response", len(text))
+    raise JSONExtractionError("Could not parse JSON from response", error_position)
+
+
+def extract_json(text: str, repair: bool = True, allow_array: bool = False) -> Any:
+    """
+    מחזיר רק את הערך המפורסר (ראה find_json)
+
+    Example:
+        story = extract_json(response.content[0].text)
+    """
+    return find_json(text, repair=repair, allow_array=allow_array)["value"]
+
+
+if __name__ == "__main__":
+    samples = [
+        'הנה הסיפור:\n```json\n{"title": "נועה", "pages": [{"text": "a } b"}]}\n```\nבהצלחה!',
+        'Sure! {"overall_verdict": "PASS", "reason": "ok",}\nNote: {not json}',
+        '{"title": "קטוע", "pages": [{"text": "עמוד 1"}, {"text": "עמוד 2 שנקט',
+        'no json here',
+    ]
+    for sample in samples:
+        try:
+            result = find_json(sample)
+            print(f"✅ {result['value']} (chars {result['start']}-{result['end']}, "
+                  f"repaired={result['repaired']})")
+        except JSONExtractionError as e:
+            print(f"❌ {e} | position={e.position}")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+LLM Response Cache - מטמון תשובות מודלים על הדיסק
+מפתח = hash של ספק, מודל, פרמטרים ופרומפט
+
+מצבים (LLM_CACHE_MODE):
+- off:           ללא מטמון (ברירת מחדל)
+- deterministic: רק קריאות שסומנו דטרמיניסטיות (ניקוד, QA, דירוג) או temperature=0
+- replay:        כל הקריאות, כולל temperature>0 - ריצה חוזרת זהה וחינמית
+- record:        תמיד קורא ל-API ומעדכן את המטמון (הקלטת fixtures)
+- playback:      אף פעם לא קורא ל-API - החטאה זורקת LLMCacheMiss (לבדיקות)
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import dataclasses
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+
+CACHE_MODES = ("off", "deterministic", "replay", "record", "playback")
+
+
+class LLMCacheMiss(RuntimeError):
+    """אין תשובה שמורה לקריאה במצב playback"""
+    def __init__(self, call_site: str, key: str):
+        super().__init__(f"No cached response for {call_site} (key={key[:12]}) in playback mode")
+        self.call_site = call_site
+        self.key = key
+
+
+def _json_default(obj: Any):
+    """ממיר אובייקטי SDK (GenerationConfig וכו') לצורה יציבה ל-hash"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (bytes, bytearray)):
+        return hashlib.sha256(obj).hexdigest()
+    if hasattr(obj, "__dict__"):
+        return vars(obj)
+    return repr(obj)
+
+
+class LLMCache:
+    """
+    מטמון תשובות על הדיסק עם TTL ופינוי לפי גודל (LRU לפי זמן גישה)
+    """
+
+    # יחסית לחבילה ולא לתיקיית העבודה - אותו מטמון מכל מקום שממנו מריצים
+    DEFAULT_DIR = Path(__file__).parent.parent / "data" / ".llm_cache"
+    DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+    DEFAULT_MAX_ENTRIES = 20000
+    DEFAULT_MAX_MB = 1024
+    # בדיקת פינוי כל N כתיבות (סריקת תיקייה אינה זולה)
+    EVICTION_CHECK_EVERY = 50
+
+    def __init__(self, cache_dir: Path = None, mode: str = None,
+                 ttl_seconds: float = None, max_entries: int = None,
+                 max_mb: float = None):
+        self.cache_dir = Path(cache_dir or os.getenv("LLM_CACHE_DIR", self.DEFAULT_DIR))
+        self.mode = (mode or os.getenv("LLM_CACHE_MODE", "off")).lower()
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {self.mode} (expected one of {CACHE_MODES})")
+
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else
+                                 os.getenv("LLM_CACHE_TTL", self.DEFAULT_TTL_SECONDS))
+        self.max_entries = int(max_entries if max_entries is not None else
+                               os.getenv("LLM_CACHE_MAX_ENTRIES", self.DEFAULT_MAX_ENTRIES))
+        self.max_bytes = int(float(max_mb if max_mb is not None else
+                                   os.getenv("LLM_CACHE_MAX_MB", self.DEFAULT_MAX_MB)) * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_eviction = 0
+
+    @staticmethod
+    def make_key(provider: str, params: Dict) -> str:
+        """מפתח יציב: sha256 של ספק + כל הפרמטרים (כולל מודל ופרומפט)"""
+        payload = json.dumps({"provider": provider, "params": params},
+                             sort_keys=True, ensure_ascii=False, default=_json_default)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def applies_to(self, deterministic: bool) -> bool:
+        """האם קריאה עם סימון דטרמיניסטיות נתון עוברת דרך המטמון"""
+        if self.mode == "off":
+            return False
+        if self.mode == "deterministic":
+            return deterministic
+        return True
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """מחזיר רשומה שמורה או None (פג תוקף = החטאה)"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if self.ttl_seconds > 0 and time.time() - entry.get("stored_at", 0) > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            return None
+
+        # עדכון זמן גישה - בסיס ל-LRU
+        os.utime(path, None)
+        return entry
+
+    def put(self, key: str, response: Any, call_site: str = None, model: str = None):
+        """שומר תשובה (כתיבה אטומית - בטוח לכמה תהליכים ו-threads)"""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            "key": key,
+            "call_site": call_site,
+            "model": model,
+            "stored_at": time.time(),
+            "created_at": datetime.now().isoformat(),
+            "response": response
+        }
+
+        # שם זמני ייחודי - כמה threads באותו תהליך כותבים את אותו מפתח במקביל
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._puts_since_eviction += 1
+        if self._puts_since_eviction >= self.EVICTION_CHECK_EVERY:
+            self.evict()
+
+    def _lookup(self, provider: str, params: Dict, call_site: str) -> tuple:
+        key = self.make_key(provider, params)
+        if self.mode == "record":
+            return key, None
+
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return key, entry
+
+        self.misses += 1
+        if self.mode == "playback":
+            raise LLMCacheMiss(call_site, key)
+        return key, None
+
+    def fetch(self, provider: str, params: Dict, call: Callable[[], Any],
+              serialize: Callable[[Any], Any], deserialize: Callable[[Any], Any],
+              call_site: str, deterministic: bool):
+        """
+        מחזיר תשובה מהמטמון אם קיימת, אחרת קורא ל-API ושומר
+
+        Args:
+            provider: anthropic / openai / gemini
+            params: כל הפרמטרים של הקריאה (חלק מהמפתח)
+            call: הקריאה האמיתית ל-API
+            serialize / deserialize: המרת אובייקט התשובה ל-JSON ובחזרה
+            call_site: שם נקודת הקריאה (לוגים ודיבאג)
+            deterministic: האם נקודת הקריאה הצהירה על תשובה דטרמיניסטית
+        """
+        if not self.applies_to(deterministic):
+            return call()
+
+        key, entry = self._lookup(provider, params, call_site)
+        if entry is not None:
+            return deserialize(entry["response"])
+
+        response = call()
+        self._store(key, serialize(response), call_site, params)
+        return response
+
+    async def fetch_async(self, provider: str, params: Dict, call: Callable[[], Any],
+                          serialize: Callable[[Any], Any], deserialize: Callable[[Any], Any],
+                          call_site: str, deterministic: bool):
+        """כמו fetch, עבור קריאות async (call מחזיר coroutine)"""
+        if not self.applies_to(deterministic):
+            return await call()
+
+        key, entry = self._lookup(provider, params, call_site)
+        if entry is not None:
+            return deserialize(entry["response"])
+
+        response = await call()
+        self._store(key, serialize(response), call_site, params)
+        return response
+
+    def _store(self, key: str, data: Any, call_site: str, params: Dict):
+        # serialize מחזיר None עבור תשובות שאין לשמור (חסומות / ריקות)
+        if data is not None:
+            self.put(key, data, call_site, params.get("model"))
+
+    def evict(self) -> int:
+        """
+        מוחק רשומות שפג תוקפן, ואז את הישנות ביותר (לפי גישה אחרונה)
+        עד שהמטמון בגבולות max_entries / max_bytes
+
+        Returns:
+            מספר רשומות שנמחקו
+        """
+        self._puts_since_eviction = 0
+        if not self.cache_dir.exists():
+            return 0
+
+        now = time.time()
+        removed = 0
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            # mtime מתעדכן בכל hit; רשומה שלא נגעו בה מעבר ל-TTL בוודאי פגה
+            if self.ttl_seconds > 0 and now - stat.st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            removed += 1
+
+        return removed
+
+    def clear(self):
+        """מוחק את כל המטמון"""
+        for path in self.cache_dir.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict:
+        """סטטיסטיקות מטמון"""
+        files = list(self.cache_dir.glob("*/*.json")) if self.cache_dir.exists() else []
+        return {
+            "mode": self.mode,
+            "cache_dir": str(self.cache_dir),
+            "entries": len(files),
+            "size_mb": round(sum(f.stat().st_size for f in files) / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+_default_cache: Optional[LLMCache] = None
+
+
+def get_default_cache() -> LLMCache:
+    """מטמון משותף לכל התהליך (מוגדר ממשתני סביבה)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache()
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[LLMCache]):
+    """מחליף את המטמון המשותף (למשל LLMCache(mode="playback") בבדיקות)"""
+    global _default_cache
+    _default_cache = cache
+
+
+if __name__ == "__main__":
+    cache = get_default_cache()
+    print("📦 LLM Cache")
+    print(json.dumps(cache.get_stats(), ensure_ascii=False, indent=2))
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+LLM Clients - עטיפות שקופות ללקוחות Claude / OpenAI / Gemini עם מטמון דיסק
+
+העטיפות חושפות את אותו API של ה-SDK (messages.create, chat.completions.create,
+generate_content), כך שהסוכנים לא משנים את הקוד שלהם - רק את בניית הלקוח.
+
+כל עטיפה מוגדרת עם call_site (שם נקודת הקריאה) ו-deterministic:
+- True:  הקריאה נשמרת גם במצב "deterministic" (ניקוד, QA, דירוג)
+- False: נשמרת רק במצב "replay"
+- None:  נקבע לפי temperature == 0 של הקריאה
+
+אפשר לדרוס לקריאה בודדת עם cache_site=... / cache_deterministic=...
+ו-cache_variant=... מפריד בין כמה דגימות של אותו פרומפט (best-of-N)
+
+כל קריאה (כולל hit במטמון) נרשמת ביומן העלויות הפעיל (cost_ledger) עם
+ה-usage האמיתי מהתשובה, זמן הקריאה ונקודת הקריאה.
+
+קריאות אמיתיות ל-API עוברות דרך בקר הקצב המשותף של הספק (rate_limiter),
+שמטפל גם בניסיונות החוזרים (429 ושגיאות רשת / 5xx חולפות) - לכן ה-SDK מוגדר
+עם max_retries=0.
+"""
+import time
+import asyncio
+import inspect
+import threading
+import weakref
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from llm_cache import LLMCache, get_default_cache
+from cost_ledger import record_usage
+from rate_limiter import get_limiter, estimate_request_tokens
+
+
+def _resolve_deterministic(deterministic: Optional[bool], params: Dict) -> bool:
+    if deterministic is not None:
+        return deterministic
+    temperature = params.get("temperature")
+    if temperature is None:
+        config = params.get("generation_config")
+        if isinstance(config, dict):
+            temperature = config.get("temperature")
+        else:
+            temperature = getattr(config, "temperature", None)
+    return temperature == 0
+
+
+class _UsageRecorder:
+    """
+    מודד זמן ורושם usage ביומן - מבחין בין קריאת API אמיתית לבין hit במטמון
+    """
+
+    def __init__(self, provider: str, model: str, call_site: str, extract_usage):
+        self.provider = provider
+        self.model = model
+        self.call_site = call_site
+        self.extract_usage = extract_usage
+        self.called_api = False
+        self.started = time.perf_counter()
+
+    def mark_api_call(self):
+        self.called_api = True
+
+    def record(self, response):
+        try:
+            usage = self.extract_usage(response)
+        except AttributeError:
+            usage = {}
+        record_usage(self.provider, self.model, self.call_site, usage,
+                     time.perf_counter() - self.started, cache_hit=not self.called_api)
+        return response
+
+
+def _billable_tokens(extract_usage):
+    """טוקנים שנספרים במכסת TPM (קריאות מה-prompt cache לא נספרות)"""
+    def count(response) -> int:
+        usage = extract_usage(response)
+        return (usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                + usage.get("cache_write_tokens", 0))
+    return count
+
+
+class _CachedCreate:
+    """
+    עוטף פונקציית create של SDK (sync או async) בקריאה דרך המטמון
+    """
+
+    def __init__(self, create, provider: str, serialize, deserialize, extract_usage,
+                 call_site: str, deterministic: Optional[bool], cache: Optional[LLMCache]):
+        self._create = create
+        self._provider = provider
+        self._serialize = serialize
+        self._deserialize = deserialize
+        self._extract_usage = extract_usage
+        self._call_site = call_site
+        self._deterministic = deterministic
+        self._cache = cache
+        # create של ה-SDK עטופה ב-decorators - בודקים את הפונקציה המקורית
+        self._is_async = inspect.iscoroutinefunction(inspect.unwrap(create))
+        self._limiter = get_limiter(provider)
+        self._count_tokens = _billable_tokens(extract_usage)
+
+    def _prepare(self, kwargs: Dict):
+        call_site = kwargs.pop("cache_site", self._call_site)
+        deterministic = kwargs.pop("cache_deterministic", self._deterministic)
+        # cache_variant נכנס למפתח בלבד (לא נשלח ל-API) - מבדיל בין מועמדים מקבילים
+        variant = kwargs.pop("cache_variant", None)
+        key_params = kwargs if variant is None else {**kwargs, "cache_variant": variant}
+        cache = self._cache or get_default_cache()
+        return cache, call_site, _resolve_deterministic(deterministic, kwargs), key_params
+
+    def __call__(self, **kwargs):
+        cache, call_site, deterministic, key_params = self._prepare(kwargs)
+        recorder = _UsageRecorder(self._provider, kwargs.get("model"), call_site, self._extract_usage)
+
+        def call():
+            recorder.mark_api_call()
+            estimated = estimate_request_tokens(kwargs)
+            if self._is_async:
+                return self._limiter.call_async(lambda: self._create(**kwargs),
+                                                estimated, self._count_tokens)
+            return self._limiter.call(lambda: self._create(**kwargs),
+                                      estimated, self._count_tokens)
+
+        if self._is_async:
+            async def run():
+                response = await cache.fetch_async(
+                    self._provider, key_params, call,
+                    self._serialize, self._deserialize, call_site, deterministic
+                )
+                return recorder.record(response)
+            return run()
+
+        response = cache.fetch(
+            self._provider, key_params, call,
+            self._serialize, self._deserialize, call_site, deterministic
+        )
+        return recorder.record(response)
+
+
+class _ClientProxy:
+    """בסיס משותף: כל מאפיין שלא נעטף מועבר ללקוח המקורי"""
+
+    def __init__(self, client, call_site: str, deterministic: Optional[bool] = None,
+                 cache: Optional[LLMCache] = None):
+        self._client = client
+        self._call_site = call_site
+        self._deterministic = deterministic
+        self._cache = cache
+
+    def with_cache_site(self, call_site: str, deterministic: Optional[bool] = None):
+        """מחזיר עטיפה חדשה לאותו לקוח עם נקודת קריאה אחרת"""
+        return type(self)(self._client, call_site, deterministic, self._cache)
+
+    @property
+    def raw(self):
+        """הלקוח המקורי של ה-SDK (ללא מטמון)"""
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# ============================================================
+# Anthropic
+# ============================================================
+
+def _serialize_model(response) -> Dict:
+    return response.model_dump(mode="json")
+
+
+def _deserialize_anthropic(data: Dict):
+    from anthropic.types import Message
+    return Message.model_validate(data)
+
+
+def _anthropic_usage(response) -> Dict:
+    usage = response.usage
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0
+    }
+
+
+class _AnthropicMessages:
+    def __init__(self, proxy: "CachedAnthropic"):
+        self._messages = proxy._client.messages
+        self.create = _CachedCreate(
+            self._messages.create, "anthropic", _serialize_model, _deserialize_anthropic, _anthropic_usage,
+            proxy._call_site, proxy._deterministic, proxy._cache
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class CachedAnthropic(_ClientProxy):
+    """עטיפה ל-Anthropic / AsyncAnthropic"""
+
+    @property
+    def messages(self):
+        return _AnthropicMessages(self)
+
+
+# ============================================================
+# OpenAI
+# ============================================================
+
+def _deserialize_openai(data: Dict):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(data)
+
+
+def _openai_usage(response) -> Dict:
+    # prompt_tokens של OpenAI כולל את הטוקנים שהגיעו מה-prompt cache
+    usage = response.usage
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    return {
+        "input_tokens": usage.prompt_tokens - cached,
+        "output_tokens": usage.completion_tokens,
+        "cache_read_tokens": cached
+    }
+
+
+class _OpenAICompletions:
+    def __init__(self, proxy: "CachedOpenAI"):
+        self._completions = proxy._client.chat.completions
+        self.create = _CachedCreate(
+            self._completions.create, "openai", _serialize_model, _deserialize_openai, _openai_usage,
+            proxy._call_site, proxy._deterministic, proxy._cache
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _OpenAIChat:
+    def __init__(self, proxy: "CachedOpenAI"):
+        self._chat = proxy._client.chat
+        self.completions = _OpenAICompletions(proxy)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class CachedOpenAI(_ClientProxy):
+    """עטיפה ל-OpenAI / AsyncOpenAI"""
+
+    @property
+    def chat(self):
+        return _OpenAIChat(self)
+
+
+# ============================================================
+# Gemini (google.generativeai)
+# ============================================================
+
+def _gemini_usage(response) -> Dict:
+    # prompt_token_count של Gemini כולל את הטוקנים מ-cached content
+    usage = response.usage_metadata
+    cached = getattr(usage, "cached_content_token_count", 0) or 0
+    return {
+        "input_tokens": (usage.prompt_token_count or 0) - cached,
+        "output_tokens": usage.candidates_token_count or 0,
+        "cache_read_tokens": cached
+    }
+
+
+def _serialize_gemini(response) -> Optional[Dict]:
+    try:
+        text = response.text
+    except ValueError:
+        # תשובה חסומה / ריקה - לא נשמרת
+        return None
+    try:
+        usage = _gemini_usage(response)
+    except AttributeError:
+        usage = {}
+    data = {"text": text, "usage": usage}
+    if hasattr(response, "to_dict"):
+        # התשובה המלאה (candidates, prompt_feedback ...) - hit מחזיר את אותו טיפוס כמו miss
+        data["response"] = response.to_dict()
+    return data
+
+
+def _deserialize_gemini(data: Dict):
+    if "response" in data:
+        from google.generativeai import protos
+        from google.generativeai.types import GenerateContentResponse
+        return GenerateContentResponse.from_response(protos.GenerateContentResponse(data["response"]))
+    # רשומות ישנות במטמון - רק טקסט ו-usage
+    usage = data.get("usage", {})
+    return SimpleNamespace(
+        text=data["text"],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=usage.get("input_tokens", 0) + usage.get("cache_read_tokens", 0),
+            candidates_token_count=usage.get("output_tokens", 0),
+            cached_content_token_count=usage.get("cache_read_tokens", 0)
+        )
+    )
+
+
+class CachedGeminiModel(_ClientProxy):
+    """
+    עטיפה ל-genai.GenerativeModel
+    תשובה מהמטמון היא GenerateContentResponse משוחזר (text, candidates, prompt_feedback, usage_metadata)
+    """
+
+    def generate_content(self, contents, **kwargs):
+        cache = self._cache or get_default_cache()
+        call_site = kwargs.pop("cache_site", self._call_site)
+        deterministic = _resolve_deterministic(
+            kwargs.pop("cache_deterministic", self._deterministic), kwargs
+        )
+        params = {"model": self._client.model_name, "contents": contents, **kwargs}
+        recorder = _UsageRecorder("gemini", self._client.model_name, call_site, _gemini_usage)
+
+        def call():
+            recorder.mark_api_call()
+            return get_limiter("gemini").call(
+                lambda: self._client.generate_content(contents, **kwargs),
+                estimate_request_tokens({"contents": contents}),
+                _billable_tokens(_gemini_usage)
+            )
+
+        response = cache.fetch(
+            "gemini", params, call,
+            _serialize_gemini, _deserialize_gemini, call_site, deterministic
+        )
+        return recorder.record(response)
+
+
+# אורך מינימלי של prefix ש-Anthropic שומר ב-prompt cache - מתחתיו cache_control
+# פשוט לא נשמר (אין חיסכון), אז לא מסמנים
+CACHE_MIN_TOKENS = 1024
+CACHE_MIN_TOKENS_HAIKU = 2048
+
+
+def cached_system(text: str, model: str = None) -> List[Dict]:
+    """
+    בלוק system סטטי, מסומן ל-prompt caching של Anthropic כשהוא ארוך מספיק
+
+    הטקסט חייב להיות זהה בין קריאות (תוכן משתנה הולך להודעת ה-user, בסוף).
+    cache_control נוסף רק אם האומדן (estimate_request_tokens) מגיע למינימום
+    של המודל - 1024 טוקנים, 2048 ב-Haiku.
+    """
+    block = {"type": "text", "text": text}
+    minimum = CACHE_MIN_TOKENS_HAIKU if model and "haiku" in model else CACHE_MIN_TOKENS
+    if estimate_request_tokens({"system": text}) >= minimum:
+        block["cache_control"] = {"type": "ephemeral"}
+    return [block]
+
+
+class LoopLocalClient:
+    """
+    לקוח async (AsyncAnthropic / AsyncOpenAI עטוף) נפרד לכל event loop
+
+    ה-pool של httpx נקשר ל-loop שבו נפתחו החיבורים. asyncio.run נפרד לכל סבב
+    סוגר את ה-loop בסופו, ולקוח משותף נכשל בסבב הבא ב-"Event loop is closed".
+    כאן כל loop מקבל לקוח משלו (factory), ו-aclose() בסוף הסבב סוגר אותו
+    בתוך ה-loop שלו. שאר המאפיינים מועברים ללקוח של ה-loop הנוכחי.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def current(self):
+        """הלקוח של ה-loop שרץ עכשיו (נוצר בקריאה הראשונה ב-loop)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = self._factory()
+        return client
+
+    async def aclose(self):
+        """סוגר את הלקוח של ה-loop הנוכחי - לקרוא בסוף הסבב, לפני שה-loop נסגר"""
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+def wrap_anthropic(client, call_site: str = "anthropic", deterministic: Optional[bool] = None,
+                   cache: Optional[LLMCache] = None) -> CachedAnthropic:
+    # הניסיונות החוזרים (429 ושגיאות חולפות) מנוהלים ב-rate_limiter, כולל retry-after משותף
+    return CachedAnthropic(client.with_options(max_retries=0), call_site, deterministic, cache)
+
+
+def wrap_openai(client, call_site: str = "openai", deterministic: Optional[bool] = None,
+                cache: Optional[LLMCache] = None) -> CachedOpenAI:
+    return CachedOpenAI(client.with_options(max_retries=0), call_site, deterministic, cache)
+
+
+def wrap_gemini(model, call_site: str = "gemini", deterministic: Optional[bool] = None,
+                cache: Optional[LLMCache] = None) -> CachedGeminiModel:
+    return CachedGeminiModel(model, call_site, deterministic, cache)
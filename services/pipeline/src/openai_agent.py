@@ -3,74 +3,103 @@ OpenAI Agent - אחראי על הערכה וביקורת
 """
 import os
 import json
-from openai import OpenAI
-from typing import Dict, List
+import asyncio
+from openai import OpenAI, AsyncOpenAI
+from typing import Dict, List, Optional, Union
 from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
 from rating_system import RatingSystem
+from llm_clients import LoopLocalClient, wrap_openai
 
 load_dotenv()
 
 
+class ItemRating(BaseModel):
+    """דירוג של פריט בודד בתוך תשובת אצווה"""
+    index: int
+    scores: Dict[str, float]
+    weighted_score: float = 0
+    reasoning: str = ""
+    suggestions: str = ""
+
+
+class BatchRatingResponse(BaseModel):
+    """תשובת דירוג אצווה - מערך דירוגים לפי אינדקס"""
+    ratings: List[ItemRating]
+
+
 class OpenAIAgent:
-    def __init__(self, model: str = None):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # מספר בקשות מקבילות מקסימלי בדירוג אסינכרוני
+    DEFAULT_MAX_CONCURRENCY = 8
+    # ניסיונות חוזרים לכל פריט (שגיאת רשת / JSON שבור)
+    DEFAULT_MAX_RETRIES = 3
+
+    # גודל חלון הקשר (טוקנים) ומקסימום טוקני פלט לפי מודל - לחישוב גודל אצווה
+    MODEL_LIMITS = {
+        "gpt-4o-mini": {"context": 128000, "output": 16384},
+        "gpt-4o": {"context": 128000, "output": 16384},
+        "gpt-4-turbo": {"context": 128000, "output": 4096},
+        "gpt-4": {"context": 8192, "output": 4096},
+        "gpt-3.5-turbo": {"context": 16385, "output": 4096},
+    }
+    DEFAULT_MODEL_LIMITS = {"context": 16000, "output": 4096}
+    # טוקני פלט משוערים לדירוג של פריט אחד (ציונים + נימוק + הצעות בעברית)
+    OUTPUT_TOKENS_PER_ITEM = 400
+    MAX_BATCH_SIZE = 20
+
+    def __init__(self, model: str = None, max_concurrency: int = None,
+                 max_retries: int = None):
+        # דירוג הוא קריאה דטרמיניסטית (אותה רובריקה + אותו תוכן = אותו ציון)
+        self.client = wrap_openai(OpenAI(api_key=os.getenv("OPENAI_API_KEY")),
+                                  "openai_rating", deterministic=True)
+        # לקוח לכל event loop - כל סבב דירוג רץ ב-asyncio.run משלו (aclose בסוף הסבב)
+        self.async_client = LoopLocalClient(lambda: wrap_openai(
+            AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")), "openai_rating", deterministic=True
+        ))
         self.model = model or os.getenv("OPENAI_MODEL", "gpt-4o")
         self.rating_system = RatingSystem()
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("OPENAI_MAX_CONCURRENCY", self.DEFAULT_MAX_CONCURRENCY)
+        )
+        self.max_retries = max_retries or self.DEFAULT_MAX_RETRIES
 
-    def rate_topics(self, topics: List[Dict]) -> List[Dict]:
-        """
-        מעריך רשימת נושאים לפי קריטריוני הדירוג
-
-        Returns:
-            רשימת נושאים עם ציונים ומשוב
-        """
-        rating_prompt = self.rating_system.get_rating_prompt("topic_rating")
-
-        results = []
-        for topic in topics:
-            system_prompt = """אתה מומחה לחינוך והתפתחות ילדים.
+    TOPIC_SYSTEM_PROMPT = """אתה מומחה לחינוך והתפתחות ילדים.
 תפקידך להעריך נושאים לספרי ילדים בצורה אובייקטיבית וקפדנית.
 היה ביקורתי אך בונה, והצע שיפורים קונקרטיים."""
 
-            user_prompt = f"""העריך את הנושא הבא:
+    CHARACTER_SYSTEM_PROMPT = """אתה מומחה לפיתוח דמויות בספרות ילדים.
+העריך את הדמות לפי פוטנציאל הזיהוי, הייחודיות והמשיכה הויזואלית."""
 
-שם: {topic['name']}
+    @staticmethod
+    def _describe_topic(topic: Dict) -> str:
+        return f"""שם: {topic['name']}
 תת-נושאים: {', '.join(topic['sub_topics'])}
 ערך חינוכי: {topic['educational_value']}
-רעיון לעלילה: {topic['story_concept']}
+רעיון לעלילה: {topic['story_concept']}"""
 
-{rating_prompt}
-"""
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
+    @staticmethod
+    def _describe_character(character: Dict) -> str:
+        return f"""שם: {character['name']}
+תיאור פיזי: {character['physical_description']}
+אופי: {character['personality']}
+רקע: {character['background']}
+ייחודיות: {character['unique_trait']}"""
 
-            rating_data = json.loads(response.choices[0].message.content)
+    def _build_topic_messages(self, topic: Dict, rating_prompt: str) -> List[Dict]:
+        system_prompt = self.TOPIC_SYSTEM_PROMPT
 
-            results.append({
-                "topic": topic,
-                "rating": rating_data,
-                "approved": self.rating_system.meets_threshold(
-                    rating_data["weighted_score"],
-                    "topic_rating"
-                )
-            })
+        user_prompt = f"""העריך את הנושא הבא:
 
-        return results
+{self._describe_topic(topic)}
 
-    def rate_story(self, story: Dict, topic: Dict) -> Dict:
-        """
-        מעריך סיפור מלא
-        """
-        rating_prompt = self.rating_system.get_rating_prompt("story_rating")
+{rating_prompt}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
+    def _build_story_messages(self, story: Dict, topic: Dict, rating_prompt: str) -> List[Dict]:
         system_prompt = """אתה עורך ומבקר ספרים מנוסה המתמחה בספרות ילדים.
 העריך את הסיפור לפי איכות הכתיבה, המסר החינוכי, והתאמה לגיל היעד.
 היה ביקורתי ודרוש רמה גבוהה."""
@@ -91,18 +120,304 @@ class OpenAIAgent:
 
 {rating_prompt}
 """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _build_character_messages(self, character: Dict, rating_prompt: str) -> List[Dict]:
+        system_prompt = self.CHARACTER_SYSTEM_PROMPT
+
+        user_prompt = f"""העריך את הדמות הבאה:
+
+{self._describe_character(character)}
+
+{rating_prompt}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _build_batch_messages(self, system_prompt: str, item_label: str,
+                              descriptions: List[str], rating_prompt: str) -> List[Dict]:
+        """
+        בונה בקשה אחת לכמה פריטים - הרובריקה נשלחת פעם אחת בלבד
+        """
+        items_text = ""
+        for index, description in enumerate(descriptions):
+            items_text += f"=== {item_label} #{index} ===\n{description}\n\n"
+
+        user_prompt = f"""העריך כל אחד מהפריטים הבאים בנפרד ובאופן בלתי תלוי:
+
+{items_text}
+{rating_prompt}
+
+חשוב: יש {len(descriptions)} פריטים. החזר דירוג נפרד לכל פריט, בפורמט JSON הבא:
+{{
+    "ratings": [
+        {{
+            "index": מספר הפריט,
+            "scores": {{"criterion_name": score, ...}},
+            "weighted_score": final_score,
+            "reasoning": "הסבר מפורט לציונים",
+            "suggestions": "הצעות לשיפור"
+        }}
+    ]
+}}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _estimate_tokens(self, text: str) -> int:
+        """אומדן גס - בערך 2.5 תווים לטוקן בעברית"""
+        return int(len(text) / 2.5) + 1
+
+    def get_batch_size(self, descriptions: List[str], rating_prompt: str) -> int:
+        """
+        מחשב כמה פריטים נכנסים לבקשה אחת לפי גודל חלון ההקשר של המודל
+
+        Returns:
+            K - מספר פריטים לאצווה (לפחות 1)
+        """
+        limits = self.DEFAULT_MODEL_LIMITS
+        # התאמת prefix ארוך ביותר (gpt-4o-mini לפני gpt-4o)
+        for model_prefix in sorted(self.MODEL_LIMITS, key=len, reverse=True):
+            if self.model.startswith(model_prefix):
+                limits = self.MODEL_LIMITS[model_prefix]
+                break
+
+        if not descriptions:
+            return 1
+
+        fixed_tokens = self._estimate_tokens(rating_prompt) + 500
+        item_tokens = max(self._estimate_tokens(d) for d in descriptions) + 20
+
+        by_context = (limits["context"] - fixed_tokens) // (item_tokens + self.OUTPUT_TOKENS_PER_ITEM)
+        by_output = limits["output"] // self.OUTPUT_TOKENS_PER_ITEM
+
+        return max(1, min(self.MAX_BATCH_SIZE, by_context, by_output))
 
+    def _parse_batch_ratings(self, content: str, batch_size: int,
+                             rating_type: str) -> Dict[int, Dict]:
+        """
+        מוודא את תשובת האצווה מול הסכמה ומחשב מחדש את הציון המשוקלל
+
+        Returns:
+            {index: rating_data} - רק פריטים תקינים; חסרים ייפלו לדירוג בודד
+        """
+        try:
+            parsed = BatchRatingResponse.model_validate_json(content)
+        except ValidationError as e:
+            print(f"⚠️  תשובת אצווה לא תקינה: {e.error_count()} שגיאות")
+            return {}
+
+        criteria_names = {c['name'] for c in self.rating_system.criteria[rating_type]['criteria']}
+
+        ratings = {}
+        for item in parsed.ratings:
+            if not 0 <= item.index < batch_size or item.index in ratings:
+                continue
+            # בלי ציון לכל קריטריון אי אפשר לחשב ציון משוקלל אמין
+            if not criteria_names.issubset(item.scores):
+                continue
+
+            ratings[item.index] = {
+                "scores": item.scores,
+                "weighted_score": self.rating_system.calculate_weighted_score(
+                    item.scores, rating_type
+                ),
+                "reasoning": item.reasoning,
+                "suggestions": item.suggestions
+            }
+
+        return ratings
+
+    def _rate(self, messages: List[Dict]) -> Dict:
+        """קריאה סינכרונית אחת למודל ופרסור הדירוג"""
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            messages=messages,
             temperature=0.3,
             response_format={"type": "json_object"}
         )
 
-        rating_data = json.loads(response.choices[0].message.content)
+        return json.loads(response.choices[0].message.content)
+
+    async def _rate_async(self, messages: List[Dict],
+                          semaphore: asyncio.Semaphore) -> Dict:
+        """
+        קריאה אסינכרונית אחת עם הגבלת מקביליות וניסיונות חוזרים
+
+        כל פריט מנוסה עד max_retries פעמים בנפרד, כך שכשל של פריט אחד
+        לא מפיל את כל האצווה.
+        """
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        response_format={"type": "json_object"}
+                    )
+                rating_data = json.loads(response.choices[0].message.content)
+                if "weighted_score" not in rating_data:
+                    raise ValueError("Rating response missing weighted_score")
+                return rating_data
+            except Exception as e:
+                last_error = e
+                if attempt < self.max_retries:
+                    await asyncio.sleep(2 ** (attempt - 1))
+
+        raise RuntimeError(f"Rating failed after {self.max_retries} attempts: {last_error}")
+
+    async def _rate_each_async(self, messages_list: List[List[Dict]],
+                               semaphore: asyncio.Semaphore) -> List[Union[Dict, Exception]]:
+        """
+        מדרג כל בקשה בנפרד - פריט שנכשל סופית מחזיר את השגיאה ולא מפיל את שאר הדירוגים
+        """
+        results = await asyncio.gather(*[
+            self._rate_async(messages, semaphore) for messages in messages_list
+        ], return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️  דירוג פריט נכשל: {result}")
+        return results
+
+    @staticmethod
+    def _raise_if_all_failed(ratings: List[Union[Dict, Exception]]):
+        """
+        כל הפריטים נכשלו (למשל OpenAI לא זמין) - מעלים את השגיאה במקום רשימה ריקה,
+        אחרת ה-Orchestrator ממשיך לשלם על הצעות חדשות בלי משוב עד max_iterations
+        """
+        if ratings and all(isinstance(rating, Exception) for rating in ratings):
+            raise ratings[0]
+
+    async def _rate_many_async(self, messages_list: List[List[Dict]]) -> List[Union[Dict, Exception]]:
+        """מדרג רשימת בקשות במקביל - התוצאות חוזרות לפי סדר הקלט (Exception = נכשל)"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await self._rate_each_async(messages_list, semaphore)
+
+    async def _rate_batched_async(self, system_prompt: str, item_label: str,
+                                  descriptions: List[str], rating_type: str,
+                                  single_messages: List[List[Dict]]) -> List[Union[Dict, Exception]]:
+        """
+        מדרג פריטים באצוות של K בבקשה אחת, אצוות במקביל
+
+        הרובריקה נשלחת בלי פורמט הפריט הבודד - לאצווה יש פורמט "ratings" משלה.
+        פריטים שחסרים בתשובה או לא עברו ולידציה מדורגים בנפרד.
+        התוצאות חוזרות לפי סדר הקלט (Exception = הדירוג הבודד נכשל).
+        """
+        rating_prompt = self.rating_system.get_rating_prompt(rating_type, include_output_format=False)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batch_size = self.get_batch_size(descriptions, rating_prompt)
+
+        async def rate_batch(start: int) -> List[Union[Dict, Exception]]:
+            chunk = descriptions[start:start + batch_size]
+            messages = self._build_batch_messages(system_prompt, item_label, chunk, rating_prompt)
+
+            ratings = {}
+            try:
+                async with semaphore:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        response_format={"type": "json_object"}
+                    )
+                ratings = self._parse_batch_ratings(
+                    response.choices[0].message.content, len(chunk), rating_type
+                )
+            except Exception as e:
+                print(f"⚠️  דירוג אצווה נכשל ({e}), עובר לדירוג בודד")
+
+            missing = [i for i in range(len(chunk)) if i not in ratings]
+            fallback = await self._rate_each_async(
+                [single_messages[start + i] for i in missing], semaphore
+            )
+            ratings.update(zip(missing, fallback))
+
+            return [ratings[i] for i in range(len(chunk))]
+
+        batches = await asyncio.gather(*[
+            rate_batch(start) for start in range(0, len(descriptions), batch_size)
+        ])
+        return [rating for batch in batches for rating in batch]
+
+    def rate_topics(self, topics: List[Dict]) -> List[Dict]:
+        """
+        מעריך רשימת נושאים לפי קריטריוני הדירוג
+
+        Returns:
+            רשימת נושאים עם ציונים ומשוב
+        """
+        rating_prompt = self.rating_system.get_rating_prompt("topic_rating")
+
+        results = []
+        for topic in topics:
+            rating_data = self._rate(self._build_topic_messages(topic, rating_prompt))
+
+            results.append({
+                "topic": topic,
+                "rating": rating_data,
+                "approved": self.rating_system.meets_threshold(
+                    rating_data["weighted_score"],
+                    "topic_rating"
+                )
+            })
+
+        return results
+
+    async def rate_topics_async(self, topics: List[Dict], batched: bool = False) -> List[Dict]:
+        """
+        גרסה אסינכרונית של rate_topics - כל הנושאים מדורגים במקביל
+
+        Args:
+            topics: רשימת נושאים
+            batched: לארוז כמה נושאים בבקשה אחת (הרובריקה נשלחת פעם אחת)
+
+        Returns:
+            רשימת נושאים עם ציונים ומשוב, באותו סדר כמו הקלט
+            (נושא שהדירוג שלו נכשל בכל הניסיונות לא מוחזר; אם כולם נכשלו - השגיאה עולה)
+        """
+        rating_prompt = self.rating_system.get_rating_prompt("topic_rating")
+        single_messages = [self._build_topic_messages(topic, rating_prompt) for topic in topics]
+
+        if batched:
+            ratings = await self._rate_batched_async(
+                self.TOPIC_SYSTEM_PROMPT, "נושא",
+                [self._describe_topic(topic) for topic in topics],
+                "topic_rating", single_messages
+            )
+        else:
+            ratings = await self._rate_many_async(single_messages)
+        self._raise_if_all_failed(ratings)
+
+        return [
+            {
+                "topic": topic,
+                "rating": rating_data,
+                "approved": self.rating_system.meets_threshold(
+                    rating_data["weighted_score"],
+                    "topic_rating"
+                )
+            }
+            for topic, rating_data in zip(topics, ratings)
+            if not isinstance(rating_data, Exception)
+        ]
+
+    def rate_story(self, story: Dict, topic: Dict) -> Dict:
+        """
+        מעריך סיפור מלא
+        """
+        rating_prompt = self.rating_system.get_rating_prompt("story_rating")
+
+        rating_data = self._rate(self._build_story_messages(story, topic, rating_prompt))
 
         return {
             "story": story,
@@ -113,6 +428,31 @@ class OpenAIAgent:
             )
         }
 
+    async def rate_stories_async(self, stories: List[Dict], topic: Dict) -> List[Dict]:
+        """
+        מעריך כמה סיפורים מועמדים לאותו נושא במקביל
+        (סיפור שהדירוג שלו נכשל בכל הניסיונות לא מוחזר; אם כולם נכשלו - השגיאה עולה)
+        """
+        rating_prompt = self.rating_system.get_rating_prompt("story_rating")
+
+        ratings = await self._rate_many_async([
+            self._build_story_messages(story, topic, rating_prompt) for story in stories
+        ])
+        self._raise_if_all_failed(ratings)
+
+        return [
+            {
+                "story": story,
+                "rating": rating_data,
+                "approved": self.rating_system.meets_threshold(
+                    rating_data["weighted_score"],
+                    "story_rating"
+                )
+            }
+            for story, rating_data in zip(stories, ratings)
+            if not isinstance(rating_data, Exception)
+        ]
+
     def rate_characters(self, characters: List[Dict]) -> List[Dict]:
         """
         מעריך דמויות
@@ -121,42 +461,60 @@ class OpenAIAgent:
 
         results = []
         for character in characters:
-            system_prompt = """אתה מומחה לפיתוח דמויות בספרות ילדים.
-העריך את הדמות לפי פוטנציאל הזיהוי, הייחודיות והמשיכה הויזואלית."""
+            rating_data = self._rate(self._build_character_messages(character, rating_prompt))
 
-            user_prompt = f"""העריך את הדמות הבאה:
+            results.append({
+                "character": character,
+                "rating": rating_data,
+                "approved": self.rating_system.meets_threshold(
+                    rating_data["weighted_score"],
+                    "character_rating"
+                )
+            })
 
-שם: {character['name']}
-תיאור פיזי: {character['physical_description']}
-אופי: {character['personality']}
-רקע: {character['background']}
-ייחודיות: {character['unique_trait']}
+        return results
 
-{rating_prompt}
-"""
+    async def rate_characters_async(self, characters: List[Dict],
+                                    batched: bool = False) -> List[Dict]:
+        """
+        גרסה אסינכרונית של rate_characters - כל הדמויות מדורגות במקביל
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
+        Args:
+            characters: רשימת דמויות
+            batched: לארוז כמה דמויות בבקשה אחת (הרובריקה נשלחת פעם אחת)
 
-            rating_data = json.loads(response.choices[0].message.content)
+        Returns:
+            דמויות עם ציונים, באותו סדר כמו הקלט (דמות שהדירוג שלה נכשל לא מוחזרת;
+            אם כולן נכשלו - השגיאה עולה)
+        """
+        rating_prompt = self.rating_system.get_rating_prompt("character_rating")
+        single_messages = [
+            self._build_character_messages(character, rating_prompt)
+            for character in characters
+        ]
+
+        if batched:
+            ratings = await self._rate_batched_async(
+                self.CHARACTER_SYSTEM_PROMPT, "דמות",
+                [self._describe_character(character) for character in characters],
+                "character_rating", single_messages
+            )
+        else:
+            ratings = await self._rate_many_async(single_messages)
+        self._raise_if_all_failed(ratings)
 
-            results.append({
+        return [
+            {
                 "character": character,
                 "rating": rating_data,
                 "approved": self.rating_system.meets_threshold(
                     rating_data["weighted_score"],
                     "character_rating"
                 )
-            })
-
-        return results
+            }
+            for character, rating_data in zip(characters, ratings)
+            if not isinstance(rating_data, Exception)
+        ]
 
 
 # Test
@@ -172,5 +530,11 @@ if __name__ == "__main__":
         "story_concept": "ילד/ה שמפחדים מהמעבר לישון בלי חיתול"
     }
 
-    result = agent.rate_topics([test_topic])
+    async def rate_once():
+        try:
+            return await agent.rate_topics_async([test_topic])
+        finally:
+            await agent.async_client.aclose()
+
+    result = asyncio.run(rate_once())
     print(json.dumps(result, ensure_ascii=False, indent=2))
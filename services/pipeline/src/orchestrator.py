@@ -4,6 +4,7 @@ Orchestrator - מנהל את התהליך המלא של יצירת הספרים
 """
 import json
 import time
+import asyncio
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
@@ -11,14 +12,21 @@ from claude_agent import ClaudeAgent
 from openai_agent import OpenAIAgent
 from gemini_agent import GeminiAgent
 from rating_system import RatingSystem
+from cost_ledger import CostLedger, set_active_ledger, ledger_context
 
 
 class Orchestrator:
-    def __init__(self, output_dir: str = None):
+    def __init__(self, output_dir: str = None, batched_rating: bool = False):
+        """
+        Args:
+            output_dir: תיקיית פלט
+            batched_rating: לדרג כמה נושאים/דמויות בבקשה אחת ל-OpenAI
+        """
         self.claude = ClaudeAgent()
         self.openai = OpenAIAgent()
         self.gemini = GeminiAgent()
         self.rating_system = RatingSystem()
+        self.batched_rating = batched_rating
 
         if output_dir is None:
             output_dir = Path(__file__).parent.parent / "data"
@@ -34,6 +42,12 @@ class Orchestrator:
                         self.ratings_dir, self.images_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
+        # יומן עלויות - כל קריאות Claude / OpenAI / Gemini של הסשן
+        ledger_path = self.output_dir / "logs" / f"cost_ledger_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        self.ledger = CostLedger(ledger_path)
+        set_active_ledger(self.ledger)
+
+    @ledger_context(stage="topics")
     def generate_topics_with_approval(self, num_topics: int = 100,
                                      max_iterations: int = 5) -> List[Dict]:
         """
@@ -60,9 +74,11 @@ class Orchestrator:
                 existing_feedback=feedback
             )
 
-            # OpenAI מעריך
+            # OpenAI מעריך - כל ההצעות במקביל
             print("🔍 OpenAI מעריך את ההצעות...")
-            evaluations = self.openai.rate_topics(proposed['topics'])
+            evaluations = asyncio.run(self._rating_round(self.openai.rate_topics_async(
+                proposed['topics'], batched=self.batched_rating
+            )))
 
             # סינון נושאים מאושרים
             new_approved = [
@@ -107,6 +123,7 @@ class Orchestrator:
         print(f"\n✅ הושלם! {len(final_topics)} נושאים נשמרו ב-{output_file}")
         return final_topics
 
+    @ledger_context(stage="characters")
     def generate_characters_with_approval(self, num_characters: int = 10,
                                          max_iterations: int = 5) -> List[Dict]:
         """
@@ -132,7 +149,9 @@ class Orchestrator:
             )
 
             print("🔍 OpenAI מעריך...")
-            evaluations = self.openai.rate_characters(proposed['characters'])
+            evaluations = asyncio.run(self._rating_round(self.openai.rate_characters_async(
+                proposed['characters'], batched=self.batched_rating
+            )))
 
             new_approved = [
                 eval_result for eval_result in evaluations
@@ -164,6 +183,7 @@ class Orchestrator:
         print(f"\n✅ הושלם! {len(final_characters)} דמויות נשמרו ב-{output_file}")
         return final_characters
 
+    @ledger_context(stage="story")
     def create_story_with_approval(self, topic: Dict, character: Dict,
                                    style_guide: Dict, max_iterations: int = 5) -> Dict:
         """
@@ -249,6 +269,13 @@ class Orchestrator:
 
         return final_output
 
+    async def _rating_round(self, ratings):
+        """סבב דירוג אחד ב-loop משלו - הלקוח של הסבב נסגר לפני שה-loop נסגר"""
+        try:
+            return await ratings
+        finally:
+            await self.openai.async_client.aclose()
+
     def _compile_feedback(self, rejected_items: List[Dict]) -> str:
         """
         מרכז משוב מפריטים שנדחו
@@ -323,3 +350,5 @@ if __name__ == "__main__":
         )
 
         print("\n🎉 תהליך הושלם בהצלחה!")
+
+    orchestrator.ledger.print_report()
@@ -4,12 +4,14 @@ Orchestrator מותאם לעלויות - גרסה חסכונית
 """
 import json
 import time
+import asyncio
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
 from cost_optimizer import CostOptimizer, CostEfficientClaudeAgent, CostEfficientOpenAIAgent
 from gemini_agent import GeminiAgent
 from rating_system import RatingSystem
+from json_extraction import extract_json
 
 
 class OptimizedOrchestrator:
@@ -42,12 +44,29 @@ class OptimizedOrchestrator:
                         self.ratings_dir, self.images_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
+    STORY_SYSTEM = "אתה סופר מוכשר של ספרי ילדים בעברית."
+    SELF_EVAL_CRITERIA = "דרג את איכות הסיפור מ-0 ל-100"
+    SELF_SCORE_THRESHOLD = 70
+    APPROVAL_SCORE = 90
+
     def create_story_optimized(self, topic: Dict, character: Dict,
-                              style_guide: Dict, max_iterations: int = 5) -> Dict:
+                              style_guide: Dict, max_iterations: int = 5,
+                              speculative: bool = False, num_candidates: int = 4,
+                              top_k: int = 2, max_cost: float = None) -> Dict:
         """
         יצירת סיפור עם Progressive Quality
         מתחיל זול, משדרג רק אם צריך
+
+        Args:
+            speculative: best-of-N - כל איטרציה יוצרת num_candidates טיוטות במקביל,
+                         מסננת כל אחת ב-self_evaluate ברגע שהיא מוכנה, ושולחת
+                         ל-OpenAI רק את top_k הראשונות שעוברות
+            max_cost: תקרת עלות בדולרים - מעבר לה מפסיקים לשלוח בקשות חדשות
         """
+        if speculative:
+            return self._create_story_speculative(topic, character, style_guide, max_iterations,
+                                                  num_candidates, top_k, max_cost)
+
         print(f"\n{'='*60}")
         print(f"📖 יצירת סיפור (מותאם עלויות): {topic['name']}")
         print(f"{'='*60}\n")
@@ -81,7 +100,7 @@ class OptimizedOrchestrator:
             story_prompt = self._build_story_prompt(topic, character, style_guide)
             story_response = self.claude.generate_with_model(
                 prompt=story_prompt,
-                system="אתה סופר מוכשר של ספרי ילדים בעברית.",
+                system=self.STORY_SYSTEM,
                 model=claude_model,
                 temperature=0.9
             )
@@ -97,12 +116,12 @@ class OptimizedOrchestrator:
             print(f"\n🔍 Claude מעריך את עצמו (pre-filter)...")
             self_score = self.claude.self_evaluate(
                 content=json.dumps(story, ensure_ascii=False),
-                criteria="דרג את איכות הסיפור מ-0 ל-100"
+                criteria=self.SELF_EVAL_CRITERIA
             )
             print(f"   Self-score: {self_score}/100")
 
             # אם הציון העצמי נמוך מדי, לא שולחים ל-OpenAI
-            if self_score < 70:
+            if self_score < self.SELF_SCORE_THRESHOLD:
                 print(f"   ⏭️ ציון נמוך מדי, מדלג על OpenAI (חוסך כסף!)")
                 current_score = self_score
                 continue
@@ -125,7 +144,7 @@ class OptimizedOrchestrator:
                 continue
 
             # בדיקת אישור
-            if current_score >= 90:
+            if current_score >= self.APPROVAL_SCORE:
                 print(f"✅ סיפור אושר! (ציון {current_score})")
                 approved_story = story
             else:
@@ -135,6 +154,176 @@ class OptimizedOrchestrator:
             print(f"⚠️ לא הושג אישור אחרי {max_iterations} איטרציות")
             return None
 
+        return self._finalize_story(topic, character, style_guide,
+                                    approved_story, iteration, current_score)
+
+    # ============================================================
+    # Speculative best-of-N
+    # ============================================================
+
+    def _create_story_speculative(self, topic: Dict, character: Dict, style_guide: Dict,
+                                  max_iterations: int, num_candidates: int, top_k: int,
+                                  max_cost: Optional[float]) -> Dict:
+        """
+        כמו create_story_optimized, אבל כל איטרציה היא סבב best-of-N מקבילי
+        הסבב נעצר (ומבטל את הבקשות הפתוחות) ברגע שמועמד אחד עובר 90
+        """
+        print(f"\n{'='*60}")
+        print(f"📖 יצירת סיפור (speculative, {num_candidates} מועמדים): {topic['name']}")
+        print(f"{'='*60}\n")
+
+        story_prompt = self._build_story_prompt(topic, character, style_guide)
+        current_score = 0
+        iteration = 0
+
+        while iteration < max_iterations:
+            iteration += 1
+            if self._over_budget(max_cost):
+                print(f"💸 תקרת העלות (${max_cost:.2f}) הושגה - עוצר")
+                break
+
+            strategy = "draft" if iteration == 1 else ("refinement" if current_score < 85 else "final")
+            claude_model, openai_model = self.cost_optimizer.progressive_quality_strategy(
+                strategy, current_score
+            )
+            print(f"\n--- סבב {iteration} | {strategy} | {claude_model} → {openai_model} ---")
+
+            started = time.perf_counter()
+            best_story, best_score = asyncio.run(self._run_round(
+                story_prompt, claude_model, openai_model, iteration,
+                num_candidates, top_k, max_cost
+            ))
+            print(f"⏱️ סבב {iteration}: {time.perf_counter() - started:.1f}s, "
+                  f"ציון מיטבי {best_score}")
+
+            current_score = max(current_score, best_score)
+            if best_story is not None:
+                return self._finalize_story(topic, character, style_guide,
+                                            best_story, iteration, best_score)
+
+        print(f"⚠️ לא הושג אישור אחרי {iteration} סבבים")
+        return None
+
+    def _over_budget(self, max_cost: Optional[float]) -> bool:
+        return max_cost is not None and self.cost_optimizer.get_total_cost() >= max_cost
+
+    async def _draft_candidate(self, story_prompt: str, claude_model: str,
+                               variant: str) -> Optional[Dict]:
+        """טיוטה + הערכה עצמית של מועמד אחד"""
+        response = await self.claude.generate_with_model_async(
+            prompt=story_prompt,
+            system=self.STORY_SYSTEM,
+            model=claude_model,
+            temperature=0.9,
+            variant=variant
+        )
+        try:
+            story = self._parse_json_from_text(response["content"])
+        except ValueError:
+            print(f"   ⚠️ {variant}: שגיאה בפרסום JSON")
+            return None
+
+        self_score = await self.claude.self_evaluate_async(
+            content=json.dumps(story, ensure_ascii=False),
+            criteria=self.SELF_EVAL_CRITERIA
+        )
+        print(f"   🔍 {variant}: self-score {self_score}/100")
+        return {"variant": variant, "story": story, "self_score": self_score}
+
+    async def _evaluate_candidate(self, candidate: Dict, openai_model: str) -> Dict:
+        """הערכה ב-OpenAI של מועמד שעבר את הסינון"""
+        eval_response = await self.openai.evaluate_with_model_async(
+            content=json.dumps(candidate["story"], ensure_ascii=False)[:3000],  # limit
+            criteria=self.rating_system.get_rating_prompt("story_rating"),
+            model=openai_model
+        )
+        try:
+            score = json.loads(eval_response["content"])["weighted_score"]
+        except (ValueError, KeyError, TypeError):
+            print(f"   ⚠️ {candidate['variant']}: שגיאה בפרסום דירוג")
+            score = 0
+        return {**candidate, "score": score}
+
+    async def _run_round(self, *args):
+        """סבב אחד ב-loop משלו - הלקוחות של הסבב נסגרים לפני שה-loop נסגר"""
+        try:
+            return await self._speculative_round(*args)
+        finally:
+            await self.claude.async_client.aclose()
+            await self.openai.async_client.aclose()
+
+    async def _speculative_round(self, story_prompt: str, claude_model: str, openai_model: str,
+                                 iteration: int, num_candidates: int, top_k: int,
+                                 max_cost: Optional[float]):
+        """
+        סבב אחד: N טיוטות במקביל; כל טיוטה שעוברת את הסינון נשלחת מיד ל-OpenAI
+        (עד top_k), בלי לחכות לשאר הטיוטות. מועמד שעובר 90 או תקרת העלות מבטלים
+        את כל מה שעוד רץ - טיוטות והערכות יחד
+        מחזיר (סיפור מאושר או None, הציון הטוב ביותר שנראה בסבב)
+        """
+        best_score = 0
+
+        print(f"📝 Claude יוצר {num_candidates} טיוטות במקביל...")
+        drafts = {
+            asyncio.ensure_future(self._draft_candidate(story_prompt, claude_model,
+                                                        f"r{iteration}c{i + 1}"))
+            for i in range(num_candidates)
+        }
+        evaluations = set()
+        pending = set(drafts)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        print(f"   ⚠️ {'טיוטה' if task in drafts else 'הערכה'} נכשלה: {e}")
+                        continue
+
+                    if task in drafts:
+                        if result is None:
+                            continue
+                        best_score = max(best_score, result["self_score"])
+                        if result["self_score"] < self.SELF_SCORE_THRESHOLD:
+                            print(f"   ⏭️ {result['variant']}: מתחת ל-{self.SELF_SCORE_THRESHOLD}, "
+                                  f"מדלג על OpenAI (חוסך כסף!)")
+                            continue
+                        if self._over_budget(max_cost):
+                            print(f"💸 תקרת העלות (${max_cost:.2f}) הושגה - מבטל את הסבב")
+                            return None, best_score
+                        print(f"🔍 OpenAI מעריך את {result['variant']}...")
+                        evaluation = asyncio.ensure_future(self._evaluate_candidate(result, openai_model))
+                        evaluations.add(evaluation)
+                        pending.add(evaluation)
+                        if len(evaluations) >= top_k:
+                            # טיוטות שעוד רצות כבר לא יגיעו ל-OpenAI
+                            unused = pending & drafts
+                            for draft in unused:
+                                draft.cancel()
+                            pending -= unused
+                        continue
+
+                    score = result["score"]
+                    best_score = max(best_score, score)
+                    print(f"📊 {result['variant']}: ציון OpenAI {score}/100")
+                    if score >= self.APPROVAL_SCORE:
+                        print(f"✅ סיפור אושר! ({result['variant']}, ציון {score})")
+                        return result["story"], score
+                    if self._over_budget(max_cost):
+                        print(f"💸 תקרת העלות (${max_cost:.2f}) הושגה - מבטל את הסבב")
+                        return None, best_score
+        finally:
+            outstanding = [task for task in drafts | evaluations if not task.done()]
+            for task in outstanding:
+                task.cancel()
+            await asyncio.gather(*outstanding, return_exceptions=True)
+
+        return None, best_score
+
+    def _finalize_story(self, topic: Dict, character: Dict, style_guide: Dict,
+                        approved_story: Dict, iterations: int, score: float) -> Dict:
+        """שיפור ויזואלי, פרומפטים לתמונות ושמירה של סיפור מאושר"""
         # שיפור ויזואלי (Gemini - חינם!)
         print("\n🎨 Gemini משפר תיאורים ויזואליים (חינם!)...")
         enhanced_story = self.gemini.enhance_visual_descriptions(
@@ -152,8 +341,8 @@ class OptimizedOrchestrator:
             "character": character,
             "story": enhanced_story,
             "image_prompts": image_prompts,
-            "iterations": iteration,
-            "final_score": current_score,
+            "iterations": iterations,
+            "final_score": score,
             "total_cost": self.cost_optimizer.get_total_cost(),
             "timestamp": datetime.now().isoformat()
         }
@@ -197,13 +386,11 @@ class OptimizedOrchestrator:
 """
 
     def _parse_json_from_text(self, text: str) -> Dict:
-        """מוצא ומפרסר JSON מתוך טקסט"""
-        json_start = text.find('{')
-        json_end = text.rfind('}') + 1
-        if json_start != -1 and json_end > json_start:
-            json_str = text[json_start:json_end]
-            return json.loads(json_str)
-        raise ValueError("Could not parse JSON")
+        """
+        מוצא ומפרסר JSON מתוך טקסט (JSONExtractionError הוא ValueError)
+        בלי תיקון - טיוטה שנקטעה היא כשל, לא סיפור תקין עם חצי מהעמודים
+        """
+        return extract_json(text, repair=False)
 
     def print_final_cost_report(self):
         """מדפיס דוח עלויות סופי"""
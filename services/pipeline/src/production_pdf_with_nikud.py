@@ -4,7 +4,8 @@ Production PDF Generator עם ניקוד מדויק
 מערכת ייצור מלאה לספרי ילדים
 """
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
@@ -18,45 +19,112 @@ from hebrew_nikud_renderer import HebrewNikudRenderer
 from professional_cover_layout import ProfessionalCoverLayout
 
 
-def calculate_ideal_font_size(age: int, text: str) -> int:
-    """
-    מחשב גודל פונט אידיאלי בהתאם לגיל וכמות מילים
+# גודל עמוד 4:3 מותאם לאייפד (תואם את התמונות, שנמתחות לכל העמוד) - בנקודות
+PAGE_SIZE = (1024, 768)
 
-    Args:
-        age: גיל היעד של הספר
-        text: הטקסט של העמוד
+# פריסת עמוד סיפור - עמודת טקסט בצד ימין של התמונה
+TEXT_AREA_RATIO = 0.35  # 35% מרוחב העמוד לטקסט
+TEXT_RIGHT_MARGIN = 30  # מיישר ימינה עם מרווח קטן מהקצה
+TEXT_VERTICAL_MARGIN = 100  # הטקסט מתחיל 100 מלמעלה ולא יורד מתחת ל-100
+LINE_HEIGHT_RATIO = 1.8  # רווח גדול לניקוד (1.8x גודל הפונט)
+MAX_CHARS_PER_LINE = 23  # כולל רווחים, סימני פיסוק וניקוד
 
-    Returns:
-        גודל פונט בנקודות
-    """
-    # ספירת מילים
-    word_count = len(text.split())
 
-    # גודל בסיס לפי גיל
+def font_size_bounds(age: int) -> Tuple[int, int]:
+    """
+    טווח גדלי הפונט המותר לגיל (מינימום, מקסימום)
+    בסיס לפי גיל, מ-3 מתחת ועד 4 מעל, בין 18 ל-30
+    """
     if age <= 4:
         base_size = 24
     elif age <= 6:
         base_size = 22
     else:
         base_size = 20
+    return max(18, base_size - 3), min(30, base_size + 4)
 
-    # התאמה לפי כמות מילים
-    if word_count < 15:
-        adjustment = 4
-    elif word_count < 25:
-        adjustment = 2
-    elif word_count < 40:
-        adjustment = 0
-    elif word_count < 60:
-        adjustment = -2
-    else:
-        adjustment = -3
 
-    # חישוב סופי עם גבולות
-    final_size = base_size + adjustment
-    final_size = max(18, min(30, final_size))  # בין 18 ל-30
+@lru_cache(maxsize=8192)
+def _unit_width(text: str, font_name: str) -> float:
+    """רוחב טקסט בגודל 1 - הרוחב ב-reportlab לינארי בגודל הפונט, אז מודדים כל מילה פעם אחת"""
+    return pdfmetrics.stringWidth(get_display(text), font_name, 1)
 
-    return final_size
+
+def break_lines(text: str, font_name: str, font_size: int, max_width: float) -> List[str]:
+    """
+    שבירת טקסט עמוד לשורות - בדיוק כפי שהן מצוירות:
+    כל משפט מתחיל שורה חדשה, ושורה נסגרת כשחורגת מהרוחב, ממספר המילים לגודל הפונט
+    או מ-MAX_CHARS_PER_LINE תווים
+    """
+    max_words_per_line = calculate_max_words_per_line(font_size)
+    space_width = _unit_width(" ", font_name)
+    lines = []
+
+    for sentence in text.split('.'):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+
+        current_line = []
+        line_width = 0.0
+        line_chars = 0
+        for word in (sentence + '.').split():
+            word_width = _unit_width(word, font_name)
+            test_width = line_width + space_width + word_width if current_line else word_width
+            test_chars = line_chars + 1 + len(word) if current_line else len(word)
+
+            if (test_width * font_size <= max_width and
+                    len(current_line) < max_words_per_line and
+                    test_chars <= MAX_CHARS_PER_LINE):
+                current_line.append(word)
+                line_width, line_chars = test_width, test_chars
+            else:
+                if current_line:
+                    lines.append(' '.join(current_line))
+                current_line = [word]
+                line_width, line_chars = word_width, len(word)
+
+        if current_line:
+            lines.append(' '.join(current_line))
+
+    return lines
+
+
+def calculate_ideal_font_size(age: int, text: str, font_name: str,
+                              max_width: float, max_height: float) -> int:
+    """
+    הגודל הגדול ביותר בטווח הגיל שבו הטקסט נכנס כולו לעמודת הטקסט
+
+    חיפוש בינארי על הגודל - כל בדיקה היא מעבר שבירת שורות אחד (break_lines)
+    עם רוחבי מילים ממוטמנים. גדלים גדולים יותר = שורות רחבות יותר ופחות מילים
+    לשורה, כך שאם גודל לא נכנס - גם אף גודל גדול ממנו.
+
+    Args:
+        age: גיל היעד של הספר
+        text: הטקסט של העמוד (כפי שיצויר - כולל ניקוד)
+        font_name: הפונט הרשום ב-reportlab
+        max_width: רוחב עמודת הטקסט
+        max_height: המרחק בין השורה הראשונה לתחתית המותרת
+
+    Returns:
+        גודל פונט בנקודות (המינימום לגיל אם גם הוא לא נכנס)
+    """
+    def fits(font_size: int) -> bool:
+        lines = break_lines(text, font_name, font_size, max_width)
+        line_height = int(font_size * LINE_HEIGHT_RATIO)
+        return ((len(lines) - 1) * line_height <= max_height and
+                all(_unit_width(line, font_name) * font_size <= max_width for line in lines))
+
+    low, high = font_size_bounds(age)
+    best = low
+    while low <= high:
+        middle = (low + high) // 2
+        if fits(middle):
+            best = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best
 
 
 def calculate_max_words_per_line(font_size: int) -> int:
@@ -93,10 +161,8 @@ class ProductionPDFWithNikud:
         """
         self.output_path = output_path
         self.target_age = target_age
-        # גודל עמוד 4:3 מותאם לאייפד (תואם את התמונות)
-        ipad_size = (1024, 768)
-        self.canvas = canvas.Canvas(str(output_path), pagesize=ipad_size)
-        self.page_width, self.page_height = ipad_size
+        self.canvas = canvas.Canvas(str(output_path), pagesize=PAGE_SIZE)
+        self.page_width, self.page_height = PAGE_SIZE
         self.text_processor = HebrewTextProcessor()
         self.hebrew_font = self._load_font()
 
@@ -154,7 +220,8 @@ class ProductionPDFWithNikud:
 
         self.canvas.showPage()
 
-    def add_story_page(self, page_num: int, text: str, image_path: Optional[Path] = None):
+    def add_story_page(self, page_num: int, text: str, image_path: Optional[Path] = None,
+                       text_with_nikud: Optional[str] = None):
         """
         יוצר עמוד סיפור עם ניקוד מדויק
 
@@ -162,6 +229,7 @@ class ProductionPDFWithNikud:
             page_num: מספר עמוד
             text: טקסט העמוד
             image_path: נתיב לתמונה (אופציונלי)
+            text_with_nikud: הטקסט כבר מנוקד (אופציונלי) - מדלג על קריאת הניקוד
         """
         print(f"   📄 עמוד {page_num}")
         print(f"   🔍 DEBUG - page {page_num}:")
@@ -191,77 +259,42 @@ class ProductionPDFWithNikud:
 
         # טקסט מונח על התמונה בצד ימין
         # התמונה כבר כוללת שטח ריק בצד ימין (40% מהתמונה) לטקסט
-        text_area_width = self.page_width * 0.35  # 35% מרוחב העמוד לטקסט
-        text_x = self.page_width - 30  # מיישר ימינה עם מרווח קטן מהקצה (30px במקום 60px)
-        text_y = self.page_height - 100
+        text_area_width = self.page_width * TEXT_AREA_RATIO
+        text_x = self.page_width - TEXT_RIGHT_MARGIN
+        text_y = self.page_height - TEXT_VERTICAL_MARGIN
 
         # טקסט הסיפור עם ניקוד - צבע כהה לקריאות
         self.canvas.setFillColorRGB(0, 0, 0)  # שחור מלא לקריאות טובה
 
         # הוסף ניקוד לטקסט - משתמש ב-Claude API לניקוד מלא
-        text_with_nikud = self.text_processor.add_nikud(text, use_api=True)
-
-        # חישוב גודל פונט אידיאלי
-        font_size = calculate_ideal_font_size(self.target_age, text)
-        line_height = int(font_size * 1.8)  # רווח גדול לניקוד (1.8x גודל הפונט)
-
-        # חישוב מקסימום מילים לשורה לפי גודל פונט
-        max_words_per_line = calculate_max_words_per_line(font_size)
-
-        # פצל לפי משפטים
-        sentences = text_with_nikud.split('.')
-
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-
-            sentence = sentence + '.'
-
-            # פצל משפט למילים
-            words = sentence.split()
-            lines = []
-            current_line = []
-
-            for word in words:
-                test_line = ' '.join(current_line + [word])
-                # בדיקת רוחב משוערת
-                test_display = get_display(test_line)
-                line_width = self.canvas.stringWidth(test_display, self.hebrew_font, font_size)
-
-                # בדיקה משולשת: רוחב, מספר מילים, ומספר תווים
-                words_in_line = len(current_line) + 1
-                chars_in_line = len(test_line)  # כולל רווחים וסימני פיסוק
-                max_chars_per_line = 23
-
-                if (line_width <= text_area_width and
-                    words_in_line <= max_words_per_line and
-                    chars_in_line <= max_chars_per_line):
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        lines.append(' '.join(current_line))
-                    current_line = [word]
-
-            if current_line:
-                lines.append(' '.join(current_line))
-
-            # צייר כל שורה עם ניקוד מדויק
-            for line in lines:
-                if text_y < 100:  # אין מספיק מקום
-                    break
+        if text_with_nikud is None:
+            text_with_nikud = self.text_processor.add_nikud(text, use_api=True)
 
-                # חשב רוחב השורה
-                line_display = get_display(line)
-                line_width = self.canvas.stringWidth(line_display, self.hebrew_font, font_size)
+        # הגודל הגדול ביותר שבו כל הטקסט נכנס לעמודה
+        font_size = calculate_ideal_font_size(
+            self.target_age, text_with_nikud, self.hebrew_font,
+            text_area_width, self.page_height - 2 * TEXT_VERTICAL_MARGIN
+        )
+        line_height = int(font_size * LINE_HEIGHT_RATIO)
+        lines = break_lines(text_with_nikud, self.hebrew_font, font_size, text_area_width)
+        print(f"      font_size: {font_size} ({len(lines)} lines)")
 
-                # צייר עם HebrewNikudRenderer
-                HebrewNikudRenderer.draw_text_with_nikud_pdf(
-                    self.canvas, text_x - line_width, text_y,
-                    line, self.hebrew_font, font_size
-                )
+        # צייר כל שורה עם ניקוד מדויק
+        for line in lines:
+            if text_y < TEXT_VERTICAL_MARGIN:  # אין מספיק מקום
+                break
 
-                text_y -= line_height
+            # חשב רוחב השורה
+            line_display = get_display(line)
+            line_width = self.canvas.stringWidth(line_display, self.hebrew_font, font_size)
+
+            # צייר עם HebrewNikudRenderer
+            HebrewNikudRenderer.draw_text_with_nikud_pdf(
+                self.canvas, text_x - line_width, text_y,
+                line, self.hebrew_font, font_size
+            )
+
+            text_y -= line_height
 
         # מספר עמוד בתחתית בצד ימין - רק ספרה
         self.canvas.setFont(self.hebrew_font, 14)
@@ -396,11 +429,6 @@ def create_production_pdf(story_data: Dict, images_dir: Optional[Path], output_p
             else:
                 print(f"      ✓ תמונה: {image_path.name}")
 
-        # חישוב גודל פונט לעמוד זה
-        word_count = len(text.split())
-        font_size = calculate_ideal_font_size(age, text)
-        print(f"      גודל פונט: {font_size} (מילים: {word_count})")
-
         pdf.add_story_page(page_num, text, image_path)
 
     # כריכה אחורית לא רלוונטית לסיפורי אייפד - מדלגים
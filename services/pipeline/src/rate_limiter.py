@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter - בקרת קצב ומקביליות משותפת לכל ספקי ה-API
+
+לכל ספק (anthropic / openai / gemini / image):
+- token bucket לבקשות לדקה (RPM) ולטוקנים לדקה (TPM)
+- מגבלת מקביליות אדפטיבית (AIMD): +1 בהדרגה על הצלחות, חצי על 429
+- כיבוד retry-after: אחרי 429 כל הקוראים לאותו ספק ממתינים עד שהחלון נפתח
+- ניסיונות חוזרים על 429 / 529 / 503 (ה-SDK מוגדר עם max_retries=0 כדי שלא ינסה במקביל)
+- ניסיונות חוזרים (מעטים, עם backoff לכל קריאה בנפרד) על שגיאות חולפות: ניתוק,
+  timeout, 408 / 409 / 5xx - מה שה-SDK היה מנסה שוב בעצמו. אלה לא אות עומס,
+  ולכן לא מקטינים את המקביליות ולא חוסמים את שאר הקוראים
+
+הגדרה ממשתני סביבה: <PROVIDER>_RPM, <PROVIDER>_TPM, <PROVIDER>_MAX_CONCURRENCY
+(למשל ANTHROPIC_RPM=50, OPENAI_TPM=200000, IMAGE_MAX_CONCURRENCY=4)
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+
+# סטטוסים שמשמעותם "האט" - מנסים שוב אחרי המתנה
+RETRYABLE_STATUS = {429, 503, 529}
+
+# שגיאות חולפות שה-SDKs מנסים שוב כברירת מחדל (408 / 409 / 5xx)
+TRANSIENT_STATUS = {408, 409}
+# שגיאות רשת בלי סטטוס HTTP (anthropic / openai / httpx / google)
+TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException",
+    "DeadlineExceeded", "ServiceUnavailable"
+}
+
+# ברירות מחדל שמרניות (tier נמוך); מעלים דרך משתני סביבה לפי המכסה בפועל
+DEFAULT_LIMITS = {
+    "anthropic": {"rpm": 50, "tpm": 30000, "max_concurrency": 8},
+    "openai": {"rpm": 500, "tpm": 200000, "max_concurrency": 16},
+    "gemini": {"rpm": 60, "tpm": 1000000, "max_concurrency": 8},
+    "image": {"rpm": 10, "tpm": 0, "max_concurrency": 4},
+}
+
+
+class RateLimitExceeded(RuntimeError):
+    """הספק המשיך להחזיר 429 אחרי כל הניסיונות"""
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """סטטוס HTTP מחריגה של כל אחד מה-SDKs (anthropic / openai / google)"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return get_status_code(error) in RETRYABLE_STATUS
+
+
+def is_transient_error(error: Exception) -> bool:
+    """שגיאת רשת / שרת חולפת (לא rate limit) - שווה ניסיון חוזר"""
+    status = get_status_code(error)
+    if status is not None and status not in RETRYABLE_STATUS:
+        return status in TRANSIENT_STATUS or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """שניות המתנה מכותרות retry-after / retry-after-ms (אם הספק שלח)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # retry-after בפורמט תאריך - מתעלמים ונופלים ל-backoff
+        return None
+    return None
+
+
+class TokenBucket:
+    """
+    דלי טוקנים שמתמלא בקצב קבוע (rate לדקה)
+    reserve מחזיר כמה זמן להמתין - ההזמנה נרשמת מיד, כך שקוראים מקבילים
+    מקבלים זמני המתנה עוקבים ולא מתנפלים יחד כשהדלי מתמלא
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_second > 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """מזמין amount טוקנים ומחזיר שניות המתנה עד שההזמנה מכוסה"""
+        if not self.enabled or amount <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            # בקשה גדולה מהקיבולת עדיין צריכה לעבור בסוף
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    def adjust(self, delta: float):
+        """תיקון אחרי שה-usage האמיתי ידוע (חיובי = נצרכו יותר מההערכה)"""
+        if not self.enabled or delta == 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class ProviderLimiter:
+    """
+    בקר קצב ומקביליות לספק אחד - משותף לכל ה-threads וה-event loops בתהליך
+    """
+
+    MAX_RETRIES = 6
+    # מתוך MAX_RETRIES - כמה ניסיונות חוזרים על שגיאה חולפת (ברירת המחדל של ה-SDKs)
+    MAX_TRANSIENT_RETRIES = 2
+    BASE_BACKOFF_SECONDS = 1.0
+    MAX_BACKOFF_SECONDS = 60.0
+    # המתנה בין בדיקות של slot פנוי במסלול ה-async
+    ASYNC_POLL_SECONDS = 0.05
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int,
+                 min_concurrency: int = 1):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        # AIMD: מתחילים מלמעלה ויורדים רק כשהספק מאותת
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.rate_limited_count = 0
+        self._cond = threading.Condition()
+
+    # ----- מקביליות -----
+
+    def _can_start(self) -> bool:
+        return self.in_flight < int(self.concurrency_limit) and time.monotonic() >= self.blocked_until
+
+    def _acquire_slot(self):
+        with self._cond:
+            while not self._can_start():
+                wait = max(self.blocked_until - time.monotonic(), 0) or None
+                self._cond.wait(timeout=wait)
+            self.in_flight += 1
+
+    async def _acquire_slot_async(self):
+        while True:
+            with self._cond:
+                if self._can_start():
+                    self.in_flight += 1
+                    return
+                wait = max(self.blocked_until - time.monotonic(), self.ASYNC_POLL_SECONDS)
+            await asyncio.sleep(wait)
+
+    def _release_slot(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self):
+        with self._cond:
+            # additive increase: בערך +1 לכל "חלון" מלא של הצלחות
+            if self.concurrency_limit < self.max_concurrency:
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+                self._cond.notify_all()
+
+    def _on_rate_limited(self, error: Exception, attempt: int) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is None:
+            backoff = min(self.MAX_BACKOFF_SECONDS, self.BASE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            retry_after = backoff * (0.5 + random.random() / 2)
+
+        with self._cond:
+            # multiplicative decrease - פעם אחת לכל חלון המתנה (כמה 429 מקבילים = אות אחד)
+            if time.monotonic() >= self.blocked_until:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            # חסימה משותפת עד סוף החלון
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.rate_limited_count += 1
+
+        print(f"   ⏳ {self.name}: rate limit ({get_status_code(error)}), "
+              f"ממתין {retry_after:.1f}s, מקביליות={int(self.concurrency_limit)}")
+        return retry_after
+
+    def _on_transient_error(self, error: Exception, failures: int) -> float:
+        backoff = min(self.MAX_BACKOFF_SECONDS, self.BASE_BACKOFF_SECONDS * 2 ** (failures - 1))
+        backoff *= 0.5 + random.random() / 2
+        print(f"   🔁 {self.name}: {type(error).__name__} ({get_status_code(error) or 'network'}), "
+              f"מנסה שוב בעוד {backoff:.1f}s")
+        return backoff
+
+    def _retry_delay(self, error: Exception, attempt: int, transient_failures: int) -> Optional[float]:
+        """
+        המתנה לפני הניסיון הבא, או None אם לא מנסים שוב
+
+        על rate limit ההמתנה משותפת (blocked_until, נאכפת ב-_acquire_slot);
+        על שגיאה חולפת רק הקריאה הזו ממתינה
+        """
+        if attempt == self.MAX_RETRIES:
+            return None
+        if is_rate_limit_error(error):
+            self._on_rate_limited(error, attempt)
+            return 0.0
+        if is_transient_error(error) and transient_failures <= self.MAX_TRANSIENT_RETRIES:
+            return self._on_transient_error(error, transient_failures)
+        return None
+
+    # ----- קצב -----
+
+    def _pace_delay(self, estimated_tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def _settle_tokens(self, response, estimated_tokens: int, count_tokens: Optional[Callable]):
+        if count_tokens is None:
+            return
+        try:
+            actual = count_tokens(response)
+        except AttributeError:
+            return
+        self.tokens.adjust(actual - estimated_tokens)
+
+    # ----- קריאות -----
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+             count_tokens: Callable[[Any], int] = None):
+        """
+        מריץ fn תחת מגבלות הקצב והמקביליות, עם ניסיונות חוזרים על 429
+        ועל שגיאות רשת / שרת חולפות
+
+        Args:
+            fn: הקריאה ל-API (ללא ארגומנטים)
+            estimated_tokens: הערכת טוקנים מראש (ל-TPM)
+            count_tokens: מחלץ את מספר הטוקנים בפועל מהתשובה (לתיקון ה-TPM)
+        """
+        retry_delay = 0.0
+        transient_failures = 0
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            delay = max(self._pace_delay(estimated_tokens), retry_delay)
+            if delay > 0:
+                time.sleep(delay)
+
+            self._acquire_slot()
+            try:
+                response = fn()
+            except Exception as e:
+                transient_failures += is_transient_error(e)
+                retry_delay = self._retry_delay(e, attempt, transient_failures)
+                if retry_delay is None:
+                    raise
+                continue
+            finally:
+                self._release_slot()
+
+            self._on_success()
+            self._settle_tokens(response, estimated_tokens, count_tokens)
+            return response
+
+        raise RateLimitExceeded(f"{self.name}: rate limited after {self.MAX_RETRIES} attempts")
+
+    async def call_async(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+                         count_tokens: Callable[[Any], int] = None):
+        """כמו call, עבור fn שמחזיר coroutine"""
+        retry_delay = 0.0
+        transient_failures = 0
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            delay = max(self._pace_delay(estimated_tokens), retry_delay)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            await self._acquire_slot_async()
+            try:
+                response = await fn()
+            except Exception as e:
+                transient_failures += is_transient_error(e)
+                retry_delay = self._retry_delay(e, attempt, transient_failures)
+                if retry_delay is None:
+                    raise
+                continue
+            finally:
+                self._release_slot()
+
+            self._on_success()
+            self._settle_tokens(response, estimated_tokens, count_tokens)
+            return response
+
+        raise RateLimitExceeded(f"{self.name}: rate limited after {self.MAX_RETRIES} attempts")
+
+    def get_stats(self) -> Dict:
+        return {
+            "provider": self.name,
+            "concurrency_limit": int(self.concurrency_limit),
+            "in_flight": self.in_flight,
+            "rate_limited": self.rate_limited_count
+        }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """מחזיר את הבקר המשותף לספק (נוצר פעם אחת לכל תהליך)"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            defaults = DEFAULT_LIMITS.get(provider, {"rpm": 0, "tpm": 0, "max_concurrency": 4})
+            prefix = provider.upper()
+            _limiters[provider] = ProviderLimiter(
+                provider,
+                rpm=float(os.getenv(f"{prefix}_RPM", defaults["rpm"])),
+                tpm=float(os.getenv(f"{prefix}_TPM", defaults["tpm"])),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", defaults["max_concurrency"]))
+            )
+        return _limiters[provider]
+
+
+# תמונה בבקשת vision נספרת כמספר טוקנים קבוע, לא לפי אורך ה-base64
+IMAGE_TOKENS_ESTIMATE = 1600
+
+
+def _estimate_tokens(value) -> float:
+    if isinstance(value, str):
+        return len(value) / 2.5  # עברית ~2.5 תווים לטוקן
+    if isinstance(value, dict):
+        if value.get("type") in ("image", "image_url"):
+            return IMAGE_TOKENS_ESTIMATE
+        return sum(_estimate_tokens(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_tokens(v) for v in value)
+    return 0
+
+
+def estimate_request_tokens(params: Dict) -> int:
+    """הערכה גסה של טוקני קלט מהפרמטרים של הקריאה"""
+    return int(sum(_estimate_tokens(params.get(key))
+                   for key in ("system", "messages", "contents")))
+
+
+if __name__ == "__main__":
+    limiter = get_limiter("anthropic")
+    print(f"🚦 {limiter.get_stats()}")
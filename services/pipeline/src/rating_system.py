@@ -14,12 +14,14 @@ class RatingSystem:
         with open(criteria_path, 'r', encoding='utf-8') as f:
             self.criteria = json.load(f)
 
-    def get_rating_prompt(self, rating_type: str) -> str:
+    def get_rating_prompt(self, rating_type: str, include_output_format: bool = True) -> str:
         """
         יוצר פרומפט מובנה למתן ציון
 
         Args:
             rating_type: topic_rating, story_rating, או character_rating
+            include_output_format: לצרף את פורמט ה-JSON לפריט בודד
+                (False כשהקורא מגדיר פורמט משלו, למשל דירוג באצווה)
         """
         if rating_type not in self.criteria:
             raise ValueError(f"Unknown rating type: {rating_type}")
@@ -44,7 +46,11 @@ class RatingSystem:
 1. דרג כל קריטריון בסולם 0-100
 2. חשב ציון משוקלל סופי
 3. הציון המינימלי לאישור הוא {rating_config['min_score']}
+"""
+        if not include_output_format:
+            return prompt
 
+        prompt += f"""
 השב בפורמט JSON הבא:
 {{
     "scores": {{
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Run Index - אינדקס SQLite של כל הריצות ב-data/runs
+
+במקום glob על תיקיות הריצה ומעבר על כל העץ data/runs/<slug>/<run_id>:
+- RunManager מעדכן את האינדקס בטרנזקציה בכל יצירה, סיום שלב, כתיבת קובץ,
+  כישלון והשלמה
+- שאילתות על אינדקסים: לפי סטטוס, שלב שנכשל, ילד, נושא וטווח תאריכים
+- רשימת קבצים של ריצה בלי לגעת במערכת הקבצים
+- rebuild בונה את האינדקס מחדש מהדיסק (הפעולה היחידה שסורקת את העץ)
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from run_journal import load_run_metadata
+from artifact_store import ArtifactStore
+
+
+# תת-תיקיות של ריצה שהקבצים בהן נרשמים באינדקס (שם התיקייה = סוג הקובץ)
+ARTIFACT_KINDS = ("story", "images", "pdf", "qa", "logs")
+
+# עמודות ריצה שנלקחות מ-run_metadata.json כפי שהן
+_RUN_FIELDS = ("book_slug", "topic", "age", "character_name", "status", "created_at",
+               "completed_at", "failed_at", "failure_reason", "failed_stage")
+
+
+def default_runs_root() -> Path:
+    return Path("data/runs")
+
+
+def artifact_kind(path: Path) -> str:
+    """סוג הקובץ לפי התיקייה שלו בתוך הריצה (story / images / pdf / qa / logs)"""
+    for parent in Path(path).parents:
+        if parent.name in ARTIFACT_KINDS:
+            return parent.name
+    return "other"
+
+
+def _created_from_run_id(run_id: str) -> Optional[str]:
+    """run_id מתחיל ב-YYYYMMDD_HHMMSS - זמן היצירה לריצות בלי metadata"""
+    try:
+        return datetime.strptime(run_id[:15], "%Y%m%d_%H%M%S").isoformat()
+    except ValueError:
+        return None
+
+
+class RunIndex:
+    """
+    אינדקס ריצות מבוסס SQLite (WAL + busy_timeout - כמה תהליכים כותבים במקביל)
+    כל עדכון הוא טרנזקציה אחת: שורת הריצה והשלב / הקובץ מתעדכנים יחד
+    """
+
+    BUSY_TIMEOUT_MS = 30000
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        book_slug TEXT,
+        run_dir TEXT NOT NULL,
+        topic TEXT,
+        age INTEGER,
+        character_name TEXT,
+        status TEXT,
+        created_at TEXT,
+        completed_at TEXT,
+        failed_at TEXT,
+        failure_reason TEXT,
+        failed_stage TEXT,
+        updated_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_runs_failed_stage ON runs(failed_stage);
+    CREATE INDEX IF NOT EXISTS idx_runs_child ON runs(character_name, created_at);
+    CREATE INDEX IF NOT EXISTS idx_runs_topic ON runs(topic, created_at);
+    CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at);
+    CREATE TABLE IF NOT EXISTS steps (
+        run_id TEXT NOT NULL,
+        step TEXT NOT NULL,
+        passed INTEGER NOT NULL,
+        timestamp TEXT,
+        details TEXT,
+        PRIMARY KEY (run_id, step)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS artifacts (
+        run_id TEXT NOT NULL,
+        path TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        size INTEGER,
+        created_at TEXT,
+        sha256 TEXT,
+        PRIMARY KEY (run_id, path)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_artifacts_kind ON artifacts(run_id, kind);
+    """
+
+    def __init__(self, db_path: Path = None):
+        if db_path is None:
+            db_path = default_runs_root() / "run_index.db"
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_MS / 1000,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """עמודות שנוספו אחרי יצירת אינדקסים קיימים"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(artifacts)")}
+        if "sha256" not in columns:
+            self._conn.execute("ALTER TABLE artifacts ADD COLUMN sha256 TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_sha256 ON artifacts(sha256)")
+
+    def _transaction(self, statements: List[tuple]):
+        """מריץ את כל הפקודות בטרנזקציה אחת (BEGIN IMMEDIATE - כותב אחד בכל רגע)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _upsert_run_sql(metadata: Dict, run_dir: Path) -> tuple:
+        values = [metadata.get(field) for field in _RUN_FIELDS]
+        columns = ", ".join(("run_id", "run_dir") + _RUN_FIELDS + ("updated_at",))
+        updates = ", ".join(f"{field} = excluded.{field}"
+                            for field in ("run_dir",) + _RUN_FIELDS + ("updated_at",))
+        placeholders = ", ".join("?" * (len(_RUN_FIELDS) + 3))
+        return (
+            f"INSERT INTO runs ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT(run_id) DO UPDATE SET {updates}",
+            (metadata["run_id"], str(run_dir), *values, datetime.now().isoformat())
+        )
+
+    @staticmethod
+    def _step_sql(run_id: str, step: str, data: Dict) -> tuple:
+        return (
+            "INSERT OR REPLACE INTO steps (run_id, step, passed, timestamp, details) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (run_id, step, int(bool(data.get("passed"))), data.get("timestamp"),
+             json.dumps(data.get("details") or {}, ensure_ascii=False))
+        )
+
+    @staticmethod
+    def _artifact_sql(run_id: str, path: Path, kind: str = None, size: int = None,
+                      created_at: str = None, sha256: str = None) -> tuple:
+        return (
+            "INSERT OR REPLACE INTO artifacts (run_id, path, kind, size, created_at, sha256) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, str(path), kind or artifact_kind(path), size,
+             created_at or datetime.now().isoformat(), sha256)
+        )
+
+    # --- עדכונים (נקראים מ-RunManager) ---
+
+    def upsert_run(self, metadata: Dict, run_dir: Path):
+        """יצירה / כישלון / השלמה - שורת הריצה מה-metadata"""
+        self._transaction([self._upsert_run_sql(metadata, run_dir)])
+
+    def record_step(self, metadata: Dict, run_dir: Path, step: str):
+        """סיום שלב - השלב ושורת הריצה באותה טרנזקציה"""
+        self._transaction([
+            self._upsert_run_sql(metadata, run_dir),
+            self._step_sql(metadata["run_id"], step, metadata["steps"][step])
+        ])
+
+    def record_artifact(self, run_id: str, path: Path, kind: str = None, size: int = None,
+                        sha256: str = None):
+        """קובץ שנכתב לתיקיית הריצה (sha256 = האובייקט במאגר הקבצים, אם הוכנס)"""
+        self._transaction([self._artifact_sql(run_id, path, kind, size, sha256=sha256)])
+
+    def remove_run(self, run_id: str):
+        self._transaction([
+            ("DELETE FROM artifacts WHERE run_id = ?", (run_id,)),
+            ("DELETE FROM steps WHERE run_id = ?", (run_id,)),
+            ("DELETE FROM runs WHERE run_id = ?", (run_id,)),
+        ])
+
+    # --- שאילתות ---
+
+    def runs(self, status: str = None, failed_stage: str = None, child: str = None,
+             topic: str = None, since: str = None, until: str = None,
+             limit: int = None) -> List[Dict]:
+        """
+        ריצות לפי סינון (כל הפרמטרים אופציונליים), מהחדשה לישנה
+
+        Args:
+            status: RUNNING / FAILED / COMPLETED
+            failed_stage: השלב שבו הריצה נכשלה
+            child: שם הדמות
+            topic: נושא (התאמה מדויקת)
+            since / until: תאריך או זמן ISO (until כולל את כל היום / הדקה שצוינו)
+        """
+        conditions, params = [], []
+        for column, value in (("status", status), ("failed_stage", failed_stage),
+                              ("character_name", child), ("topic", topic)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            # "2026-01-05" כולל את כל ה-2026-01-05T...
+            conditions.append("created_at <= ?")
+            params.append(until + "\uffff")
+
+        sql = "SELECT * FROM runs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def steps(self, run_id: str) -> Dict[str, Dict]:
+        """השלבים של ריצה - באותו מבנה כמו metadata['steps']"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step, passed, timestamp, details FROM steps WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        return {
+            row["step"]: {"passed": bool(row["passed"]), "timestamp": row["timestamp"],
+                          "details": json.loads(row["details"] or "{}")}
+            for row in rows
+        }
+
+    def artifacts(self, run_id: str, kind: str = None, suffix: str = None) -> List[str]:
+        """נתיבי הקבצים של ריצה (אופציונלית: סוג / סיומת) - בלי סריקת תיקיות"""
+        sql = "SELECT path FROM artifacts WHERE run_id = ?"
+        params = [run_id]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            paths = [row["path"] for row in self._conn.execute(sql + " ORDER BY path", params)]
+        if suffix:
+            paths = [path for path in paths if path.endswith(suffix)]
+        return paths
+
+    def artifacts_by_digest(self, sha256: str) -> List[Dict]:
+        """כל הקבצים (בכל הריצות) עם אותו תוכן"""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT run_id, path, kind FROM artifacts WHERE sha256 = ?", (sha256,))]
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {row["status"]: row["n"] for row in self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM runs GROUP BY status")}
+
+    # --- בנייה מחדש מהדיסק ---
+
+    def index_run_dir(self, run_dir: Path) -> Optional[str]:
+        """
+        מאנדקס ריצה אחת מהדיסק: metadata (snapshot + יומן אירועים) אם קיים, אחרת שורה מינימלית
+        מהתיקייה (ריצות ישנות בלי metadata), וכל הקבצים בתת-התיקיות (עם sha256 לקבצים
+        שמקושרים למאגר הקבצים)
+
+        Returns:
+            run_id, או None אם התיקייה אינה ריצה
+        """
+        run_dir = Path(run_dir)
+        metadata = load_run_metadata(run_dir)
+        if metadata is None:
+            if not (run_dir / "story").is_dir():
+                return None
+            metadata = {"run_id": run_dir.name, "book_slug": run_dir.parent.name,
+                        "status": "UNKNOWN", "created_at": _created_from_run_id(run_dir.name)}
+        metadata.setdefault("run_id", run_dir.name)
+
+        run_id = metadata["run_id"]
+        statements = [
+            ("DELETE FROM artifacts WHERE run_id = ?", (run_id,)),
+            ("DELETE FROM steps WHERE run_id = ?", (run_id,)),
+            self._upsert_run_sql(metadata, run_dir),
+        ]
+        statements += [self._step_sql(run_id, step, data)
+                       for step, data in (metadata.get("steps") or {}).items()]
+        for kind in ARTIFACT_KINDS:
+            kind_dir = run_dir / kind
+            if not kind_dir.is_dir():
+                continue
+            for path in kind_dir.rglob("*"):
+                if path.is_file():
+                    stat = path.stat()
+                    # קובץ עם יותר מקישור אחד הוא הפניה למאגר הקבצים - ה-digest שלו נשמר
+                    digest = ArtifactStore.digest_file(path) if stat.st_nlink > 1 else None
+                    statements.append(self._artifact_sql(
+                        run_id, path, kind, stat.st_size,
+                        datetime.fromtimestamp(stat.st_mtime).isoformat(), digest
+                    ))
+        self._transaction(statements)
+        return run_id
+
+    def rebuild(self, runs_root: Path = None) -> int:
+        """
+        בונה את האינדקס מחדש מ-data/runs/<slug>/<run_id>
+        ריצות שנמחקו מהדיסק נמחקות גם מהאינדקס
+
+        Returns:
+            מספר הריצות שאונדקסו
+        """
+        runs_root = Path(runs_root) if runs_root else self.db_path.parent
+        indexed = set()
+        for run_dir in sorted(p for p in runs_root.glob("*/*") if p.is_dir()):
+            run_id = self.index_run_dir(run_dir)
+            if run_id:
+                indexed.add(run_id)
+
+        with self._lock:
+            known = [row["run_id"] for row in self._conn.execute("SELECT run_id FROM runs")]
+        for run_id in known:
+            if run_id not in indexed:
+                self.remove_run(run_id)
+        return len(indexed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+    from run_journal import atomic_write_json
+
+    root = Path(tempfile.mkdtemp()) / "runs"
+    index = RunIndex(root / "run_index.db")
+    run_dir = root / "נועה_age4_גן" / "20260101_120000_abc123"
+    (run_dir / "images").mkdir(parents=True)
+    (run_dir / "images" / "page_01.png").write_bytes(b"png")
+
+    metadata = {"run_id": run_dir.name, "book_slug": run_dir.parent.name, "topic": "גן",
+                "age": 4, "character_name": "נועה", "status": "RUNNING",
+                "created_at": "2026-01-01T12:00:00"}
+    index.upsert_run(metadata, run_dir)
+    index.record_artifact(run_dir.name, run_dir / "images" / "page_01.png")
+    metadata.update(status="FAILED", failed_stage="images", failure_reason="QA")
+    index.upsert_run(metadata, run_dir)
+    atomic_write_json(run_dir / "run_metadata.json", metadata)
+
+    print(f"🔍 נכשלו ב-images: {[r['run_id'] for r in index.runs(failed_stage='images')]}")
+    print(f"🖼️  קבצים: {index.artifacts(run_dir.name, kind='images')}")
+    print(f"♻️  rebuild: {index.rebuild()} ריצות, {index.status_counts()}")
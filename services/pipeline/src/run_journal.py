@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Run Journal - יומן אירועים של ריצה + metadata כתצוגה ממומשת שלו
+
+במקום לכתוב את run_metadata.json מחדש (indent=2) בכל שלב, וקובץ לוג חדש לכל שלב:
+- כל אירוע (יצירה, שלב, לוג, כישלון, השלמה) הוא שורה ב-logs/events.jsonl
+- run_metadata.json הוא snapshot של היומן עד אירוע events_applied, ונכתב
+  אטומית (קובץ זמני + rename) - קריסה באמצע משאירה את ה-snapshot הקודם שלם
+- עדכונים צפופים מתאחדים (debounce): ה-snapshot נכתב לכל היותר פעם בחלון,
+  ובכל מקרה ב-flush (כישלון / השלמה / יציאה מהתהליך)
+- load_run_metadata = snapshot + האירועים שאחריו, כך שגם snapshot ישן נותן מצב עדכני
+"""
+import os
+import json
+import time
+import atexit
+import tempfile
+import weakref
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+METADATA_FILENAME = "run_metadata.json"
+EVENTS_FILENAME = "events.jsonl"
+
+# ברירת המחדל לחלון איחוד הכתיבות (שניות)
+DEFAULT_DEBOUNCE_S = 1.0
+
+# יומנים פתוחים - נכתבים ביציאה מהתהליך. WeakSet: יומן של ריצה שהסתיימה (או שאף
+# אחד לא מחזיק) לא נשאר בזיכרון לאורך חיי התהליך (worker התור מריץ אלפי ריצות)
+_open_journals = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_journals():
+    for journal in list(_open_journals):
+        journal.flush()
+
+
+def atomic_write_json(path: Path, data, indent: Optional[int] = 2):
+    """כתיבה לקובץ זמני באותה תיקייה, fsync, ואז rename מעל הקובץ - אטומי ב-POSIX וב-Windows"""
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def apply_event(metadata: Dict, event: Dict) -> Dict:
+    """מחיל אירוע אחד על ה-metadata (אירועי log לא משנים את ה-snapshot)"""
+    kind = event["event"]
+    if kind == "created":
+        metadata.clear()
+        metadata.update(event["metadata"])
+    elif kind == "step":
+        metadata.setdefault("steps", {})[event["step"]] = {
+            "passed": event["passed"],
+            "timestamp": event["timestamp"],
+            "details": event.get("details") or {}
+        }
+    elif kind == "failed":
+        metadata["status"] = "FAILED"
+        metadata["failure_reason"] = event["reason"]
+        metadata["failed_stage"] = event.get("stage")
+        metadata["failed_at"] = event["timestamp"]
+    elif kind == "completed":
+        metadata["status"] = "COMPLETED"
+        metadata["completed_at"] = event["timestamp"]
+    elif kind == "resumed":
+        metadata["status"] = "RUNNING"
+        metadata["resumed_at"] = event["timestamp"]
+        for field in ("failure_reason", "failed_stage", "failed_at", "completed_at"):
+            metadata.pop(field, None)
+    metadata["events_applied"] = event["seq"]
+    return metadata
+
+
+def read_events(events_path: Path, after_seq: int = 0) -> List[Dict]:
+    """אירועים מהיומן (שורה אחרונה קטועה מקריסה באמצע כתיבה - מדולגת)"""
+    events = []
+    if not Path(events_path).exists():
+        return events
+    with open(events_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("seq", 0) > after_seq:
+                events.append(event)
+    return events
+
+
+def load_run_metadata(run_dir: Path) -> Optional[Dict]:
+    """
+    המצב העדכני של ריצה: ה-snapshot + כל האירועים שנרשמו אחריו
+    None אם אין לריצה לא snapshot ולא יומן
+    """
+    run_dir = Path(run_dir)
+    metadata = None
+    metadata_path = run_dir / METADATA_FILENAME
+    if metadata_path.exists():
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            # snapshot פגום (ריצות מלפני הכתיבה האטומית) - משחזרים מהיומן בלבד
+            print(f"⚠️  {metadata_path} פגום ({e}) - משחזר מיומן האירועים")
+
+    after_seq = metadata.get("events_applied", 0) if metadata else 0
+    events = read_events(run_dir / "logs" / EVENTS_FILENAME, after_seq)
+    if metadata is None and not events:
+        return None
+    metadata = metadata or {}
+    for event in events:
+        apply_event(metadata, event)
+    return metadata
+
+
+class RunJournal:
+    """
+    כותב היומן וה-snapshot של ריצה אחת
+
+    metadata הוא ה-dict החי (RunManager מחזיק את אותו אובייקט).
+    record() מוסיף שורה ליומן מיד; ה-snapshot נכתב אם עבר חלון ה-debounce
+    מהכתיבה הקודמת, או ב-flush().
+    """
+
+    def __init__(self, run_dir: Path, metadata: Dict = None,
+                 debounce_s: float = DEFAULT_DEBOUNCE_S):
+        self.run_dir = Path(run_dir)
+        self.metadata_path = self.run_dir / METADATA_FILENAME
+        self.events_path = self.run_dir / "logs" / EVENTS_FILENAME
+        self.events_path.parent.mkdir(parents=True, exist_ok=True)
+        self.metadata = metadata if metadata is not None else {}
+        self.debounce_s = debounce_s
+        self._seq = self.metadata.get("events_applied", 0)
+        self._dirty = False
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        # snapshot שלא נכתב בגלל debounce נכתב ביציאה מהתהליך (או ב-close)
+        _open_journals.add(self)
+
+    @classmethod
+    def open(cls, run_dir: Path, debounce_s: float = DEFAULT_DEBOUNCE_S) -> "RunJournal":
+        """פותח יומן של ריצה קיימת (להמשך ריצה) - המצב משוחזר מה-snapshot והיומן"""
+        run_dir = Path(run_dir)
+        metadata = load_run_metadata(run_dir)
+        if metadata is None:
+            raise FileNotFoundError(f"No run metadata or event log in {run_dir}")
+        journal = cls(run_dir, metadata, debounce_s)
+        journal._truncate_partial_line()
+        last_events = read_events(journal.events_path)
+        journal._seq = max([journal._seq] + [event["seq"] for event in last_events])
+        return journal
+
+    def _truncate_partial_line(self):
+        """שורה אחרונה בלי \\n (קריסה באמצע append) נחתכת - אחרת האירוע הבא יידבק אליה"""
+        if not self.events_path.exists():
+            return
+        with open(self.events_path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def record(self, event: str, flush: bool = False, **fields) -> Dict:
+        """
+        רושם אירוע ומחיל אותו על ה-metadata
+
+        Args:
+            event: created / step / log / failed / completed / resumed
+            flush: לכתוב את ה-snapshot מיד (מעברי סטטוס)
+        """
+        with self._lock:
+            self._seq += 1
+            entry = {"seq": self._seq, "event": event,
+                     "timestamp": fields.pop("timestamp", None) or datetime.now().isoformat(),
+                     **fields}
+            with open(self.events_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            apply_event(self.metadata, entry)
+            self._dirty = True
+            if flush or time.monotonic() - self._last_write >= self.debounce_s:
+                self._write_snapshot()
+        return entry
+
+    def _write_snapshot(self):
+        atomic_write_json(self.metadata_path, self.metadata)
+        self._dirty = False
+        self._last_write = time.monotonic()
+
+    def flush(self):
+        """כותב את ה-snapshot אם יש אירועים שעוד לא נכללו בו"""
+        with self._lock:
+            if self._dirty:
+                self._write_snapshot()
+
+    def close(self):
+        """סוף הריצה: כותב את ה-snapshot ומוריד את היומן מרשימת הכתיבה ביציאה"""
+        self.flush()
+        _open_journals.discard(self)
+
+
+if __name__ == "__main__":
+    run_dir = Path(tempfile.mkdtemp())
+    journal = RunJournal(run_dir, debounce_s=60)
+    journal.record("created", flush=True, metadata={"run_id": "demo", "status": "RUNNING"})
+    for step in ("story", "images", "pdf"):
+        journal.record("step", step=step, passed=True, details={})
+
+    with open(journal.metadata_path, 'r', encoding='utf-8') as f:
+        print(f"📄 snapshot (debounced): {list(json.load(f).get('steps', {}))}")
+    print(f"🔁 replay: {list(load_run_metadata(run_dir)['steps'])}")
+    journal.record("completed", flush=True)
+    journal.close()
+    print(f"✅ {load_run_metadata(run_dir)['status']}, {journal._seq} אירועים, "
+          f"{len(_open_journals)} יומנים פתוחים")
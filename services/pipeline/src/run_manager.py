@@ -2,12 +2,17 @@
 """
 מנהל ריצות - Run Manager
 מטפל ב-run_id, תיקיות, schema, ולוגים
+ה-metadata הוא snapshot של יומן האירועים (run_journal) - נכתב אטומית ובאיחוד עדכונים
 """
 from pathlib import Path
 from datetime import datetime
 import json
 import hashlib
 from typing import Dict, Optional
+from cost_ledger import CostLedger, set_active_ledger
+from run_journal import RunJournal, DEFAULT_DEBOUNCE_S, atomic_write_json
+from run_index import RunIndex
+from artifact_store import ArtifactStore
 
 
 class InputContractError(RuntimeError):
@@ -81,7 +86,9 @@ class RunManager:
                     f"Expected name '{expected_name}' not found in story text"
                 )
 
-    def __init__(self, topic: str, age: int, name: str, base_dir: Path = None):
+    def __init__(self, topic: str, age: int, name: str, base_dir: Path = None,
+                 index: RunIndex = None, metadata_debounce_s: float = DEFAULT_DEBOUNCE_S,
+                 store: ArtifactStore = None, run_id: str = None, book_slug: str = None):
         """
         יוצר run_id ומבנה תיקיות
 
@@ -90,20 +97,32 @@ class RunManager:
             age: גיל יעד
             name: שם הדמות
             base_dir: תיקייה בסיס (ברירת מחדל: data/runs)
+            index: אינדקס הריצות (ברירת מחדל: run_index.db בתיקיית הבסיס)
+            metadata_debounce_s: חלון איחוד כתיבות run_metadata.json
+            store: מאגר הקבצים לפי תוכן (ברירת מחדל: cas ליד תיקיית הבסיס - data/cas)
+            run_id: מזהה ריצה מפורש (ברירת מחדל: YYYYMMDD_HHMMSS_<hash>)
+            book_slug: שם תיקיית הספר (ברירת מחדל: <name>_age<age>_<topic>)
         """
         # יצירת run_id: YYYYMMDD_HHMMSS_<hash>
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        topic_hash = hashlib.md5(topic.encode()).hexdigest()[:6]
-        self.run_id = f"{timestamp}_{topic_hash}"
+        if run_id is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            topic_hash = hashlib.md5(topic.encode()).hexdigest()[:6]
+            run_id = f"{timestamp}_{topic_hash}"
+        self.run_id = run_id
 
         # book_slug: מזהה נקי
-        clean_name = name.replace(" ", "_")
-        clean_topic = topic.replace(" ", "_")[:20]
-        self.book_slug = f"{clean_name}_age{age}_{clean_topic}"
+        if book_slug is None:
+            clean_name = name.replace(" ", "_")
+            clean_topic = topic.replace(" ", "_")[:20]
+            book_slug = f"{clean_name}_age{age}_{clean_topic}"
+        self.book_slug = book_slug
 
         # מבנה תיקיות
         if base_dir is None:
             base_dir = Path("data/runs")
+        self._owns_index = index is None
+        self.index = index or RunIndex(base_dir / "run_index.db")
+        self.store = store or ArtifactStore(base_dir.parent / "cas")
 
         self.base_dir = base_dir / self.book_slug / self.run_id
         self.story_dir = self.base_dir / "story"
@@ -117,8 +136,10 @@ class RunManager:
                          self.qa_dir, self.logs_dir]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
-        # מטא-דאטה
-        self.metadata = {
+        # מטא-דאטה - אירוע היצירה נכתב ליומן ול-snapshot מיד
+        self.journal = RunJournal(self.base_dir, debounce_s=metadata_debounce_s)
+        self.metadata = self.journal.metadata
+        self.journal.record("created", flush=True, metadata={
             "run_id": self.run_id,
             "book_slug": self.book_slug,
             "created_at": datetime.now().isoformat(),
@@ -127,15 +148,58 @@ class RunManager:
             "character_name": name,
             "schema_version": self.STORY_SCHEMA_VERSION,
             "status": "RUNNING"
-        }
+        })
+        self.index.upsert_run(self.metadata, self.base_dir)
+
+        # יומן עלויות - כל קריאות ה-API בתהליך נרשמות לריצה הזו
+        self.ledger = CostLedger(self.logs_dir / "cost_ledger.jsonl")
+        set_active_ledger(self.ledger)
 
-        self._save_metadata()
+    @classmethod
+    def resume(cls, run_dir: Path, index: RunIndex = None,
+               metadata_debounce_s: float = DEFAULT_DEBOUNCE_S,
+               store: ArtifactStore = None) -> "RunManager":
+        """
+        ממשיך ריצה קיימת (למשל אחרי כישלון או קריסה)
+        המצב משוחזר מה-snapshot ומהאירועים שאחריו, והסטטוס חוזר ל-RUNNING
 
-    def _save_metadata(self):
-        """שומר metadata של הריצה"""
-        metadata_path = self.base_dir / "run_metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        Args:
+            run_dir: data/runs/<slug>/<run_id>
+        """
+        run = cls.__new__(cls)
+        run.base_dir = Path(run_dir)
+        run.journal = RunJournal.open(run.base_dir, debounce_s=metadata_debounce_s)
+        run.metadata = run.journal.metadata
+        run.run_id = run.metadata["run_id"]
+        run.book_slug = run.metadata.get("book_slug", run.base_dir.parent.name)
+        run._owns_index = index is None
+        run.index = index or RunIndex(run.base_dir.parent.parent / "run_index.db")
+        run.store = store or ArtifactStore(run.base_dir.parent.parent.parent / "cas")
+        run.story_dir = run.base_dir / "story"
+        run.images_dir = run.base_dir / "images"
+        run.pdf_dir = run.base_dir / "pdf"
+        run.qa_dir = run.base_dir / "qa"
+        run.logs_dir = run.base_dir / "logs"
+
+        run.journal.record("resumed", flush=True)
+        run.index.upsert_run(run.metadata, run.base_dir)
+
+        run.ledger = CostLedger.load(run.logs_dir / "cost_ledger.jsonl")
+        set_active_ledger(run.ledger)
+        return run
+
+    def flush(self):
+        """כותב את run_metadata.json אם יש עדכונים שהתאחדו וטרם נכתבו"""
+        self.journal.flush()
+
+    def close(self):
+        """
+        סוף הריצה: כותב את ה-snapshot, משחרר את היומן וסוגר את האינדקס (אם נפתח כאן)
+        בתהליך ארוך (worker התור) כל ריצה נסגרת - אחרת משאבים מצטברים
+        """
+        self.journal.close()
+        if self._owns_index:
+            self.index.close()
 
     def validate_story_schema(self, story_data: dict) -> tuple:
         """
@@ -180,25 +244,41 @@ class RunManager:
 
         return len(errors) == 0, errors
 
-    def save_story(self, story_data: dict, version: str = "v1"):
+    def save_story(self, story_data: dict, version: Optional[str] = "v1"):
         """
         שומר סיפור אחרי ולידציה
 
         Args:
             story_data: נתוני הסיפור
-            version: גרסה (v1, best, text_checked וכו')
+            version: גרסה (v1, best, text_checked וכו'); None = story.json
         """
         # וולידציה
         is_valid, errors = self.validate_story_schema(story_data)
         if not is_valid:
             raise ValueError(f"Invalid story schema: {errors}")
 
-        # שמירה
-        story_path = self.story_dir / f"story_{version}.json"
-        with open(story_path, 'w', encoding='utf-8') as f:
-            json.dump(story_data, f, ensure_ascii=False, indent=2)
+        # שמירה (קובץ חדש + rename - גרסה קודמת יכולה להיות קישור במאגר הקבצים)
+        story_path = self.story_dir / (f"story_{version}.json" if version else "story.json")
+        atomic_write_json(story_path, story_data)
+
+        return self.record_artifact(story_path)
 
-        return story_path
+    def record_artifact(self, path: Path, kind: str = None, dedupe: bool = True) -> Path:
+        """
+        רושם קובץ שנכתב לתיקיית הריצה באינדקס (הדוח לא סורק תיקיות)
+        ומכניס אותו למאגר הקבצים - תוכן שכבר קיים הופך ל-hard link במקום עותק
+
+        הקובץ נעשה לקריאה בלבד: מחליפים אותו בכתיבה לקובץ חדש ו-rename, לא במקום
+
+        Args:
+            path: נתיב הקובץ
+            kind: story / images / pdf / qa (ברירת מחדל: לפי התיקייה)
+            dedupe: להכניס למאגר הקבצים
+        """
+        path = Path(path)
+        digest = self.store.ingest(path) if dedupe else None
+        self.index.record_artifact(self.run_id, path, kind, path.stat().st_size, sha256=digest)
+        return path
 
     def load_story(self, version: str = "best") -> dict:
         """טוען סיפור"""
@@ -211,64 +291,56 @@ class RunManager:
 
     def log_step(self, step_name: str, data: dict):
         """
-        לוג שלב
+        לוג שלב - שורה ביומן האירועים (logs/events.jsonl)
 
         Args:
             step_name: שם השלב (story_generation, text_check, וכו')
             data: נתונים לשמירה
         """
-        log_path = self.logs_dir / f"{step_name}_{self.run_id}.json"
-
-        log_entry = {
-            "step": step_name,
-            "timestamp": datetime.now().isoformat(),
-            "run_id": self.run_id,
-            **data
-        }
-
-        with open(log_path, 'w', encoding='utf-8') as f:
-            json.dump(log_entry, f, ensure_ascii=False, indent=2)
+        self.journal.record("log", step=step_name, run_id=self.run_id, data=data)
 
     def mark_step_complete(self, step_name: str, passed: bool, details: dict = None):
         """
-        מסמן שלב כהושלם
+        מסמן שלב כהושלם (ה-snapshot מתעדכן לכל היותר פעם בחלון ה-debounce)
 
         Args:
             step_name: שם השלב
             passed: האם עבר
             details: פרטים נוספים
         """
-        if 'steps' not in self.metadata:
-            self.metadata['steps'] = {}
+        self.journal.record("step", step=step_name, passed=passed, details=details or {})
+        self.index.record_step(self.metadata, self.base_dir, step_name)
 
-        self.metadata['steps'][step_name] = {
-            "passed": passed,
-            "timestamp": datetime.now().isoformat(),
-            "details": details or {}
-        }
+    def mark_failed(self, reason: str, stage: str = None):
+        """
+        מסמן ריצה כנכשלה
 
-        self._save_metadata()
+        Args:
+            reason: סיבת הכישלון
+            stage: השלב שנכשל (ברירת מחדל: השלב האחרון שלא עבר)
+        """
+        if stage is None:
+            failed_steps = [name for name, step in self.metadata.get('steps', {}).items()
+                            if not step.get('passed')]
+            stage = failed_steps[-1] if failed_steps else None
 
-    def mark_failed(self, reason: str):
-        """מסמן ריצה כנכשלה"""
-        self.metadata['status'] = "FAILED"
-        self.metadata['failure_reason'] = reason
-        self.metadata['failed_at'] = datetime.now().isoformat()
-        self._save_metadata()
+        self.journal.record("failed", flush=True, reason=reason, stage=stage)
+        self.index.upsert_run(self.metadata, self.base_dir)
 
     def mark_complete(self):
         """מסמן ריצה כהושלמה בהצלחה"""
-        self.metadata['status'] = "COMPLETED"
-        self.metadata['completed_at'] = datetime.now().isoformat()
-        self._save_metadata()
+        self.journal.record("completed", flush=True)
+        self.index.upsert_run(self.metadata, self.base_dir)
 
     def generate_report(self) -> dict:
         """
         יוצר דוח מסכם של הריצה
+        רשימות הקבצים מגיעות מאינדקס הריצות - בלי glob על התיקיות
 
         Returns:
             dict עם סיכום מלא
         """
+        self.flush()
         report = {
             "run_id": self.run_id,
             "book_slug": self.book_slug,
@@ -276,10 +348,10 @@ class RunManager:
             "created_at": self.metadata.get('created_at'),
             "steps": self.metadata.get('steps', {}),
             "files": {
-                "story": [str(p) for p in self.story_dir.glob("*.json")],
-                "images": [str(p) for p in self.images_dir.glob("*.png")],
-                "pdf": [str(p) for p in self.pdf_dir.glob("*.pdf")],
-                "qa": [str(p) for p in self.qa_dir.glob("*.json")]
+                "story": self.index.artifacts(self.run_id, "story", ".json"),
+                "images": self.index.artifacts(self.run_id, "images", ".png"),
+                "pdf": self.index.artifacts(self.run_id, "pdf", ".pdf"),
+                "qa": self.index.artifacts(self.run_id, "qa", ".json")
             },
             "summary": {}
         }
@@ -295,10 +367,16 @@ class RunManager:
             total_steps = len(steps)
             report['summary']['steps_passed'] = f"{passed_steps}/{total_steps}"
 
+        # עלויות וזמנים לפי שלב ועמוד (מה-usage האמיתי של כל קריאה)
+        costs = self.ledger.summarize()
+        report['costs'] = costs
+        report['summary']['total_cost_usd'] = round(costs['total']['cost_usd'], 4)
+        report['summary']['api_calls'] = costs['total']['calls']
+
         # שמירת דוח
         report_path = self.qa_dir / "final_report.json"
-        with open(report_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        atomic_write_json(report_path, report)
+        self.record_artifact(report_path)
 
         return report
 
@@ -325,3 +403,4 @@ if __name__ == "__main__":
     # דוח
     report = run.generate_report()
     print(f"\nReport: {json.dumps(report, indent=2, ensure_ascii=False)}")
+    run.close()
@@ -5,95 +5,96 @@ Story Diversity Checker
 """
 import json
 from pathlib import Path
-from typing import Dict, List, Optional
-from collections import Counter
-from story_fingerprint import load_fingerprints
+from typing import Dict, List, Optional, Union
+from story_fingerprint import load_pattern_window
+from fingerprint_store import PatternWindow, structure_key
+from keyword_matcher import KeywordMatcher
 
 
-def check_solution_repetition(new_patterns: Dict, last_n: List[Dict], threshold: int = 3) -> Optional[str]:
+def _as_window(last_n: Union[List[Dict], PatternWindow]) -> PatternWindow:
+    """הבדיקות מקבלות רשימת fingerprints או חלון מונים מהמאגר"""
+    return last_n if isinstance(last_n, PatternWindow) else PatternWindow.from_fingerprints(last_n)
+
+
+def check_solution_repetition(new_patterns: Dict, last_n: Union[List[Dict], PatternWindow],
+                              threshold: int = 3) -> Optional[str]:
     """
     בודק חזרה של אותו מנגנון פתרון
 
     Args:
         new_patterns: הדפוסים של הסיפור החדש
-        last_n: N סיפורים אחרונים
+        last_n: N סיפורים אחרונים (רשימה או PatternWindow)
         threshold: מספר מקסימלי של חזרות מותרות
 
     Returns:
         אזהרה או None
     """
+    window = _as_window(last_n)
     new_mechanism = new_patterns["solution_mechanism"]
 
     # ספור כמה פעמים המנגנון הזה מופיע ב-N אחרונים
-    mechanisms = [s["patterns"]["solution_mechanism"] for s in last_n]
-    count = mechanisms.count(new_mechanism)
+    count = window.count("solution_mechanism", new_mechanism)
 
     if count >= threshold:
-        return f"⚠️  Solution mechanism '{new_mechanism}' appears in {count}/{len(last_n)} recent stories"
+        return f"⚠️  Solution mechanism '{new_mechanism}' appears in {count}/{window.size} recent stories"
 
     return None
 
 
-def check_structure_repetition(new_patterns: Dict, last_n: List[Dict], threshold: int = 2) -> Optional[str]:
+def check_structure_repetition(new_patterns: Dict, last_n: Union[List[Dict], PatternWindow],
+                               threshold: int = 2) -> Optional[str]:
     """בודק חזרה של אותו מבנה רגשי (combo של conflict + truth_moment + ending)"""
+    window = _as_window(last_n)
 
-    new_structure = f"{new_patterns['conflict_type']}→{new_patterns['truth_moment_type']}→{new_patterns['ending_tone']}"
-
-    structures = []
-    for s in last_n:
-        p = s["patterns"]
-        structures.append(f"{p['conflict_type']}→{p['truth_moment_type']}→{p['ending_tone']}")
-
-    count = structures.count(new_structure)
+    count = window.count("structure", structure_key(new_patterns))
 
     if count >= threshold:
-        return f"🔴 CRITICAL: Identical emotional structure in {count}/{len(last_n)} recent stories"
+        return f"🔴 CRITICAL: Identical emotional structure in {count}/{window.size} recent stories"
 
     return None
 
 
-def check_adult_role_repetition(new_patterns: Dict, last_n: List[Dict]) -> Optional[str]:
+def check_adult_role_repetition(new_patterns: Dict,
+                                last_n: Union[List[Dict], PatternWindow]) -> Optional[str]:
     """בודק אם תפקיד המבוגר זהה בכל הסיפורים"""
-
+    window = _as_window(last_n)
     new_role = new_patterns["adult_role"]
 
-    roles = [s["patterns"]["adult_role"] for s in last_n]
-
     # אם כל N סיפורים אחרונים עם אותו תפקיד מבוגר
-    if len(set(roles)) == 1 and roles[0] == new_role:
-        return f"⚠️  Adult role '{new_role}' is identical in ALL {len(last_n)} recent stories"
+    if window.size and window.count("adult_role", new_role) == window.size:
+        return f"⚠️  Adult role '{new_role}' is identical in ALL {window.size} recent stories"
 
     return None
 
 
-def check_pacing_repetition(new_patterns: Dict, last_n: List[Dict], threshold: int = 4) -> Optional[str]:
+def check_pacing_repetition(new_patterns: Dict, last_n: Union[List[Dict], PatternWindow],
+                            threshold: int = 4) -> Optional[str]:
     """בודק חזרה של אותו קצב"""
-
+    window = _as_window(last_n)
     new_pacing = new_patterns["pacing_profile"]
 
-    pacings = [s["patterns"]["pacing_profile"] for s in last_n]
-    count = pacings.count(new_pacing)
+    count = window.count("pacing_profile", new_pacing)
 
     if count >= threshold:
-        return f"⚠️  Pacing '{new_pacing}' appears in {count}/{len(last_n)} recent stories"
+        return f"⚠️  Pacing '{new_pacing}' appears in {count}/{window.size} recent stories"
 
     return None
 
 
-def check_ending_repetition(new_patterns: Dict, last_n: List[Dict]) -> Optional[str]:
+def check_ending_repetition(new_patterns: Dict,
+                            last_n: Union[List[Dict], PatternWindow]) -> Optional[str]:
     """בודק אם כל הסיפורים מסתיימים באותו טון"""
-
+    window = _as_window(last_n)
     new_ending = new_patterns["ending_tone"]
 
-    endings = [s["patterns"]["ending_tone"] for s in last_n]
-
-    if len(set(endings)) == 1 and endings[0] == new_ending:
-        return f"🔴 CRITICAL: All {len(last_n)} recent stories end with '{new_ending}'"
+    if window.size and window.count("ending_tone", new_ending) == window.size:
+        return f"🔴 CRITICAL: All {window.size} recent stories end with '{new_ending}'"
 
     return None
 
 
-def check_symbolic_object_repetition(new_patterns: Dict, last_n: List[Dict], threshold: int = 2) -> Optional[str]:
+def check_symbolic_object_repetition(new_patterns: Dict, last_n: Union[List[Dict], PatternWindow],
+                                     threshold: int = 2) -> Optional[str]:
     """בודק חזרה של אותו חפץ סמלי"""
 
     new_object = new_patterns.get("symbolic_object")
@@ -101,15 +102,29 @@ def check_symbolic_object_repetition(new_patterns: Dict, last_n: List[Dict], thr
     if not new_object:
         return None  # אין חפץ סמלי בסיפור החדש
 
-    objects = [s["patterns"].get("symbolic_object") for s in last_n if s["patterns"].get("symbolic_object")]
-    count = objects.count(new_object)
+    window = _as_window(last_n)
+    count = window.count("symbolic_object", new_object)
 
     if count >= threshold:
-        return f"⚠️  Symbolic object '{new_object}' appears in {count}/{len(last_n)} recent stories"
+        return f"⚠️  Symbolic object '{new_object}' appears in {count}/{window.size} recent stories"
 
     return None
 
 
+# Blacklist - רק דוגמאות ברורות, לא רשימה ממצה
+# המטרה: לתפוס את הדוגמאות הגרועות ביותר, לא לכסות הכל
+CLICHE_BLACKLIST = [
+    "כולם יכולים להיות חברים",
+    "גם לי היה קשה כשהייתי",
+    "הוא למד ש",
+    "עכשיו היא יודעת ש",
+    "עכשיו הוא יודע ש",
+    "בסוף הכול הסתדר",
+    "הגוף שלך חכם"
+]
+CLICHE_MATCHER = KeywordMatcher(CLICHE_BLACKLIST)
+
+
 def check_external_cliches(story_text: str) -> List[str]:
     """
     בודק קלישאות מהספרות החיצונית
@@ -120,26 +135,8 @@ def check_external_cliches(story_text: str) -> List[str]:
     Returns:
         רשימת קלישאות שנמצאו
     """
-    # Blacklist - רק דוגמאות ברורות, לא רשימה ממצה
-    # המטרה: לתפוס את הדוגמאות הגרועות ביותר, לא לכסות הכל
-    blacklist = [
-        "כולם יכולים להיות חברים",
-        "גם לי היה קשה כשהייתי",
-        "הוא למד ש",
-        "עכשיו היא יודעת ש",
-        "עכשיו הוא יודע ש",
-        "בסוף הכול הסתדר",
-        "הגוף שלך חכם"
-    ]
-
-    found_cliches = []
-    text_lower = story_text.lower()
-
-    for cliche in blacklist:
-        if cliche.lower() in text_lower:
-            found_cliches.append(cliche)
-
-    return found_cliches
+    hits = CLICHE_MATCHER.scan(story_text)
+    return [cliche for cliche in CLICHE_BLACKLIST if hits.contains(cliche)]
 
 
 def generate_diversity_note(warnings: List[str]) -> str:
@@ -182,10 +179,10 @@ def check_internal_diversity(new_fingerprint: Dict,
     Returns:
         דיקט עם warnings ו-diversity note
     """
-    # טען N אחרונים
-    last_n = load_fingerprints(n=n, series=series)
+    # ספירות הדפוסים ב-N אחרונים (מהמונים המצטברים - לא תלוי בגודל ההיסטוריה)
+    last_n = load_pattern_window(n=n, series=series)
 
-    if len(last_n) < 3:
+    if last_n.size < 3:
         # אין מספיק היסטוריה
         return {
             "warnings": [],
@@ -237,7 +234,7 @@ def check_internal_diversity(new_fingerprint: Dict,
         "warnings": warnings,
         "diversity_note": diversity_note,
         "status": status,
-        "last_n_analyzed": len(last_n)
+        "last_n_analyzed": last_n.size
     }
 
 
@@ -278,25 +275,19 @@ def analyze_recent_patterns(n: int = 5, series: str = None) -> Dict:
     Returns:
         סיכום של הדפוסים האחרונים
     """
-    last_n = load_fingerprints(n=n, series=series)
+    last_n = load_pattern_window(n=n, series=series)
 
-    if len(last_n) < 3:
+    if last_n.size < 3:
         return {"status": "insufficient_history"}
 
     # אסוף סטטיסטיקות
-    conflicts = [s["patterns"]["conflict_type"] for s in last_n]
-    truth_moments = [s["patterns"]["truth_moment_type"] for s in last_n]
-    solutions = [s["patterns"]["solution_mechanism"] for s in last_n]
-    adult_roles = [s["patterns"]["adult_role"] for s in last_n]
-    endings = [s["patterns"]["ending_tone"] for s in last_n]
-
     return {
-        "analyzed": len(last_n),
-        "conflicts": dict(Counter(conflicts)),
-        "truth_moments": dict(Counter(truth_moments)),
-        "solutions": dict(Counter(solutions)),
-        "adult_roles": dict(Counter(adult_roles)),
-        "endings": dict(Counter(endings))
+        "analyzed": last_n.size,
+        "conflicts": last_n.counter("conflict_type"),
+        "truth_moments": last_n.counter("truth_moment_type"),
+        "solutions": last_n.counter("solution_mechanism"),
+        "adult_roles": last_n.counter("adult_role"),
+        "endings": last_n.counter("ending_tone")
     }
 
 
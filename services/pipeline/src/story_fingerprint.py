@@ -4,96 +4,130 @@ Story Fingerprint Extractor
 מחלץ "טביעת אצבע" של סיפור לזיהוי דפוסים חוזרים
 """
 import json
-import re
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
+from fingerprint_store import FingerprintStore, PatternWindow, get_store
+from keyword_matcher import KeywordMatcher
+
+
+# ========================================
+# טבלאות מילות מפתח (נבנות פעם אחת, נסרקות במעבר אחד)
+# ========================================
+
+CONFLICT_PATTERNS = {
+    "fear_of_new": ["חדש", "מפחד", "לא מכיר", "ראשון"],
+    "loss_grief": ["מת", "נעלם", "אבד", "נפרד", "לא יתעורר"],
+    "social_isolation": ["לבד", "אף אחד", "בודד", "לא משחק"],
+    "anger_frustration": ["כועס", "לא רוצה", "מכה", "זורק"],
+    "change_transition": ["עובר", "משתנה", "עוזב", "מתחיל"],
+    "self_regulation": ["חיתול", "שינה", "אוכל", "לא מצליח"]
+}
+
+TRUTH_PATTERNS = {
+    "creates_physical_solution": ["בונה", "עושה", "שם", "מניח", "ממלא"],
+    "makes_internal_decision": ["מחליט", "בוחר", "חושב", "מרגיש"],
+    "takes_action_alone": ["הולך", "ניגש", "קם", "עושה בעצמו"],
+    "connects_with_other": ["מתיישב", "מתקרב", "נותן", "משתף"],
+    "accepts_situation": ["נשאר", "מסתכל", "שותק", "מקבל"]
+}
+
+SOLUTION_PATTERNS = {
+    "physical_object_comfort": ["כוס", "כרית", "שמיכה", "חפץ", "אבן", "משהו"],
+    "parallel_activity": ["ליד", "יחד", "גם", "בונה", "עושה"],
+    "adult_presence": ["אמא", "אבא", "מורה", "עומד", "מסתכל"],
+    "self_initiated_action": ["בעצמו", "לבד", "קם", "הולך"],
+    "time_and_repetition": ["שוב", "עוד", "כל יום", "ממשיך"]
+}
+
+ADULT_WORDS = ["אמא", "אבא", "מורה"]
+
+# ספור מילות מפתח לכל תפקיד (חיפוש מדויק יותר)
+ADULT_PATTERNS = {
+    "validates_explicitly": ["כל הכבוד", "יפה מאוד", "מצוין", "ילד גדול", "ילדה גדולה", "אח גדול טוב", "אחות גדולה טובה", "נהדר", "גאה בך"],
+    "gives_direct_instruction": ["אומר ל", "מסביר", "מראה ל", "מלמד"],
+    "participates_actively": ["משחק", "בונה", "מוציא", "נותן", "עושה יחד"],
+    "provides_gentle_support": ["שואל", "מתקרב", "יושב ל", "מחייך", "מנהנ"],
+    "observes_silently": ["רואה", "מסתכל", "עומד ו", "לא אומר"]
+}
+
+# ניתוח דפוסי תנועה
+MOVEMENT_WORDS = ["רץ", "הולך", "קופץ", "נע", "עובר"]
+STILLNESS_WORDS = ["יושב", "עומד", "שוכב", "מסתכל", "שותק"]
+
+ENDING_PATTERNS = {
+    "open_continuation": ["מחר", "עוד", "עד", "ממשיך"],
+    "quiet_closure": ["שקט", "נרדם", "שוכב", "סוגר עיניים"],
+    "gentle_resolution": ["בסדר", "טוב", "יפה", "נרגע"],
+    "energetic_celebration": ["יש", "הצלחתי", "כל הכבוד"]
+}
+
+# חפצים שמופיעים מספר פעמים
+SYMBOLIC_OBJECTS = ["כוס", "כרית", "שמיכה", "אבן", "עץ", "פינה", "חדר", "מיטה"]
+
+FINGERPRINT_MATCHER = KeywordMatcher.from_groups(
+    CONFLICT_PATTERNS, TRUTH_PATTERNS, SOLUTION_PATTERNS, ADULT_PATTERNS, ENDING_PATTERNS,
+    {"adult_words": ADULT_WORDS, "movement": MOVEMENT_WORDS,
+     "stillness": STILLNESS_WORDS, "objects": SYMBOLIC_OBJECTS}
+)
+
+
+class StoryScan:
+    """
+    סריקה אחת של כל טקסט הסיפור (העמודים מחוברים ברווח, כמו ב-" ".join)
+    + הטווח של כל עמוד בטקסט המחובר, לשאילתות לפי עמוד
+    """
 
+    def __init__(self, story: Dict):
+        texts = [p["text"].lower() for p in story["pages"]]
+        self.page_spans = []
+        offset = 0
+        for text in texts:
+            self.page_spans.append((offset, offset + len(text)))
+            offset += len(text) + 1
+        self.hits = FINGERPRINT_MATCHER.scan(" ".join(texts))
 
-def extract_conflict_type(story: Dict) -> str:
-    """מזהה את סוג הקונפליקט המרכזי"""
-    pages_text = " ".join([p["text"] for p in story["pages"]]).lower()
-
-    # מילות מפתח לזיהוי קונפליקטים
-    conflict_patterns = {
-        "fear_of_new": ["חדש", "מפחד", "לא מכיר", "ראשון"],
-        "loss_grief": ["מת", "נעלם", "אבד", "נפרד", "לא יתעורר"],
-        "social_isolation": ["לבד", "אף אחד", "בודד", "לא משחק"],
-        "anger_frustration": ["כועס", "לא רוצה", "מכה", "זורק"],
-        "change_transition": ["עובר", "משתנה", "עוזב", "מתחיל"],
-        "self_regulation": ["חיתול", "שינה", "אוכל", "לא מצליח"]
-    }
 
-    for conflict_type, keywords in conflict_patterns.items():
-        if any(kw in pages_text for kw in keywords):
-            return conflict_type
+def scan_story(story: Dict) -> StoryScan:
+    """סורק את הסיפור פעם אחת - התוצאה משותפת לכל ה-extract_*"""
+    return StoryScan(story)
 
-    return "general_emotional"
+
+def extract_conflict_type(story: Dict, scan: StoryScan = None) -> str:
+    """מזהה את סוג הקונפליקט המרכזי"""
+    scan = scan or scan_story(story)
+    return scan.hits.first_group(CONFLICT_PATTERNS) or "general_emotional"
 
 
-def extract_truth_moment_type(story: Dict) -> str:
+def extract_truth_moment_type(story: Dict, scan: StoryScan = None) -> str:
     """מזהה את סוג רגע האמת (truth moment)"""
-    pages = story["pages"]
-    mid_section = pages[len(pages)//2:]  # חצי שני של הסיפור
-
-    truth_patterns = {
-        "creates_physical_solution": ["בונה", "עושה", "שם", "מניח", "ממלא"],
-        "makes_internal_decision": ["מחליט", "בוחר", "חושב", "מרגיש"],
-        "takes_action_alone": ["הולך", "ניגש", "קם", "עושה בעצמו"],
-        "connects_with_other": ["מתיישב", "מתקרב", "נותן", "משתף"],
-        "accepts_situation": ["נשאר", "מסתכל", "שותק", "מקבל"]
-    }
+    scan = scan or scan_story(story)
+    spans = scan.page_spans
+    mid_section = spans[len(spans)//2:]  # חצי שני של הסיפור
 
-    for page in mid_section:
-        text = page["text"].lower()
-        for truth_type, keywords in truth_patterns.items():
-            if any(kw in text for kw in keywords):
-                return truth_type
+    for start, end in mid_section:
+        truth_type = scan.hits.first_group(TRUTH_PATTERNS, start, end)
+        if truth_type:
+            return truth_type
 
     return "observes_and_processes"
 
 
-def extract_solution_mechanism(story: Dict) -> str:
+def extract_solution_mechanism(story: Dict, scan: StoryScan = None) -> str:
     """מזהה את מנגנון הפתרון"""
-    pages_text = " ".join([p["text"] for p in story["pages"]]).lower()
-
-    solution_patterns = {
-        "physical_object_comfort": ["כוס", "כרית", "שמיכה", "חפץ", "אבן", "משהו"],
-        "parallel_activity": ["ליד", "יחד", "גם", "בונה", "עושה"],
-        "adult_presence": ["אמא", "אבא", "מורה", "עומד", "מסתכל"],
-        "self_initiated_action": ["בעצמו", "לבד", "קם", "הולך"],
-        "time_and_repetition": ["שוב", "עוד", "כל יום", "ממשיך"]
-    }
-
-    for mechanism, keywords in solution_patterns.items():
-        if any(kw in pages_text for kw in keywords):
-            return mechanism
+    scan = scan or scan_story(story)
+    return scan.hits.first_group(SOLUTION_PATTERNS) or "internal_processing"
 
-    return "internal_processing"
 
-
-def extract_adult_role(story: Dict) -> str:
+def extract_adult_role(story: Dict, scan: StoryScan = None) -> str:
     """מזהה את תפקיד המבוגר - בוחר בדפוס הדומיננטי"""
-    pages_text = " ".join([p["text"] for p in story["pages"]]).lower()
+    scan = scan or scan_story(story)
 
-    if "אמא" not in pages_text and "אבא" not in pages_text and "מורה" not in pages_text:
+    if not scan.hits.any_of(ADULT_WORDS):
         return "no_adult_present"
 
-    # ספור מילות מפתח לכל תפקיד (חיפוש מדויק יותר)
-    adult_patterns = {
-        "validates_explicitly": ["כל הכבוד", "יפה מאוד", "מצוין", "ילד גדול", "ילדה גדולה", "אח גדול טוב", "אחות גדולה טובה", "נהדר", "גאה בך"],
-        "gives_direct_instruction": ["אומר ל", "מסביר", "מראה ל", "מלמד"],
-        "participates_actively": ["משחק", "בונה", "מוציא", "נותן", "עושה יחד"],
-        "provides_gentle_support": ["שואל", "מתקרב", "יושב ל", "מחייך", "מנהנ"],
-        "observes_silently": ["רואה", "מסתכל", "עומד ו", "לא אומר"]
-    }
-
     # ספור matches לכל קטגוריה
-    role_scores = {}
-    for role, keywords in adult_patterns.items():
-        count = sum(1 for kw in keywords if kw in pages_text)
-        if count > 0:
-            role_scores[role] = count
+    role_scores = scan.hits.group_counts(ADULT_PATTERNS)
 
     # אם יש validation מפורש - זה תמיד הכי בעייתי
     if "validates_explicitly" in role_scores:
@@ -106,23 +140,14 @@ def extract_adult_role(story: Dict) -> str:
     return "background_presence"
 
 
-def extract_pacing_profile(story: Dict) -> str:
+def extract_pacing_profile(story: Dict, scan: StoryScan = None) -> str:
     """מזהה את פרופיל הקצב"""
-    pages = story["pages"]
-
-    # ספירת משפטים בכל עמוד
-    sentence_counts = []
-    for page in pages:
-        text = page["text"]
-        sentences = [s.strip() for s in re.split(r'[.!?]', text) if s.strip()]
-        sentence_counts.append(len(sentences))
-
-    # ניתוח דפוסי תנועה
-    movement_words = ["רץ", "הולך", "קופץ", "נע", "עובר"]
-    stillness_words = ["יושב", "עומד", "שוכב", "מסתכל", "שותק"]
+    scan = scan or scan_story(story)
 
-    movement_count = sum(1 for p in pages if any(w in p["text"].lower() for w in movement_words))
-    stillness_count = sum(1 for p in pages if any(w in p["text"].lower() for w in stillness_words))
+    movement_count = sum(1 for start, end in scan.page_spans
+                         if scan.hits.any_of(MOVEMENT_WORDS, start, end))
+    stillness_count = sum(1 for start, end in scan.page_spans
+                          if scan.hits.any_of(STILLNESS_WORDS, start, end))
 
     if stillness_count > movement_count * 2:
         return "slow_contemplative"
@@ -132,34 +157,24 @@ def extract_pacing_profile(story: Dict) -> str:
         return "balanced_mixed"
 
 
-def extract_ending_tone(story: Dict) -> str:
+def extract_ending_tone(story: Dict, scan: StoryScan = None) -> str:
     """מזהה את טון הסיום"""
-    last_pages = story["pages"][-3:]  # 3 עמודים אחרונים
-    text = " ".join([p["text"] for p in last_pages]).lower()
-
-    ending_patterns = {
-        "open_continuation": ["מחר", "עוד", "עד", "ממשיך"],
-        "quiet_closure": ["שקט", "נרדם", "שוכב", "סוגר עיניים"],
-        "gentle_resolution": ["בסדר", "טוב", "יפה", "נרגע"],
-        "energetic_celebration": ["יש", "הצלחתי", "כל הכבוד"]
-    }
-
-    for tone, keywords in ending_patterns.items():
-        if any(kw in text for kw in keywords):
-            return tone
+    scan = scan or scan_story(story)
+    last_pages = scan.page_spans[-3:]  # 3 עמודים אחרונים
+    if not last_pages:
+        return "neutral_ending"
 
-    return "neutral_ending"
+    # הטווח של שלושת העמודים האחרונים בטקסט המחובר = " ".join שלהם
+    start, end = last_pages[0][0], last_pages[-1][1]
+    return scan.hits.first_group(ENDING_PATTERNS, start, end) or "neutral_ending"
 
 
-def extract_symbolic_object(story: Dict) -> Optional[str]:
+def extract_symbolic_object(story: Dict, scan: StoryScan = None) -> Optional[str]:
     """מזהה חפץ סמלי מרכזי (אם יש)"""
-    pages_text = " ".join([p["text"] for p in story["pages"]]).lower()
+    scan = scan or scan_story(story)
 
-    # חפשים שמופיעים מספר פעמים
-    objects = ["כוס", "כרית", "שמיכה", "אבן", "עץ", "פינה", "חדר", "מיטה"]
-
-    for obj in objects:
-        if pages_text.count(obj) >= 3:  # מופיע לפחות 3 פעמים
+    for obj in SYMBOLIC_OBJECTS:
+        if scan.hits.count(obj) >= 3:  # מופיע לפחות 3 פעמים
             return obj
 
     return None
@@ -182,6 +197,8 @@ def extract_fingerprint(story_data: Dict,
         Fingerprint מלא
     """
     story = story_data["story"]
+    # סריקה אחת של הטקסט לכל הדפוסים
+    scan = scan_story(story)
 
     fingerprint = {
         "story_id": story_id,
@@ -195,42 +212,36 @@ def extract_fingerprint(story_data: Dict,
 
         # Pattern fingerprints
         "patterns": {
-            "conflict_type": extract_conflict_type(story),
-            "truth_moment_type": extract_truth_moment_type(story),
-            "solution_mechanism": extract_solution_mechanism(story),
-            "adult_role": extract_adult_role(story),
-            "pacing_profile": extract_pacing_profile(story),
-            "ending_tone": extract_ending_tone(story),
-            "symbolic_object": extract_symbolic_object(story)
+            "conflict_type": extract_conflict_type(story, scan),
+            "truth_moment_type": extract_truth_moment_type(story, scan),
+            "solution_mechanism": extract_solution_mechanism(story, scan),
+            "adult_role": extract_adult_role(story, scan),
+            "pacing_profile": extract_pacing_profile(story, scan),
+            "ending_tone": extract_ending_tone(story, scan),
+            "symbolic_object": extract_symbolic_object(story, scan)
         }
     }
 
     return fingerprint
 
 
-def save_fingerprint(fingerprint: Dict, history_file: Path = None):
-    """שומר fingerprint להיסטוריה"""
-    if history_file is None:
-        history_file = Path(__file__).parent.parent / "data" / "fingerprints" / "fingerprints_history.json"
+DEFAULT_HISTORY_FILE = Path(__file__).parent.parent / "data" / "fingerprints" / "fingerprints_history.json"
 
-    # צור תיקייה אם לא קיימת
-    history_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # טען היסטוריה קיימת
-    if history_file.exists():
-        with open(history_file, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-    else:
-        history = {"stories": []}
-
-    # הוסף fingerprint חדש
-    history["stories"].append(fingerprint)
+def _get_store(history_file: Path = None) -> FingerprintStore:
+    """
+    המאגר שמאחורי history_file: <history_file>.db לצד קובץ ה-JSON הישן,
+    שמיובא אליו אוטומטית בפעם הראשונה
+    """
+    history_file = Path(history_file) if history_file is not None else DEFAULT_HISTORY_FILE
+    return get_store(history_file.with_suffix(".db"), legacy_file=history_file)
 
-    # שמור
-    with open(history_file, 'w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
 
-    return history_file
+def save_fingerprint(fingerprint: Dict, history_file: Path = None):
+    """שומר fingerprint להיסטוריה (INSERT יחיד - לא קורא את ההיסטוריה)"""
+    store = _get_store(history_file)
+    store.append(fingerprint)
+    return store.db_path
 
 
 def load_fingerprints(n: int = None,
@@ -245,28 +256,22 @@ def load_fingerprints(n: int = None,
         history_file: נתיב לקובץ היסטוריה
 
     Returns:
-        רשימת fingerprints
+        רשימת fingerprints (הישן ראשון)
     """
-    if history_file is None:
-        history_file = Path(__file__).parent.parent / "data" / "fingerprints" / "fingerprints_history.json"
-
-    if not history_file.exists():
-        return []
-
-    with open(history_file, 'r', encoding='utf-8') as f:
-        history = json.load(f)
+    return _get_store(history_file).last(n=n, series=series)
 
-    stories = history["stories"]
 
-    # סנן לפי סדרה אם צריך
-    if series:
-        stories = [s for s in stories if s.get("series") == series]
-
-    # קח N אחרונים אם צריך
-    if n:
-        stories = stories[-n:]
+def load_pattern_window(n: int = None,
+                        series: str = None,
+                        history_file: Path = None) -> PatternWindow:
+    """
+    ספירות הדפוסים ב-N האחרונים (None = הכל) - מהמונים המצטברים, בלי לטעון fingerprints
 
-    return stories
+    Example:
+        window = load_pattern_window(n=5)
+        window.count("ending_tone", "quiet_closure")
+    """
+    return _get_store(history_file).window(n=n, series=series)
 
 
 if __name__ == "__main__":
@@ -4,9 +4,132 @@ Story Personalizer - התאמה אישית של סיפורים
 """
 import json
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 import re
 
+from keyword_matcher import trie_pattern
+
+
+# פעלים, כינויים ושמות תואר בלשון נקבה -> זכר (סיפורי המקור כתובים על ילדה)
+FEMININE_TO_MASCULINE = {
+    # כינויים
+    "היא": "הוא",
+    "שלה": "שלו",
+    "אותה": "אותו",
+    "לה": "לו",
+    "ילדה": "ילד",
+    "בת": "בן",
+    "הגיבורה": "הגיבור",
+    # שמות תואר
+    "מוכנה": "מוכן",
+    "גדולה": "גדול",
+    "אמיצה": "אמיץ",
+    "מודאגות": "מודאגים",
+    "נחושות": "נחושים",
+    "גאה": "גאה",  # זה זהה
+    # פעלים - עבר
+    "עמדה": "עמד",
+    "הביטה": "הביט",
+    "ליטפה": "ליטף",
+    "הרגישה": "הרגיש",
+    "ניסתה": "ניסה",
+    "זכרה": "זכר",
+    "התעוררה": "התעורר",
+    "ירדה": "ירד",
+    "נגעו": "נגעו",  # זה זהה לזכר
+    "עשתה": "עשה",
+    "קפאה": "קפא",
+    "ראתה": "ראה",
+    "צחקה": "צחק",
+    "לחשה": "לחש",
+    "התכרבלה": "התכרבל",
+    "נזכרה": "נזכר",
+    "מיהרה": "מיהר",
+    "קיבלה": "קיבל",
+    "אמרה": "אמר",
+    "חשבה": "חשב",
+    "שאלה": "שאל",
+    "ידעה": "ידע",
+    "התכוננה": "התכונן",
+    "חיכתה": "חיכה",
+    "שכבה": "שכב",
+    "סגרה": "סגר",
+    "פתחה": "פתח",
+    "עלתה": "עלה",
+    "השתמשה": "השתמש",
+    "שטפה": "שטף",
+    "עצרה": "עצר",
+    "הסתכלה": "הסתכל",
+    "חזרה": "חזר",
+    "קפצה": "קפץ",
+    "סיפרה": "סיפר",
+    "נראית": "נראה",
+    "לבושה": "לבוש",
+    # פעלים - הווה
+    "צריכה": "צריך",
+    "יכולה": "יכול",
+    "מתרגשת": "מתרגש"
+}
+
+# תו ששייך למילה: אות / ספרה / _ או ניקוד וטעמים (U+0591-U+05C7, בלי מקף עברי U+05BE)
+# כך ש"לָה" מנוקדת לא נחתכת באמצע כמו עם \b
+_WORD_CHAR = r"[\w\u0591-\u05BD\u05BF-\u05C7]"
+
+
+class GenderRewriter:
+    """
+    מנוע החלפה מקומפל לכיוון מגדר אחד - נבנה פעם אחת מהמילון
+    מעבר אחד על הטקסט מחליף גם את המילים (מילה שלמה, ההתאמה הארוכה ביותר)
+    וגם שמות (שם הילד / אמא / אבא - כל מופע, גם עם תחילית כמו "לנועה")
+    """
+
+    def __init__(self, mapping: Dict[str, str]):
+        # החלפות זהות (גאה -> גאה) לא משנות דבר
+        self.mapping = {old: new for old, new in mapping.items() if old != new}
+        self._words = (
+            f"(?<!{_WORD_CHAR})(?P<word>{trie_pattern(list(self.mapping))})(?!{_WORD_CHAR})"
+            if self.mapping else None
+        )
+        self._patterns: Dict[tuple, Optional[re.Pattern]] = {}
+
+    def _pattern(self, names: tuple) -> Optional[re.Pattern]:
+        """regex משולב לשמות הנתונים (נשמר לכל צירוף שמות)"""
+        if names not in self._patterns:
+            parts = []
+            if names:
+                # הארוך קודם - שם שמכיל שם אחר מוחלף בשלמותו
+                alternation = "|".join(re.escape(old) for old, _ in sorted(names, key=lambda n: -len(n[0])))
+                parts.append(f"(?P<name>{alternation})")
+            if self._words:
+                parts.append(self._words)
+            self._patterns[names] = re.compile("|".join(parts)) if parts else None
+        return self._patterns[names]
+
+    def rewrite(self, text: str, names: Dict[str, str] = None) -> str:
+        """
+        Args:
+            text: הטקסט המקורי
+            names: {שם מקורי: שם חדש} - מוחלף בכל מופע (לא רק מילה שלמה)
+        """
+        names = {old: new for old, new in (names or {}).items() if old and new and old != new}
+        pattern = self._pattern(tuple(sorted(names.items())))
+        if pattern is None or not text:
+            return text
+
+        def replace(match: re.Match) -> str:
+            if match.lastgroup == "name":
+                return names[match.group()]
+            return self.mapping[match.group()]
+
+        return pattern.sub(replace, text)
+
+
+# מנוע אחד לכל כיוון - סיפורי המקור בלשון נקבה, כך שלבת מוחלפים רק שמות
+REWRITERS = {
+    "boy": GenderRewriter(FEMININE_TO_MASCULINE),
+    "girl": GenderRewriter({})
+}
+
 
 class StoryPersonalizer:
     """
@@ -36,71 +159,8 @@ class StoryPersonalizer:
         """
         print(f"✨ מתאים סיפור ל-{child_name}...")
         
-        # הגדרות מגדר - פעלים ושמות תואר בלשון נקבה -> זכר
-        if child_gender == "boy":
-            pronouns = {
-                # כינויים
-                "היא": "הוא",
-                "שלה": "שלו",
-                "אותה": "אותו",
-                "לה": "לו",
-                "ילדה": "ילד",
-                "בת": "בן",
-                "הגיבורה": "הגיבור",
-                # שמות תואר
-                "מוכנה": "מוכן",
-                "גדולה": "גדול",
-                "אמיצה": "אמיץ",
-                "מודאגות": "מודאגים",
-                "נחושות": "נחושים",
-                "גאה": "גאה",  # זה זהה
-                # פעלים - עבר
-                "עמדה": "עמד",
-                "הביטה": "הביט",
-                "ליטפה": "ליטף",
-                "הרגישה": "הרגיש",
-                "ניסתה": "ניסה",
-                "זכרה": "זכר",
-                "התעוררה": "התעורר",
-                "ירדה": "ירד",
-                "נגעו": "נגעו",  # זה זהה לזכר
-                "עשתה": "עשה",
-                "קפאה": "קפא",
-                "ראתה": "ראה",
-                "צחקה": "צחק",
-                "לחשה": "לחש",
-                "התכרבלה": "התכרבל",
-                "נזכרה": "נזכר",
-                "מיהרה": "מיהר",
-                "קיבלה": "קיבל",
-                "אמרה": "אמר",
-                "חשבה": "חשב",
-                "שאלה": "שאל",
-                "ידעה": "ידע",
-                "התכוננה": "התכונן",
-                "חיכתה": "חיכה",
-                "שכבה": "שכב",
-                "סגרה": "סגר",
-                "פתחה": "פתח",
-                "עלתה": "עלה",
-                "השתמשה": "השתמש",
-                "שטפה": "שטף",
-                "עצרה": "עצר",
-                "הסתכלה": "הסתכל",
-                "חזרה": "חזר",
-                "קפצה": "קפץ",
-                "סיפרה": "סיפר",
-                "נראית": "נראה",
-                "לבושה": "לבוש",
-                "נראית": "נראה",
-                # פעלים - הווה
-                "צריכה": "צריך",
-                "יכולה": "יכול",
-                "מתרגשת": "מתרגש"
-            }
-        else:
-            pronouns = {}  # אם זה בת, הסיפור המקורי כבר נכון
-        
+        rewriter = REWRITERS["boy" if child_gender == "boy" else "girl"]
+
         # העתק story_data
         import copy
         personalized_story = copy.deepcopy(story_data)
@@ -118,56 +178,18 @@ class StoryPersonalizer:
             new_title = original_title.replace("נועה", child_name)
         personalized_story['story']['title'] = new_title
         
-        # עבור על כל עמודי הסיפור
+        # שם הילד, כינויים ושמות ההורים - מעבר אחד לכל שדה
+        page_names = {original_name: child_name, 'אמא': mother_name, 'אבא': father_name}
         for page in personalized_story['story']['pages']:
-            # החלף את השם
-            page['text'] = page['text'].replace(original_name, child_name)
-            page['visual_description'] = page['visual_description'].replace(original_name, child_name)
-            
-            # החלף כינויים (רק אם בן)
-            if child_gender == "boy":
-                for fem, masc in pronouns.items():
-                    # החלף בטקסט
-                    page['text'] = self._smart_replace(page['text'], fem, masc)
-                    # החלף בתיאור ויזואלי
-                    page['visual_description'] = self._smart_replace(
-                        page['visual_description'], fem, masc
-                    )
-        
-        # שנה שמות הורים אם צוין
-        if mother_name:
-            personalized_story['story']['pages'] = [
-                {**page, 
-                 'text': page['text'].replace('אמא', mother_name),
-                 'visual_description': page['visual_description'].replace('אמא', mother_name if 'אמא' in page['visual_description'] else page['visual_description'])}
-                for page in personalized_story['story']['pages']
-            ]
-        
-        if father_name:
-            personalized_story['story']['pages'] = [
-                {**page,
-                 'text': page['text'].replace('אבא', father_name),
-                 'visual_description': page['visual_description'].replace('אבא', father_name if 'אבא' in page['visual_description'] else page['visual_description'])}
-                for page in personalized_story['story']['pages']
-            ]
-        
-        # עדכן summary
-        summary = personalized_story['story']['summary']
-        summary = summary.replace(original_name, child_name)
-        if child_gender == "boy":
-            for fem, masc in pronouns.items():
-                summary = self._smart_replace(summary, fem, masc)
-        personalized_story['story']['summary'] = summary
+            page['text'] = rewriter.rewrite(page['text'], page_names)
+            page['visual_description'] = rewriter.rewrite(page['visual_description'], page_names)
+
+        # עדכן summary (בלי שמות ההורים)
+        personalized_story['story']['summary'] = rewriter.rewrite(
+            personalized_story['story']['summary'], {original_name: child_name}
+        )
         
         return personalized_story
-    
-    def _smart_replace(self, text: str, old: str, new: str) -> str:
-        """
-        החלפה חכמה שמתחשבת בגבולות מילים
-        """
-        # החלף רק במילים שלמות
-        pattern = r'\b' + re.escape(old) + r'\b'
-        return re.sub(pattern, new, text)
 
 
 # Test
@@ -2,10 +2,27 @@
 """
 Story Personalizer Smart - שימוש ב-Claude להחלפה חכמה
 """
+import re
 import json
-from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
+from pydantic import ValidationError
+
 from claude_agent import ClaudeAgent
+from llm_clients import wrap_anthropic, cached_system
+from story_personalizer import REWRITERS
+from story_schema import StoryPage
+
+
+# מצייני מקום לשמות - הבקשה למודל תלויה רק בתבנית ובמגדר (ולא בשם הילד),
+# כך שתשובה אחת משמשת את כל הילדים מאותו מגדר
+CHILD_PLACEHOLDER = "{{CHILD}}"
+MOTHER_PLACEHOLDER = "{{MOTHER}}"
+FATHER_PLACEHOLDER = "{{FATHER}}"
+
+ADAPT_TOOL_NAME = "submit_adapted_pages"
+
+# ניקוד וטעמים - מוסרים לפני החיפוש של השם והמילה שאחריו
+_NIKUD = re.compile(r"[\u0591-\u05C7]")
 
 
 class StoryPersonalizerSmart:
@@ -13,18 +30,36 @@ class StoryPersonalizerSmart:
     מתאים סיפור בצורה חכמה עם Claude
     """
 
+    ADAPT_SYSTEM = f"""אתה עורך לשוני של ספרי ילדים בעברית.
+תקבל עמודים מסיפור שנכתב על ילדה, ותתאים אותם למגדר של הדמות הראשית.
+
+כללים:
+- {CHILD_PLACEHOLDER} הוא שם הדמות הראשית - השאר אותו בדיוק כך (כולל הסוגריים המסולסלים)
+- התאם למגדר הדמות את כל הפעלים, שמות התואר והכינויים שמתייחסים אליה בלבד
+- {MOTHER_PLACEHOLDER} / {FATHER_PLACEHOLDER} (אם מופיעים) הם שמות ההורים - השאר אותם בדיוק כך;
+  אמא היא נקבה ואבא הוא זכר - הצורות שמתייחסות אליהם לא משתנות
+- אל תשנה שום דבר אחר: לא עלילה, לא ניסוח, לא פיסוק
+- החזר את כל העמודים שקיבלת (אותו page_number) דרך הכלי {ADAPT_TOOL_NAME}"""
+
     def __init__(self):
         self.claude = ClaudeAgent()
-        self.client = self.claude.client
+        self.client = self.claude.client.with_cache_site("smart_personalization")
         self.model = self.claude.model
+        # ההתאמה לכל הסיפור תלויה רק בתבנית ובמגדר - דטרמיניסטית, נשמרת לפי LLM_CACHE_MODE
+        self.batch_client = wrap_anthropic(self.claude.client.raw, "smart_personalization_batch",
+                                           deterministic=True)
     
     def personalize_story(self, story_data: Dict,
                          child_name: str,
                          child_gender: str,
                          mother_name: str = None,
-                         father_name: str = None) -> Dict:
+                         father_name: str = None,
+                         batch: bool = True) -> Dict:
         """
         מתאים סיפור בצורה חכמה
+
+        Args:
+            batch: בקשה אחת לכל הסיפור (ברירת מחדל); False = בקשה לכל עמוד
         """
         import copy
         personalized = copy.deepcopy(story_data)
@@ -39,7 +74,11 @@ class StoryPersonalizerSmart:
             personalized['story']['title'] = f"הלילה הגדול של {child_name}"
         
         print(f"✨ מתאים סיפור ל-{child_name} (בצורה חכמה)...")
-        
+
+        if batch:
+            return self._personalize_batch(personalized, original_name, child_name, child_gender,
+                                           mother_name, father_name)
+
         # עבור על כל עמוד
         for i, page in enumerate(personalized['story']['pages']):
             print(f"   עמוד {i+1}...", end='', flush=True)
@@ -77,6 +116,142 @@ class StoryPersonalizerSmart:
         
         return personalized
     
+    def _personalize_batch(self, personalized: Dict, original_name: str, child_name: str,
+                           gender: str, mother_name: str = None, father_name: str = None) -> Dict:
+        """
+        התאמה של כל הסיפור במעבר אחד:
+        1. מעבר דטרמיניסטי - שמות (ו"אמא" -> "אמא <שם>") מוחלפים במצייני מקום
+        2. רק עמודים עם דקדוק מגדרי שצריך לשנות נשלחים למודל - בבקשה אחת
+        3. מצייני המקום מוחלפים בשמות האמיתיים
+        """
+        placeholders = {original_name: CHILD_PLACEHOLDER}
+        names = {CHILD_PLACEHOLDER: child_name}
+        if mother_name and mother_name != "אמא":
+            placeholders["אמא"] = f"אמא {MOTHER_PLACEHOLDER}"
+            names[MOTHER_PLACEHOLDER] = mother_name
+        if father_name and father_name != "אבא":
+            placeholders["אבא"] = f"אבא {FATHER_PLACEHOLDER}"
+            names[FATHER_PLACEHOLDER] = father_name
+
+        # סיפורי המקור כתובים על ילדה - מנוע "girl" מחליף שמות בלבד
+        names_only = REWRITERS["girl"]
+        story = personalized['story']
+        pages = {}
+        for page in story['pages']:
+            pages[page['page_number']] = {
+                'text': names_only.rewrite(page['text'], placeholders),
+                'visual_description': names_only.rewrite(page['visual_description'], placeholders)
+            }
+        summary = names_only.rewrite(story.get('summary', ''), placeholders)
+
+        gendered = [page['page_number'] for page in story['pages']
+                    if self._has_gendered_grammar(page['text'], original_name, gender)
+                    or self._has_gendered_grammar(page['visual_description'], original_name, gender)]
+        adapt_summary = bool(summary) and self._has_gendered_grammar(
+            story.get('summary', ''), original_name, gender)
+
+        if gendered or adapt_summary:
+            print(f"   🤖 עמודים עם דקדוק מגדרי: {gendered}"
+                  + (" + תקציר" if adapt_summary else "") + " - בקשה אחת")
+            adapted, adapted_summary = self._adapt_pages(
+                {number: pages[number] for number in gendered},
+                summary if adapt_summary else None, gender
+            )
+            pages.update(adapted)
+            if adapted_summary:
+                summary = adapted_summary
+        else:
+            print("   ✓ אין דקדוק מגדרי לשנות - ללא קריאה למודל")
+
+        def fill(text: str) -> str:
+            for placeholder, name in names.items():
+                text = text.replace(placeholder, name)
+            return text
+
+        for page in story['pages']:
+            page['text'] = fill(pages[page['page_number']]['text'])
+            page['visual_description'] = fill(pages[page['page_number']]['visual_description'])
+        if 'summary' in story:
+            story['summary'] = fill(summary)
+        return personalized
+
+    @staticmethod
+    def _has_gendered_grammar(text: str, original_name: str, gender: str) -> bool:
+        """
+        האם יש בטקסט דקדוק שצריך להתאים: רק לבן (המקור בלשון נקבה), וכשיש
+        צורת נקבה מהמילון, או שהמילה שאחרי שם הדמות נגמרת ב-ה / ת
+        ("נועה צעדה", "נועה מתרגשת") - אזכור של השם לבדו לא מספיק
+        """
+        if gender != "boy" or not text:
+            return False
+        if REWRITERS["boy"].rewrite(text) != text:
+            return True
+        plain = _NIKUD.sub("", text)
+        for match in re.finditer(re.escape(_NIKUD.sub("", original_name)) + r"\s+(\S+)", plain):
+            word = match.group(1).rstrip(".,!?;:\"'")
+            if len(word) >= 3 and word[-1] in "הת":
+                return True
+        return False
+
+    def _adapt_pages(self, pages: Dict[int, Dict], summary: Optional[str],
+                     gender: str) -> tuple:
+        """
+        בקשה מובנית אחת לכל העמודים (tool use) - מחזיר ({מספר עמוד: עמוד}, תקציר)
+        עמוד שחסר או לא תקין בתשובה נשאר כמו שהוא אחרי המעבר הדטרמיניסטי
+        """
+        gender_he = "בן (זכר)" if gender == "boy" else "בת (נקבה)"
+        payload = {"pages": [{"page_number": number, **page} for number, page in sorted(pages.items())]}
+        if summary is not None:
+            payload["summary"] = summary
+
+        properties = {"pages": {"type": "array", "items": StoryPage.model_json_schema()}}
+        if summary is not None:
+            properties["summary"] = {"type": "string", "minLength": 1}
+        tool = {
+            "name": ADAPT_TOOL_NAME,
+            "description": "שליחת העמודים המותאמים, לפי page_number",
+            "input_schema": {"type": "object", "properties": properties,
+                             "required": list(properties)}
+        }
+
+        response = self.batch_client.messages.create(
+            model=self.model,
+            max_tokens=8000,
+            temperature=0,
+            system=cached_system(self.ADAPT_SYSTEM, self.model),
+            tools=[tool],
+            tool_choice={"type": "tool", "name": ADAPT_TOOL_NAME},
+            messages=[{
+                "role": "user",
+                "content": f"הדמות הראשית {CHILD_PLACEHOLDER} היא {gender_he}.\n\n"
+                           + json.dumps(payload, ensure_ascii=False, indent=2)
+            }]
+        )
+        data = self.claude.tool_input(response, ADAPT_TOOL_NAME)
+
+        adapted = {}
+        for raw in data.get("pages") or []:
+            try:
+                page = StoryPage.model_validate(raw)
+            except ValidationError:
+                continue
+            # עמוד שאיבד את מציין המקום של השם לא נלקח
+            if page.page_number in pages and page.page_number not in adapted and all(
+                page.text.count(p) >= pages[page.page_number]['text'].count(p)
+                for p in (CHILD_PLACEHOLDER, MOTHER_PLACEHOLDER, FATHER_PLACEHOLDER)
+            ):
+                adapted[page.page_number] = {'text': page.text,
+                                             'visual_description': page.visual_description}
+
+        missing = sorted(set(pages) - set(adapted))
+        if missing:
+            print(f"   ⚠️  עמודים שלא הותאמו (נשארו אחרי החלפת שמות): {missing}")
+
+        adapted_summary = data.get("summary") if summary is not None else None
+        if not isinstance(adapted_summary, str) or not adapted_summary.strip():
+            adapted_summary = None
+        return adapted, adapted_summary
+
     def _adapt_text_smart(self, text: str, 
                          original_name: str, 
                          new_name: str,
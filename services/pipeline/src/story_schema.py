@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Story Schema - חוזה הסיפור כמודלי pydantic + כלים (tool use) ל-Claude
+
+מאותם מודלים נבנים:
+- ה-input_schema של הכלי submit_story (בדיוק N עמודים) - Claude מחזיר JSON מובנה
+  ולא טקסט חופשי שצריך לחלץ ממנו JSON
+- ולידציה לפי עמוד: עמוד לא תקין או חסר מבוקש מחדש לבד (submit_pages),
+  בלי לייצר שוב את כל הסיפור
+"""
+import copy
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+
+
+class StoryPage(BaseModel):
+    """עמוד אחד בסיפור"""
+    page_number: int = Field(ge=1)
+    text: str = Field(min_length=1, description="טקסט העמוד בעברית")
+    visual_description: str = Field(min_length=1, description="תיאור מפורט של הסצנה לאיור")
+
+
+class Story(BaseModel):
+    """הסיפור המלא (התוכן של story.json תחת המפתח "story")"""
+    title: str = Field(min_length=1)
+    target_age: int = Field(ge=1, le=18)
+    pages: List[StoryPage]
+
+
+class StoryValidationError(ValueError):
+    """הסיפור לא עמד בחוזה גם אחרי בקשות התיקון (pages = מספרי העמודים הפגומים)"""
+
+    def __init__(self, message: str, pages: List[int] = None):
+        super().__init__(message)
+        self.pages = pages or []
+
+
+STORY_TOOL_NAME = "submit_story"
+PAGES_TOOL_NAME = "submit_pages"
+
+
+def _inline_refs(schema: Dict) -> Dict:
+    """מחליף $ref בהגדרות עצמן - סכמה שטוחה לכלי"""
+    defs = schema.get("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(copy.deepcopy(defs[node["$ref"].split("/")[-1]]))
+            return {key: resolve(value) for key, value in node.items() if key != "$defs"}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+
+def _pages_schema(count: int) -> Dict:
+    pages = _inline_refs(Story.model_json_schema())["properties"]["pages"]
+    pages["minItems"] = count
+    pages["maxItems"] = count
+    return pages
+
+
+def story_tool(num_pages: int) -> Dict:
+    """הגדרת הכלי submit_story - סיפור עם בדיוק num_pages עמודים"""
+    schema = _inline_refs(Story.model_json_schema())
+    schema["properties"]["pages"] = _pages_schema(num_pages)
+    return {
+        "name": STORY_TOOL_NAME,
+        "description": f"שליחת הסיפור המלא: כותרת, גיל יעד ובדיוק {num_pages} עמודים.",
+        "input_schema": schema
+    }
+
+
+def pages_tool(page_numbers: List[int], include_title: bool = False) -> Dict:
+    """הגדרת הכלי submit_pages - רק העמודים שצריך לכתוב מחדש"""
+    properties = {"pages": _pages_schema(len(page_numbers))}
+    required = ["pages"]
+    if include_title:
+        properties["title"] = {"type": "string", "minLength": 1}
+        required.append("title")
+    return {
+        "name": PAGES_TOOL_NAME,
+        "description": f"שליחת העמודים {', '.join(map(str, page_numbers))} בלבד.",
+        "input_schema": {"type": "object", "properties": properties, "required": required}
+    }
+
+
+def validate_pages(raw_pages, num_pages: int) -> Tuple[Dict[int, StoryPage], List[int]]:
+    """
+    מוודא כל עמוד בנפרד
+
+    Returns:
+        (עמודים תקינים לפי מספר עמוד, מספרי עמודים חסרים / פגומים בטווח 1..num_pages)
+    """
+    valid: Dict[int, StoryPage] = {}
+    for i, raw in enumerate(raw_pages if isinstance(raw_pages, list) else []):
+        if isinstance(raw, dict) and "page_number" not in raw:
+            raw = {**raw, "page_number": i + 1}
+        try:
+            page = StoryPage.model_validate(raw)
+        except ValidationError:
+            continue
+        # עמודים מחוץ לטווח או כפולים - נזרקים (הראשון נשאר)
+        if page.page_number <= num_pages and page.page_number not in valid:
+            valid[page.page_number] = page
+
+    invalid = [number for number in range(1, num_pages + 1) if number not in valid]
+    return valid, invalid
+
+
+def validate_header(data: Dict, target_age: int) -> Optional[str]:
+    """
+    כותרת מתשובת הכלי (None אם חסרה)
+
+    גיל היעד של הסיפור הוא תמיד הגיל שהתבקש - גיל אחר מהמודל רק נרשם ביומן
+    """
+    title = data.get("title") if isinstance(data, dict) else None
+    if not isinstance(title, str) or not title.strip():
+        title = None
+    age = data.get("target_age") if isinstance(data, dict) else None
+    if age is not None and age != target_age:
+        print(f"   ⚠️ המודל החזיר גיל יעד {age!r} במקום {target_age} - נשאר {target_age}")
+    return title
+
+
+def build_story(title: str, target_age: int, pages: Dict[int, StoryPage]) -> Dict:
+    """מרכיב את מבנה story.json ({"story": {...}}) מעמודים תקינים"""
+    story = Story(title=title, target_age=target_age,
+                  pages=[pages[number] for number in sorted(pages)])
+    return {"story": story.model_dump()}
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(story_tool(3), ensure_ascii=False, indent=2))
+
+    valid, invalid = validate_pages([
+        {"page_number": 1, "text": "נועה התעוררה", "visual_description": "חדר שינה"},
+        {"page_number": 2, "text": ""},
+        {"page_number": 7, "text": "x", "visual_description": "y"}
+    ], 3)
+    print(f"✅ תקינים: {sorted(valid)} | ❌ לבקש מחדש: {invalid}")
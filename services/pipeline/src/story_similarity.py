@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Story Similarity - זיהוי סיפורים כמעט-זהים בכל הקורפוס (MinHash + LSH)
+
+בדיקת הגיוון (story_diversity_checker) משווה רק תוויות דפוס מול 5 הסיפורים האחרונים.
+כאן משווים את הטקסט עצמו מול כל הסיפורים שנוצרו אי פעם:
+- נרמול עברית: הסרת ניקוד וטעמים, אותיות סופיות → רגילות, ללא פיסוק
+- MinHash על shingles של 3 מילים - הערכת דמיון Jaccard בין סיפורים
+- LSH (bands × rows) ב-SQLite לצד היסטוריית ה-fingerprints:
+  שאילתה בודקת רק סיפורים שחולקים לפחות band אחד, לא את כל הקורפוס
+- backfill מכניס לאינדקס את הסיפורים שכבר על הדיסק (ריצות ו-data/stories) -
+  היסטוריית ה-fingerprints שומרת רק דפוסים, לא טקסט
+"""
+import re
+import json
+import struct
+import random
+import sqlite3
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+
+# ניקוד וטעמים (U+0591-U+05C7), חוץ ממקף עברי (U+05BE) שמפריד מילים
+_NIKUD_RE = re.compile("[\u0591-\u05BD\u05BF-\u05C7]")
+_NON_WORD_RE = re.compile(r"[^\w]+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+# קובץ הסיפור בתיקיית ריצה - הראשון שקיים (story.json של Stage 1, או גרסאות ישנות)
+RUN_STORY_FILES = ("story.json", "story_best.json", "story_v1.json")
+
+# 2^61 - 1 (ראשוני מרסן) - מרחב ה-hash של הפרמוטציות
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_hebrew(text: str) -> str:
+    """טקסט להשוואה: בלי ניקוד, בלי פיסוק, אותיות סופיות כרגילות, רווח יחיד"""
+    text = _NIKUD_RE.sub("", text).replace("\u05BE", " ")
+    text = _NON_WORD_RE.sub(" ", text.lower()).translate(_FINAL_LETTERS)
+    return " ".join(text.split())
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """קבוצת רצפים של size מילים (טקסט קצר מ-size = המילים עצמן)"""
+    words = normalize_hebrew(text).split()
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def story_text(story: Dict) -> str:
+    """כל טקסט העמודים (מקבל story_data או story)"""
+    story = story.get("story", story)
+    return "\n".join(page.get("text", "") for page in story.get("pages", []))
+
+
+class MinHasher:
+    """
+    חתימת MinHash בגודל num_perm - פרמוטציות (a*x + b) mod p קבועות (seed),
+    כך שחתימות מריצות שונות ניתנות להשוואה
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+                       for _ in range(num_perm)]
+
+    @staticmethod
+    def _hash(shingle: str) -> int:
+        return struct.unpack("<I", hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest())[0]
+
+    def signature(self, items: set) -> List[int]:
+        hashes = [self._hash(item) for item in items]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """הערכת Jaccard - אחוז המקומות שבהם החתימות זהות"""
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class SimilarityIndex:
+    """
+    אינדקס LSH של חתימות MinHash ב-SQLite
+
+    bands × rows = num_perm. זוג סיפורים עם דמיון s נהיה מועמד בהסתברות
+    1 - (1 - s^rows)^bands; ברירת המחדל (32×4) תופסת כמעט כל זוג מעל ~0.5.
+    """
+
+    BUSY_TIMEOUT_MS = 30000
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS signatures (
+        story_id TEXT PRIMARY KEY,
+        title TEXT,
+        created_at TEXT,
+        signature BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS lsh_buckets (
+        band INTEGER NOT NULL,
+        bucket TEXT NOT NULL,
+        story_id TEXT NOT NULL,
+        PRIMARY KEY (band, bucket, story_id)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: Path = None, bands: int = 32, rows: int = 4):
+        if db_path is None:
+            db_path = Path(__file__).parent.parent / "data" / "fingerprints" / "story_similarity.db"
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(num_perm=bands * rows)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_MS / 1000,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def signature(self, story: Dict) -> List[int]:
+        return self.hasher.signature(shingles(story_text(story)))
+
+    def _band_keys(self, signature: List[int]) -> List[tuple]:
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            keys.append((band, hashlib.blake2b(array("Q", chunk).tobytes(), digest_size=8).hexdigest()))
+        return keys
+
+    def add(self, story_id: str, story: Dict, title: str = None,
+            signature: List[int] = None) -> List[int]:
+        """מוסיף (או מחליף) סיפור באינדקס ומחזיר את החתימה"""
+        signature = signature or self.signature(story)
+        story = story.get("story", story)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM lsh_buckets WHERE story_id = ?", (story_id,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO signatures (story_id, title, created_at, signature) "
+                    "VALUES (?, ?, ?, ?)",
+                    (story_id, title or story.get("title"), datetime.now().isoformat(),
+                     array("Q", signature).tobytes())
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO lsh_buckets (band, bucket, story_id) VALUES (?, ?, ?)",
+                    [(band, bucket, story_id) for band, bucket in self._band_keys(signature)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return signature
+
+    def most_similar(self, story: Dict, k: int = 5, min_similarity: float = 0.0,
+                     signature: List[int] = None, exclude: str = None) -> List[Dict]:
+        """
+        k הסיפורים הדומים ביותר מבין המועמדים של LSH
+
+        Returns:
+            [{"story_id", "title", "similarity"}] מהדומה ביותר
+        """
+        signature = signature or self.signature(story)
+        with self._lock:
+            candidates = set()
+            for band, bucket in self._band_keys(signature):
+                candidates.update(story_id for (story_id,) in self._conn.execute(
+                    "SELECT story_id FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+                ))
+            candidates.discard(exclude)
+
+            results = []
+            for story_id in candidates:
+                row = self._conn.execute(
+                    "SELECT title, signature FROM signatures WHERE story_id = ?", (story_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                other = array("Q")
+                other.frombytes(row[1])
+                similarity = MinHasher.similarity(signature, other)
+                if similarity >= min_similarity:
+                    results.append({"story_id": story_id, "title": row[0],
+                                    "similarity": round(similarity, 3)})
+
+        results.sort(key=lambda r: r["similarity"], reverse=True)
+        return results[:k]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def backfill(self, runs_root: Path = None, stories_dir: Path = None) -> int:
+        """
+        מכניס לאינדקס סיפורים קיימים שעוד לא בו - ריצות (data/runs/<slug>/<run_id>/story)
+        וסיפורי ה-Orchestrator (data/stories/story_<id>.json)
+        story_id של ריצה הוא ה-run_id, כמו ב-Stage 1
+
+        Returns:
+            מספר הסיפורים שנוספו
+        """
+        data_dir = Path(__file__).parent.parent / "data"
+        runs_root = Path(runs_root) if runs_root else data_dir / "runs"
+        stories_dir = Path(stories_dir) if stories_dir else data_dir / "stories"
+
+        sources = []
+        for run_dir in sorted(p for p in runs_root.glob("*/*") if p.is_dir()):
+            story_path = next((run_dir / "story" / name for name in RUN_STORY_FILES
+                               if (run_dir / "story" / name).exists()), None)
+            if story_path:
+                sources.append((run_dir.name, story_path))
+        for story_path in sorted(stories_dir.glob("story_*.json")):
+            sources.append((story_path.stem[len("story_"):], story_path))
+
+        with self._lock:
+            known = {story_id for (story_id,) in self._conn.execute("SELECT story_id FROM signatures")}
+
+        added = 0
+        for story_id, story_path in sources:
+            if story_id in known:
+                continue
+            try:
+                with open(story_path, 'r', encoding='utf-8') as f:
+                    story = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  {story_path}: {e}")
+                continue
+            if not isinstance(story, dict) or not story_text(story).strip():
+                continue
+            self.add(story_id, story)
+            known.add(story_id)
+            added += 1
+        return added
+
+
+class DuplicateStoryError(RuntimeError):
+    """הטיוטה כמעט-זהה לסיפור קיים גם אחרי כל הניסיונות (matches = הדומים ביותר)"""
+
+    def __init__(self, message: str, matches: List[Dict]):
+        super().__init__(message)
+        self.matches = matches
+
+
+def generate_distinct_story(generate: Callable[[str], Dict], prompt: str, index: SimilarityIndex,
+                            exclude: str = None, threshold: float = 0.6,
+                            max_attempts: int = 3) -> Tuple[Dict, List[int]]:
+    """
+    מייצר טיוטה עד שהיא לא כמעט-זהה לסיפור באינדקס
+    כל ניסיון חוזר מבקש סיפור שונה לגמרי מהכותרות הדומות
+
+    Args:
+        generate: fn(prompt) -> story_data
+        exclude: story_id שלא משווים אליו (הריצה עצמה)
+        max_attempts: לפחות ניסיון אחד
+
+    Returns:
+        (story_data, signature) - החתימה להוספה לאינדקס אחרי שהסיפור נשמר
+
+    Raises:
+        DuplicateStoryError: אם כל הניסיונות דומים לסיפור קיים
+    """
+    max_attempts = max(1, max_attempts)
+    avoid_titles = []
+    for attempt in range(1, max_attempts + 1):
+        attempt_prompt = prompt
+        if avoid_titles:
+            attempt_prompt += "\n\nהסיפור חייב להיות שונה לגמרי (עלילה, מקומות, פתרון) מהסיפורים: " \
+                              + ", ".join(f'"{t}"' for t in avoid_titles)
+
+        story_data = generate(attempt_prompt)
+        signature = index.signature(story_data)
+        similar = index.most_similar(story_data, k=3, min_similarity=threshold,
+                                     signature=signature, exclude=exclude)
+        if not similar:
+            return story_data, signature
+        top = similar[0]
+        print(f"   ⚠️  ניסיון {attempt}: דומה ב-{top['similarity']:.0%} ל-\"{top['title']}\" ({top['story_id']})")
+        avoid_titles.extend(match['title'] for match in similar
+                            if match['title'] and match['title'] not in avoid_titles)
+
+    raise DuplicateStoryError(
+        f"Story is a near-duplicate of an existing story after {max_attempts} attempts "
+        f"(similarity {top['similarity']:.2f} to {top['story_id']})",
+        similar
+    )
+
+
+if __name__ == "__main__":
+    import tempfile
+    index = SimilarityIndex(Path(tempfile.mkdtemp()) / "similarity.db")
+    base = ["נועה הלכה לגן בבוקר עם אמא שלה והייתה מאוד מתרגשת",
+            "בגן היא פגשה את יואב שבנה מגדל גבוה מקוביות",
+            "בסוף היום נועה חזרה הביתה שמחה ועייפה"]
+    index.add("original", {"title": "נועה בגן", "pages": [{"text": t} for t in base]})
+
+    draft = {"pages": [{"text": "נוֹעָה הָלְכָה לַגַּן בַּבּוֹקֶר עִם אִמָּא שֶׁלָּהּ וְהָיְיתָה מְאוֹד מִתְרַגֶּשֶׁת"}]
+             + [{"text": t} for t in base[1:]]}
+    print(f"🔍 {index.most_similar(draft, k=3)}")
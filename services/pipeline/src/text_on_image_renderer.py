@@ -6,9 +6,42 @@ Text-on-Image Renderer - משרטט טקסט עברי על תמונות
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 from typing import Tuple, Optional
+from functools import lru_cache
+from bidi.algorithm import get_display
 from hebrew_text_processor import HebrewTextProcessor
 import os
-from collections import Counter
+from color_analysis import analyze_region, choose_text_colors
+
+
+@lru_cache(maxsize=64)
+def get_font(font_path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
+    """
+    FreeTypeFont משותף לכל התהליך לכל (נתיב, גודל) - הטעינה מהדיסק קורית פעם אחת
+    (font_path=None = פונט ברירת המחדל של Pillow)
+    """
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default()
+
+
+# משטח מדידה קבוע - textbbox לא תלוי בתמונה שעליה מציירים (אותו fontmode של RGBA)
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+
+@lru_cache(maxsize=16384)
+def text_bbox(font: ImageFont.FreeTypeFont, text: str) -> Tuple[int, int, int, int]:
+    """
+    גבולות טקסט (x, y, רוחב, גובה) - נשמר לכל (פונט, טקסט)
+    הפונטים עצמם משותפים (get_font), כך שאותו פונט = אותו אובייקט = אותו מפתח
+    """
+    bbox = _MEASURE_DRAW.textbbox((0, 0), text, font=font)
+    return (bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1])
+
+
+@lru_cache(maxsize=16384)
+def display_text(text: str) -> str:
+    """get_display (bidi) עם מטמון - אותן שורות נבדקות שוב ושוב בזמן שבירת שורות"""
+    return get_display(text)
 
 
 class TextOnImageRenderer:
@@ -39,12 +72,20 @@ class TextOnImageRenderer:
         }
     ]
 
+    # תוצאת חיפוש הפונט - פעם אחת לכל התהליך (לא בכל יצירת renderer)
+    _discovered_font: Optional[dict] = None
+
     def __init__(self):
         self.text_processor = HebrewTextProcessor()
         self.font_config = self._find_available_font()
 
     def _find_available_font(self) -> dict:
         """מוצא את הפונט הטוב ביותר הזמין במערכת"""
+        if TextOnImageRenderer._discovered_font is None:
+            TextOnImageRenderer._discovered_font = self._scan_fonts()
+        return dict(TextOnImageRenderer._discovered_font)
+
+    def _scan_fonts(self) -> dict:
         for font_config in self.BEAUTIFUL_FONTS:
             if os.path.exists(font_config["regular"]):
                 print(f"✅ נמצא פונט: {font_config['name']}")
@@ -58,16 +99,16 @@ class TextOnImageRenderer:
         }
 
     def load_font(self, size: int, bold: bool = False) -> Optional[ImageFont.FreeTypeFont]:
-        """טוען פונט בגודל מסוים"""
+        """טוען פונט בגודל מסוים (מהמטמון המשותף)"""
         try:
             font_path = self.font_config["bold"] if bold else self.font_config["regular"]
             if font_path and os.path.exists(font_path):
-                return ImageFont.truetype(font_path, size)
+                return get_font(font_path, size)
         except Exception as e:
             print(f"⚠️  שגיאה בטעינת פונט: {e}")
 
         # Fallback to default
-        return ImageFont.load_default()
+        return get_font(None, size)
 
     def extract_dominant_color(self, image_path: Path, position: str = "bottom-left") -> Tuple[int, int, int]:
         """
@@ -80,8 +121,8 @@ class TextOnImageRenderer:
         Returns:
             צבע RGB דומיננטי
         """
-        img = Image.open(image_path).convert('RGB')
-        width, height = img.size
+        with Image.open(image_path) as img:
+            width, height = img.size
 
         # קבע איזור לדגימה (10% מהתמונה)
         sample_w = width // 10
@@ -96,50 +137,48 @@ class TextOnImageRenderer:
         else:
             box = (0, height - sample_h, sample_w, height)
 
-        # דגום צבעים מהאיזור
-        region = img.crop(box)
-        pixels = list(region.getdata())
-
-        # מצא את הצבע הנפוץ ביותר
-        color_counter = Counter(pixels)
-        dominant_color = color_counter.most_common(1)[0][0]
-
-        return dominant_color
+        # היסטוגרמה גסה על דגימה מוקטנת - לא Counter על כל פיקסל
+        return analyze_region(image_path, box)["dominant"]
 
     def calculate_optimal_font_size(self, text: str, max_width: int = 300,
-                                    min_font: int = 22, max_font: int = 36) -> int:
+                                    min_font: int = 22, max_font: int = 36,
+                                    max_height: Optional[int] = None) -> int:
         """
-        מחשב גודל פונט אידאלי לפי אורך הטקסט
+        הגודל הגדול ביותר שבו הטקסט נכנס לתיבה - לפי מדידה אמיתית
+
+        חיפוש בינארי על הגודל: כל בדיקה שוברת שורות עם אותו שובר שורות של
+        add_text_to_image (מדידות ממוטמנות), כך שנדרשים O(log) מעברים בלבד
 
         Args:
             text: הטקסט לבדיקה
             max_width: רוחב מקסימלי זמין
             min_font: גודל פונט מינימלי
             max_font: גודל פונט מקסימלי
+            max_height: גובה מקסימלי זמין (None = רק רוחב)
 
         Returns:
-            גודל פונט מומלץ
+            גודל פונט מומלץ (min_font אם גם הוא לא נכנס)
         """
-        # ספור מילים ותווים
-        num_words = len(text.split())
-        num_chars = len(text.strip())
-
-        # חישוב לפי מספר מילים (עיקרי)
-        if num_words <= 8:
-            # טקסט קצר מאוד - פונט גדול
-            return max_font
-        elif num_words <= 15:
-            # טקסט קצר - פונט בינוני-גדול
-            return max_font - 4
-        elif num_words <= 25:
-            # טקסט בינוני - פונט בינוני
-            return max_font - 8
-        elif num_words <= 35:
-            # טקסט ארוך - פונט קטן
-            return min_font + 2
-        else:
-            # טקסט ארוך מאוד - פונט מינימלי
-            return min_font
+        def fits(font_size: int) -> bool:
+            font = self.load_font(font_size, bold=False)
+            lines = self._split_text_to_lines_with_bidi(text, font, max_width, None)
+            if max_height is not None and len(lines) * int(font_size * 1.3) > max_height:
+                return False
+            return all(self._get_text_bbox(line, font, None)[2] <= max_width for line in lines)
+
+        low, high = min_font, max_font
+        best = min_font
+        while low <= high:
+            middle = (low + high) // 2
+            if fits(middle):
+                best = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+        return best
+
+    # פורמט פלט לפי סיומת הקובץ (ברירת מחדל PNG)
+    OUTPUT_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".png": "PNG"}
 
     def add_text_to_image(self,
                          image_path: Path,
@@ -151,10 +190,16 @@ class TextOnImageRenderer:
                          bg_color: Optional[Tuple[int, int, int, int]] = None,
                          max_width: int = 500,
                          padding: int = 40,
-                         use_nikud: bool = False) -> Path:
+                         use_nikud: bool = False,
+                         quality: int = 90,
+                         output_format: Optional[str] = None,
+                         auto_color: bool = False) -> Path:
         """
         מוסיף טקסט על תמונה קיימת
 
+        הטקסט וההצללה מצוירים על שכבה בגודל אזור הטקסט בלבד, ורק האזור הזה
+        עובר alpha composite - לא כל התמונה (חוסך זיכרון וזמן בכריכות ברזולוציה גבוהה)
+
         Args:
             image_path: נתיב לתמונה המקורית
             text: טקסט עברי
@@ -166,18 +211,19 @@ class TextOnImageRenderer:
             max_width: רוחב מקסימלי לטקסט
             padding: ריווח מהקצוות
             use_nikud: האם להוסיף ניקוד (מומלץ רק אם הפונט תומך)
+            quality: איכות דחיסה ל-JPEG / WebP (ב-PNG אין משמעות)
+            output_format: "PNG" / "JPEG" / "WEBP" (ברירת מחדל: לפי סיומת output_path)
+            auto_color: צבע טקסט והצללה לפי בהירות הרקע מתחת לטקסט (במקום text_color)
 
         Returns:
             נתיב לתמונה החדשה
         """
-        # טען תמונה
-        img = Image.open(image_path).convert('RGBA')
+        # טען תמונה - בלי להמיר את כולה ל-RGBA (רק אזור הטקסט יומר)
+        with Image.open(image_path) as source:
+            has_alpha = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+            img = source.convert('RGBA' if has_alpha else 'RGB')
         width, height = img.size
 
-        # צור שכבת טקסט
-        txt_layer = Image.new('RGBA', img.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(txt_layer)
-
         # טען פונט
         font = self.load_font(font_size, bold=False)
 
@@ -188,7 +234,7 @@ class TextOnImageRenderer:
             text_with_nikud = text
 
         # חלק לשורות והחל bidi על כל שורה בנפרד
-        lines = self._split_text_to_lines_with_bidi(text_with_nikud, font, max_width, draw)
+        lines = self._split_text_to_lines_with_bidi(text_with_nikud, font, max_width, None)
 
         # חשב גובה שורה קבוע (1.3 פעמים גודל הפונט - צפוף יותר)
         line_height = int(font_size * 1.3)
@@ -223,18 +269,12 @@ class TextOnImageRenderer:
             y = height - total_height - padding
             align = "left"
 
-        # רקע אופציונלי לטקסט
-        if bg_color:
-            bg_rect = [
-                x - 20, y - 20,
-                x + max_width + 20, y + total_height + 20
-            ]
-            draw.rounded_rectangle(bg_rect, radius=15, fill=bg_color)
-
-        # צייר כל שורה
+        # מיקום כל שורה, וגבולות כל מה שמצויר (טקסט + הצללה + רקע)
+        placed = []
+        boxes = []
         current_y = y
         for line in lines:
-            bbox = self._get_text_bbox(line, font, draw)
+            bbox = self._get_text_bbox(line, font, None)
             line_width = bbox[2]
 
             # מיקום X לפי יישור
@@ -245,25 +285,72 @@ class TextOnImageRenderer:
             else:
                 line_x = x
 
-            # הצללה (shadow) לקריאות
-            shadow_color = (0, 0, 0, 100) if sum(text_color) > 300 else (255, 255, 255, 100)
-            draw.text((line_x + 2, current_y + 2), line, font=font, fill=shadow_color)
-
-            # טקסט עצמו
-            draw.text((line_x, current_y), line, font=font, fill=text_color + (255,))
+            placed.append((line, line_x, current_y))
+            boxes.append((line_x + bbox[0], current_y + bbox[1],
+                          line_x + bbox[0] + bbox[2] + 2, current_y + bbox[1] + bbox[3] + 2))
 
             # עבור לשורה הבאה עם מרווח אחיד
             current_y += line_height
 
-        # שלב שכבות
-        img = Image.alpha_composite(img, txt_layer)
+        bg_rect = None
+        if bg_color:
+            bg_rect = [x - 20, y - 20, x + max_width + 20, y + total_height + 20]
+            boxes.append((bg_rect[0], bg_rect[1], bg_rect[2] + 1, bg_rect[3] + 1))
+
+        # אזור השכבה - איחוד הגבולות + שוליים קטנים ל-antialiasing, חתוך לגבולות התמונה
+        margin = 4
+        region = None
+        if boxes:
+            region = (max(0, min(b[0] for b in boxes) - margin), max(0, min(b[1] for b in boxes) - margin),
+                      min(width, max(b[2] for b in boxes) + margin), min(height, max(b[3] for b in boxes) + margin))
+            if region[0] >= region[2] or region[1] >= region[3]:
+                region = None
+
+        shadow_color = (0, 0, 0, 100) if sum(text_color) > 300 else (255, 255, 255, 100)
+        if auto_color and region is not None and not bg_color:
+            text_color, shadow_color = choose_text_colors(analyze_region(img, region))
+
+        if region is not None:
+            left, top = region[0], region[1]
+            txt_layer = Image.new('RGBA', (region[2] - left, region[3] - top), (255, 255, 255, 0))
+            draw = ImageDraw.Draw(txt_layer)
+
+            # רקע אופציונלי לטקסט
+            if bg_rect:
+                draw.rounded_rectangle([bg_rect[0] - left, bg_rect[1] - top,
+                                        bg_rect[2] - left, bg_rect[3] - top], radius=15, fill=bg_color)
+
+            # צייר כל שורה
+            for line, line_x, line_y in placed:
+                # הצללה (shadow) לקריאות
+                draw.text((line_x - left + 2, line_y - top + 2), line, font=font, fill=shadow_color)
+                # טקסט עצמו
+                draw.text((line_x - left, line_y - top), line, font=font, fill=text_color + (255,))
+
+            # שלב שכבות - רק באזור הטקסט
+            patch = Image.alpha_composite(img.crop(region).convert('RGBA'), txt_layer)
+            if has_alpha:
+                img.paste(patch, region[:2])
+            else:
+                img.paste(patch.convert('RGB'), region[:2])
 
         # המר ל-RGB ושמור
-        final_img = img.convert('RGB')
-        final_img.save(output_path, 'PNG', quality=95)
+        final_img = img.convert('RGB') if has_alpha else img
+        self._save_image(final_img, output_path, quality, output_format)
 
         return output_path
 
+    def _save_image(self, img: Image.Image, output_path: Path, quality: int,
+                    output_format: Optional[str] = None):
+        """שמירה עם פרמטרים אמיתיים לפורמט (quality קיים רק ב-JPEG / WebP)"""
+        fmt = (output_format or self.OUTPUT_FORMATS.get(Path(output_path).suffix.lower(), "PNG")).upper()
+        if fmt == "JPEG":
+            img.save(output_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+        elif fmt == "WEBP":
+            img.save(output_path, 'WEBP', quality=quality, method=4)
+        else:
+            img.save(output_path, 'PNG')
+
     def _split_text_to_lines_with_bidi(self, text: str, font: ImageFont.FreeTypeFont,
                                         max_width: int, draw: ImageDraw.Draw) -> list:
         """
@@ -271,8 +358,6 @@ class TextOnImageRenderer:
         CRITICAL: פיצול לפני bidi, ואז bidi על כל שורה בנפרד!
         עברית לא צריכה reshaping - רק bidi!
         """
-        from bidi.algorithm import get_display
-
         words = text.split()
         lines_raw = []
         current_line = []
@@ -281,7 +366,7 @@ class TextOnImageRenderer:
             test_line = ' '.join(current_line + [word])
 
             # החל bidi זמנית לבדיקת רוחב (ללא reshape!)
-            test_line_display = get_display(test_line)
+            test_line_display = display_text(test_line)
             bbox = self._get_text_bbox(test_line_display, font, draw)
 
             if bbox[2] <= max_width:
@@ -297,7 +382,7 @@ class TextOnImageRenderer:
         # החל bidi על כל שורה בנפרד (ללא reshape!)
         lines_processed = []
         for line in lines_raw:
-            bidi_text = get_display(line)
+            bidi_text = display_text(line)
             lines_processed.append(bidi_text)
 
         return lines_processed
@@ -327,9 +412,8 @@ class TextOnImageRenderer:
 
     def _get_text_bbox(self, text: str, font: ImageFont.FreeTypeFont,
                        draw: ImageDraw.Draw) -> Tuple[int, int, int, int]:
-        """מחשב את גבולות הטקסט"""
-        bbox = draw.textbbox((0, 0), text, font=font)
-        return (bbox[0], bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1])
+        """מחשב את גבולות הטקסט (ממוטמן לפי פונט וטקסט - draw לא משפיע על המדידה)"""
+        return text_bbox(font, text)
 
 
 # Demo
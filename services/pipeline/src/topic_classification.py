@@ -4,6 +4,7 @@ Topic Classification & Contextual Adult Role Policy
 מנגנון classification של נושאים + העדפות adult role לפי הקשר
 """
 from typing import Dict, List, Optional
+from keyword_matcher import KeywordMatcher
 
 
 # ========================================
@@ -93,6 +94,10 @@ TOPIC_CATEGORIES = {
 }
 
 
+TOPIC_KEYWORDS = {category: info["keywords"] for category, info in TOPIC_CATEGORIES.items()}
+TOPIC_MATCHER = KeywordMatcher.from_groups(TOPIC_KEYWORDS)
+
+
 def classify_topic(topic: str) -> Optional[str]:
     """
     מסווג נושא לפי מילות מפתח
@@ -103,14 +108,8 @@ def classify_topic(topic: str) -> Optional[str]:
     Returns:
         שם הקטגוריה או None
     """
-    topic_lower = topic.lower()
-
-    # ספור matches לכל קטגוריה
-    matches = {}
-    for category, info in TOPIC_CATEGORIES.items():
-        count = sum(1 for keyword in info["keywords"] if keyword in topic_lower)
-        if count > 0:
-            matches[category] = count
+    # ספור matches לכל קטגוריה (סריקה אחת של הנושא)
+    matches = TOPIC_MATCHER.scan(topic).group_counts(TOPIC_KEYWORDS)
 
     # החזר את הקטגוריה עם הכי הרבה matches
     if matches:
@@ -0,0 +1,120 @@
+"""
+הגדרות משותפות לבדיקות: src ב-sys.path ושרת API מזויף (OpenAI / Anthropic)
+"""
+import sys
+import json
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+# CLIs בשורש (run_full_book_10pages, bulk_personalize ...)
+sys.path.insert(1, str(Path(__file__).parent.parent))
+
+
+def chat_completion(content: str, model: str = "gpt-4o") -> Dict:
+    """תשובת chat.completions מינימלית"""
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    }
+
+
+class FakeLLMServer:
+    """
+    שרת HTTP מקומי שמחקה את ה-API של הספקים
+
+    responder(path, body) -> (status, json_body, headers) מחליט על כל תשובה;
+    requests שומר את כל הבקשות (path, body) לפי סדר ההגעה.
+    """
+
+    def __init__(self):
+        self.responder: Callable[[str, Dict], Tuple[int, Dict, Dict]] = (
+            lambda path, body: (200, chat_completion('{"weighted_score": 90}'), {})
+        )
+        self.requests: List[Tuple[str, Dict]] = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests.append((self.path, body))
+                status, payload, headers = server.responder(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """שרת מזויף + משתני סביבה שמפנים אליו את ה-SDKs (בלי מטמון LLM)"""
+    server = FakeLLMServer()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server.url}/v1")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+    monkeypatch.setenv("LLM_CACHE_MODE", "off")
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def rating_criteria(tmp_path, monkeypatch):
+    """
+    קובץ קריטריונים מינימלי (config/rating_criteria.json לא נשמר ב-repo)
+    RatingSystem() בלי נתיב טוען אותו
+    """
+    import rating_system
+
+    criteria = {
+        rating_type: {
+            "description": f"דירוג {rating_type}",
+            "min_score": 90,
+            "criteria": [
+                {"name": "quality", "weight": 60, "description": "איכות"},
+                {"name": "fit", "weight": 40, "description": "התאמה"}
+            ]
+        }
+        for rating_type in ("topic_rating", "story_rating", "character_rating")
+    }
+    path = tmp_path / "rating_criteria.json"
+    path.write_text(json.dumps(criteria, ensure_ascii=False), encoding="utf-8")
+
+    original_init = rating_system.RatingSystem.__init__
+    monkeypatch.setattr(rating_system.RatingSystem, "__init__",
+                        lambda self, criteria_path=None: original_init(self, criteria_path or path))
+    return criteria
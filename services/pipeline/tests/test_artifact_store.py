@@ -0,0 +1,97 @@
+"""
+מאגר הקבצים לפי תוכן - hard links, gc (גם במקביל ל-ingest), ומערכת קבצים אחרת
+"""
+import os
+import errno
+import hashlib
+import threading
+
+from artifact_store import ArtifactStore
+
+
+def write_page(root, run_id: str, data: bytes = b"same illustration" * 100):
+    path = root / "runs" / run_id / "images" / "page_01.png"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_duplicates_become_links(tmp_path):
+    store = ArtifactStore(tmp_path / "cas")
+    pages = [write_page(tmp_path, run_id) for run_id in ("a", "b", "c")]
+    digests = {store.ingest(page) for page in pages}
+
+    assert len(digests) == 1
+    digest = digests.pop()
+    assert store.refcount(digest) == 3
+    assert os.path.samefile(pages[0], pages[2])
+
+    for page in pages:
+        page.unlink()
+    assert store.gc() == {"removed": 1, "freed_bytes": 1700}
+    assert not store.has(digest)
+
+
+def test_other_filesystem_keeps_files_in_place(tmp_path, monkeypatch):
+    store = ArtifactStore(tmp_path / "cas")
+    linked = write_page(tmp_path, "same_fs")
+    digest = store.ingest(linked)
+
+    def cross_device_link(source, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device_link)
+
+    # פעם ראשונה (אין אובייקט) ושנייה (יש אובייקט) - הקובץ נשאר כמו שהוא
+    for run_id in ("other_fs_1", "other_fs_2"):
+        page = write_page(tmp_path, run_id)
+        assert store.ingest(page) == digest
+        assert page.exists() and not os.path.samefile(page, linked)
+
+    fresh = write_page(tmp_path, "other_fs_3", b"new content")
+    store.ingest(fresh)
+    assert fresh.exists()
+    assert not store.has(store.digest_file(fresh))
+    assert store.materialize(digest, tmp_path / "copy.png") is None
+
+    assert store.gc()["removed"] == 0
+    assert store.refcount(digest) == 1
+
+
+def test_gc_waits_for_ingest_in_progress(tmp_path):
+    store = ArtifactStore(tmp_path / "cas")
+    orphan = write_page(tmp_path, "old")
+    digest = store.ingest(orphan)
+    orphan.unlink()
+    page = write_page(tmp_path, "new")
+    link_replace = store._link_replace
+    collected = []
+    gc_threads = []
+
+    def gc_between_check_and_link(source, dest):
+        # gc שרץ אחרי ש-ingest ראה שהאובייקט קיים ולפני הקישור אליו
+        thread = threading.Thread(target=lambda: collected.append(store.gc()))
+        thread.start()
+        thread.join(0.3)
+        try:
+            return link_replace(source, dest)
+        finally:
+            store._link_replace = link_replace
+            gc_threads.append(thread)
+
+    store._link_replace = gc_between_check_and_link
+
+    assert store.ingest(page) == digest
+    gc_threads[0].join()
+
+    assert collected == [{"removed": 0, "freed_bytes": 0}]
+    assert store.refcount(digest) == 1
+    assert os.path.samefile(page, store.object_path(digest))
+
+
+def test_digest_without_file_digest(tmp_path, monkeypatch):
+    page = write_page(tmp_path, "a", os.urandom(3 * (1 << 20) + 7))
+    expected = ArtifactStore.digest_file(page)
+    monkeypatch.delattr(hashlib, "file_digest")
+
+    assert ArtifactStore.digest_file(page) == expected == hashlib.sha256(page.read_bytes()).hexdigest()
@@ -0,0 +1,82 @@
+"""
+ה-worker - מיפוי תוצאת ריצה לסטטוס העבודה בתור, ביטול ו-worker שאיבד בעלות
+"""
+import pytest
+
+from book_worker import BookWorker
+from job_queue import CANCELLED, COMPLETED, FAILED, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.db")
+
+
+def run(queue, handler, **kwargs):
+    worker = BookWorker(queue, handler, max_jobs=2, poll_seconds=0.01, name="w", **kwargs)
+    return worker, worker.run(exit_when_empty=True)
+
+
+def test_results_map_to_job_status(queue):
+    ok = queue.enqueue({"outcome": "PASSED"})
+    failed = queue.enqueue({"outcome": "FAILED"}, max_attempts=3)
+
+    def handler(payload, checkpoint):
+        checkpoint("story")
+        return {"run_id": payload["outcome"].lower(), "status": payload["outcome"]}
+
+    _, stats = run(queue, handler)
+
+    assert queue.get(ok)["status"] == COMPLETED
+    job = queue.get(failed)
+    assert (job["status"], job["attempts"]) == (FAILED, 1)
+    assert job["result"]["run_id"] == "failed"
+    assert "failed" in job["last_error"].lower()
+    assert (stats["completed"], stats["failed"], stats["retried"]) == (1, 1, 0)
+
+
+def test_exception_is_retried(queue):
+    job_id = queue.enqueue({}, max_attempts=2)
+
+    def handler(payload, checkpoint):
+        raise TimeoutError("slow")
+
+    _, stats = run(queue, handler)
+
+    job = queue.get(job_id)
+    assert job["last_error"] == "TimeoutError: slow"
+    assert stats["retried"] == 1
+
+
+def test_cancel_stops_at_next_stage(queue):
+    job_id = queue.enqueue({})
+    stages = []
+
+    def handler(payload, checkpoint):
+        for stage in ("story", "images", "pdf"):
+            checkpoint(stage)
+            stages.append(stage)
+            if stage == "story":
+                queue.cancel(job_id)
+        return {}
+
+    _, stats = run(queue, handler)
+
+    assert stages == ["story"]
+    assert queue.get(job_id)["status"] == CANCELLED
+    assert stats["cancelled"] == 1
+
+
+def test_lost_job_is_not_overwritten(queue):
+    job_id = queue.enqueue({})
+
+    def handler(payload, checkpoint):
+        # worker אחר לקח את העבודה בזמן שהריצה הזאת נתקעה
+        queue._conn.execute("UPDATE jobs SET worker = 'other' WHERE id = ?", (job_id,))
+        return {"run_dir": "stale"}
+
+    _, stats = run(queue, handler)
+
+    job = queue.get(job_id)
+    assert (job["worker"], job["result"]) == ("other", None)
+    assert (stats["completed"], stats["lost"]) == (0, 1)
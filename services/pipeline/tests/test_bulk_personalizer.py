@@ -0,0 +1,88 @@
+"""
+הפקה מרובה - שם ילד מה-CSV כשם תיקייה, ואיור עמודי variant עם Stage 3
+"""
+import io
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from bulk_personalizer import BulkPersonalizer, TemplateRun, VariantRun, safe_path_component
+from run_journal import load_run_metadata, read_events
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("נועה כהן", "נועה_כהן"),
+    ("../../etc/passwd", "etc_passwd"),
+    ("a\\b:c", "a_b_c"),
+    ("..", "child"),
+    ("   ", "child"),
+])
+def test_child_name_is_a_single_safe_path_component(name, expected):
+    assert safe_path_component(name) == expected
+
+
+def write_template(run_dir: Path) -> TemplateRun:
+    """ריצת תבנית מינימלית: עמוד 1 בלשון נקבה בתיאור, עמוד 2 ניטרלי"""
+    (run_dir / "story").mkdir(parents=True)
+    (run_dir / "images").mkdir()
+    pages = [
+        {"page_number": 1, "text": "נועה ראתה ים", "visual_description": "ילדה עמדה ליד הים"},
+        {"page_number": 2, "text": "הים כחול", "visual_description": "גלים כחולים"},
+    ]
+    story = {"character": {"name": "נועה"},
+             "story": {"title": "הים", "target_age": 5, "pages": pages}}
+    (run_dir / "story" / "story.json").write_text(json.dumps(story, ensure_ascii=False), encoding="utf-8")
+    for page in pages:
+        illustration().save(run_dir / "images" / f"page_{page['page_number']:02d}.png")
+    return TemplateRun(run_dir)
+
+
+def illustration() -> Image.Image:
+    """4:3, בלי מסגרת ובלי לבן - עוברת את ה-QA של Stage 3"""
+    return Image.linear_gradient("L").resize((400, 300)).point(lambda v: 60 + v // 2).convert("RGB")
+
+
+def test_variant_images_run_full_stage3(tmp_path, monkeypatch):
+    pytest.importorskip("fitz")
+    import run_full_book_10pages
+    from bulk_personalize import make_variant_images
+
+    prompts = []
+
+    class FakeImageGenerator:
+        def __init__(self, provider):
+            pass
+
+        def generate_image(self, prompt, **kwargs):
+            prompts.append(prompt)
+            buffer = io.BytesIO()
+            illustration().save(buffer, format="PNG")
+            return {"image_data": buffer.getvalue()}
+
+    monkeypatch.setattr(run_full_book_10pages, "ImageGenerator", FakeImageGenerator)
+    template = write_template(tmp_path / "noa_age5_sea" / "run1")
+    bulk = BulkPersonalizer(template, output_dir=tmp_path / "out", variant_images=make_variant_images)
+
+    images = bulk.images_for("boy")
+
+    variant_dir = template.run_dir / "variants" / "boy"
+    assert images[1] == variant_dir / "images" / "page_01.png" and images[1].exists()
+    assert images[2] == template.images_dir / "page_02.png"
+    assert len(prompts) == 1 and "ילד עמד ליד הים" in prompts[0]
+
+    metadata = load_run_metadata(variant_dir)
+    assert metadata["status"] == "COMPLETED"
+    qa = [event for event in read_events(variant_dir / "logs" / "events.jsonl") if event.get("step") == "image_qa"]
+    assert [event["data"]["passed"] for event in qa] == [True]
+
+
+def test_variant_run_records_failure(tmp_path):
+    run = VariantRun(tmp_path / "variants" / "boy", "boy")
+    run.log_step("image_qa", {"page": 1, "passed": False})
+    assert run.record_artifact(run.images_dir / "page_01.png") == run.images_dir / "page_01.png"
+    run.close(error=RuntimeError("עמוד 1 נכשל QA"))
+
+    metadata = load_run_metadata(run.base_dir)
+    assert metadata["status"] == "FAILED" and metadata["failed_stage"] == "images"
@@ -0,0 +1,44 @@
+"""
+ClaudeAgent מול שרת Anthropic מזויף - סיפור מובנה (tool use) וסימון prompt cache
+"""
+import pytest
+
+from claude_agent import ClaudeAgent
+from llm_clients import cached_system
+from story_schema import STORY_TOOL_NAME
+
+
+def tool_message(name: str, tool_input: dict) -> dict:
+    """תשובת messages מינימלית עם בלוק tool_use אחד"""
+    return {
+        "id": "msg_test", "type": "message", "role": "assistant", "model": "claude-test",
+        "content": [{"type": "tool_use", "id": "toolu_test", "name": name, "input": tool_input}],
+        "stop_reason": "tool_use", "stop_sequence": None,
+        "usage": {"input_tokens": 10, "output_tokens": 5}
+    }
+
+
+def test_structured_story_keeps_requested_age(fake_llm, capsys):
+    pages = [{"page_number": n, "text": f"עמוד {n}", "visual_description": "גן"} for n in (1, 2)]
+    fake_llm.responder = lambda path, body: (
+        200, tool_message(STORY_TOOL_NAME, {"title": "נועה בגן", "target_age": 9, "pages": pages}), {})
+
+    story = ClaudeAgent("claude-test").generate_story_structured("כתוב סיפור", num_pages=2, target_age=5)
+
+    assert story["story"]["target_age"] == 5
+    assert len(story["story"]["pages"]) == 2
+    assert "9" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("chars, model, marked", [
+    (200, None, False),
+    (2000, "claude-sonnet-4-5", False),
+    (3000, "claude-sonnet-4-5", True),
+    (3000, "claude-3-5-haiku-latest", False),
+    (6000, "claude-3-5-haiku-latest", True),
+])
+def test_cache_marker_only_above_minimum(chars, model, marked):
+    block, = cached_system("א" * chars, model)
+
+    assert ("cache_control" in block) is marked
+
@@ -0,0 +1,62 @@
+"""
+ניתוח צבע של אזור - פענוח JPEG מוקטן (draft) מול אזורים קטנים, סגירת קבצים ועמודת הטקסט
+"""
+import builtins
+
+import pytest
+from PIL import Image
+
+from color_analysis import analyze_region, text_column_bounds
+
+
+@pytest.mark.parametrize("box", [(0, 0, 3, 3), (3, 3, 6, 6), (27, 0, 30, 3)])
+def test_tiny_box_on_small_jpeg(tmp_path, box):
+    path = tmp_path / "page.jpg"
+    Image.new("RGB", (30, 30), (200, 30, 30)).save(path)
+
+    stats = analyze_region(path, box)
+
+    assert stats["dominant_share"] == 1.0
+    assert stats["mean"][0] > 150 and stats["mean"][1] < 80
+
+
+@pytest.mark.parametrize("box", [(10, 10, 13, 13), (5, 700, 2040, 704), (100, 100, 300, 300), None])
+def test_jpeg_draft_matches_full_decode(tmp_path, box):
+    image = Image.linear_gradient("L").resize((2048, 1536)).convert("RGB")
+    path = tmp_path / "page.jpg"
+    image.save(path, quality=95)
+
+    drafted = analyze_region(path, box)
+    full = analyze_region(image, box)
+
+    assert drafted["luminance"] == pytest.approx(full["luminance"], abs=3)
+
+
+@pytest.mark.parametrize("suffix", [".jpg", ".gif", ".png"])
+def test_image_file_is_closed(tmp_path, monkeypatch, suffix):
+    # כמה פריימים (GIF / APNG) - Pillow לא סוגר את הקובץ לבד אחרי load
+    path = tmp_path / f"page{suffix}"
+    frames = [Image.new("RGB", (300, 200), color) for color in ((20, 40, 200), (200, 40, 20))]
+    frames[0].save(path, save_all=suffix != ".jpg", append_images=frames[1:])
+    opened = []
+    real_open = builtins.open
+
+    def tracking_open(file, *args, **kwargs):
+        handle = real_open(file, *args, **kwargs)
+        if str(file) == str(path):
+            opened.append(handle)
+        return handle
+
+    monkeypatch.setattr(builtins, "open", tracking_open)
+
+    analyze_region(path, (0, 0, 10, 10))
+
+    assert len(opened) == 1 and opened[0].closed
+
+
+@pytest.mark.parametrize("size, bounds", [
+    ((1024, 768), (636, 100, 358, 568)),
+    ((2048, 1536), (1272, 200, 716, 1136)),
+])
+def test_text_column_matches_pdf_layout(size, bounds):
+    assert text_column_bounds(*size) == bounds
@@ -0,0 +1,81 @@
+"""
+תור העבודות - עדיפויות, backoff, ביטול ובעלות של worker על עבודה
+"""
+import time
+
+import pytest
+
+from job_queue import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.db")
+
+
+def test_priority_then_fifo(queue):
+    backfill = queue.enqueue({"n": 1}, priority=-10)
+    first = queue.enqueue({"n": 2})
+    customer = queue.enqueue({"n": 3}, priority=10)
+    second = queue.enqueue({"n": 4})
+
+    claimed = [queue.claim("w")["id"] for _ in range(4)]
+
+    assert claimed == [customer, first, second, backfill]
+    assert queue.claim("w") is None
+
+
+def test_retry_waits_for_backoff_then_fails(queue):
+    job_id = queue.enqueue({}, max_attempts=2)
+
+    assert queue.claim("w")["attempts"] == 1
+    assert queue.fail(job_id, "w", "timeout") == QUEUED
+    assert queue.get(job_id)["not_before"] > time.time()
+    assert queue.claim("w") is None
+
+    queue._conn.execute("UPDATE jobs SET not_before = 0")
+    assert queue.claim("w")["attempts"] == 2
+    assert queue.fail(job_id, "w", "timeout") == FAILED
+    assert queue.get(job_id)["last_error"] == "timeout"
+
+
+def test_not_retryable_fails_with_result(queue):
+    job_id = queue.enqueue({})
+    queue.claim("w")
+
+    assert queue.fail(job_id, "w", "run FAILED", retryable=False, result={"run_dir": "x"}) == FAILED
+    assert queue.get(job_id)["result"] == {"run_dir": "x"}
+
+
+def test_cancel_queued_and_running(queue):
+    queued = queue.enqueue({})
+    running = queue.enqueue({}, priority=1)
+    queue.claim("w")
+
+    assert queue.cancel(queued) == CANCELLED
+    assert queue.cancel(running) == RUNNING
+    assert queue.set_stage(running, "images") is True
+    assert queue.mark_cancelled(running, "w") is True
+    assert queue.get(running)["status"] == CANCELLED
+
+
+def test_stale_worker_cannot_overwrite_new_owner(queue):
+    job_id = queue.enqueue({})
+    queue.claim("stale")
+    queue._conn.execute("UPDATE jobs SET heartbeat = 0")
+    assert queue.requeue_stale(60) == 1
+    queue._conn.execute("UPDATE jobs SET not_before = 0")
+    assert queue.claim("fresh")["worker"] == "fresh"
+
+    queue.heartbeat("stale", [job_id])
+    assert queue.complete(job_id, "stale", {"run_dir": "old"}) is False
+    assert queue.fail(job_id, "stale", "late error") is None
+    assert queue.mark_cancelled(job_id, "stale") is False
+    assert queue.release(job_id, "stale") is False
+    job = queue.get(job_id)
+    assert (job["status"], job["worker"], job["result"]) == (RUNNING, "fresh", None)
+
+    assert queue.complete(job_id, "fresh", {"run_dir": "new"}) is True
+    assert queue.get(job_id)["status"] == COMPLETED
+    assert queue.complete(job_id, "fresh", {"run_dir": "again"}) is False
+    assert queue.get(job_id)["result"] == {"run_dir": "new"}
@@ -0,0 +1,147 @@
+"""
+חילוץ JSON מתשובות LLM - טקסט עוטף, code fence, תשובות קטועות ומיקום הכשל
+"""
+import json
+import random
+
+import pytest
+
+from json_extraction import JSONExtractionError, extract_json, find_json
+
+STORY = {
+    "title": "נועה והדרקון } {",
+    "pages": [
+        {"page": 1, "text": "היה היה \"דרקון\" קטן [באמת]"},
+        {"page": 2, "text": "שורה\\ראשונה, ועוד אחת"},
+    ],
+    "approved": True,
+    "score": 8.5,
+}
+STORY_JSON = json.dumps(STORY, ensure_ascii=False)
+
+PREFIXES = ["", "Sure! Here is the story:\n", "הנה התשובה {לא json}: ", "[note] "]
+SUFFIXES = ["", "\nבהצלחה!", "\n\nNote: {not json}", " ]} trailing"]
+
+
+@pytest.mark.parametrize("prefix", PREFIXES)
+@pytest.mark.parametrize("suffix", SUFFIXES)
+def test_wrapped(prefix, suffix):
+    text = prefix + STORY_JSON + suffix
+    result = find_json(text)
+
+    assert result["value"] == STORY
+    assert result["repaired"] is False
+    assert text[result["start"]:result["end"]] == STORY_JSON
+
+
+@pytest.mark.parametrize("fence", ["```json\n", "```JSON\n", "```\n", "```json \r\n"])
+def test_fenced(fence):
+    text = f"ראה {{דוגמה}} למטה:\n{fence}{STORY_JSON}\n```\nסוף"
+    result = find_json(text)
+
+    assert result["value"] == STORY
+    assert text[result["start"]:result["end"]] == STORY_JSON
+
+
+def test_fenced_preferred_over_earlier_object():
+    text = 'Old: {"title": "draft"}\n```json\n' + STORY_JSON + "\n```"
+    assert extract_json(text) == STORY
+
+
+def test_trailing_comma_and_newline_in_string():
+    text = 'Sure! {"verdict": "PASS", "reason": "שורה\nשנייה",}\nNote: {not json}'
+    result = find_json(text)
+
+    assert result["value"] == {"verdict": "PASS", "reason": "שורה\nשנייה"}
+    assert result["repaired"] is True
+
+
+@pytest.mark.parametrize("cut", range(1, len(STORY_JSON)))
+def test_truncated_is_repaired(cut):
+    text = "```json\n" + STORY_JSON[:cut]
+    result = find_json(text)
+
+    assert result["repaired"] is True
+    assert isinstance(result["value"], dict)
+    assert set(result["value"]) <= set(STORY)
+    for page in result["value"].get("pages", []):
+        assert set(page) <= {"page", "text"}
+
+
+@pytest.mark.parametrize("cut", range(1, len(STORY_JSON)))
+def test_truncated_without_repair_reports_end(cut):
+    text = "Here:\n" + STORY_JSON[:cut]
+    with pytest.raises(JSONExtractionError) as error:
+        find_json(text, repair=False)
+
+    assert error.value.position == len(text)
+
+
+def test_random_wrapping_fuzz():
+    rng = random.Random(1234)
+    noise = "abc אבג {}[]\"\\,:\n`"
+    for _ in range(300):
+        # בלי '{' בקידומת - אחרת זה האובייקט הראשון בטקסט
+        prefix = "".join(rng.choice(noise.replace("{", "")) for _ in range(rng.randint(0, 20)))
+        suffix = "".join(rng.choice(noise) for _ in range(rng.randint(0, 20)))
+        text = prefix + STORY_JSON + suffix
+        assert extract_json(text) == STORY, text
+
+
+@pytest.mark.parametrize("text, position", [
+    ("", 0),
+    ("no json here", len("no json here")),
+    ('{"a": 1 ] x', 8),
+    ('prefix {"a": tru}', len("prefix ") + 6),
+])
+def test_error_position(text, position):
+    with pytest.raises(JSONExtractionError) as error:
+        find_json(text)
+
+    assert error.value.position == position
+    assert f"at char {position}" in str(error.value)
+
+
+def test_array_only_when_allowed():
+    text = 'Result: [{"page": 1}, {"page": 2}] done'
+    assert extract_json(text, allow_array=True) == [{"page": 1}, {"page": 2}]
+    assert extract_json(text) == {"page": 1}
+
+
+def test_repair_parses_a_constant_number_of_candidates(monkeypatch):
+    """תשובה קטועה עם אלפי נקודות חיתוך - לא json.loads לכל אחת (ריבועי)"""
+    import json_extraction
+
+    calls = []
+    real_loads = json_extraction.json.loads
+
+    def counting_loads(text, **kwargs):
+        calls.append(len(text))
+        return real_loads(text, **kwargs)
+
+    monkeypatch.setattr(json_extraction.json, "loads", counting_loads)
+    text = '{"pages": [' + '{"text": "עמוד"}, ' * 2000 + '{"text": "קטו'
+
+    result = find_json(text)
+
+    assert result["repaired"] is True
+    assert len(result["value"]["pages"]) == 2001
+    assert len(calls) <= 6
+
+    # שגיאה לפני נקודת החיתוך האחרונה - לא חוזרים אחורה פסיק אחרי פסיק
+    calls.clear()
+    with pytest.raises(JSONExtractionError):
+        find_json('{"pages": [1, ' + "x, " * 2000)
+    assert len(calls) <= 6
+
+
+def test_broken_candidates_are_not_rescanned():
+    text = '{x, {y}} ' * 2000 + '```\n{"ok": 1}'
+    assert extract_json(text) == {"ok": 1}
+    assert extract_json('{"a": {"b": 1, x}} {"ok": 1}') == {"ok": 1}
+
+
+def test_nesting_too_deep_is_an_extraction_error():
+    with pytest.raises(JSONExtractionError):
+        find_json('{"a": ' + "[" * 5000)
+    assert find_json('{"a": ' + "[" * 500)["repaired"] is True
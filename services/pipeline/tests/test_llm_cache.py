@@ -0,0 +1,79 @@
+"""
+מטמון תשובות LLM - כתיבות מקבילות לאותו מפתח, תיקיית ברירת המחדל ו-hit של Gemini
+"""
+import threading
+from pathlib import Path
+
+import pytest
+
+from llm_cache import LLMCache
+
+
+def test_concurrent_puts_of_same_key(tmp_path):
+    cache = LLMCache(cache_dir=tmp_path, mode="replay")
+    key = cache.make_key("openai", {"model": "gpt-4o", "messages": "שלום"})
+    errors = []
+    start = threading.Barrier(16)
+
+    def put(i: int):
+        start.wait()
+        try:
+            for _ in range(20):
+                cache.put(key, {"content": i}, call_site="test")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.get(key)["response"]["content"] in range(16)
+    # לא נשארים קבצים זמניים
+    assert [path.name for path in tmp_path.rglob("*") if path.is_file()] == [f"{key}.json"]
+
+
+def test_default_dir_does_not_depend_on_cwd(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_DIR", raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    assert LLMCache(mode="off").cache_dir == Path(__file__).parent.parent / "data" / ".llm_cache"
+
+
+class FakeGeminiModel:
+    """genai.GenerativeModel מזויף שמחזיר תשובה אמיתית של ה-SDK"""
+    model_name = "gemini-test"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        from google.generativeai import protos
+        from google.generativeai.types import GenerateContentResponse
+
+        self.calls += 1
+        return GenerateContentResponse.from_response(protos.GenerateContentResponse({
+            "candidates": [{"content": {"parts": [{"text": "שלום"}], "role": "model"},
+                            "finish_reason": "STOP", "index": 0}],
+            "usage_metadata": {"prompt_token_count": 5, "candidates_token_count": 3}
+        }))
+
+
+def test_gemini_hit_matches_miss(tmp_path):
+    pytest.importorskip("google.generativeai")
+    from llm_clients import wrap_gemini
+
+    model = FakeGeminiModel()
+    cached = wrap_gemini(model, cache=LLMCache(cache_dir=tmp_path, mode="replay"))
+
+    miss = cached.generate_content("היי")
+    hit = cached.generate_content("היי")
+
+    assert model.calls == 1
+    assert type(hit) is type(miss)
+    assert hit.text == miss.text == "שלום"
+    assert hit.candidates[0].finish_reason == miss.candidates[0].finish_reason
+    assert hit.prompt_feedback == miss.prompt_feedback
+    assert hit.usage_metadata.prompt_token_count == 5
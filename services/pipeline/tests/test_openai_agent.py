@@ -0,0 +1,117 @@
+"""
+דירוג אסינכרוני מול שרת OpenAI מזויף
+"""
+import json
+import asyncio
+
+import pytest
+
+from conftest import chat_completion
+from openai_agent import OpenAIAgent
+
+
+def make_topic(name: str) -> dict:
+    return {
+        "name": name,
+        "sub_topics": ["אומץ"],
+        "educational_value": "התמודדות עם פחד",
+        "story_concept": "ילד שמתגבר על פחד"
+    }
+
+
+def rating_response(score: float) -> str:
+    return json.dumps({"scores": {}, "weighted_score": score, "reasoning": "", "suggestions": ""})
+
+
+def run_round(agent: OpenAIAgent, topics, batched: bool = False):
+    """סבב אחד כמו ב-Orchestrator: asyncio.run נפרד, הלקוח נסגר בסוף"""
+    async def round_():
+        try:
+            return await agent.rate_topics_async(topics, batched=batched)
+        finally:
+            await agent.async_client.aclose()
+    return asyncio.run(round_())
+
+
+def test_rounds_in_separate_event_loops(fake_llm, rating_criteria):
+    fake_llm.responder = lambda path, body: (200, chat_completion(rating_response(95)), {})
+    agent = OpenAIAgent(model="gpt-4o-mini", max_retries=1)
+    topics = [make_topic(f"נושא {i}") for i in range(4)]
+
+    for _ in range(3):
+        results = run_round(agent, topics)
+        assert [r["topic"]["name"] for r in results] == [t["name"] for t in topics]
+        assert all(r["approved"] for r in results)
+
+    # בלי ניסיונות חוזרים - כל פריט בכל סבב הוא בקשה אחת
+    assert len(fake_llm.requests) == 3 * len(topics)
+
+
+def test_failed_item_does_not_drop_other_ratings(fake_llm, rating_criteria):
+    def responder(path, body):
+        if "נושא שבור" in body["messages"][-1]["content"]:
+            return 200, chat_completion("not json"), {}
+        return 200, chat_completion(rating_response(50)), {}
+
+    fake_llm.responder = responder
+    agent = OpenAIAgent(model="gpt-4o-mini", max_retries=1)
+    topics = [make_topic("נושא א"), make_topic("נושא שבור"), make_topic("נושא ב")]
+
+    results = run_round(agent, topics)
+
+    assert [r["topic"]["name"] for r in results] == ["נושא א", "נושא ב"]
+    assert not any(r["approved"] for r in results)
+
+
+def test_batch_prompt_has_single_output_format(fake_llm, rating_criteria):
+    single_format = "השב בפורמט JSON הבא"
+
+    def responder(path, body):
+        prompt = body["messages"][-1]["content"]
+        if '"ratings"' in prompt:
+            # פריט #1 חסר בתשובה - ייפול לדירוג בודד
+            ratings = [{"index": i, "scores": {"quality": 95, "fit": 95},
+                        "reasoning": "", "suggestions": ""} for i in (0, 2)]
+            return 200, chat_completion(json.dumps({"ratings": ratings})), {}
+        return 200, chat_completion(rating_response(95)), {}
+
+    fake_llm.responder = responder
+    agent = OpenAIAgent(model="gpt-4o-mini", max_retries=1)
+    topics = [make_topic(f"נושא {i}") for i in range(3)]
+
+    results = run_round(agent, topics, batched=True)
+
+    assert [r["topic"]["name"] for r in results] == [t["name"] for t in topics]
+    batch_prompt, single_prompt = [body["messages"][-1]["content"] for _, body in fake_llm.requests]
+    assert '"ratings"' in batch_prompt and single_format not in batch_prompt
+    assert single_format in single_prompt and "נושא 1" in single_prompt
+
+
+def test_all_ratings_failing_raises(fake_llm, rating_criteria):
+    fake_llm.responder = lambda path, body: (400, {"error": {"message": "bad request"}}, {})
+    agent = OpenAIAgent(model="gpt-4o-mini", max_retries=1)
+
+    with pytest.raises(RuntimeError, match="Rating failed"):
+        run_round(agent, [make_topic("נושא א"), make_topic("נושא ב")])
+
+
+def test_orchestrator_stops_when_rating_is_unavailable(fake_llm, rating_criteria, tmp_path):
+    """OpenAI לא זמין - לא ממשיכים לשלם על הצעות Claude בלי משוב עד max_iterations"""
+    from orchestrator import Orchestrator
+
+    class CountingClaude:
+        calls = 0
+
+        def generate_topics(self, num_topics, existing_feedback=None):
+            self.calls += 1
+            return {"topics": [make_topic(f"נושא {i}") for i in range(num_topics)]}
+
+    fake_llm.responder = lambda path, body: (400, {"error": {"message": "bad request"}}, {})
+    orchestrator = Orchestrator(output_dir=tmp_path)
+    orchestrator.claude = CountingClaude()
+    orchestrator.openai.max_retries = 1
+
+    with pytest.raises(RuntimeError, match="Rating failed"):
+        orchestrator.generate_topics_with_approval(num_topics=2, max_iterations=3)
+
+    assert orchestrator.claude.calls == 1
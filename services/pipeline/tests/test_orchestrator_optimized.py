@@ -0,0 +1,104 @@
+"""
+סבב speculative - טיוטה שמוכנה נשלחת להערכה מיד, ואישור מבטל את כל מה שעוד רץ
+"""
+import asyncio
+import json
+
+from orchestrator_optimized import OptimizedOrchestrator
+
+
+class Claude:
+    """טיוטות מזויפות: variant -> (השהיה, self-score)"""
+
+    def __init__(self, drafts):
+        self.drafts = drafts
+        self.cancelled = []
+
+    async def generate_with_model_async(self, prompt, system, model, temperature, variant):
+        delay, self_score = self.drafts[variant]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(variant)
+            raise
+        return {"content": json.dumps({"variant": variant, "self_score": self_score})}
+
+    async def self_evaluate_async(self, content, criteria):
+        return json.loads(content)["self_score"]
+
+
+class OpenAI:
+    def __init__(self, scores):
+        self.scores = scores
+        self.evaluated = []
+
+    async def evaluate_with_model_async(self, content, criteria, model):
+        variant = json.loads(content)["variant"]
+        self.evaluated.append(variant)
+        await asyncio.sleep(0.01)
+        return {"content": json.dumps({"weighted_score": self.scores[variant]})}
+
+
+class Ratings:
+    def get_rating_prompt(self, kind):
+        return kind
+
+
+class Budget:
+    def __init__(self, total=0.0):
+        self.total = total
+
+    def get_total_cost(self):
+        return self.total
+
+
+def orchestrator(drafts, scores, cost=0.0):
+    orchestrator = OptimizedOrchestrator.__new__(OptimizedOrchestrator)
+    orchestrator.claude = Claude(drafts)
+    orchestrator.openai = OpenAI(scores)
+    orchestrator.rating_system = Ratings()
+    orchestrator.cost_optimizer = Budget(cost)
+    return orchestrator
+
+
+def run_round(orchestrator, num_candidates=3, top_k=2, max_cost=None):
+    return asyncio.run(asyncio.wait_for(orchestrator._speculative_round(
+        "prompt", "claude", "openai", 1, num_candidates, top_k, max_cost), timeout=2))
+
+
+def test_first_approved_draft_cancels_slow_drafts():
+    o = orchestrator({"r1c1": (0, 95), "r1c2": (30, 99), "r1c3": (30, 99)}, {"r1c1": 92})
+
+    story, score = run_round(o)
+
+    assert (story["variant"], score) == ("r1c1", 92)
+    assert sorted(o.claude.cancelled) == ["r1c2", "r1c3"]
+
+
+def test_low_self_scores_skip_openai():
+    o = orchestrator({"r1c1": (0, 40), "r1c2": (0.01, 60), "r1c3": (0.02, 95)}, {"r1c3": 80})
+
+    story, score = run_round(o)
+
+    assert story is None and score == 95
+    assert o.openai.evaluated == ["r1c3"]
+
+
+def test_top_k_evaluations_cancel_remaining_drafts():
+    o = orchestrator({"r1c1": (0, 80), "r1c2": (0, 80), "r1c3": (30, 99)}, {"r1c1": 70, "r1c2": 75})
+
+    story, score = run_round(o, top_k=2)
+
+    assert story is None and score == 80
+    assert sorted(o.openai.evaluated) == ["r1c1", "r1c2"]
+    assert o.claude.cancelled == ["r1c3"]
+
+
+def test_budget_cancels_the_round():
+    o = orchestrator({"r1c1": (0, 95), "r1c2": (30, 99)}, {}, cost=5.0)
+
+    story, _ = run_round(o, num_candidates=2, max_cost=1.0)
+
+    assert story is None
+    assert o.openai.evaluated == []
+    assert o.claude.cancelled == ["r1c2"]
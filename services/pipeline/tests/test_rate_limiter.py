@@ -0,0 +1,89 @@
+"""
+ניסיונות חוזרים ב-rate_limiter מול שרת OpenAI מזויף (ה-SDK עם max_retries=0)
+"""
+import pytest
+from openai import OpenAI, BadRequestError
+
+import rate_limiter
+from conftest import chat_completion
+from llm_clients import wrap_openai
+from rate_limiter import ProviderLimiter
+
+
+@pytest.fixture
+def client(fake_llm, monkeypatch):
+    # בקרים חדשים לכל בדיקה - חסימה / מקביליות לא עוברות בין בדיקות
+    monkeypatch.setattr(rate_limiter, "_limiters", {})
+    monkeypatch.setattr(ProviderLimiter, "BASE_BACKOFF_SECONDS", 0.01)
+    return wrap_openai(OpenAI(), "test")
+
+
+def failing_then_ok(failures, status: int, headers: dict = None):
+    """responder שמחזיר status בפעמים הראשונות ואז תשובה תקינה"""
+    remaining = [failures]
+
+    def responder(path, body):
+        if remaining[0] > 0:
+            remaining[0] -= 1
+            return status, {"error": {"message": "fail", "type": "error"}}, headers or {}
+        return 200, chat_completion("ok"), {}
+    return responder
+
+
+def create(client):
+    return client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}]
+    )
+
+
+def test_429_waits_for_retry_after_and_backs_off(fake_llm, client):
+    fake_llm.responder = failing_then_ok(2, 429, {"retry-after-ms": "20"})
+
+    assert create(client).choices[0].message.content == "ok"
+    assert len(fake_llm.requests) == 3
+
+    limiter = rate_limiter.get_limiter("openai")
+    assert limiter.rate_limited_count == 2
+    assert limiter.concurrency_limit < limiter.max_concurrency
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_transient_server_error_is_retried(fake_llm, client, status):
+    fake_llm.responder = failing_then_ok(1, status)
+
+    assert create(client).choices[0].message.content == "ok"
+    assert len(fake_llm.requests) == 2
+    # שגיאה חולפת היא לא אות עומס
+    limiter = rate_limiter.get_limiter("openai")
+    assert limiter.concurrency_limit == limiter.max_concurrency
+
+
+def test_transient_retries_are_bounded(fake_llm, client):
+    fake_llm.responder = failing_then_ok(10, 502)
+
+    with pytest.raises(Exception):
+        create(client)
+    assert len(fake_llm.requests) == ProviderLimiter.MAX_TRANSIENT_RETRIES + 1
+
+
+def test_client_error_is_not_retried(fake_llm, client):
+    fake_llm.responder = failing_then_ok(1, 400)
+
+    with pytest.raises(BadRequestError):
+        create(client)
+    assert len(fake_llm.requests) == 1
+
+
+def test_connection_error_is_retried(monkeypatch):
+    monkeypatch.setattr(ProviderLimiter, "BASE_BACKOFF_SECONDS", 0.01)
+    limiter = ProviderLimiter("test", rpm=0, tpm=0, max_concurrency=2)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionResetError("connection reset by peer")
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert len(calls) == 2
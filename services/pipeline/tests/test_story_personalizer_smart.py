@@ -0,0 +1,32 @@
+"""
+התאמה חכמה - אילו עמודים באמת נשלחים למודל, וקריאת תשובת הכלי
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from claude_agent import ClaudeAgent
+from story_personalizer_smart import ADAPT_TOOL_NAME, StoryPersonalizerSmart
+
+
+@pytest.mark.parametrize("text, gender, expected", [
+    ("נועה ואבא בגן", "boy", False),
+    ("לנועה יש כלב חדש", "boy", False),
+    ("מגדל גבוה ליד החלון", "boy", False),
+    ("נועה צעדה לאט אל החלון", "boy", True),
+    ("נוֹעָה מִתְרַגֶּשֶׁת מאוד", "boy", True),
+    ("בבוקר היא קמה מוקדם", "boy", True),
+    ("נועה צעדה לאט אל החלון", "girl", False),
+    ("", "boy", False),
+])
+def test_gendered_grammar(text, gender, expected):
+    assert StoryPersonalizerSmart._has_gendered_grammar(text, "נועה", gender) is expected
+
+
+def test_tool_input_is_public():
+    response = SimpleNamespace(content=[
+        SimpleNamespace(type="text", text="הנה"),
+        SimpleNamespace(type="tool_use", name=ADAPT_TOOL_NAME, input={"pages": []}),
+    ])
+
+    assert ClaudeAgent.tool_input(response, ADAPT_TOOL_NAME) == {"pages": []}
@@ -0,0 +1,114 @@
+"""
+זיהוי סיפורים כמעט-זהים - Stage 1 (קבלה / ניסיון חוזר / דחייה) ו-backfill מסיפורים קיימים
+"""
+import json
+
+import pytest
+
+from story_similarity import DuplicateStoryError, SimilarityIndex, generate_distinct_story
+
+ORIGINAL = [
+    "נועה הלכה לגן בבוקר עם אמא שלה והייתה מאוד מתרגשת מהיום החדש",
+    "בגן היא פגשה את יואב שבנה מגדל גבוה מקוביות צבעוניות ליד החלון",
+    "בסוף היום נועה חזרה הביתה שמחה ועייפה וסיפרה לאבא על המגדל",
+]
+DIFFERENT = [
+    "הדרקון הקטן גר במערה על ההר ופחד מהחושך בלילות החורף הארוכים",
+    "יום אחד הוא מצא פנס ישן בין הסלעים והדליק אותו בזהירות רבה",
+    "מאז הדרקון יוצא לטייל בלילה ומאיר את הדרך לכל חיות היער",
+]
+
+
+def story(title: str, texts) -> dict:
+    return {"story": {"title": title, "target_age": 5,
+                      "pages": [{"page_number": i, "text": text} for i, text in enumerate(texts, 1)]}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SimilarityIndex(tmp_path / "similarity.db")
+    index.add("old_run", story("נועה בגן", ORIGINAL))
+    return index
+
+
+class Drafts:
+    """generate מזויף - מחזיר טיוטות לפי הסדר ושומר את הפרומפטים"""
+
+    def __init__(self, *drafts):
+        self.drafts = list(drafts)
+        self.prompts = []
+
+    def __call__(self, prompt: str) -> dict:
+        self.prompts.append(prompt)
+        return self.drafts.pop(0)
+
+
+def test_distinct_draft_is_accepted(index):
+    generate = Drafts(story("הדרקון", DIFFERENT))
+
+    story_data, signature = generate_distinct_story(generate, "כתוב סיפור", index)
+
+    assert story_data["story"]["title"] == "הדרקון"
+    assert signature == index.signature(story_data)
+    assert generate.prompts == ["כתוב סיפור"]
+
+
+def test_duplicate_draft_is_retried_with_the_similar_title(index):
+    generate = Drafts(story("נועה בגן שוב", ORIGINAL), story("הדרקון", DIFFERENT))
+
+    story_data, _ = generate_distinct_story(generate, "כתוב סיפור", index)
+
+    assert story_data["story"]["title"] == "הדרקון"
+    assert len(generate.prompts) == 2
+    assert '"נועה בגן"' in generate.prompts[1]
+
+
+def test_duplicate_after_all_attempts_is_rejected(index):
+    generate = Drafts(*[story("נועה בגן שוב", ORIGINAL)] * 2)
+
+    with pytest.raises(DuplicateStoryError) as error:
+        generate_distinct_story(generate, "כתוב סיפור", index, max_attempts=2)
+
+    assert error.value.matches[0]["story_id"] == "old_run"
+    assert len(generate.prompts) == 2
+
+
+@pytest.mark.parametrize("max_attempts", [0, -1])
+def test_at_least_one_attempt(index, max_attempts):
+    generate = Drafts(story("הדרקון", DIFFERENT))
+
+    story_data, _ = generate_distinct_story(generate, "כתוב סיפור", index, max_attempts=max_attempts)
+
+    assert story_data["story"]["title"] == "הדרקון"
+
+
+def test_own_story_id_is_excluded(index):
+    generate = Drafts(story("נועה בגן", ORIGINAL))
+
+    story_data, _ = generate_distinct_story(generate, "כתוב סיפור", index, exclude="old_run")
+
+    assert story_data["story"]["title"] == "נועה בגן"
+
+
+def test_backfill_finds_old_duplicates(tmp_path):
+    runs_root = tmp_path / "runs"
+    story_dir = runs_root / "נועה_age5_גן" / "20250101_120000_abcd1234" / "story"
+    story_dir.mkdir(parents=True)
+    (story_dir / "story_best.json").write_text(
+        json.dumps(story("נועה בגן", ORIGINAL), ensure_ascii=False), encoding="utf-8")
+    stories_dir = tmp_path / "stories"
+    stories_dir.mkdir()
+    (stories_dir / "story_7_20250301_090000.json").write_text(
+        json.dumps({"topic": {"id": 7}, "story": story("הדרקון", DIFFERENT)["story"]}, ensure_ascii=False),
+        encoding="utf-8")
+    (stories_dir / "story_broken.json").write_text("{", encoding="utf-8")
+    index = SimilarityIndex(tmp_path / "similarity.db")
+
+    assert index.backfill(runs_root, stories_dir) == 2
+    assert index.backfill(runs_root, stories_dir) == 0
+    assert index.count() == 2
+
+    matches = index.most_similar(story("נועה בגן שוב", ORIGINAL), min_similarity=0.6)
+    assert [m["story_id"] for m in matches] == ["20250101_120000_abcd1234"]
+    matches = index.most_similar(story("דרקון", DIFFERENT), min_similarity=0.6)
+    assert [m["story_id"] for m in matches] == ["7_20250301_090000"]